@@ -0,0 +1,180 @@
+"""Load-tests the alert bus with thousands of concurrent local stream subscribers.
+
+Usage:
+    python benchmarks/bench_bus.py [--subscribers 1000 2000 4000] [--alerts 100] [--interval-ms 100]
+        [--stalled 50] [--webhooks 2] [--webhook-latency-ms 50] [--json]
+
+For each subscriber count, client processes open that many ``/events``
+streams, plus ``--stalled`` streams that never read and ``--webhooks``
+webhooks whose endpoint takes ``--webhook-latency-ms`` to answer. Then
+``--alerts`` alerts are published ``--interval-ms`` apart. Reported: how
+long ``publish`` blocked the caller, the time from publishing each alert
+to a subscriber reading it (p50/p99/max over every delivery), deliveries
+per second, how many alerts the stalled streams dropped and how many
+webhook POSTs succeeded. The client processes share the machine with the
+bus, so on few cores the latencies include their parsing time.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from patreon_tier_alerter.src.bus import DROPPED, WEBHOOK_DELIVERIES, AlertBus, Webhook
+
+CLIENTS_PER_PROCESS = 500
+
+
+def percentile(values: list, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+async def _subscribe(host: str, port: int, expected: int, stalled: bool, latencies: list, connected: list):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(b'GET /events HTTP/1.1\r\nHost: localhost\r\n\r\n')
+    await writer.drain()
+    await reader.readuntil(b'retry: 2000\n\n')
+    connected.append(1)
+    if stalled:
+        await asyncio.sleep(3600)  # cancelled once the others are done
+    received = 0
+    while received < expected:
+        line = await reader.readline()
+        if not line:
+            break
+        if line.startswith(b'data: '):
+            latencies.append(time.time() - json.loads(line[6:])['published_at'])
+            received += 1
+    writer.close()
+
+
+def _client_process(host: str, port: int, count: int, expected: int, stalled: bool, ready, results):
+    async def run():
+        latencies, connected = [], []
+        tasks = []
+        for _ in range(count):
+            tasks.append(asyncio.create_task(_subscribe(host, port, expected, stalled, latencies, connected)))
+            await asyncio.sleep(0.0005)  # stay inside the listen backlog
+        while len(connected) < count:
+            await asyncio.sleep(0.01)
+        ready.release()
+        if stalled:
+            await asyncio.get_running_loop().run_in_executor(None, results.get)  # told to stop
+            for task in tasks:
+                task.cancel()
+            return
+        await asyncio.wait(tasks, timeout=120)
+        results.put(latencies)
+
+    asyncio.run(run())
+
+
+def start_webhook_receiver(latency: float) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers['Content-Length']))
+            time.sleep(latency)
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run(subscribers: int, args) -> dict:
+    receiver = start_webhook_receiver(args.webhook_latency_ms / 1000)
+    hook_url = f'http://127.0.0.1:{receiver.server_address[1]}/hook'
+    bus = AlertBus(port=0, webhooks=[Webhook(hook_url) for _ in range(args.webhooks)]).start()
+    host, port = bus.address
+    context = multiprocessing.get_context('spawn')
+    ready = context.Semaphore(0)
+    results = context.Queue()
+    stop = context.Queue()
+    processes = []
+    for start in range(0, subscribers, CLIENTS_PER_PROCESS):
+        count = min(CLIENTS_PER_PROCESS, subscribers - start)
+        processes.append(context.Process(target=_client_process,
+                                         args=(host, port, count, args.alerts, False, ready, results)))
+    if args.stalled:
+        processes.append(context.Process(target=_client_process,
+                                         args=(host, port, args.stalled, args.alerts, True, ready, stop)))
+    for process in processes:
+        process.start()
+    for _ in processes:
+        ready.acquire()
+    dropped_before = DROPPED.labels('stream').value
+    delivered_before = WEBHOOK_DELIVERIES.labels('ok').value
+
+    publish_seconds = []
+    started = time.perf_counter()
+    for i in range(args.alerts):
+        alert = {'creator_name': f'Creator {i % 50}', 'tier_name': f'Tier {i}',
+                 'url': f'https://www.patreon.com/c/creator{i % 50}/membership'}
+        called = time.perf_counter()
+        bus.publish([alert])
+        publish_seconds.append(time.perf_counter() - called)
+        time.sleep(args.interval_ms / 1000)
+    latencies = []
+    for _ in range(len(processes) - (1 if args.stalled else 0)):
+        latencies.extend(results.get(timeout=180))
+    elapsed = time.perf_counter() - started
+    if args.stalled:
+        stop.put(None)
+    for process in processes:
+        process.join()
+    dropped = DROPPED.labels('stream').value - dropped_before
+    bus.close()
+    webhook_posts = WEBHOOK_DELIVERIES.labels('ok').value - delivered_before
+    receiver.shutdown()
+    receiver.server_close()
+
+    return {
+        'subscribers': subscribers,
+        'deliveries': len(latencies),
+        'expected': subscribers * args.alerts,
+        'publish_p99_us': round(percentile(publish_seconds, 0.99) * 1e6),
+        'publish_max_us': round(max(publish_seconds) * 1e6),
+        'latency_p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+        'latency_p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'latency_max_ms': round(max(latencies, default=0) * 1000, 2),
+        'deliveries_per_s': round(len(latencies) / elapsed),
+        'stalled_dropped': int(dropped),
+        'webhook_posts': int(webhook_posts),
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--subscribers', type=int, nargs='+', default=[1000, 2000, 4000])
+    ap.add_argument('--alerts', type=int, default=100)
+    ap.add_argument('--interval-ms', type=float, default=100)
+    ap.add_argument('--stalled', type=int, default=50)
+    ap.add_argument('--webhooks', type=int, default=2)
+    ap.add_argument('--webhook-latency-ms', type=float, default=50)
+    ap.add_argument('--json', action='store_true')
+    args = ap.parse_args(argv)
+
+    rows = [run(count, args) for count in args.subscribers]
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    columns = list(rows[0])
+    print(''.join(f'{column:>17}' for column in columns))
+    for row in rows:
+        print(''.join(f'{row[column]!s:>17}' for column in columns))
+
+
+if __name__ == '__main__':
+    main()
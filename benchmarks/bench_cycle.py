@@ -0,0 +1,194 @@
+"""Load-tests full check cycles against the local fake Patreon server.
+
+Usage:
+    python benchmarks/bench_cycle.py [--creators 10 100 1000 10000] [--tiers 10] [--page-kb 300]
+        [--latency-ms 20] [--error-rate 0] [--etag] [--embedded-json] [--output results.json] [--compare previous.json]
+
+For each creator count a baseline cycle runs with every tier sold out, then
+the first tier of ``--open-ratio`` of the creators is opened on the server
+and a second cycle picks up the change and sends SMS to the fake Textbelt
+endpoint. Reported per creator count:
+
+    cycle_wall_s      wall time of the second (alerting) cycle
+    pages_per_s       creators checked per second in that cycle
+    parse_us_per_page CPU time to stream-parse one served page
+    max_rss_kib       process memory high-water mark so far (it only grows)
+    alert_latency_*   seconds from opening a tier to the SMS reaching the fake API
+
+Results are written as JSON tagged with the current git commit so runs from
+different commits can be compared with ``--compare``.
+"""
+import argparse
+import asyncio
+import contextlib
+import functools
+import io
+import json
+import math
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import requests
+
+from benchmarks.fake_server import start_in_process
+from patreon_tier_alerter.src import alerter
+from patreon_tier_alerter.src.engine import FetchEngine
+from patreon_tier_alerter.src.session import NOT_MODIFIED
+from patreon_tier_alerter.src.state import MemoryStateStore
+from patreon_tier_alerter.src.subscriptions import AlertRouter
+from patreon_tier_alerter.src.tier_parser import StreamingTierParser
+
+USER_AGENT = 'patreon-bot-benchmark'
+METRICS = ('cycle_wall_s', 'pages_per_s', 'parse_us_per_page', 'max_rss_kib', 'alert_latency_p50_s',
+           'alert_latency_max_s')
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def make_config(base_url: str, run: str, count: int, args) -> dict:
+    return {
+        'creators': [
+            {'name': f'Creator {i}', 'url': f'{base_url}/{run}/c/{i}/membership', 'tiers_to_watch': ['Tier 0000']}
+            for i in range(count)
+        ],
+        'sms_providers': {
+            'fake': {'provider': 'textbelt', 'textbelt_api_key': 'bench', 'textbelt_url': f'{base_url}/text'},
+        },
+        'subscriptions': [{'recipient': '+15550000000', 'provider': 'fake'}],
+        'alert_dispatch': {'max_parallel_sends': 8},
+        'max_concurrent_requests': args.concurrency,
+        'max_requests_per_host': args.concurrency,
+        'requests_per_second': 1e6,
+        'tier_extraction': 'embedded_json' if getattr(args, 'embedded_json', False) else 'html',
+    }
+
+
+def parse_us_per_page(base_url: str, repeat: int = 20, embedded_json: bool = False) -> float:
+    body = requests.get(f'{base_url}/parse/c/0/membership').content
+    chunks = [body[i:i + alerter.STREAM_CHUNK_SIZE] for i in range(0, len(body), alerter.STREAM_CHUNK_SIZE)]
+    started = time.process_time()
+    for _ in range(repeat):
+        parser = StreamingTierParser(['Tier 0000'], embedded_json=embedded_json)
+        for chunk in chunks:
+            parser.feed(chunk)
+        parser.close()
+    return (time.process_time() - started) / repeat * 1e6
+
+
+async def timed_cycle(creators, router, engine, alert_state) -> tuple:
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = await alerter.run_check_cycle(creators, USER_AGENT, router, engine, alert_state)
+    return time.perf_counter() - started, results
+
+
+def run_size(base_url: str, count: int, args) -> dict:
+    run = f'run{count}'
+    config = make_config(base_url, run, count, args)
+    creators = config['creators']
+    with contextlib.redirect_stdout(io.StringIO()):
+        router = AlertRouter.from_config(config, creators)
+    engine = FetchEngine.from_config(functools.partial(alerter.scrape_patreon_page, conditional=True), config)
+    alert_state = MemoryStateStore()
+    requests.post(f'{base_url}/_control/reset')
+
+    async def scenario():
+        baseline_s, _ = await timed_cycle(creators, router, engine, alert_state)
+        opened = max(1, math.ceil(count * args.open_ratio))
+        flipped_at = requests.post(f'{base_url}/_control/open', params={'prefix': f'/{run}', 'count': opened}).json()['flipped_at']
+        cycle_s, results = await timed_cycle(creators, router, engine, alert_state)
+        return baseline_s, cycle_s, results, opened, flipped_at
+
+    baseline_s, cycle_s, results, opened, flipped_at = asyncio.run(scenario())
+    router.dispatcher.close()
+    latencies = sorted(sms['received_at'] - flipped_at for sms in requests.get(f'{base_url}/_control/sms').json())
+
+    return {
+        'creators': count,
+        'baseline_cycle_s': round(baseline_s, 4),
+        'cycle_wall_s': round(cycle_s, 4),
+        'pages_per_s': round(count / cycle_s, 1),
+        'failed_pages': sum(1 for result in results if result is None),
+        'unchanged_pages': sum(1 for result in results if result is NOT_MODIFIED),
+        'opened_tiers': opened,
+        'alerts_received': len(latencies),
+        'alert_latency_p50_s': round(statistics.median(latencies), 4) if latencies else None,
+        'alert_latency_max_s': round(latencies[-1], 4) if latencies else None,
+        'parse_us_per_page': round(parse_us_per_page(base_url, embedded_json=args.embedded_json), 1),
+        'max_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def compare(previous: dict, current: dict):
+    before = {row['creators']: row for row in previous['results']}
+    print(f"\nCompared with {previous.get('commit', '?')}:")
+    for row in current['results']:
+        old = before.get(row['creators'])
+        if old is None:
+            continue
+        changes = []
+        for metric in METRICS:
+            if old.get(metric) and row.get(metric) is not None:
+                changes.append(f"{metric} {100 * (row[metric] - old[metric]) / old[metric]:+.1f}%")
+        print(f"  {row['creators']:>6} creators: " + ', '.join(changes))
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--creators', type=int, nargs='+', default=[10, 100, 1000])
+    ap.add_argument('--tiers', type=int, default=10)
+    ap.add_argument('--page-kb', type=int, default=300)
+    ap.add_argument('--latency-ms', type=float, default=20)
+    ap.add_argument('--error-rate', type=float, default=0.0)
+    ap.add_argument('--etag', action='store_true', help='serve ETags and answer conditional requests with 304')
+    ap.add_argument('--embedded-json', action='store_true', help="read tiers from the pages' embedded JSON")
+    ap.add_argument('--open-ratio', type=float, default=0.1)
+    ap.add_argument('--concurrency', type=int, default=16)
+    ap.add_argument('--output', help='where to write JSON results (default: print only)')
+    ap.add_argument('--compare', help='JSON results of an earlier run to compare against')
+    args = ap.parse_args(argv)
+
+    process, base_url = start_in_process(tiers=args.tiers, page_kb=args.page_kb, latency=args.latency_ms / 1000,
+                                         error_rate=args.error_rate, etag=args.etag)
+    try:
+        rows = []
+        for count in args.creators:
+            rows.append(run_size(base_url, count, args))
+            print(json.dumps(rows[-1]), file=sys.stderr)
+    finally:
+        process.terminate()
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'parameters': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'results': rows,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    print(f"{'creators':>8}{'cycle s':>10}{'pages/s':>10}{'parse us':>10}{'rss KiB':>10}{'alerts':>8}{'p50 s':>8}{'max s':>8}")
+    for row in rows:
+        print(f"{row['creators']:>8}{row['cycle_wall_s']:>10}{row['pages_per_s']:>10}{row['parse_us_per_page']:>10}"
+              f"{row['max_rss_kib']:>10}{row['alerts_received']:>8}{row['alert_latency_p50_s'] or '-':>8}"
+              f"{row['alert_latency_max_s'] or '-':>8}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Measures alert dispatch throughput and time-to-last-alert against a fake provider.
+
+Usage:
+    python benchmarks/bench_dispatch.py [--alerts N] [--latency-ms MS] [--failure-rate P] [--json]
+
+The fake provider sleeps for ``latency`` per send (with jitter) and fails a
+fraction of sends with a transient error. The sequential configuration
+(one send at a time, no merging) matches the old send_alerts behaviour.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from patreon_tier_alerter.src.dispatch import AlertDispatcher, Channel
+
+
+class FakeProvider:
+    """Thread-safe stand-in for an SMS API with latency and transient failures."""
+
+    def __init__(self, latency: float, failure_rate: float, seed: int = 0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.sent = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def send(self, recipient, message):
+        with self._lock:
+            fail = self._rng.random() < self.failure_rate
+            jitter = self._rng.uniform(0.8, 1.2)
+        time.sleep(self.latency * jitter)
+        if fail:
+            raise ConnectionError("fake transient failure")
+        with self._lock:
+            self.sent += 1
+            return f"fake-{self.sent}"
+
+
+def make_alerts(count: int) -> list:
+    return [
+        {'tier_name': f'Tier {i}', 'creator_name': f'Creator {i % 7}', 'url': f'https://www.patreon.com/c/c{i % 7}/membership'}
+        for i in range(count)
+    ]
+
+
+def run(label: str, alerts: list, provider: FakeProvider, max_parallel: int, merge: bool) -> dict:
+    channel = Channel('fake', '+15550000000', provider.send, retries=3, backoff_seconds=provider.latency / 2)
+    dispatcher = AlertDispatcher(max_parallel=max_parallel, merge=merge)
+    started = time.monotonic()
+    results = dispatcher.dispatch([(channel, alerts)])
+    elapsed = time.monotonic() - started
+    dispatcher.close()
+    return {
+        'config': label,
+        'alerts': len(alerts),
+        'messages': len(results),
+        'delivered_alerts': sum(len(r.alerts) for r in results if r.ok),
+        'attempts': sum(r.attempts for r in results),
+        'time_to_last_alert_s': round(max(r.finished_at for r in results) - started, 3),
+        'alerts_per_s': round(len(alerts) / elapsed, 1),
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--alerts', type=int, default=40)
+    ap.add_argument('--latency-ms', type=float, default=150)
+    ap.add_argument('--failure-rate', type=float, default=0.05)
+    ap.add_argument('--json', action='store_true')
+    args = ap.parse_args(argv)
+
+    alerts = make_alerts(args.alerts)
+    latency = args.latency_ms / 1000
+    configs = [
+        ('sequential', 1, False),
+        ('parallel-4', 4, False),
+        ('parallel-16', 16, False),
+        ('parallel-4-merged', 4, True),
+    ]
+    rows = [run(label, alerts, FakeProvider(latency, args.failure_rate), parallel, merge)
+            for label, parallel, merge in configs]
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    print(f"{'config':<20}{'messages':>10}{'delivered':>11}{'attempts':>10}{'last alert s':>14}{'alerts/s':>10}")
+    for row in rows:
+        print(f"{row['config']:<20}{row['messages']:>10}{row['delivered_alerts']:>11}{row['attempts']:>10}"
+              f"{row['time_to_last_alert_s']:>14}{row['alerts_per_s']:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""Measures fetch throughput through 1, 2, 4 and 8 egresses, each held to its own rate.
+
+Usage:
+    python benchmarks/bench_egress.py [--egresses 1 2 4 8] [--rate 10] [--pages 1000] [--seconds 4] [--json]
+
+A local page server stands in for Patreon and each egress is a local
+forward proxy on its own port. ``--pages`` membership pages are polled
+through an ``EgressPool`` of that many proxies, each limited to ``--rate``
+requests per second with a burst of one, for ``--seconds``. Reported: the
+aggregate pages fetched per second, the scaling against one egress, and the
+highest rate any single proxy saw in a one-second window, which stays at
+``--rate`` plus the one-request burst.
+
+Every page is polled equally often and stays pinned to its egress, so the
+egress with the largest share of pages sets the pace: aggregate throughput
+approaches ``--rate`` times the egress count as ``--pages`` grows and the
+shares even out.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from patreon_tier_alerter.src import alerter
+from patreon_tier_alerter.src.egress import Egress, EgressPool
+from patreon_tier_alerter.src.engine import FetchEngine
+
+PAGE = (b'<html><body><div><h3>Gold</h3><a href="/checkout" data-tag="patron-checkout-continue-button" '
+        b'aria-label="Gold Join"><div class="cm-oHFIQB">Join</div></a></div></body></html>')
+
+
+def serve(handler_class) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler_class)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_page_server() -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(PAGE)))
+            self.end_headers()
+            self.wfile.write(PAGE)
+
+        def log_message(self, *args):
+            pass
+
+    return serve(Handler)
+
+
+def start_proxy(arrivals: list) -> ThreadingHTTPServer:
+    local = threading.local()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            arrivals.append(time.monotonic())
+            if not hasattr(local, 'session'):
+                local.session = requests.Session()
+                local.session.trust_env = False
+            response = local.session.get(self.path)
+            self.send_response(response.status_code)
+            self.send_header('Content-Length', str(len(response.content)))
+            self.end_headers()
+            self.wfile.write(response.content)
+
+        def log_message(self, *args):
+            pass
+
+    return serve(Handler)
+
+
+def peak_rate(arrivals: list) -> int:
+    """Most requests inside any one-second window."""
+    peak, start = 0, 0
+    for end, arrived in enumerate(arrivals):
+        while arrived - arrivals[start] >= 1.0:
+            start += 1
+        peak = max(peak, end - start + 1)
+    return peak
+
+
+def run(egress_count: int, args) -> dict:
+    pages = start_page_server()
+    arrivals = defaultdict(list)
+    proxies = {f'proxy{i}': start_proxy(arrivals[f'proxy{i}']) for i in range(egress_count)}
+    pool = EgressPool([Egress(name, proxy=f'http://127.0.0.1:{server.server_address[1]}',
+                              requests_per_second=args.rate, burst=1, max_concurrent=4)
+                       for name, server in proxies.items()])
+    urls = [f'http://127.0.0.1:{pages.server_address[1]}/c/creator{i}/membership' for i in range(args.pages)]
+
+    async def poll():
+        engine = FetchEngine(lambda url, user_agent, session: alerter.scrape_patreon_page(
+            url, user_agent, tiers_to_watch=['Gold'], session=session),
+            max_concurrency=4 * egress_count, egress_pool=pool)
+        fetched = 0
+        deadline = time.monotonic() + args.seconds
+
+        async def worker(offset: int):
+            nonlocal fetched
+            index = offset
+            while time.monotonic() < deadline:
+                await engine.fetch(urls[index % len(urls)], 'bench')
+                fetched += 1
+                index += 4 * egress_count
+        await asyncio.gather(*(worker(offset) for offset in range(4 * egress_count)))
+        return fetched
+
+    started = time.monotonic()
+    fetched = asyncio.run(poll())
+    elapsed = time.monotonic() - started
+    pool.close()
+    for server in (pages, *proxies.values()):
+        server.shutdown()
+        server.server_close()
+    return {
+        'egresses': egress_count,
+        'pages_per_s': round(fetched / elapsed, 1),
+        'limit_per_s': args.rate * egress_count,
+        'peak_egress_per_s': max(peak_rate(times) for times in arrivals.values()),
+        'egress_limit_per_s': args.rate,
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--egresses', type=int, nargs='+', default=[1, 2, 4, 8])
+    ap.add_argument('--rate', type=float, default=10)
+    ap.add_argument('--pages', type=int, default=1000)
+    ap.add_argument('--seconds', type=float, default=4)
+    ap.add_argument('--json', action='store_true')
+    args = ap.parse_args(argv)
+
+    rows = [run(count, args) for count in args.egresses]
+    for row in rows:
+        row['scaling'] = round(row['pages_per_s'] / rows[0]['pages_per_s'] * rows[0]['egresses'], 2)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    columns = list(rows[0])
+    print(''.join(f'{column:>19}' for column in columns))
+    for row in rows:
+        print(''.join(f'{row[column]!s:>19}' for column in columns))
+
+
+if __name__ == '__main__':
+    main()
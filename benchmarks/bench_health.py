@@ -0,0 +1,165 @@
+"""Measures how failing pages affect the detection time of healthy ones.
+
+Usage:
+    python benchmarks/bench_health.py [--healthy 40] [--stalled 10] [--priority 10] [--cycles 12]
+        [--warmup 3] [--latency-ms 20] [--slow-rate 0.05] [--stall-seconds 3] [--timeout 1] [--json]
+
+``--stalled`` creator pages on the fake server hang and then answer 503;
+the rest answer after ``--latency-ms`` (``--slow-rate`` of requests take ten
+times as long). Check cycles run back to back, as the alerter's loop does,
+in three modes:
+
+    baseline   fetch health disabled: every stalled page is requested each
+               cycle and holds a fetch slot until ``--timeout``
+    breaker    circuit breakers on: stalled pages back off after failing
+    hedged     breakers on and the first ``--priority`` healthy creators
+               marked ``"priority": "high"``, so their slow fetches are hedged
+
+Time to detect is modelled per healthy page and cycle as a tier opening at
+a uniformly random moment of the previous cycle and being seen when this
+cycle's fetch of the page completes. The first ``--warmup`` cycles, while
+breakers are still opening and latencies are being learned, are left out.
+Reported per mode: cycle wall time, p50/p99 time to detect for all healthy
+pages and for the priority ones, and requests sent to stalled pages.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.fake_server import start_in_process
+from patreon_tier_alerter.src import alerter
+from patreon_tier_alerter.src.engine import FetchEngine
+from patreon_tier_alerter.src.health import FetchHealth
+from patreon_tier_alerter.src.plan import compile_config
+from patreon_tier_alerter.src.state import MemoryStateStore
+from patreon_tier_alerter.src.subscriptions import AlertRouter
+
+USER_AGENT = 'patreon-bot-benchmark'
+MODES = ('baseline', 'breaker', 'hedged')
+
+
+def make_config(base_url: str, mode: str, args) -> dict:
+    creators = [
+        {'name': f'Healthy {i}', 'url': f'{base_url}/{mode}/c/{i}/membership', 'tiers_to_watch': ['Tier 0000'],
+         **({'priority': 'high'} if mode == 'hedged' and i < args.priority else {})}
+        for i in range(args.healthy)
+    ] + [
+        {'name': f'Stalled {i}', 'url': f'{base_url}/stall-{mode}/c/{i}/membership', 'tiers_to_watch': ['Tier 0000']}
+        for i in range(args.stalled)
+    ]
+    return {
+        'creators': creators,
+        'max_concurrent_requests': 8,
+        'max_requests_per_host': 8,
+        'requests_per_second': 1e6,
+        'fetch_timeout_seconds': args.timeout,
+        'fetch_health': {'enabled': mode != 'baseline', 'failure_threshold': 2,
+                         'backoff_seconds': 3600, 'max_backoff_seconds': 3600},
+    }
+
+
+def percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run_mode(base_url: str, mode: str, args) -> dict:
+    config = make_config(base_url, mode, args)
+    plan = compile_config(config)
+    alerter.fetch_health = FetchHealth()
+    alerter.fetch_health.configure_from(config)
+    completions = {}
+    stalled_requests = [0]
+
+    def timed_fetch(url, *fetch_args, **kwargs):
+        if '/stall-' in url:
+            stalled_requests[0] += 1
+        result = alerter.scrape_patreon_page(url, *fetch_args, timeout=args.timeout, **kwargs)
+        if result is not None:
+            now = time.monotonic()
+            completions[url] = min(completions.get(url, now), now)
+        return result
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        router = AlertRouter.from_config(config, list(plan.creators))
+    rng = random.Random(0)
+    healthy = [page for page in plan.pages if '/stall-' not in page.url]
+    priority = {page.url for page in healthy if page.hedged}
+
+    async def cycles():
+        engine = FetchEngine.from_config(timed_fetch, config)
+        walls, detect, detect_priority = [], [], []
+        previous = None
+        for cycle in range(args.warmup + args.cycles):
+            completions.clear()
+            started = time.monotonic()
+            await alerter.run_check_cycle(list(plan.pages), USER_AGENT, router, engine, MemoryStateStore())
+            wall = time.monotonic() - started
+            if cycle > args.warmup:
+                for page in healthy:
+                    if page.url not in completions:
+                        continue
+                    seen = previous * (1 - rng.random()) + completions[page.url] - started
+                    detect.append(seen)
+                    if page.url in priority:
+                        detect_priority.append(seen)
+            if cycle >= args.warmup:
+                walls.append(wall)
+            previous = wall
+        return walls, detect, detect_priority
+
+    walls, detect, detect_priority = asyncio.run(cycles())
+    router.dispatcher.close()
+    row = {
+        'mode': mode,
+        'cycle_wall_p50_s': round(statistics.median(walls), 3),
+        'detect_p50_s': round(statistics.median(detect), 3),
+        'detect_p99_s': round(percentile(detect, 0.99), 3),
+        'stalled_requests': stalled_requests[0],
+    }
+    if detect_priority:
+        row['priority_detect_p99_s'] = round(percentile(detect_priority, 0.99), 3)
+    return row
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--healthy', type=int, default=40)
+    ap.add_argument('--stalled', type=int, default=10)
+    ap.add_argument('--priority', type=int, default=10)
+    ap.add_argument('--cycles', type=int, default=12)
+    ap.add_argument('--warmup', type=int, default=3)
+    ap.add_argument('--latency-ms', type=float, default=20)
+    ap.add_argument('--slow-rate', type=float, default=0.05)
+    ap.add_argument('--stall-seconds', type=float, default=3)
+    ap.add_argument('--timeout', type=float, default=1)
+    ap.add_argument('--json', action='store_true')
+    args = ap.parse_args(argv)
+
+    process, base_url = start_in_process(tiers=10, page_kb=100, latency=args.latency_ms / 1000,
+                                         slow_rate=args.slow_rate, stall=args.stall_seconds)
+    try:
+        rows = [run_mode(base_url, mode, args) for mode in MODES]
+    finally:
+        process.terminate()
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    columns = ('mode', 'cycle_wall_p50_s', 'detect_p50_s', 'detect_p99_s', 'priority_detect_p99_s', 'stalled_requests')
+    print(''.join(f'{column:>24}' for column in columns))
+    for row in rows:
+        print(''.join(f'{row.get(column, "-")!s:>24}' for column in columns))
+
+
+if __name__ == '__main__':
+    main()
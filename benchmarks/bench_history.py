@@ -0,0 +1,99 @@
+"""Measures the tier history log: recording cost, file size and query times.
+
+Usage:
+    python benchmarks/bench_history.py [--records 1000000 5000000] [--creators 1000] [--tiers 5] [--json]
+
+A synthetic log is written with one transition every few seconds across
+``--creators`` x ``--tiers`` series, then reopened and queried the way the
+history CLI does. ``observe_us`` is the per-call cost of recording a status
+that did not change, which is what almost every poll does.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from patreon_tier_alerter.src.history import HistoryLog, HistoryReader, change_rates, open_durations, restock_report
+
+START = 1_700_000_000
+
+
+def write_log(path: str, records: int, creators: int, tiers: int) -> float:
+    rng = random.Random(records)
+    creator_names = [f'Creator {i}' for i in range(creators)]
+    tier_names = [f'Tier {i}' for i in range(tiers)]
+    available = {}
+    log = HistoryLog(path)
+    started = time.perf_counter()
+    for i in range(records):
+        # Each series alternates between sold out and available, so every call is a transition.
+        key = (creator_names[rng.randrange(creators)], tier_names[rng.randrange(tiers)])
+        available[key] = not available.get(key, False)
+        log.observe(key[0], key[1], 'available' if available[key] else 'sold_out', START + i * 5)
+        if i % 65536 == 0:
+            log.flush()
+    log.close()
+    return time.perf_counter() - started
+
+
+def timed(function, *args, **kwargs) -> float:
+    started = time.perf_counter()
+    function(*args, **kwargs)
+    return time.perf_counter() - started
+
+
+def run(records: int, creators: int, tiers: int) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'history.log')
+        write_s = write_log(path, records, creators, tiers)
+
+        started = time.perf_counter()
+        log = HistoryLog(path)
+        reopen_s = time.perf_counter() - started
+        calls = 200_000
+        started = time.perf_counter()
+        for _ in range(calls):
+            log.observe('Creator 0', 'Tier 0', 'unknown', START)
+        observe_us = (time.perf_counter() - started) / calls * 1e6
+        log.close()
+
+        with HistoryReader(path) as reader:
+            row = {
+                'records': len(reader),
+                'file_mib': round(os.path.getsize(path) / 2 ** 20, 1),
+                'write_s': round(write_s, 2),
+                'reopen_s': round(reopen_s, 3),
+                'observe_us': round(observe_us, 2),
+                'restocks_s': round(timed(restock_report, reader), 3),
+                'restocks_one_creator_s': round(timed(restock_report, reader, 'Creator 7'), 3),
+                'open_s': round(timed(open_durations, reader), 3),
+                'rates_s': round(timed(change_rates, reader), 3),
+            }
+    return row
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--records', type=int, nargs='+', default=[1_000_000])
+    ap.add_argument('--creators', type=int, default=1000)
+    ap.add_argument('--tiers', type=int, default=5)
+    ap.add_argument('--json', action='store_true')
+    args = ap.parse_args(argv)
+
+    rows = [run(records, args.creators, args.tiers) for records in args.records]
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    columns = list(rows[0])
+    print(''.join(f'{column:>24}' for column in columns))
+    for row in rows:
+        print(''.join(f'{row[column]:>24}' for column in columns))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""Measures parse throughput in the fetch threads and in a parse pool of 1, 2, 4 and 8 workers.
+
+Usage:
+    python benchmarks/bench_parse_pool.py [--workers 1 2 4 8] [--pages 200] [--tiers 40] [--objects 4000]
+        [--fetchers 16] [--max-pending N] [--json]
+
+Synthetic membership pages carry ``--tiers`` checkout buttons and a
+``__NEXT_DATA__`` script holding the tiers' reward objects among
+``--objects`` other nested objects (posts, benefits, media), as real pages
+do. ``--fetchers`` threads stand in for the fetch engine: each takes pages
+from a shared list, feeds them to a ``StreamingTierParser`` in 16 KiB
+chunks as if reading a response, and finishes the parse the way
+``scrape_patreon_page`` does with ``tier_extraction`` set to
+``embedded_json`` and the HTML self-check on.
+
+The first row finishes every parse in the fetch threads, where the GIL lets
+one run at a time. The others send each tier region to a ``ParsePool`` of
+that many workers (workers are started and warmed up before timing), so the
+fetchers always outpace the pool and wait on it. Reported: pages parsed per
+second, the scaling against one worker, the most regions ever queued in the
+pool (it never exceeds ``max_pending``, by default twice the workers), the
+share of parses that had to wait for room, and the tier region bytes sent
+per page against the page size. Throughput can only scale up to the number
+of cores; the core count is printed first.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from patreon_tier_alerter.src import parse_pool
+from patreon_tier_alerter.src.parse_pool import ParsePool
+from patreon_tier_alerter.src.tier_parser import StreamingTierParser
+
+from benchmarks.synthetic import random_statuses, tier_card
+
+CHUNK_SIZE = 16384
+
+
+def bench_page(tiers: int, objects: int, seed: int) -> tuple:
+    """Returns ``(page, watched tier names)`` for a page with a heavy bootstrap JSON."""
+    rng = random.Random(seed)
+    statuses = random_statuses(tiers, seed=seed)
+    included = [{'type': 'reward', 'id': str(1000 + i), 'attributes': {
+        'title': name, 'published': True, 'user_limit': 50, 'remaining': 5 if status == 'available' else 0}}
+        for i, (name, status) in enumerate(statuses.items())]
+    for i in range(objects):
+        included.append({'type': rng.choice(('post', 'benefit', 'media')), 'id': str(5000 + i), 'attributes': {
+            'title': f'Item {i}', 'created_at': '2024-01-01T00:00:00Z', 'tags': ['a', 'b', 'c'],
+            'metadata': {'width': rng.randrange(2000), 'height': rng.randrange(2000), 'flags': [1, 2]}},
+            'relationships': {'campaign': {'data': {'type': 'campaign', 'id': '1'}}}})
+    rng.shuffle(included)
+    payload = json.dumps({'props': {'pageProps': {'bootstrap': {'campaign': {'included': included}}}}})
+    cards = ''.join(tier_card(name, status, token=f'{rng.randrange(1 << 30):x}') for name, status in statuses.items())
+    page = (f'<!DOCTYPE html><html><body><main>{cards}</main>'
+            f'<script id="__NEXT_DATA__" type="application/json">{payload}</script></body></html>').encode()
+    return page, [name for name in statuses if rng.random() < 0.2]
+
+
+def feed(page: bytes, watch: list) -> StreamingTierParser:
+    parser = StreamingTierParser(watch, embedded_json=True, self_check=True)
+    for i in range(0, len(page), CHUNK_SIZE):
+        if parser.feed(page[i:i + CHUNK_SIZE]):
+            break
+    return parser
+
+
+def parse_in_place(parser):
+    parser.digest()
+    return parser.close()
+
+
+def run(workers: int, pages: list, args) -> dict:
+    pool = None
+    if workers:
+        pool = ParsePool(workers, max_pending=args.max_pending, min_bytes=0)
+        warm = [threading.Thread(target=pool.parse, args=(feed(*pages[0]).region(),)) for _ in range(workers)]
+        for thread in warm:
+            thread.start()
+        for thread in warm:
+            thread.join()
+    waits = parse_pool.WAIT_SECONDS.labels().count
+    sent = parse_pool.REGION_BYTES.value
+    order = iter(range(args.pages))
+    lock = threading.Lock()
+    peak = 0
+
+    def fetcher():
+        while True:
+            with lock:
+                index = next(order, None)
+            if index is None:
+                return
+            parser = feed(*pages[index % len(pages)])
+            if pool is not None:
+                pool.parse(parser.region())
+            else:
+                parse_in_place(parser)
+
+    threads = [threading.Thread(target=fetcher) for _ in range(args.fetchers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    while any(thread.is_alive() for thread in threads):
+        if pool is not None:
+            peak = max(peak, pool.pending)
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - started
+    if pool is not None:
+        pool.close()
+    return {
+        'workers': workers or 'in_thread',
+        'pages_per_s': round(args.pages / elapsed, 1),
+        'peak_pending': peak if pool is not None else '',
+        'max_pending': pool.max_pending if pool is not None else '',
+        'waited': f'{(parse_pool.WAIT_SECONDS.labels().count - waits) / args.pages:.0%}' if pool is not None else '',
+        'sent_kib_per_page': round((parse_pool.REGION_BYTES.value - sent) / args.pages / 1024, 1) if pool is not None else '',
+        'page_kib': round(sum(len(page) for page, _ in pages) / len(pages) / 1024, 1),
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    ap.add_argument('--pages', type=int, default=200)
+    ap.add_argument('--tiers', type=int, default=40)
+    ap.add_argument('--objects', type=int, default=4000)
+    ap.add_argument('--fetchers', type=int, default=16)
+    ap.add_argument('--max-pending', type=int, default=None)
+    ap.add_argument('--json', action='store_true')
+    args = ap.parse_args(argv)
+
+    pages = [bench_page(args.tiers, args.objects, seed) for seed in range(8)]
+    rows = [run(0, pages, args)] + [run(count, pages, args) for count in args.workers]
+    base = next((row['pages_per_s'] for row in rows[1:] if row['workers'] == 1), rows[0]['pages_per_s'])
+    for row in rows:
+        row['scaling'] = round(row['pages_per_s'] / base, 2)
+    if args.json:
+        print(json.dumps({'cores': os.cpu_count(), 'rows': rows}, indent=2))
+        return
+    print(f'cores: {os.cpu_count()}')
+    columns = list(rows[0])
+    print(''.join(f'{column:>18}' for column in columns))
+    for row in rows:
+        print(''.join(f'{row[column]!s:>18}' for column in columns))
+
+
+if __name__ == '__main__':
+    main()
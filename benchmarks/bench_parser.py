@@ -0,0 +1,113 @@
+"""Compares per-page CPU time and peak memory of the tier parsers.
+
+Usage:
+    python benchmarks/bench_parser.py [saved_page.html ...] [--repeat N] [--json]
+
+The embedded_json rows read tiers from the page's ``__NEXT_DATA__`` JSON
+(with and without the anchor cross-check).
+
+Saved pages (e.g. ``curl -o drums.html https://www.patreon.com/c/<creator>/membership``)
+are benchmarked as-is, watching the first tier found on each page as well as
+the whole page. Without arguments a set of synthetic pages is used.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from patreon_tier_alerter.src.tier_parser import StreamingTierParser, TierParser
+
+from benchmarks.synthetic import membership_page, random_statuses
+
+CHUNK_SIZE = 16384
+
+
+def parse_full(page: bytes, watch):
+    # What scrape_patreon_page did before: decode the whole body, then feed it.
+    parser = TierParser()
+    parser.feed(page.decode('utf-8', errors='replace'))
+    return parser.tiers
+
+
+def parse_streaming(page: bytes, watch, **options):
+    parser = StreamingTierParser(watch, **options)
+    view = memoryview(page)
+    for i in range(0, len(page), CHUNK_SIZE):
+        if parser.feed(bytes(view[i:i + CHUNK_SIZE])):
+            break
+    return parser.close()
+
+
+def parse_embedded_json(page: bytes, watch):
+    return parse_streaming(page, watch, embedded_json=True, self_check=False)
+
+
+def parse_embedded_json_checked(page: bytes, watch):
+    return parse_streaming(page, watch, embedded_json=True, self_check=True)
+
+
+PARSERS = ('full_parser', 'streaming', 'streaming_early_exit', 'embedded_json', 'embedded_json_self_check')
+
+
+def measure(func, page: bytes, watch, repeat: int) -> dict:
+    started = time.process_time()
+    for _ in range(repeat):
+        func(page, watch)
+    cpu_us = (time.process_time() - started) / repeat * 1e6
+
+    tracemalloc.start()
+    func(page, watch)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'cpu_us_per_page': round(cpu_us, 1), 'peak_kib': round(peak / 1024, 1)}
+
+
+def load_pages(paths):
+    if paths:
+        pages = {}
+        for path in paths:
+            with open(path, 'rb') as f:
+                pages[os.path.basename(path)] = f.read()
+        return pages
+    return {
+        f"synthetic-{tiers}tiers-{size}kb": membership_page(random_statuses(tiers), size_kb=size)
+        for tiers, size in ((5, 150), (10, 400), (40, 800))
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('pages', nargs='*', help='saved membership pages (HTML)')
+    ap.add_argument('--repeat', type=int, default=20)
+    ap.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = ap.parse_args(argv)
+
+    results = []
+    for label, page in load_pages(args.pages).items():
+        tiers = parse_full(page, None)
+        first_tier = [tiers[0]['name']] if tiers else None
+        row = {'page': label, 'bytes': len(page), 'tiers': len(tiers)}
+        row['full_parser'] = measure(parse_full, page, None, args.repeat)
+        row['streaming'] = measure(parse_streaming, page, None, args.repeat)
+        row['streaming_early_exit'] = measure(parse_streaming, page, first_tier, args.repeat)
+        row['embedded_json'] = measure(parse_embedded_json, page, None, args.repeat)
+        row['embedded_json_self_check'] = measure(parse_embedded_json_checked, page, None, args.repeat)
+        results.append(row)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'page':<32}{'parser':<24}{'cpu us/page':>14}{'peak KiB':>12}")
+    for row in results:
+        for name in PARSERS:
+            m = row[name]
+            print(f"{row['page']:<32}{name:<24}{m['cpu_us_per_page']:>14}{m['peak_kib']:>12}")
+
+
+if __name__ == '__main__':
+    main()
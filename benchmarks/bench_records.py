@@ -0,0 +1,171 @@
+"""Compares the per-check cost of the tier diff engine with the dict-based check it replaced.
+
+Usage:
+    python benchmarks/bench_records.py [--pages 10000] [--tiers 10] [--cycles 10] [--change-rate 0.01] [--json]
+
+``--pages`` pages with one creator entry each watch ``--tiers`` tiers
+(100,000 watched tiers by default). Every cycle checks every page against
+the same ``MemoryStateStore``; between cycles ``--change-rate`` of the tiers
+flip between available and sold out. Reported per implementation: median
+CPU time per cycle after the first, and the memory held between cycles: the
+tier region cache's copy of every page (dicts before, shared ``Tier``
+records now) plus, for the diff engine, its status vectors and page layouts.
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from patreon_tier_alerter.src.plan import PagePlan
+from patreon_tier_alerter.src.records import TierDiff, tier_records
+from patreon_tier_alerter.src.state import MemoryStateStore
+
+log = logging.getLogger('bench_records')
+
+
+def legacy_check_page(scraped_tiers: list, page, alerted_tiers_cache, alerts: list):
+    # check_page before the diff engine (debug logging off, as in production):
+    # every watched tier consults the alert state.
+    scraped_tiers_map = {tier.get('name', '').lower(): tier for tier in scraped_tiers}
+    for watch in page.creators:
+        creator_name = watch.name
+        for tier_to_watch_name, lowered_name in watch.watched:
+            cache_key = (creator_name, tier_to_watch_name)
+            found_tier_info = scraped_tiers_map.get(lowered_name)
+            if found_tier_info:
+                if found_tier_info.get('status') == 'available':
+                    if not alerted_tiers_cache.get(cache_key):
+                        alert = {'creator_name': creator_name, 'tier_name': tier_to_watch_name, 'url': watch.url}
+                        if found_tier_info.get('remaining') is not None:
+                            alert['remaining'] = found_tier_info['remaining']
+                        alerts.append(alert)
+                        alerted_tiers_cache[cache_key] = True
+                        log.debug("Tier '%s' for %s is AVAILABLE. Added to alerts.", tier_to_watch_name, creator_name)
+                    else:
+                        log.debug("Tier '%s' for %s is available but already alerted.", tier_to_watch_name,
+                                  creator_name)
+                elif alerted_tiers_cache.get(cache_key):
+                    log.debug("Tier '%s' for %s is NO LONGER available. Resetting alert state.",
+                              tier_to_watch_name, creator_name)
+                    alerted_tiers_cache[cache_key] = False
+                else:
+                    log.debug("Tier '%s' for %s is not available and was not alerted.", tier_to_watch_name,
+                              creator_name)
+            elif alerted_tiers_cache.get(cache_key):
+                log.debug("Tier '%s' for %s was NOT FOUND (previously available). Resetting alert state.",
+                          tier_to_watch_name, creator_name)
+                alerted_tiers_cache[cache_key] = False
+            else:
+                log.debug("Tier '%s' for %s was not found and not alerted.", tier_to_watch_name, creator_name)
+
+
+def make_cycles(args) -> tuple:
+    rng = random.Random(0)
+    names = [f'Tier {i:04d}' for i in range(args.tiers)]
+    pages = [PagePlan.from_creators(f'https://example.com/c/{p}/membership',
+                                    [{'name': f'Creator {p}', 'tiers_to_watch': names}])
+             for p in range(args.pages)]
+    statuses = [[rng.choice(('available', 'sold_out')) for _ in names] for _ in pages]
+    cycles = []
+    for _ in range(args.cycles):
+        # Fresh dicts and name strings every cycle, as the parser returns them.
+        cycles.append([[{'name': ''.join(name), 'status': status} for name, status in zip(names, page_statuses)]
+                       for page_statuses in statuses])
+        for page_statuses in statuses:
+            for i in range(len(page_statuses)):
+                if rng.random() < args.change_rate:
+                    page_statuses[i] = 'sold_out' if page_statuses[i] == 'available' else 'available'
+    return pages, cycles
+
+
+def run_legacy(pages, cycles) -> list:
+    store = MemoryStateStore()
+    seconds = []
+    for scraped_pages in cycles:
+        alerts = []
+        started = time.process_time()
+        for page, scraped in zip(pages, scraped_pages):
+            legacy_check_page(scraped, page, store, alerts)
+        seconds.append(time.process_time() - started)
+    return seconds
+
+
+def run_diff(pages, cycles) -> list:
+    store = MemoryStateStore()
+    diff = TierDiff()
+    seconds = []
+    for scraped_pages in cycles:
+        alerts = []
+        started = time.process_time()
+        for page, scraped in zip(pages, scraped_pages):
+            diff.check_page(page, scraped, store, alerts)
+        seconds.append(time.process_time() - started)
+    return seconds
+
+
+def held_bytes(build) -> int:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    held = build()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del held
+    return size
+
+
+def fresh_copy(scraped_pages: list) -> list:
+    # The parser's output for a cycle, with names not shared with any earlier cycle.
+    return [[dict(tier, name=''.join(tier['name'])) for tier in scraped] for scraped in scraped_pages]
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--pages', type=int, default=10000)
+    ap.add_argument('--tiers', type=int, default=10)
+    ap.add_argument('--cycles', type=int, default=10)
+    ap.add_argument('--change-rate', type=float, default=0.01)
+    ap.add_argument('--json', action='store_true')
+    args = ap.parse_args(argv)
+
+    pages, cycles = make_cycles(args)
+    legacy_seconds = run_legacy(pages, cycles)
+    diff_seconds = run_diff(pages, cycles)
+
+    legacy_held = held_bytes(lambda: [[dict(tier) for tier in scraped] for scraped in fresh_copy(cycles[0])])
+
+    def diff_held():
+        diff = TierDiff()
+        cached = [tier_records(scraped) for scraped in fresh_copy(cycles[0])]
+        for page, scraped in zip(pages, fresh_copy(cycles[0])):
+            diff.check_page(page, scraped, {}, [])
+        return cached, diff
+
+    rows = []
+    for name, seconds, held in (('legacy', legacy_seconds, legacy_held), ('diff', diff_seconds, held_bytes(diff_held))):
+        steady = sorted(seconds[1:])
+        rows.append({
+            'implementation': name,
+            'watched_tiers': args.pages * args.tiers,
+            'cycle_cpu_ms': round(steady[len(steady) // 2] * 1000, 1),
+            'held_mb': round(held / 1e6, 2),
+        })
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    columns = ('implementation', 'watched_tiers', 'cycle_cpu_ms', 'held_mb')
+    print(''.join(f'{column:>18}' for column in columns))
+    for row in rows:
+        print(''.join(f'{row.get(column, "-")!s:>18}' for column in columns))
+
+
+if __name__ == '__main__':
+    main()
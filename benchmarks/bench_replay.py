@@ -0,0 +1,105 @@
+"""Records a synthetic month of polls into a page archive and replays it.
+
+Usage:
+    python benchmarks/bench_replay.py [--creators 20] [--days 30] [--interval 300] [--tiers 10]
+        [--size-kb 300] [--change-rate 0.01] [--full-pages] [--json]
+
+Each of ``--creators`` pages is polled every ``--interval`` seconds for
+``--days`` days; at each poll ``--change-rate`` of its tiers flip between
+available and sold out, so most polls return the body recorded before.
+Without ``--full-pages`` the recorded bodies stop after the tier cards, as
+the alerter reads them. Reported: responses, archive size on disk, time to
+record and time to replay through ``scrape_patreon_page``/``check_page``.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import requests
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.synthetic import membership_page, random_statuses
+from patreon_tier_alerter.src.archive import ArchiveReader, PageArchive, index_path, replay, urls_path
+
+
+def ok_response() -> requests.Response:
+    response = requests.Response()
+    response.status_code = 200
+    response.headers['Content-Type'] = 'text/html; charset=utf-8'
+    return response
+
+
+def record_month(path: str, args) -> tuple:
+    rng = random.Random(0)
+    urls = [f'https://example.com/c/creator{c}/membership' for c in range(args.creators)]
+    statuses = [random_statuses(args.tiers, seed=c) for c in range(args.creators)]
+    bodies = [None] * args.creators
+    recorder = PageArchive(path, full_pages=args.full_pages)
+    response = ok_response()
+    polls = args.days * 86400 // args.interval
+    started = time.perf_counter()
+    for poll in range(polls):
+        timestamp = 1_700_000_000 + poll * args.interval
+        for c, url in enumerate(urls):
+            changed = bodies[c] is None
+            for name, status in statuses[c].items():
+                if rng.random() < args.change_rate:
+                    statuses[c][name] = 'sold_out' if status == 'available' else 'available'
+                    changed = True
+            if changed:
+                body = membership_page(statuses[c], size_kb=args.size_kb, seed=c)
+                if not args.full_pages:
+                    # Up to the end of the last tier card, where the alerter stops reading.
+                    body = body[:body.rindex(b'</a></div>') + len(b'</a></div>')]
+                bodies[c] = body
+            recorder.record(url, response, bodies[c], complete=args.full_pages, timestamp=timestamp)
+        if poll % 288 == 287:
+            recorder.flush()  # once a simulated day, to keep the buffer small
+    recorder.close()
+    config = {'creators': [{'name': f'Creator {c}', 'url': url, 'tiers_to_watch': list(statuses[c])}
+                           for c, url in enumerate(urls)]}
+    return config, time.perf_counter() - started
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--creators', type=int, default=20)
+    ap.add_argument('--days', type=int, default=30)
+    ap.add_argument('--interval', type=int, default=300)
+    ap.add_argument('--tiers', type=int, default=10)
+    ap.add_argument('--size-kb', type=int, default=300)
+    ap.add_argument('--change-rate', type=float, default=0.01)
+    ap.add_argument('--full-pages', action='store_true')
+    ap.add_argument('--json', action='store_true')
+    args = ap.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'pages.archive')
+        config, record_seconds = record_month(path, args)
+        size = sum(os.path.getsize(p) for p in (path, index_path(path), urls_path(path)))
+        with ArchiveReader(path) as reader:
+            report = replay(reader, config)
+
+    row = {
+        'responses': report.responses,
+        'archive_mb': round(size / 1e6, 2),
+        'record_s': round(record_seconds, 2),
+        'replay_s': round(report.seconds, 2),
+        'replay_per_s': round(report.responses / report.seconds) if report.seconds else 0,
+        'parsed': report.parsed,
+        'alerts': len(report.alerts),
+    }
+    if args.json:
+        print(json.dumps(row, indent=2))
+        return
+    print(''.join(f'{column:>14}' for column in row))
+    print(''.join(f'{value!s:>14}' for value in row.values()))
+
+
+if __name__ == '__main__':
+    main()
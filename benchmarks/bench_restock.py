@@ -0,0 +1,165 @@
+"""Simulates weeks of polling to measure time-to-alert with and without restock prediction.
+
+Usage:
+    python benchmarks/bench_restock.py [--weeks 8] [--learn-weeks 4] [--interval 600] [--burst 5]
+        [--max-burst 60] [--budget 0.5] [--seed 1] [--json]
+
+Synthetic pages restock on a schedule (``--seed`` fixes it): some weekly at
+a set weekday and time, some daily, some twice a week, each a few minutes
+either side of the set time, plus a few pages that restock at random. Every
+restock stays available for 5 to 40 minutes. The scheduler runs against a
+simulated clock, polling each page every ``--interval`` seconds (the
+minimum and maximum interval are both set to it, as with a fixed
+``check_interval_seconds``), in two modes:
+
+    fixed       no prediction
+    predicted   ``restock_prediction`` on, polling windows every ``--burst``
+                to ``--max-burst`` seconds with ``--budget`` of each page's
+                requests
+
+Reported per mode, for the restocks after the first ``--learn-weeks``:
+median, p90 and max time from a restock to the poll that sees it, restocks
+never seen, requests per page per day and, with prediction, the share of
+restocks that fell inside a predicted window and the connection pre-warms.
+"""
+import argparse
+import bisect
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from patreon_tier_alerter.src.predictor import RESTOCKS, RestockPredictor
+from patreon_tier_alerter.src.scheduler import DAY, WEEK, AdaptiveScheduler
+
+# Monday 2024-01-01 00:00 local time.
+START = time.mktime((2024, 1, 1, 0, 0, 0, 0, 0, -1))
+
+
+class SimulatedClock:
+    def __init__(self, now: float):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class SyntheticPage:
+    """Restock periods of one page, as sorted (start, end) times."""
+
+    def __init__(self, url: str, periods: list):
+        self.url = url
+        self.periods = sorted(periods)
+        self.starts = [start for start, _ in self.periods]
+        self.seen = {}  # period index -> first poll that saw it
+
+    def poll(self, now: float) -> str:
+        index = bisect.bisect_right(self.starts, now) - 1
+        if index >= 0 and now < self.periods[index][1]:
+            self.seen.setdefault(index, now)
+            return 'available'
+        return 'sold_out'
+
+
+def synthetic_pages(weeks: int, rng: random.Random) -> list:
+    def restock(at: float) -> tuple:
+        start = at + rng.uniform(-180, 180)
+        return start, start + rng.uniform(300, 2400)
+
+    pages = []
+    for i in range(4):
+        weekday, minute = rng.randrange(7), rng.randrange(8 * 60, 22 * 60)
+        pages.append([restock(START + week * WEEK + weekday * DAY + minute * 60) for week in range(weeks)])
+    for i in range(4):
+        minute = rng.randrange(8 * 60, 22 * 60)
+        pages.append([restock(START + day * DAY + minute * 60) for day in range(weeks * 7)])
+    for i in range(2):
+        slots = [(rng.randrange(7), rng.randrange(8 * 60, 22 * 60)) for _ in range(2)]
+        pages.append([restock(START + week * WEEK + weekday * DAY + minute * 60)
+                      for week in range(weeks) for weekday, minute in slots])
+    for i in range(2):
+        pages.append([restock(START + rng.uniform(0, weeks * WEEK)) for _ in range(3 * weeks)])
+    return [SyntheticPage(f'https://www.patreon.com/c/creator{i}/membership', periods)
+            for i, periods in enumerate(pages)]
+
+
+def run(predicted: bool, args) -> dict:
+    pages = synthetic_pages(args.weeks, random.Random(args.seed))
+    clock = SimulatedClock(START)
+    predictor = None
+    if predicted:
+        predictor = RestockPredictor(burst_interval_seconds=args.burst, max_burst_interval_seconds=args.max_burst,
+                                     burst_budget=args.budget, base_interval=args.interval, enabled=True)
+    scheduler = AdaptiveScheduler([{'name': page.url, 'url': page.url} for page in pages], base_interval=args.interval,
+                                  min_interval=args.interval, max_interval=args.interval, predictor=predictor,
+                                  clock=clock)
+    end = START + args.weeks * WEEK
+    evaluated_from = START + args.learn_weeks * WEEK
+    requests = prewarms = 0
+    counted_from = None
+    while clock.now < end:
+        clock.now += scheduler.seconds_until_next()
+        if counted_from is None and clock.now >= evaluated_from:
+            counted_from = (requests, prewarms, RESTOCKS.labels('predicted').value,
+                            RESTOCKS.labels('unpredicted').value)
+        prewarms += len(scheduler.pop_warmups())
+        for index, _ in scheduler.pop_due():
+            requests += 1
+            scheduler.record(index, [{'name': 'Gold', 'status': pages[index].poll(clock.now)}])
+
+    latencies, missed = [], 0
+    for page in pages:
+        for index, (start, _) in enumerate(page.periods):
+            if start < evaluated_from or start >= end - DAY:
+                continue
+            if index in page.seen:
+                latencies.append(page.seen[index] - start)
+            else:
+                missed += 1
+    latencies.sort()
+    days = (end - evaluated_from) / DAY
+    row = {
+        'mode': 'predicted' if predicted else 'fixed',
+        'restocks': len(latencies) + missed,
+        'median_s': round(statistics.median(latencies)),
+        'p90_s': round(latencies[int(len(latencies) * 0.9)]),
+        'max_s': round(latencies[-1]),
+        'missed': missed,
+        'requests_per_page_day': round((requests - counted_from[0]) / len(pages) / days, 1),
+    }
+    if predicted:
+        in_window = RESTOCKS.labels('predicted').value - counted_from[2]
+        outside = RESTOCKS.labels('unpredicted').value - counted_from[3]
+        row['in_window'] = f'{in_window / max(in_window + outside, 1):.0%}'
+        row['prewarms'] = prewarms - counted_from[1]
+    return row
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--weeks', type=int, default=8)
+    ap.add_argument('--learn-weeks', type=int, default=4)
+    ap.add_argument('--interval', type=float, default=600)
+    ap.add_argument('--burst', type=float, default=5)
+    ap.add_argument('--max-burst', type=float, default=60)
+    ap.add_argument('--budget', type=float, default=0.5)
+    ap.add_argument('--seed', type=int, default=1)
+    ap.add_argument('--json', action='store_true')
+    args = ap.parse_args(argv)
+
+    rows = [run(False, args), run(True, args)]
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    columns = list(rows[1])
+    print(''.join(f'{column:>22}' for column in columns))
+    for row in rows:
+        print(''.join(f'{row.get(column, "")!s:>22}' for column in columns))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""Measures how check throughput scales with the number of sharded workers.
+
+Usage:
+    python benchmarks/bench_shards.py [--creators 2000] [--workers 1 2 4 8] [--latency-ms 20] [--json]
+
+For each worker count, that many processes join one worker group through a
+shared SQLite database, take their consistent-hash share of the creators and
+run one check cycle against the fake Patreon server. Aggregate pages/sec is
+the creator count divided by the slowest worker's cycle time; with enough
+cores it should grow roughly linearly with the worker count.
+"""
+import argparse
+import asyncio
+import contextlib
+import functools
+import io
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.bench_cycle import USER_AGENT, make_config
+from benchmarks.fake_server import start_in_process
+
+
+def run_worker(worker_id: str, config: dict, barrier, results):
+    from patreon_tier_alerter.src import alerter
+    from patreon_tier_alerter.src.engine import FetchEngine
+    from patreon_tier_alerter.src.sharding import ShardCoordinator
+    from patreon_tier_alerter.src.state import SQLiteStateStore
+    from patreon_tier_alerter.src.subscriptions import AlertRouter
+
+    coordinator = ShardCoordinator.from_config(config, worker_id)
+    coordinator.heartbeat()
+    barrier.wait()
+    coordinator.heartbeat()
+    owned = [creator for creator in config['creators'] if coordinator.owns(creator)]
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        router = AlertRouter.from_config(config, owned)
+    engine = FetchEngine.from_config(functools.partial(alerter.scrape_patreon_page, conditional=True), config)
+    alert_state = SQLiteStateStore(config['state_path'])
+    barrier.wait()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        asyncio.run(alerter.run_check_cycle(owned, USER_AGENT, router, engine, alert_state))
+    results.put((worker_id, len(owned), time.perf_counter() - started))
+    router.dispatcher.close()
+    alert_state.close()
+    coordinator.leave()
+
+
+def run(base_url: str, workers: int, args) -> dict:
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as directory:
+        config = make_config(base_url, f'shards{workers}', args.creators, args)
+        config['state_path'] = os.path.join(directory, 'state.sqlite3')
+        config['sharding'] = {'heartbeat_seconds': 5, 'worker_ttl_seconds': 60}
+        barrier = context.Barrier(workers)
+        results = context.Queue()
+        processes = [context.Process(target=run_worker, args=(f'w{i}', config, barrier, results))
+                     for i in range(workers)]
+        for process in processes:
+            process.start()
+        rows = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+
+    slowest = max(seconds for _, _, seconds in rows)
+    return {
+        'workers': workers,
+        'creators': args.creators,
+        'shares': sorted(count for _, count, _ in rows),
+        'slowest_worker_s': round(slowest, 3),
+        'pages_per_s': round(args.creators / slowest, 1),
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--creators', type=int, default=2000)
+    ap.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    ap.add_argument('--tiers', type=int, default=10)
+    ap.add_argument('--page-kb', type=int, default=300)
+    ap.add_argument('--latency-ms', type=float, default=20)
+    ap.add_argument('--concurrency', type=int, default=16)
+    ap.add_argument('--json', action='store_true')
+    args = ap.parse_args(argv)
+
+    process, base_url = start_in_process(tiers=args.tiers, page_kb=args.page_kb, latency=args.latency_ms / 1000)
+    try:
+        rows = [run(base_url, workers, args) for workers in args.workers]
+    finally:
+        process.terminate()
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    base = rows[0]['pages_per_s'] / rows[0]['workers']
+    print(f"{'workers':>8}{'slowest s':>11}{'pages/s':>10}{'speedup':>9}  shares")
+    for row in rows:
+        print(f"{row['workers']:>8}{row['slowest_worker_s']:>11}{row['pages_per_s']:>10}"
+              f"{row['pages_per_s'] / base:>9.2f}  {row['shares']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""Measures cold-start cost of the one-shot (``--once``) path against a budget.
+
+Usage:
+    python benchmarks/bench_startup.py [--creators 20] [--repeat 5] [--max-import-ms 250]
+        [--max-once-ms 3000] [--max-rss-mib 80] [--json]
+
+Each measurement runs in a fresh interpreter:
+
+    import_ms     time to import the alerter module
+    import_rss    peak memory of an interpreter that only imports it
+    sdks_loaded   whether boto3/botocore/twilio were imported along the way
+    once_ms       wall time of ``alerter --once`` checking ``--creators`` pages
+                  on the local fake server and alerting through its Textbelt
+    once_rss      peak memory of that run
+
+Medians over ``--repeat`` runs are compared with the budgets; the exit status
+is 1 if any is exceeded, so this can gate CI.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.bench_cycle import make_config
+from benchmarks.fake_server import start_in_process
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+SDK_MODULES = ('boto3', 'botocore', 'twilio')
+IMPORT_PROBE = (
+    "import resource, sys, time, json\n"
+    "started = time.perf_counter()\n"
+    "import patreon_tier_alerter.src.alerter\n"
+    "elapsed = time.perf_counter() - started\n"
+    "print(json.dumps({'import_s': elapsed,\n"
+    "                  'rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,\n"
+    "                  'sdks': sorted({name.split('.')[0] for name in sys.modules} & set(%r))}))\n" % (SDK_MODULES,)
+)
+
+
+def run_child(command: list) -> tuple:
+    """Runs a command to completion and returns (stdout, wall seconds, peak RSS in KiB)."""
+    started = time.perf_counter()
+    process = subprocess.Popen(command, cwd=REPO_ROOT, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    stdout = process.stdout.read()
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - started
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode:
+        raise RuntimeError(f"{command} exited with {process.returncode}")
+    return stdout, elapsed, usage.ru_maxrss
+
+
+def measure_import() -> dict:
+    stdout, _, _ = run_child([sys.executable, '-c', IMPORT_PROBE])
+    return json.loads(stdout)
+
+
+def measure_once(config_path: str) -> tuple:
+    _, elapsed, rss_kib = run_child([sys.executable, '-m', 'patreon_tier_alerter.src.alerter',
+                                     '--once', '--config', config_path])
+    return elapsed, rss_kib
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--creators', type=int, default=20)
+    ap.add_argument('--repeat', type=int, default=5)
+    ap.add_argument('--max-import-ms', type=float, default=250)
+    ap.add_argument('--max-once-ms', type=float, default=3000)
+    ap.add_argument('--max-rss-mib', type=float, default=80)
+    ap.add_argument('--json', action='store_true')
+    args = ap.parse_args(argv)
+
+    imports = [measure_import() for _ in range(args.repeat)]
+
+    process, base_url = start_in_process(tiers=10, page_kb=100, latency=0.005)
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            config = make_config(base_url, 'startup', args.creators, SimpleNamespace(concurrency=8))
+            config['state_path'] = os.path.join(directory, 'state.sqlite3')
+            config['log_level'] = 'WARNING'
+            config_path = os.path.join(directory, 'config.json')
+            with open(config_path, 'w') as f:
+                json.dump(config, f)
+            runs = [measure_once(config_path) for _ in range(args.repeat)]
+    finally:
+        process.terminate()
+
+    row = {
+        'import_ms': round(statistics.median(run['import_s'] for run in imports) * 1000, 1),
+        'import_rss_mib': round(statistics.median(run['rss_kib'] for run in imports) / 1024, 1),
+        'sdks_loaded': sorted({name for run in imports for name in run['sdks']}),
+        'once_ms': round(statistics.median(elapsed for elapsed, _ in runs) * 1000, 1),
+        'once_rss_mib': round(statistics.median(rss for _, rss in runs) / 1024, 1),
+    }
+    over = []
+    if row['import_ms'] > args.max_import_ms:
+        over.append(f"import {row['import_ms']} ms > {args.max_import_ms} ms")
+    if row['once_ms'] > args.max_once_ms:
+        over.append(f"one-shot run {row['once_ms']} ms > {args.max_once_ms} ms")
+    if max(row['import_rss_mib'], row['once_rss_mib']) > args.max_rss_mib:
+        over.append(f"peak RSS {max(row['import_rss_mib'], row['once_rss_mib'])} MiB > {args.max_rss_mib} MiB")
+    if row['sdks_loaded']:
+        over.append(f"provider SDKs imported at startup: {', '.join(row['sdks_loaded'])}")
+    row['within_budget'] = not over
+
+    if args.json:
+        print(json.dumps(row, indent=2))
+    else:
+        print(f"import: {row['import_ms']} ms, {row['import_rss_mib']} MiB peak, "
+              f"SDKs loaded: {', '.join(row['sdks_loaded']) or 'none'}")
+        print(f"--once over {args.creators} creator(s): {row['once_ms']} ms, {row['once_rss_mib']} MiB peak")
+        for problem in over:
+            print(f"OVER BUDGET: {problem}")
+    return 0 if not over else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
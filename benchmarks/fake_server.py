@@ -0,0 +1,210 @@
+"""A local stand-in for Patreon membership pages and the Textbelt SMS API.
+
+Routes:
+    GET  /<run>/c/<creator>/membership   synthetic membership page
+    POST /text                           fake Textbelt send, records receipt time
+    POST /_control/open?prefix=P&count=K flips the first tier of K creators to available
+    GET  /_control/sms                   JSON list of received messages
+    POST /_control/reset                 forgets opened tiers and received messages
+
+Every creator's page lists ``tiers`` tiers, all sold out until opened. Pages
+are assembled from a shared head/tail so serving 10,000 creators costs one
+page worth of memory. Requests are delayed by ``latency`` (with jitter), a
+fraction ``slow_rate`` take ten times as long, and a fraction ``error_rate``
+answer 503. Pages of runs whose name starts with ``stall`` hang for ``stall``
+seconds and then answer 503, like a creator page that keeps timing out. With ``etag`` set the server honours
+``If-None-Match``; otherwise each response carries a fresh tracking token in
+its checkout links, like the real site.
+
+Usage:
+    python benchmarks/fake_server.py [--port 8808] [--tiers 10] [--page-kb 300] [--latency-ms 20]
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.synthetic import page_shell, rewards_json, tier_card, tier_names
+
+PAGE_PATH = re.compile(r'^(/[^/]+)?/c/([^/]+)/membership$')
+
+
+class FakePatreon:
+    """Page and SMS state shared by the request handler threads."""
+
+    def __init__(self, tiers=10, page_kb=300, latency=0.0, error_rate=0.0, etag=False, seed=0,
+                 slow_rate=0.0, stall=0.0):
+        self.tier_names = tier_names(tiers)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.stall = stall
+        self.etag = etag
+        self.head, self.tail_start, self.tail_end = page_shell(page_kb, seed)
+        self.opened = {}  # page path -> version
+        self.sms = []
+        self._tokens = itertools.count()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def page(self, path: str) -> tuple:
+        """Returns ``(version, body)`` for a creator's page."""
+        version = self.opened.get(path, 0)
+        token = '' if self.etag else str(next(self._tokens))
+        statuses = {name: 'available' if version and i == 0 else 'sold_out'
+                    for i, name in enumerate(self.tier_names)}
+        cards = ''.join(tier_card(name, status, token) for name, status in statuses.items())
+        return version, (self.head + cards.encode() + self.tail_start
+                         + rewards_json(statuses).encode() + self.tail_end)
+
+    def open(self, prefix: str, count: int) -> float:
+        with self._lock:
+            for i in range(count):
+                path = f'{prefix}/c/{i}/membership'
+                self.opened[path] = self.opened.get(path, 0) + 1
+            return time.time()
+
+    def record_sms(self, fields: dict) -> int:
+        with self._lock:
+            self.sms.append({
+                'phone': fields.get('phone', [''])[0],
+                'message': fields.get('message', [''])[0],
+                'received_at': time.time(),
+            })
+            return len(self.sms)
+
+    def delay(self, path: str = '') -> bool:
+        """Sleeps for the configured latency; returns True if this request should fail."""
+        if path.startswith('/stall'):
+            time.sleep(self.stall)
+            return True
+        with self._lock:
+            jitter = self._rng.uniform(0.5, 1.5)
+            if self._rng.random() < self.slow_rate:
+                jitter *= 10
+            fail = self._rng.random() < self.error_rate
+        if self.latency:
+            time.sleep(self.latency * jitter)
+        return fail
+
+
+def make_handler(state: FakePatreon):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, body=b'', content_type='text/html; charset=utf-8', headers=()):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            if body:
+                self.wfile.write(body)
+
+        def _json(self, payload, status=200):
+            self._send(status, json.dumps(payload).encode(), 'application/json')
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == '/_control/sms':
+                with state._lock:
+                    return self._json(list(state.sms))
+            if not PAGE_PATH.match(url.path):
+                return self._send(404, b'not found')
+            if state.delay(url.path):
+                return self._send(503, b'unavailable')
+            version, body = state.page(url.path)
+            if state.etag:
+                etag = f'"{url.path}-{version}"'
+                if self.headers.get('If-None-Match') == etag:
+                    return self._send(304, headers=[('ETag', etag)])
+                return self._send(200, body, headers=[('ETag', etag)])
+            self._send(200, body)
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            if url.path == '/text':
+                text_id = state.record_sms(parse_qs(body.decode()))
+                return self._json({'success': True, 'textId': str(text_id)})
+            if url.path == '/_control/open':
+                query = parse_qs(url.query)
+                flipped_at = state.open(query.get('prefix', [''])[0], int(query.get('count', ['1'])[0]))
+                return self._json({'flipped_at': flipped_at})
+            if url.path == '/_control/reset':
+                with state._lock:
+                    state.opened.clear()
+                    state.sms.clear()
+                return self._json({})
+            self._send(404, b'not found')
+
+    return Handler
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def handle_error(self, request, client_address):
+        # The scraper stops reading once it has the tier region and drops the
+        # connection; that is expected, not an error worth a traceback.
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+
+def serve(port: int = 0, ready=None, **options):
+    """Runs the server until interrupted; sends the bound port through ``ready``."""
+    server = _Server(('127.0.0.1', port), make_handler(FakePatreon(**options)))
+    if ready is not None:
+        ready.send(server.server_address[1])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def start_in_process(**options) -> tuple:
+    """Starts the server in a child process so it does not compete for the GIL.
+
+    Returns:
+        tuple: ``(process, base_url)``. Terminate the process when done.
+    """
+    parent, child = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=serve, kwargs=dict(options, ready=child), daemon=True)
+    process.start()
+    port = parent.recv()
+    return process, f'http://127.0.0.1:{port}'
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--port', type=int, default=8808)
+    ap.add_argument('--tiers', type=int, default=10)
+    ap.add_argument('--page-kb', type=int, default=300)
+    ap.add_argument('--latency-ms', type=float, default=20)
+    ap.add_argument('--error-rate', type=float, default=0.0)
+    ap.add_argument('--etag', action='store_true')
+    args = ap.parse_args(argv)
+    print(f"Serving fake Patreon on http://127.0.0.1:{args.port}")
+    serve(args.port, tiers=args.tiers, page_kb=args.page_kb, latency=args.latency_ms / 1000,
+          error_rate=args.error_rate, etag=args.etag)
+
+
+if __name__ == '__main__':
+    main()
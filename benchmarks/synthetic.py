@@ -0,0 +1,94 @@
+"""Synthetic Patreon membership pages for benchmarks.
+
+The generated markup mirrors what the parsers key on (checkout-button anchors
+with an aria-label and a ``cm-oHFIQB`` button div) surrounded by the large
+inline scripts and nested markup that make real membership pages heavy.
+"""
+import json
+import random
+
+STATUS_BUTTONS = {'available': 'Join', 'sold_out': 'Sold Out'}
+
+
+def tier_names(count: int) -> list:
+    return [f"Tier {i:04d}" for i in range(count)]
+
+
+def tier_card(name: str, status: str, token: str = '') -> str:
+    disabled = 'true' if status == 'sold_out' else 'false'
+    query = f'?t={token}' if token else ''
+    return (
+        '<div class="cm-card" data-tag="tier-card"><div class="cm-header">'
+        f'<h3 class="cm-title">{name}</h3><p class="cm-price">$10 / month</p></div>'
+        '<ul class="cm-benefits">' + ''.join(f'<li>Benefit {i}</li>' for i in range(5)) + '</ul>'
+        f'<a class="cm-button" href="/checkout/{name.replace(" ", "-")}{query}" '
+        f'data-tag="patron-checkout-continue-button" aria-label="{name} Join" aria-disabled="{disabled}">'
+        f'<div class="cm-oHFIQB">{STATUS_BUTTONS[status]}</div></a></div>'
+    )
+
+
+def rewards_json(statuses: dict, remaining: dict = None, limit: int = 50) -> str:
+    """JSON:API reward objects for ``statuses``, as embedded in ``__NEXT_DATA__``.
+
+    ``remaining`` maps tier names to open slots; available tiers default to
+    ``limit // 10`` remaining and sold-out ones to 0.
+    """
+    remaining = remaining or {}
+    return json.dumps([
+        {'type': 'reward', 'id': str(1000 + i), 'attributes': {
+            'title': name,
+            'amount_cents': 1000,
+            'published': True,
+            'user_limit': limit,
+            'remaining': remaining.get(name, limit // 10 if status == 'available' else 0),
+        }}
+        for i, (name, status) in enumerate(statuses.items())
+    ])
+
+
+def page_shell(size_kb: int = 300, seed: int = 0) -> tuple:
+    """Returns ``(head, tail_start, tail_end)`` bytes wrapped around the tier cards of a page.
+
+    Roughly a third of the padding is placed before the tier cards (head
+    scripts and navigation) and the rest after them in the ``__NEXT_DATA__``
+    bootstrap JSON, which matches the layout of real pages. The reward
+    objects go between ``tail_start`` and ``tail_end``.
+    """
+    rng = random.Random(seed)
+    padding = size_kb * 1024
+
+    def filler(n):
+        chunks = []
+        while n > 0:
+            token = f'<div class="x{rng.randrange(1 << 20):x}"><span>{"lorem ipsum " * 4}</span></div>'
+            chunks.append(token)
+            n -= len(token)
+        return ''.join(chunks)
+
+    head = padding // 3
+    return (
+        ('<!DOCTYPE html><html><head><title>Membership</title>'
+         f'<script>window.__nav = "{"n" * (head // 2)}";</script></head><body>'
+         + filler(head // 2) + '<main>').encode(),
+        ('</main>'
+         '<script id="__NEXT_DATA__" type="application/json">'
+         '{"props": {"pageProps": {"bootstrap": "' + 'z' * (padding - head) + '", '
+         '"campaign": {"included": ').encode(),
+        '}}}}</script></body></html>'.encode(),
+    )
+
+
+def membership_page(statuses: dict, size_kb: int = 300, seed: int = 0, token: str = '',
+                    remaining: dict = None) -> bytes:
+    """Builds a page listing ``statuses`` (name -> status) padded to ~``size_kb``."""
+    cards = ''.join(tier_card(name, status, token) for name, status in statuses.items()).encode()
+    head, tail_start, tail_end = page_shell(max(0, size_kb - len(cards) // 1024), seed)
+    return head + cards + tail_start + rewards_json(statuses, remaining).encode() + tail_end
+
+
+def random_statuses(count: int, available_ratio: float = 0.2, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    return {
+        name: 'available' if rng.random() < available_ratio else 'sold_out'
+        for name in tier_names(count)
+    }
@@ -0,0 +1,171 @@
+"""Alert state kept in Workers KV, plus a SQLite stand-in for running offline.
+
+``KVAlertState`` holds everything a run needs to remember in one JSON
+document under a single key: which (creator, tier) pairs have been alerted
+and where the next run should resume when the creator list is checked in
+slices. A run therefore costs one KV read and at most one KV write, however
+many creators or tiers are configured, and skips the write when nothing
+changed.
+
+``LocalKV`` implements the part of the KV binding API the worker uses
+(``get``, ``put``, ``delete``, ``list``) on a SQLite file, one per binding
+under ``.worker_state/kv/<binding>.sqlite3``, so the worker can be run and
+tested without Cloudflare. It is not shared with ``wrangler dev``, which
+keeps its own local KV under ``.wrangler/state/v3/kv``. ``sqlite3`` is only
+imported when a ``LocalKV`` is opened, since the Workers runtime does not
+provide it.
+"""
+import json
+import os
+import time
+
+STATE_KEY = 'alert_state'
+STATE_VERSION = 1
+LOCAL_STATE_DIR = os.path.join('.worker_state', 'kv')
+
+
+class LocalKV:
+    """SQLite-backed stand-in for a Workers KV namespace binding.
+
+    Args:
+        path (str): Database file, created if missing.
+        clock (callable): Wall clock used for ``expirationTtl``.
+
+    Attributes:
+        reads, writes: Operations performed, for checking per-run budgets.
+    """
+
+    def __init__(self, path: str, clock=time.time):
+        import sqlite3
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._clock = clock
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value BLOB NOT NULL, expiration REAL)"
+        )
+        self._conn.commit()
+        self.reads = 0
+        self.writes = 0
+
+    @classmethod
+    def for_binding(cls, binding: str, root: str = '.'):
+        """Opens the stand-in for a binding name under ``root/.worker_state/kv``."""
+        return cls(os.path.join(root, LOCAL_STATE_DIR, f"{binding}.sqlite3"))
+
+    async def get(self, key: str, type: str = 'text'):
+        """Returns the value (``str``, or parsed for ``type='json'``), or None if missing or expired."""
+        self.reads += 1
+        row = self._conn.execute("SELECT value, expiration FROM kv WHERE key = ?", (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] <= self._clock()):
+            return None
+        value = row[0]
+        if isinstance(value, bytes):
+            value = value.decode('utf-8')
+        return json.loads(value) if type == 'json' else value
+
+    async def put(self, key: str, value, expirationTtl: int = None):
+        self.writes += 1
+        expiration = self._clock() + expirationTtl if expirationTtl else None
+        self._conn.execute("INSERT OR REPLACE INTO kv (key, value, expiration) VALUES (?, ?, ?)",
+                           (key, value, expiration))
+        self._conn.commit()
+
+    async def delete(self, key: str):
+        self.writes += 1
+        self._conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+        self._conn.commit()
+
+    async def list(self, prefix: str = ''):
+        """Returns ``{'keys': [{'name': ...}, ...]}`` like the binding's ``list``."""
+        self.reads += 1
+        rows = self._conn.execute("SELECT key FROM kv WHERE key LIKE ? ESCAPE '\\' ORDER BY key",
+                                  (prefix.replace('%', r'\%').replace('_', r'\_') + '%',)).fetchall()
+        return {'keys': [{'name': row[0]} for row in rows], 'list_complete': True}
+
+    def close(self):
+        self._conn.close()
+
+
+def _pair_key(creator_name: str, tier_name: str) -> str:
+    # A JSON pair keeps keys unambiguous whatever characters the names contain.
+    return json.dumps([creator_name, tier_name])
+
+
+class KVAlertState:
+    """Dict-like alert state loaded from and saved to one KV key.
+
+    Keys are ``(creator_name, tier_name)`` tuples as in the alerter's state
+    stores. Call ``load`` once at the start of a run and ``save`` once at the
+    end.
+
+    Args:
+        namespace: A KV binding (or ``LocalKV``); None keeps state in memory only.
+        key (str): KV key holding the document.
+    """
+
+    def __init__(self, namespace, key: str = STATE_KEY):
+        self.namespace = namespace
+        self.key = key
+        self._alerted = {}
+        self.cursor = 0
+        self._saved_cursor = 0
+        self._dirty = False
+
+    async def load(self):
+        if self.namespace is None:
+            return self
+        raw = await self.namespace.get(self.key)
+        if raw:
+            try:
+                document = json.loads(raw)
+            except (TypeError, ValueError):
+                print(f"Warning: Alert state under '{self.key}' is not valid JSON; starting fresh.")
+                document = {}
+            if document.get('version') == STATE_VERSION:
+                self._alerted = {tuple(json.loads(pair)): True for pair in document.get('alerted', [])}
+                self.cursor = self._saved_cursor = document.get('cursor', 0)
+        return self
+
+    def get(self, key, default=None):
+        return self._alerted.get(key, default)
+
+    def __setitem__(self, key, value):
+        if not isinstance(key, tuple):
+            raise TypeError("alert state keys must be (creator_name, tier_name) tuples")
+        if value:
+            if key not in self._alerted:
+                self._alerted[key] = True
+                self._dirty = True
+        elif self._alerted.pop(key, None):
+            self._dirty = True
+
+    def __contains__(self, key):
+        return key in self._alerted
+
+    def __len__(self):
+        return len(self._alerted)
+
+    @property
+    def dirty(self) -> bool:
+        return self._dirty or self.cursor != self._saved_cursor
+
+    def to_json(self) -> str:
+        # Only alerted pairs are stored; anything absent counts as not alerted.
+        return json.dumps({
+            'version': STATE_VERSION,
+            'alerted': sorted(_pair_key(*pair) for pair in self._alerted),
+            'cursor': self.cursor,
+        }, separators=(',', ':'))
+
+    async def save(self) -> bool:
+        """Writes the document if anything changed. Returns True if a write was made."""
+        if self.namespace is None or not self.dirty:
+            return False
+        await self.namespace.put(self.key, self.to_json())
+        self._dirty = False
+        self._saved_cursor = self.cursor
+        return True
+
@@ -0,0 +1,336 @@
+"""Python entry points for running the Patreon Tier Alerter as a Cloudflare Worker.
+
+Python Workers run on Pyodide, which has no threads or raw sockets, so HTTP
+goes through the runtime's own ``fetch`` (``pyodide.http.pyfetch``) and
+fetches overlap as coroutines. Outside the runtime (local runs and tests)
+``urllib.request`` is used instead. Only the standard library is available,
+so the tier parser is kept self-contained instead of importing the
+requests-based alerter module.
+
+Which tiers have been alerted is kept in the ``PATREON_ALERT_CACHE`` KV
+namespace (see ``kv.KVAlertState``), read once and written at most once per
+run, so an open tier is texted once rather than on every cron trigger.
+"""
+import asyncio
+import json
+import urllib.request
+from html.parser import HTMLParser
+
+try:
+    from pyodide.http import pyfetch
+    from workers import Response
+except ImportError:  # not running in the Workers runtime
+    pyfetch = None
+    Response = None
+
+try:
+    from .kv import KVAlertState
+except ImportError:  # loaded as the Workers main module rather than as a package
+    from kv import KVAlertState
+
+# Workers allow six simultaneous open connections per invocation.
+MAX_CONCURRENT_FETCHES = 6
+# Subrequests (page fetches and SMS posts) allowed per invocation on the free plan.
+DEFAULT_MAX_SUBREQUESTS = 50
+# Subrequests kept back from page fetches so alerts found in a run can be sent.
+DEFAULT_SMS_RESERVE = 10
+CONFIG_BINDINGS = ('PATREON_CONFIG', 'KV_CONFIG')
+ALERT_CACHE_BINDING = 'PATREON_ALERT_CACHE'
+CHECKOUT_BUTTON_MARKER = b'data-tag="patron-checkout-continue-button"'
+
+
+class TierParser(HTMLParser):
+    """Extracts tiers from a Patreon membership page (mirrors the alerter's parser)."""
+
+    def __init__(self):
+        super().__init__()
+        self.tiers = []
+        self.current = None
+        self.in_btn_div = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'a' and attrs.get('data-tag') == 'patron-checkout-continue-button':
+            aria_label = attrs.get('aria-label', '')
+            if not aria_label:
+                return
+            tier_name = ' '.join(aria_label.split()[:-1])
+            disabled = attrs.get('aria-disabled') == 'true'
+            self.current = {'name': tier_name, 'disabled': disabled, 'button': ''}
+        elif self.current and tag == 'div' and attrs.get('class') == 'cm-oHFIQB':
+            self.in_btn_div = True
+
+    def handle_data(self, data):
+        if self.current and self.in_btn_div:
+            self.current['button'] += data.strip()
+
+    def handle_endtag(self, tag):
+        if tag == 'div' and self.in_btn_div:
+            self.in_btn_div = False
+        elif tag == 'a' and self.current:
+            text = self.current.get('button', '')
+            if self.current['disabled'] or text == 'Sold Out':
+                status = 'sold_out'
+            elif text == 'Join':
+                status = 'available'
+            else:
+                status = 'unknown'
+            if self.current['name']:
+                self.tiers.append({'name': self.current['name'], 'status': status})
+            self.current = None
+
+
+def checkout_fragments(body: bytes) -> str:
+    """Cuts the checkout anchors out of a page body.
+
+    Only these anchors matter to ``TierParser``, and finding them with a byte
+    search is far cheaper than running the HTML parser over the whole page,
+    which keeps a run inside the Workers CPU limit as creators are added.
+    """
+    fragments = []
+    pos = 0
+    while True:
+        marker = body.find(CHECKOUT_BUTTON_MARKER, pos)
+        if marker == -1:
+            break
+        start = body.rfind(b'<a', pos, marker)
+        end = body.find(b'</a>', marker)
+        if start == -1 or end == -1:
+            pos = marker + len(CHECKOUT_BUTTON_MARKER)
+            continue
+        end += len(b'</a>')
+        fragments.append(body[start:end])
+        pos = end
+    return b''.join(fragments).decode('utf-8', errors='replace')
+
+
+def _env_get(env, key, default=None):
+    """Reads a binding from either a dict (tests) or the Workers env object."""
+    if env is None:
+        return default
+    if isinstance(env, dict):
+        return env.get(key, default)
+    return getattr(env, key, default)
+
+
+async def _request(url: str, method: str = 'GET', headers: dict = None, body: bytes = None) -> bytes:
+    """Sends a request and returns the response body; raises on network errors and 4xx/5xx responses.
+
+    Uses the Workers runtime's ``fetch`` when available. The ``urllib``
+    fallback is for local runs and tests only; it runs in a thread, which
+    exists everywhere but Pyodide, so fetches still overlap.
+    """
+    if pyfetch is not None:
+        options = {'method': method, 'headers': headers or {}}
+        if body is not None:
+            options['body'] = body.decode()
+        response = await pyfetch(url, **options)
+        if not response.ok:
+            raise OSError(f"HTTP {response.status} from {url}")
+        return await response.bytes()
+    return await asyncio.to_thread(_urllib_request, url, method, headers, body)
+
+
+def _urllib_request(url: str, method: str, headers: dict, body: bytes) -> bytes:
+    req = urllib.request.Request(url, data=body, headers=headers or {}, method=method)
+    with urllib.request.urlopen(req, timeout=10) as resp:
+        return resp.read()
+
+
+async def _http_get(url: str, user_agent: str) -> bytes:
+    return await _request(url, headers={'User-Agent': user_agent})
+
+
+async def _http_post_json(url: str, payload: dict) -> bytes:
+    return await _request(url, 'POST', {'Content-Type': 'application/json'}, json.dumps(payload).encode())
+
+
+async def scrape_patreon_page_async(creator_url: str, user_agent: str):
+    """Fetches and parses a creator page without blocking the event loop.
+
+    Returns:
+        list: Tier dicts (``{'name': ..., 'status': ...}``), or None on error.
+    """
+    try:
+        body = await _http_get(creator_url, user_agent)
+    except Exception as e:
+        print(f"Error fetching URL {creator_url}: {e}")
+        return None
+
+    parser = TierParser()
+    try:
+        parser.feed(checkout_fragments(body))
+    except Exception as e:
+        print(f"Error parsing HTML from {creator_url}: {e}")
+        return None
+    return parser.tiers
+
+
+def check_tiers(scraped_tiers: list, creator_config: dict, alert_state=None) -> list:
+    """Returns alerts for watched tiers that are currently available.
+
+    Args:
+        alert_state (KVAlertState or dict, optional): Tiers already alerted
+            are skipped, and a tier no longer available or no longer listed
+            is reset so it alerts again when it reopens. Tiers are not marked here; the
+            caller marks them once their SMS has been sent.
+    """
+    scraped_tiers_map = {tier.get('name', '').lower(): tier for tier in scraped_tiers}
+    alerts = []
+    for tier_to_watch_name in creator_config.get('tiers_to_watch', []):
+        found = scraped_tiers_map.get(tier_to_watch_name.lower())
+        key = (creator_config['name'], tier_to_watch_name)
+        if not found:
+            if alert_state is not None and alert_state.get(key):
+                alert_state[key] = False
+            continue
+        if found.get('status') != 'available':
+            if alert_state is not None and alert_state.get(key):
+                alert_state[key] = False
+        elif alert_state is None or not alert_state.get(key):
+            alerts.append({
+                'creator_name': creator_config['name'],
+                'tier_name': tier_to_watch_name,
+                'url': creator_config['url'],
+            })
+    return alerts
+
+
+async def send_sms_alerts_async(alerts: list, env) -> list:
+    """Posts one SMS request per alert to the HTTP SMS API configured in ``env``.
+
+    Returns:
+        list: The alerts whose request succeeded.
+    """
+    api_url = _env_get(env, 'SMS_API_URL')
+    token = _env_get(env, 'SMS_API_TOKEN')
+    recipient = _env_get(env, 'RECIPIENT_PHONE_NUMBER')
+    if not alerts:
+        return []
+    if not all([api_url, token, recipient]):
+        print("Warning: SMS_API_URL, SMS_API_TOKEN or RECIPIENT_PHONE_NUMBER is not set. Cannot send SMS.")
+        return []
+
+    async def send(alert):
+        message = (
+            f"Patreon Alert: Tier '{alert['tier_name']}' for creator '{alert['creator_name']}' "
+            f"is now available! Check at: {alert['url']}"
+        )
+        if len(message) > 320:
+            message = message[:317] + "..."
+        payload = {'to': recipient, 'token': token, 'message': message}
+        try:
+            await _http_post_json(api_url, payload)
+        except Exception as e:
+            print(f"Error sending SMS for tier '{alert['tier_name']}': {e}")
+            return False
+        return True
+
+    sent = await asyncio.gather(*(send(alert) for alert in alerts))
+    return [alert for alert, ok in zip(alerts, sent) if ok]
+
+
+async def _load_config(env):
+    """Reads the config from ``CONFIG_JSON``, else from the ``config`` key of a config KV namespace."""
+    raw = _env_get(env, 'CONFIG_JSON')
+    source = 'CONFIG_JSON'
+    if not raw:
+        for binding in CONFIG_BINDINGS:
+            namespace = _env_get(env, binding)
+            if namespace is not None:
+                raw = await namespace.get('config')
+                source = f"{binding} key 'config'"
+                break
+    if not raw:
+        return None
+    try:
+        return json.loads(raw)
+    except json.JSONDecodeError:
+        print(f"Error: {source} is not valid JSON")
+        return None
+
+
+def _pages_for_run(creators: list, budget: int, cursor: int) -> tuple:
+    """Groups creators by URL and picks the pages to fetch this run.
+
+    When there are more pages than ``budget``, a window of ``budget`` pages
+    starting at ``cursor`` is taken (wrapping around), so successive runs
+    rotate through every creator.
+
+    Returns:
+        tuple: (list of (url, [creator_config, ...]) pairs, next cursor).
+    """
+    pages = {}
+    for creator_config in creators:
+        if creator_config.get('url'):
+            pages.setdefault(creator_config['url'], []).append(creator_config)
+    pages = list(pages.items())
+    if len(pages) <= budget:
+        return pages, 0
+    cursor %= len(pages)
+    window = (pages + pages)[cursor:cursor + budget]
+    return window, (cursor + budget) % len(pages)
+
+
+async def run_check(env) -> list:
+    """Runs one check of the configured creators and sends SMS for new alerts.
+
+    Alert state is loaded with one KV read before the pages are fetched and
+    saved with at most one KV write afterwards. Page fetches are capped at
+    ``worker_max_subrequests`` minus ``worker_sms_reserve`` per run; with more
+    pages than that, each run checks the next slice.
+
+    Returns:
+        list: Alerts found this run (sent or not).
+    """
+    config = await _load_config(env)
+    if config is None:
+        return []
+
+    namespace = _env_get(env, ALERT_CACHE_BINDING)
+    if namespace is None:
+        print(f"Warning: No {ALERT_CACHE_BINDING} KV binding; every open tier will alert on every run.")
+    state = await KVAlertState(namespace).load()
+
+    max_subrequests = config.get('worker_max_subrequests', DEFAULT_MAX_SUBREQUESTS)
+    sms_reserve = min(config.get('worker_sms_reserve', DEFAULT_SMS_RESERVE), max_subrequests - 1)
+    pages, state.cursor = _pages_for_run(config.get('creators', []), max_subrequests - sms_reserve, state.cursor)
+
+    user_agent = config.get('user_agent', 'Patreon Tier Alerter Bot/1.0')
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_FETCHES)
+
+    async def check(url, creator_configs):
+        async with semaphore:
+            tiers = await scrape_patreon_page_async(url, user_agent)
+        if tiers is None:
+            return []
+        return [alert for creator_config in creator_configs for alert in check_tiers(tiers, creator_config, state)]
+
+    results = await asyncio.gather(*(check(url, creator_configs) for url, creator_configs in pages))
+    alerts = [alert for page_alerts in results for alert in page_alerts]
+
+    # Alerts over the remaining budget stay unmarked and are sent on a later run.
+    sms_budget = max_subrequests - len(pages)
+    for alert in await send_sms_alerts_async(alerts[:sms_budget], env):
+        state[(alert['creator_name'], alert['tier_name'])] = True
+    await state.save()
+    return alerts
+
+
+async def fetch_alerts(env) -> dict:
+    """Runs one check over the configured creators and returns ``{'alerts': [...]}``.
+
+    Creator pages are fetched concurrently, capped at MAX_CONCURRENT_FETCHES.
+    """
+    return {'alerts': await run_check(env)}
+
+
+async def on_fetch(request, env, ctx):
+    """HTTP entry point: ``fetch_alerts`` as a JSON ``Response`` (the plain dict outside the runtime)."""
+    result = await fetch_alerts(env)
+    return Response.json(result) if Response is not None else result
+
+
+async def on_scheduled(event, env, ctx):
+    """Cron trigger entry point (see ``[triggers]`` in ``wrangler.toml``)."""
+    await run_check(env)
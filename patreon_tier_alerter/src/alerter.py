@@ -1,11 +1,34 @@
+import argparse
+import asyncio
+import functools
 import json
+import logging
+import multiprocessing
 import requests
-from html.parser import HTMLParser
+import sys
 import time
-import boto3
-from twilio.rest import Client
 import os
 
+from .archive import PageArchive
+from .bus import AlertBus
+from .dispatch import SendResult, describe_alert
+from .egress import EgressPool, EgressSession
+from .engine import FetchEngine
+from .health import FetchHealth, parse_retry_after
+from .history import STATUSES, HistoryLog, HistoryReader
+from .metrics import REGISTRY, start_metrics_server
+from .parse_pool import ParsePool
+from .plan import ConfigError, ConfigWatcher, ConfigPlan, PagePlan, compile_config
+from .predictor import RestockPredictor
+from .records import APPEARED, CLOSED, DISAPPEARED, OPENED, TierDiff
+from .scheduler import AdaptiveScheduler
+from .session import NOT_MODIFIED, HttpSession, get_session
+from .sharding import ShardCoordinator, default_worker_id
+from .slots import SlotTracker
+from .state import AlertStateStore, open_state_store
+from .subscriptions import AlertRouter
+from .tier_parser import StreamingTierParser, TierRegionCache, region_tiers
+
 # --- HTML Structure Assumptions (to be filled/verified by inspection) ---
 # Tier container selector: e.g., 'div[data-testid="tier-card"]' (This is a guess, common pattern for cards)
 # Tier name selector within container: e.g., 'h2[data-testid="tier-title"], h3[data-testid="tier-title"]' (Guessing h2 or h3 for titles)
@@ -16,75 +39,285 @@ import os
 #   - Class for disabled/sold out: e.g., 'button[disabled], .sold-out-class' (Common patterns for disabled elements)
 # -------------------------------------------------------------------------
 
-alerted_tiers_cache = {} # Global cache for alerted tiers
+tier_region_cache = TierRegionCache() # Last tier-region digest and tiers per page
+slot_tracker = SlotTracker() # Last remaining-slot count per watched tier; configured from slot_alerts
+tier_history = None # HistoryLog opened by run_worker when history_path is configured
+page_archive = None # PageArchive opened by run_worker when archive_path is configured
+alert_bus = None # AlertBus started by run_worker when alert_bus is configured
+parse_pool = None # ParsePool started by run_worker when parse_pool is configured
+fetch_health = FetchHealth() # Circuit breakers and fetch latencies per page and host; configured from fetch_health
+restock_predictor = RestockPredictor() # Restock windows learned per page; configured from restock_prediction
+
+STREAM_CHUNK_SIZE = 16384
+# After stopping early, read and discard up to this much of the rest of a
+# response so its keep-alive connection can be reused.
+DRAIN_LIMIT_BYTES = 262144
+
+log = logging.getLogger(__name__)
+
+tier_diff = TierDiff(log) # Watched statuses per creator entry as of its previous check
+
+FETCH_SECONDS = REGISTRY.histogram(
+    'patreon_fetch_seconds', 'Time to fetch and parse a membership page, by result.', ('result',))
+FETCH_BYTES = REGISTRY.counter('patreon_fetch_bytes_total', 'Response body bytes downloaded.')
+PARSE_SECONDS = REGISTRY.histogram(
+    'patreon_parse_seconds', 'Time spent feeding and parsing a page, excluding network reads.',
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1))
+REGION_CACHE = REGISTRY.counter(
+    'patreon_tier_region_cache_total', 'Tier region cache lookups, by result.', ('result',))
+ALERTS = REGISTRY.counter('patreon_alerts_total', 'Tiers that became available and were alerted.')
+SMS_MESSAGES = REGISTRY.counter('patreon_sms_messages_total', 'SMS messages by provider and result.',
+                                ('provider', 'result'))
+PROVIDER_ERRORS = REGISTRY.counter('patreon_sms_provider_errors_total', 'Failed SMS send attempts by provider.',
+                                   ('provider',))
+CYCLE_SECONDS = REGISTRY.histogram(
+    'patreon_cycle_seconds', 'Wall time of a check cycle.', buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300))
+ALERT_STATE_SIZE = REGISTRY.gauge('patreon_alert_state_entries', 'Tiers remembered in the alert state store.')
+EXTRACTIONS = REGISTRY.counter('patreon_tier_extraction_total', 'Pages parsed, by where the tiers were read from.',
+                               ('source',))
+DISAGREEMENTS = REGISTRY.counter('patreon_tier_extraction_disagreements_total',
+                                 'Pages where the embedded JSON and the HTML disagreed about a watched tier.')
+SLOT_EVENTS = REGISTRY.counter('patreon_slot_events_total', 'Remaining-slot alerts, by event.', ('event',))
+FETCHES_SKIPPED = REGISTRY.counter('patreon_fetches_skipped_total',
+                                   'Page checks skipped because the page or its host was backing off, '
+                                   'or every egress was cooling down.')
+HEDGED_FETCHES = REGISTRY.counter('patreon_hedged_fetches_total',
+                                  'Second requests sent for slow high-priority pages, by which response was used.',
+                                  ('winner',))
+TRANSITIONS = REGISTRY.counter('patreon_tier_transitions_total',
+                               'Tier status changes seen between checks of a page, by kind.', ('kind',))
+OPEN_BREAKERS = REGISTRY.gauge('patreon_open_circuit_breakers', 'Pages and hosts currently backing off.')
+PREWARMS = REGISTRY.counter('patreon_connection_prewarms_total',
+                            'Connections opened ahead of a predicted restock window, by result.', ('result',))
+
+# Children for the fixed label values recorded on every page.
+_FETCH_OK = FETCH_SECONDS.labels('ok')
+_FETCH_UNCHANGED = FETCH_SECONDS.labels('unchanged')
+_FETCH_NOT_MODIFIED = FETCH_SECONDS.labels('not_modified')
+_FETCH_ERROR = FETCH_SECONDS.labels('error')
+_REGION_HIT = REGION_CACHE.labels('hit')
+_REGION_MISS = REGION_CACHE.labels('miss')
+_TRANSITIONS = {kind: TRANSITIONS.labels(kind) for kind in (OPENED, CLOSED, DISAPPEARED, APPEARED)}
 
-def scrape_patreon_page(creator_url: str, user_agent: str):
+
+def scrape_patreon_page(creator_url: str, user_agent: str, conditional: bool = False, tiers_to_watch: list = None,
+                        embedded_json: bool = False, self_check: bool = True, timeout: float = 10,
+                        session: HttpSession = None):
     """Fetches a Patreon creator's page, parses it, and extracts tier information.
 
     Args:
         creator_url (str): The URL of the Patreon creator's page.
         user_agent (str): The User-Agent string for the request.
+        conditional (bool, optional): Send the ETag/Last-Modified validators of
+            the last successfully parsed response for this URL. Defaults to False.
+        tiers_to_watch (list, optional): Tier names the caller cares about. When
+            given, reading stops once all of them have been found, so tiers
+            listed after them on the page are not returned.
+        embedded_json (bool, optional): Read tiers, with their ``remaining``
+            slot counts, from the page's bootstrap JSON, falling back to the
+            checkout buttons if the page has none. Defaults to False.
+        self_check (bool, optional): With ``embedded_json``, also parse the
+            checkout buttons and log a warning if they disagree with the JSON.
+        timeout (float, optional): Seconds to wait for the server to respond
+            or send more data. Defaults to 10.
+        session (HttpSession, optional): Session to fetch through; defaults
+            to the shared one. ``archive.replay`` passes one that answers
+            from an archive.
 
     Returns:
         list: A list of dictionaries, where each dictionary represents a tier
               (e.g., {'name': 'Tier Name', 'status': 'available'}).
               Returns None if a network error occurs or the page cannot be parsed.
               Returns an empty list if no tiers are found.
+              Returns NOT_MODIFIED if ``conditional`` is set and either the
+              server answered 304 or the tier region of the page hashes the
+              same as last time, in which case nothing was parsed. Without
+              ``conditional`` an unchanged region returns the cached tiers.
+
+    With ``parse_pool`` set, large tier regions are parsed in its worker
+    processes rather than in the calling thread.
+
+    Every fetch outcome is recorded in ``fetch_health``, including the
+    ``Retry-After`` of a 429 or 503 response (a 429 through an egress pool
+    only cools down the egress that got it), and every response received is
+    appended to ``page_archive`` when one is open.
     """
     headers = {'User-Agent': user_agent}
+    session = session or get_session()
+    archive = page_archive
+    started = time.perf_counter()
     try:
-        response = requests.get(creator_url, headers=headers, timeout=10)
+        response = session.get(creator_url, headers=headers, timeout=timeout, conditional=conditional, stream=True)
+        if conditional and response.status_code == 304:
+            response.close()
+            if archive is not None:
+                archive.record(creator_url, response)
+            elapsed = time.perf_counter() - started
+            _FETCH_NOT_MODIFIED.observe(elapsed)
+            fetch_health.record_success(creator_url, elapsed)
+            return NOT_MODIFIED
         response.raise_for_status()  # Raises an HTTPError for bad responses (4XX or 5XX)
     except requests.exceptions.RequestException as e:
-        print(f"Error fetching URL {creator_url}: {e}")
+        _FETCH_ERROR.observe(time.perf_counter() - started)
+        failed = getattr(e, 'response', None)
+        if failed is not None:
+            if archive is not None:
+                archive.record(creator_url, failed)
+            # A 429 through an egress cools down that egress; the others may still fetch the page.
+            if failed.status_code != 429 or not isinstance(session, EgressSession):
+                fetch_health.record_failure(creator_url, failed.status_code,
+                                            parse_retry_after(failed.headers.get('Retry-After')))
+        else:
+            fetch_health.record_failure(creator_url)
+        log.warning("Error fetching URL %s: %s", creator_url, e)
         return None
 
-    class TierParser(HTMLParser):
-        def __init__(self):
-            super().__init__()
-            self.tiers = []
-            self.current = None
-            self.in_btn_div = False
-
-        def handle_starttag(self, tag, attrs):
-            attrs = dict(attrs)
-            if tag == 'a' and attrs.get('data-tag') == 'patron-checkout-continue-button':
-                aria_label = attrs.get('aria-label', '')
-                if not aria_label:
-                    return
-                tier_name = ' '.join(aria_label.split()[:-1])
-                disabled = attrs.get('aria-disabled') == 'true'
-                self.current = {'name': tier_name, 'disabled': disabled, 'button': ''}
-            elif self.current and tag == 'div' and attrs.get('class') == 'cm-oHFIQB':
-                self.in_btn_div = True
-
-        def handle_data(self, data):
-            if self.current and self.in_btn_div:
-                self.current['button'] += data.strip()
-
-        def handle_endtag(self, tag):
-            if tag == 'div' and self.in_btn_div:
-                self.in_btn_div = False
-            elif tag == 'a' and self.current:
-                text = self.current.get('button', '')
-                if self.current['disabled'] or text == 'Sold Out':
-                    status = 'sold_out'
-                elif text == 'Join':
-                    status = 'available'
-                else:
-                    status = 'unknown'
-                if self.current['name']:
-                    self.tiers.append({'name': self.current['name'], 'status': status})
-                self.current = None
-
-    parser = TierParser()
+    parser = StreamingTierParser(tiers_to_watch, encoding=response.encoding, embedded_json=embedded_json,
+                                 self_check=self_check)
+    received = 0
+    parse_seconds = 0.0
+    body = [] if archive is not None else None
+    complete = False
     try:
-        parser.feed(response.text)
+        # Stop reading as soon as every watched tier has a status; the rest of
+        # the page is scripts and markup we would only throw away.
+        chunks = response.iter_content(chunk_size=STREAM_CHUNK_SIZE)
+        for chunk in chunks:
+            received += len(chunk)
+            if body is not None:
+                body.append(chunk)
+            parse_started = time.perf_counter()
+            done = parser.feed(chunk)
+            parse_seconds += time.perf_counter() - parse_started
+            if done:
+                break
+        else:
+            complete = True
+        if body is not None and not complete and archive.full_pages:
+            for chunk in chunks:
+                received += len(chunk)
+                body.append(chunk)
+            complete = True
+        if not complete:
+            received += _drain(response, chunks)
+        region_key = (creator_url, tuple(sorted(name.lower() for name in tiers_to_watch or ())))
+        pool = parse_pool if parse_pool is not None and parse_pool.accepts(parser) else None
+        parsed = None
+        if pool is not None and parser.has_embedded_json:
+            # The digest covers the tiers read from the JSON, so it comes from the worker.
+            parsed = pool.parse(parser.region())
+            digest = parsed[0]
+        else:
+            digest = parser.digest()
+        cached_tiers = tier_region_cache.lookup(region_key, digest)
+        if cached_tiers is not None:
+            _REGION_HIT.inc()
+            PARSE_SECONDS.observe(parse_seconds + (parsed[4] if parsed is not None else 0))
+            elapsed = time.perf_counter() - started
+            _FETCH_UNCHANGED.observe(elapsed)
+            fetch_health.record_success(creator_url, elapsed)
+            if conditional:
+                session.remember(creator_url, response)
+                return NOT_MODIFIED
+            return cached_tiers
+        _REGION_MISS.inc()
+        if pool is not None and parsed is None:
+            parsed = pool.parse(parser.region())
+        if parsed is not None:
+            _, source, parsed_tiers, disagreements, seconds = parsed
+            tiers = region_tiers(parsed_tiers)
+            PARSE_SECONDS.observe(parse_seconds + seconds)
+        else:
+            parse_started = time.perf_counter()
+            tiers = parser.close()
+            PARSE_SECONDS.observe(parse_seconds + time.perf_counter() - parse_started)
+            source, disagreements = parser.source, parser.disagreements
+        EXTRACTIONS.labels(source).inc()
+        if disagreements:
+            DISAGREEMENTS.inc()
+            log.warning("Embedded JSON and page HTML disagree for %s: %s", creator_url, ', '.join(
+                f"'{name}' JSON={from_json} HTML={from_html}" for name, from_json, from_html in disagreements))
+        tier_region_cache.store(region_key, digest, tiers)
+    except requests.exceptions.RequestException as e:
+        _FETCH_ERROR.observe(time.perf_counter() - started)
+        fetch_health.record_failure(creator_url)
+        log.warning("Error reading response from %s: %s", creator_url, e)
+        session.forget(creator_url)
+        return None
     except Exception as e:  # Broad exception for parsing issues
-        print(f"Error parsing HTML from {creator_url}: {e}")
+        _FETCH_ERROR.observe(time.perf_counter() - started)
+        log.warning("Error parsing HTML from %s: %s", creator_url, e)
+        session.forget(creator_url)
         return None
+    finally:
+        FETCH_BYTES.inc(received)
+        response.close()
+        if body is not None:
+            archive.record(creator_url, response, b''.join(body), complete)
+
+    elapsed = time.perf_counter() - started
+    _FETCH_OK.observe(elapsed)
+    fetch_health.record_success(creator_url, elapsed)
+    if conditional:
+        session.remember(creator_url, response)
+    return tiers
 
-    return parser.tiers
+
+def _drain(response, chunks) -> int:
+    """Reads and discards the rest of a response that was stopped early, if it is short.
+
+    A response not read to the end cannot go back to the connection pool,
+    so the next request to the host would need a new connection (and TLS
+    handshake). More than ``DRAIN_LIMIT_BYTES`` left, by ``Content-Length``
+    or as read, is abandoned instead.
+
+    Returns:
+        int: Bytes read.
+    """
+    try:
+        left = int(response.headers['Content-Length']) - response.raw.tell()
+    except (KeyError, ValueError, TypeError, AttributeError):
+        left = None
+    if left is not None and left > DRAIN_LIMIT_BYTES:
+        return 0
+    drained = 0
+    for chunk in chunks:
+        drained += len(chunk)
+        if drained > DRAIN_LIMIT_BYTES:
+            break
+    return drained
+
+
+def prewarm_page(creator_url: str, user_agent: str, session: HttpSession = None) -> bool:
+    """Opens a connection to a page's host ahead of a predicted restock window.
+
+    Returns:
+        bool: True if the host answered.
+    """
+    warmed = (session or get_session()).prewarm(creator_url, headers={'User-Agent': user_agent})
+    PREWARMS.labels('ok' if warmed else 'error').inc()
+    return warmed
+
+
+async def scrape_patreon_page_async(creator_url: str, user_agent: str, engine: FetchEngine = None,
+                                    tiers_to_watch: list = None):
+    """Asynchronous variant of scrape_patreon_page.
+
+    Args:
+        creator_url (str): The URL of the Patreon creator's page.
+        user_agent (str): The User-Agent string for the request.
+        engine (FetchEngine, optional): Engine enforcing concurrency and rate
+            limits. Without one the page is fetched immediately in a thread.
+        tiers_to_watch (list, optional): Passed through to scrape_patreon_page.
+
+    Returns:
+        list: Same contract as scrape_patreon_page. NOT_MODIFIED may also be
+        returned if the engine's fetch function makes conditional requests.
+    """
+    if engine is None:
+        return await asyncio.to_thread(scrape_patreon_page, creator_url, user_agent,
+                                       tiers_to_watch=tiers_to_watch)
+    return await engine.fetch(creator_url, user_agent, tiers_to_watch=tiers_to_watch)
 
 
 def check_tiers(scraped_tiers: list, creator_config: dict, alerted_tiers_cache: dict) -> list:
@@ -93,303 +326,727 @@ def check_tiers(scraped_tiers: list, creator_config: dict, alerted_tiers_cache:
     Args:
         scraped_tiers (list): List of tier dicts from scrape_patreon_page.
         creator_config (dict): Configuration for a single creator.
-        alerted_tiers_cache (dict): Global cache for tracking alerted tiers.
+        alerted_tiers_cache (AlertStateStore or dict): Alert state keyed by
+            ``(creator_name, tier_name)`` tuples; updated in place.
 
     Returns:
         list: A list of newly available tiers that require alerting.
     """
-    newly_available_alerts = []
-    creator_name = creator_config['name']
-    tiers_to_watch = creator_config.get('tiers_to_watch', []) # Ensure it's a list
+    page = PagePlan.from_creators(creator_config.get('url'), [creator_config])
+    return check_page(scraped_tiers, page, alerted_tiers_cache)
 
-    # Normalize scraped tier names for easier lookup (optional, but good for robustness)
-    # And create a quick lookup map
-    scraped_tiers_map = {tier.get('name', '').lower(): tier for tier in scraped_tiers}
 
-    for tier_to_watch_name in tiers_to_watch:
-        cache_key = f"{creator_name}_{tier_to_watch_name}"
-        
-        # Search for the tier_to_watch_name in scraped_tiers (case-insensitive)
-        found_tier_info = scraped_tiers_map.get(tier_to_watch_name.lower())
-
-        if found_tier_info:
-            # Tier is found, check its status
-            # Assuming 'available' is the status for an open tier.
-            # This needs to be consistent with scrape_patreon_page's output.
-            is_available = found_tier_info.get('status') == 'available'
-
-            if is_available:
-                if not alerted_tiers_cache.get(cache_key): # If not alerted before (or was False)
-                    newly_available_alerts.append({
-                        'creator_name': creator_name,
-                        'tier_name': tier_to_watch_name, # Use original casing for alert
-                        'url': creator_config['url']
-                    })
-                    alerted_tiers_cache[cache_key] = True
-                    print(f"DEBUG: Tier '{tier_to_watch_name}' for {creator_name} is AVAILABLE. Added to alerts. Cache: {alerted_tiers_cache}")
-                else:
-                    print(f"DEBUG: Tier '{tier_to_watch_name}' for {creator_name} is available but already alerted. Cache: {alerted_tiers_cache}")
-            else: # Tier found but not available
-                if alerted_tiers_cache.get(cache_key): # Was previously alerted
-                    print(f"DEBUG: Tier '{tier_to_watch_name}' for {creator_name} is NO LONGER available. Resetting cache. Cache before: {alerted_tiers_cache}")
-                    alerted_tiers_cache[cache_key] = False
-                else:
-                    print(f"DEBUG: Tier '{tier_to_watch_name}' for {creator_name} is not available and was not alerted. Cache: {alerted_tiers_cache}")
-        else:
-            # Tier to watch is not found in scraped tiers
-            if alerted_tiers_cache.get(cache_key): # Was previously alerted (and thus available)
-                print(f"DEBUG: Tier '{tier_to_watch_name}' for {creator_name} was NOT FOUND (previously available). Resetting cache. Cache before: {alerted_tiers_cache}")
-                alerted_tiers_cache[cache_key] = False
-            else:
-                print(f"DEBUG: Tier '{tier_to_watch_name}' for {creator_name} was not found and not alerted. Cache: {alerted_tiers_cache}")
-                
+def check_page(scraped_tiers: list, page: PagePlan, alerted_tiers_cache: dict, slots: SlotTracker = None,
+               history: HistoryLog = None) -> list:
+    """Like check_tiers, for every creator entry watching a compiled page.
+
+    Each creator entry's watched statuses are compared with its previous
+    check by ``tier_diff``; see ``records`` for when the alert state is
+    consulted.
+
+    Args:
+        slots (SlotTracker, optional): Also returns its remaining-slot alerts
+            (marked with an ``event`` key) for tiers that carry counts.
+        history (HistoryLog, optional): Records the status of every watched
+            tier; tiers missing from the page are recorded as ``missing``.
+    """
+    newly_available_alerts = []
+    transitions = tier_diff.check_page(page, scraped_tiers, alerted_tiers_cache, newly_available_alerts)
+    for transition in transitions:
+        _TRANSITIONS[transition.kind].inc()
+        log.debug("Tier '%s' for %s %s.", transition.tier_name, transition.creator_name, transition.kind)
+    if slots is None and history is None:
+        return newly_available_alerts
+    # Normalize scraped tier names for easier lookup
+    scraped_tiers_map = {tier.get('name', '').lower(): tier for tier in scraped_tiers}
+    now = time.time()
+    for watch, statuses in zip(page.creators, tier_diff.statuses(page)):
+        if slots is not None:
+            newly_available_alerts.extend(slots.observe(watch, scraped_tiers_map))
+        if history is not None:
+            for (tier_name, _), status in zip(watch.watched, statuses):
+                history.observe(watch.name, tier_name, STATUSES[status], now)
     return newly_available_alerts
 
 
-def send_alerts(alerts_to_send: list, sms_config: dict = None):
-    """Prints alert messages to the console and sends SMS if configured.
+# Routers built for the sms_settings passed to send_alerts directly, keyed by
+# their JSON, so provider clients and the send thread pool are created once.
+_routers = {}
+
+
+def _router_for(sms_config: dict) -> AlertRouter:
+    key = json.dumps(sms_config, sort_keys=True)
+    router = _routers.get(key)
+    if router is None:
+        router = AlertRouter.from_config({'sms_settings': sms_config}, creators=[])
+        if router.channels:
+            _routers[key] = router
+    return router
+
+
+def _report_send_result(result: SendResult):
+    tiers = ', '.join(f"'{alert['tier_name']}'" for alert in result.alerts)
+    label = f"tier {tiers}" if len(result.alerts) == 1 else f"tiers {tiers}"
+    if result.ok:
+        print(f"SMS sent for {label} to {result.channel.recipient}! {result.detail}")
+    else:
+        print(f"Error sending SMS for {label} to {result.channel.recipient} after {result.attempts} attempt(s): {result.detail}")
+
+
+def _print_alerts(alerts: list):
+    print("\n--- !!! NEW TIER ALERTS !!! ---")
+    for alert in alerts:
+        print(f"ALERT: Tier \"{alert['tier_name']}\" for creator \"{alert['creator_name']}\" {describe_alert(alert)}! Check at: {alert['url']}")
+    print("--- !!! END OF ALERTS !!! ---")
+
+
+def send_alerts(alerts_to_send: list, sms_config: dict = None, router: AlertRouter = None):
+    """Prints alert messages to the console and sends SMS to subscribed recipients.
+
+    Each alert goes to the channels its (creator, tier) is subscribed to.
+    Messages are sent concurrently with retries, and with ``merge_alerts`` the
+    alerts for one recipient are packed into as few messages as fit.
 
     Args:
         alerts_to_send (list): A list of alert dictionaries.
-        sms_config (dict, optional): Configuration for SMS sending. Defaults to None.
+        sms_config (dict, optional): Legacy single-provider SMS settings, used
+            when no router is given. Defaults to None.
+        router (AlertRouter, optional): Subscription router built at config load.
     """
     if not alerts_to_send:
         print("No new tier availabilities to report.")
         return
 
-    # Print to console
-    print("\n--- !!! NEW TIER ALERTS !!! ---")
-    for alert in alerts_to_send:
-        print(f"ALERT: Tier \"{alert['tier_name']}\" for creator \"{alert['creator_name']}\" is now available! Check at: {alert['url']}")
-    print("--- !!! END OF ALERTS !!! ---")
+    _print_alerts(alerts_to_send)
 
-    # Send SMS if configured
-    if sms_config and sms_config.get("provider") == "aws_sns":
-        print("\n--- Attempting to send SMS alerts via AWS SNS ---")
-        aws_access_key_id = sms_config.get("aws_access_key_id")
-        aws_secret_access_key = sms_config.get("aws_secret_access_key")
-        aws_region = sms_config.get("aws_region")
-        recipient_phone_number = sms_config.get("recipient_phone_number")
-
-        placeholders_present = any([
-            aws_access_key_id == "YOUR_AWS_ACCESS_KEY_ID",
-            aws_secret_access_key == "YOUR_AWS_SECRET_ACCESS_KEY",
-            aws_region == "YOUR_AWS_REGION",
-            recipient_phone_number == "YOUR_RECIPIENT_PHONE_NUMBER",
-        ])
-
-        if not all([aws_access_key_id, aws_secret_access_key, aws_region, recipient_phone_number]) or placeholders_present:
-            if not all([aws_access_key_id, aws_secret_access_key, aws_region, recipient_phone_number]):
-                print("Warning: SMS configuration for AWS SNS is incomplete. Missing one or more of: Access Key ID, Secret Access Key, Region, or Recipient Phone Number. Cannot send SMS.")
-            if placeholders_present:
-                print("Warning: SMS configuration contains placeholder values. Please update your config.json.")
+    if router is None:
+        if not sms_config:
+            print("SMS configuration not provided. Skipping SMS alerts.")
             return
+        router = _router_for(sms_config)
+    if not router.channels:
+        return
 
-        try:
-            sns_client = boto3.client(
-                "sns",
-                aws_access_key_id=aws_access_key_id,
-                aws_secret_access_key=aws_secret_access_key,
-                region_name=aws_region
-            )
-        except Exception as e:
-            print(f"Error initializing AWS SNS client: {e}")
-            return
+    routed = router.route_all(alerts_to_send)
+    if not routed:
+        print("No SMS subscriptions match these alerts.")
+        return
 
-        for alert in alerts_to_send:
-            message = f"Patreon Alert: Tier '{alert['tier_name']}' for creator '{alert['creator_name']}' is now available! Check at: {alert['url']}"
-            # Truncate message if it's too long for SNS (max 1600 chars, but SMS itself is shorter)
-            # Standard GSM-7 SMS is 160 chars, UTF-8 is 70 chars.
-            # Let's aim for a reasonable limit, e.g. 320 chars (2 SMS segments)
-            if len(message) > 320: 
-                message = message[:317] + "..."
+    print(f"\n--- Attempting to send SMS alerts via {', '.join(router.provider_labels)} ---")
+    for result in router.dispatcher.dispatch(routed):
+        _report_send_result(result)
+        provider = result.channel.provider
+        SMS_MESSAGES.labels(provider, 'sent' if result.ok else 'failed').inc()
+        failed_attempts = result.attempts - (1 if result.ok else 0)
+        if failed_attempts:
+            PROVIDER_ERRORS.labels(provider).inc(failed_attempts)
+    print("--- SMS Sending Process Complete ---")
 
-            try:
-                response = sns_client.publish(
-                    PhoneNumber=recipient_phone_number,
-                    Message=message,
-                    MessageAttributes={
-                        'AWS.SNS.SMS.SMSType': {
-                            'DataType': 'String',
-                            'StringValue': 'Transactional'
-                        }
-                    }
-                )
-                print(f"SMS sent for tier '{alert['tier_name']}' to {recipient_phone_number}! Message ID: {response.get('MessageId')}")
-            except Exception as e:
-                print(f"Error sending SMS for tier '{alert['tier_name']}': {e}")
-        print("--- SMS Sending Process Complete ---")
-    elif sms_config and sms_config.get("provider") == "twilio":
-        print("\n--- Attempting to send SMS alerts via Twilio ---")
-        account_sid = sms_config.get("twilio_account_sid")
-        auth_token = sms_config.get("twilio_auth_token")
-        from_number = sms_config.get("twilio_from_number")
-        recipient_phone_number = sms_config.get("recipient_phone_number")
-
-        placeholders_present = any([
-            account_sid == "YOUR_TWILIO_ACCOUNT_SID",
-            auth_token == "YOUR_TWILIO_AUTH_TOKEN",
-            from_number == "YOUR_TWILIO_PHONE_NUMBER (e.g., +15551234567)",
-            recipient_phone_number == "YOUR_RECIPIENT_PHONE_NUMBER (e.g., +11234567890)",
-        ])
-
-        if not all([account_sid, auth_token, from_number, recipient_phone_number]) or placeholders_present:
-            if not all([account_sid, auth_token, from_number, recipient_phone_number]):
-                print("Warning: SMS configuration for Twilio is incomplete. Missing one or more required fields.")
-            if placeholders_present:
-                print("Warning: SMS configuration contains placeholder values. Please update your config.json.")
-            return
 
-        try:
-            client = Client(account_sid, auth_token)
-        except Exception as e:
-            print(f"Error initializing Twilio client: {e}")
-            return
+def configure_logging(level_name: str = 'INFO'):
+    """Sends log records to stdout as plain lines, like the bot's other output.
 
-        for alert in alerts_to_send:
-            message = (
-                f"Patreon Alert: Tier '{alert['tier_name']}' for creator '{alert['creator_name']}' "
-                f"is now available! Check at: {alert['url']}"
-            )
-            if len(message) > 320:
-                message = message[:317] + "..."
-            try:
-                sent = client.messages.create(body=message, from_=from_number, to=recipient_phone_number)
-                print(f"SMS sent for tier '{alert['tier_name']}' to {recipient_phone_number}! SID: {sent.sid}")
-            except Exception as e:
-                print(f"Error sending SMS for tier '{alert['tier_name']}': {e}")
-        print("--- SMS Sending Process Complete ---")
-    elif sms_config and sms_config.get("provider") == "textbelt":
-        print("\n--- Attempting to send SMS alerts via Textbelt ---")
-        textbelt_api_key = sms_config.get("textbelt_api_key", "textbelt")
-        recipient_phone_number = sms_config.get("recipient_phone_number")
-
-        placeholders_present = any([
-            textbelt_api_key == "YOUR_TEXTBELT_API_KEY",
-            recipient_phone_number == "YOUR_RECIPIENT_PHONE_NUMBER",
-        ])
-
-        if not all([textbelt_api_key, recipient_phone_number]) or placeholders_present:
-            if not all([textbelt_api_key, recipient_phone_number]):
-                print("Warning: SMS configuration for Textbelt is incomplete. Missing API key or recipient phone number.")
-            if placeholders_present:
-                print("Warning: SMS configuration contains placeholder values. Please update your config.json.")
-            return
+    Messages below ``level_name`` are dropped before they are formatted, so
+    per-tier DEBUG lines cost a level check when disabled.
+    """
+    level = logging.getLevelName(str(level_name).upper())
+    if not isinstance(level, int):
+        print(f"Warning: Unknown log_level '{level_name}'. Using INFO.")
+        level = logging.INFO
+    logging.basicConfig(stream=sys.stdout, format='%(message)s', level=level, force=True)
 
-        for alert in alerts_to_send:
-            message = (
-                f"Patreon Alert: Tier '{alert['tier_name']}' for creator '{alert['creator_name']}' "
-                f"is now available! Check at: {alert['url']}"
-            )
-            if len(message) > 320:
-                message = message[:317] + "..."
-            try:
-                resp = send_textbelt_sms(recipient_phone_number, message, textbelt_api_key)
-                if resp.get("success"):
-                    print(f"SMS sent for tier '{alert['tier_name']}' to {recipient_phone_number}! Textbelt ID: {resp.get('textId')}")
-                else:
-                    print(f"Error sending SMS for tier '{alert['tier_name']}': {resp.get('error', 'Unknown error')}")
-            except Exception as e:
-                print(f"Error sending SMS for tier '{alert['tier_name']}': {e}")
-        print("--- SMS Sending Process Complete ---")
-    elif sms_config:
-        print(f"SMS provider '{sms_config.get('provider')}' is configured but not supported. No SMS will be sent.")
-    else:
-        print("SMS configuration not provided. Skipping SMS alerts.")
 
+# Searched in order when --config is not given: from the repository root,
+# from src/, and from the Docker image's /app.
+CONFIG_PATHS = (
+    "patreon_tier_alerter/config/config.json",
+    "../patreon_tier_alerter/config/config.json",
+    "config/config.json",
+)
 
-def send_textbelt_sms(phone, message, key="textbelt"):
-    """Send an SMS using the Textbelt API."""
-    import requests
-    payload = {
-        'phone': phone,
-        'message': message,
-        'key': key,
-    }
-    response = requests.post('https://textbelt.com/text', data=payload)
-    return response.json()
+# Settings whose change on reload needs a new router or fetch engine.
+ROUTER_SETTINGS = ('sms_settings', 'sms_providers', 'subscriptions', 'alert_dispatch')
+ENGINE_SETTINGS = ('max_concurrent_requests', 'max_requests_per_host', 'requests_per_second', 'request_burst',
+                   'tier_extraction', 'tier_self_check', 'fetch_timeout_seconds', 'egress')
 
 
-def main():
-    """Main function to run the Patreon Tier Alerter bot."""
-    print("Starting Patreon Tier Alerter...")
+def main(argv: list = None):
+    """Main function to run the Patreon Tier Alerter bot.
 
-    # Update these paths to point to the correct location
-    config_path_primary = "patreon_tier_alerter/config/config.json"
-    config_path_secondary = "../patreon_tier_alerter/config/config.json" # For running directly from src
-    
-    config = load_config(config_path_primary)
-    if config is None:
-        print(f"Attempting to load config from alternative path: {config_path_secondary}")
-        config = load_config(config_path_secondary)
+    Args:
+        argv (list, optional): Command-line arguments; defaults to sys.argv.
+            ``--worker-id ID`` runs one sharded worker, ``--workers N`` starts
+            N sharded workers on this host.
+    """
+    parser = argparse.ArgumentParser(description="Patreon Tier Alerter")
+    parser.add_argument('--config', help="configuration file (default: the first of %s that exists)"
+                        % ', '.join(CONFIG_PATHS))
+    parser.add_argument('--worker-id', help="run as one sharded worker with this ID")
+    parser.add_argument('--workers', type=int, default=1, help="start this many sharded workers on this host")
+    parser.add_argument('--once', action='store_true',
+                        help="check every creator once, save the alert state and exit (for cron and job schedulers)")
+    args = parser.parse_args(argv)
 
+    print("Starting Patreon Tier Alerter...")
+
+    config_path = args.config or next((path for path in CONFIG_PATHS if os.path.exists(path)), CONFIG_PATHS[0])
+    config = load_config(config_path)
     if config is None:
         print("Error: Configuration could not be loaded. Exiting.")
-        return
+        return 1
 
-    creators_to_monitor = config.get('creators', [])
-    check_interval_seconds = config.get('check_interval_seconds', 3600)
-    user_agent = config.get('user_agent', 'Patreon Tier Alerter Bot/1.0')
+    sharded = args.worker_id is not None or args.workers > 1 or bool(config.get('sharding'))
+    if sharded and config.get('state_store', 'sqlite') != 'sqlite':
+        print("Error: Sharded workers share alert state through SQLite; state_store must be 'sqlite'. Exiting.")
+        return 1
+    if args.once and config.get('state_store', 'sqlite') == 'memory':
+        print("Warning: state_store is 'memory', so a one-shot run cannot remember which tiers it alerted.")
 
-    if not creators_to_monitor:
-        print("No creators configured to monitor. Please check your config.json. Exiting.")
-        return
+    if args.workers > 1:
+        return _run_local_workers(config, args.workers, config_path, args.once)
+    return run_worker(config, args.worker_id, sharded, config_path, args.once)
+
+
+def _run_local_workers(config: dict, count: int, config_path: str = None, once: bool = False) -> int:
+    """Starts ``count`` sharded workers as child processes and waits for them.
+
+    Returns:
+        int: 1 if any worker exited with an error, else 0.
+    """
+    print(f"Starting {count} sharded workers...")
+    context = multiprocessing.get_context('spawn')
+    processes = []
+    for index in range(count):
+        worker_config = dict(config)
+        if config.get('metrics_port') is not None:
+            worker_config['metrics_port'] = config['metrics_port'] + index
+        if (config.get('alert_bus') or {}).get('port'):
+            worker_config['alert_bus'] = dict(config['alert_bus'], port=config['alert_bus']['port'] + index)
+        process = context.Process(target=_worker_process,
+                                  args=(worker_config, default_worker_id(index), True, config_path, once),
+                                  name=f"alerter-worker-{index}")
+        process.start()
+        processes.append(process)
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.join()
+    return 1 if any(process.exitcode for process in processes) else 0
+
+
+def _worker_process(*args):
+    sys.exit(run_worker(*args))
 
-    # alerted_tiers_cache is already global, so it's implicitly used by check_tiers
-    sms_settings_from_config = config.get('sms_settings')
-
-    print(f"Configuration loaded. Monitoring {len(creators_to_monitor)} creator(s).")
-    print(f"Check interval: {check_interval_seconds} seconds.")
-    print(f"User-Agent: {user_agent}")
-    if sms_settings_from_config and sms_settings_from_config.get('provider'):
-        print(f"SMS alerts configured via: {sms_settings_from_config.get('provider')}")
-        placeholders_present = any([
-            sms_settings_from_config.get("aws_access_key_id") == "YOUR_AWS_ACCESS_KEY_ID",
-            sms_settings_from_config.get("aws_secret_access_key") == "YOUR_AWS_SECRET_ACCESS_KEY",
-            sms_settings_from_config.get("aws_region") == "YOUR_AWS_REGION",
-            sms_settings_from_config.get("recipient_phone_number") == "YOUR_RECIPIENT_PHONE_NUMBER",
-        ])
-        if placeholders_present:
-            print("WARNING: SMS configuration contains placeholder values. SMS sending may fail until these are updated in config.json.")
+
+def _print_plan_summary(plan: ConfigPlan):
+    for warning in plan.warnings:
+        print(f"Warning: {warning}")
+    config = plan.config
+    shared = len(plan.creators) - len(plan.pages)
+    print(f"Configuration loaded. Monitoring {len(plan.creators)} creator(s) on {len(plan.pages)} page(s)"
+          + (f" ({shared} sharing a page)." if shared else "."))
+    print(f"Check interval: {config.get('check_interval_seconds', 3600)} seconds.")
+    print(f"User-Agent: {config.get('user_agent', 'Patreon Tier Alerter Bot/1.0')}")
+    pool = (config.get('egress') or {}).get('pool')
+    if pool:
+        print(f"Request rate: set per egress ({len(pool)} in the pool, {config.get('requests_per_second', 1.0)}/s "
+              f"unless set), {config.get('max_concurrent_requests', 8)} concurrent request(s) max.")
+    else:
+        print(f"Request rate: {config.get('requests_per_second', 1.0)}/s per host, "
+              f"{config.get('max_concurrent_requests', 8)} concurrent request(s) max.")
+
+
+def _build_router(plan: ConfigPlan) -> AlertRouter:
+    router = AlertRouter.from_config(plan.config, list(plan.creators))
+    if router.channels:
+        print(f"SMS alerts configured via: {', '.join(router.provider_labels)} "
+              f"({len(router.channels)} recipient channel(s)).")
     else:
         print("SMS alerts not configured or provider not specified.")
+    return router
 
-    while True:
-        print(f"\n[{time.strftime('%Y-%m-%d %H:%M:%S')}] Starting new check cycle...")
-        
-        for creator_config in creators_to_monitor:
-            creator_name = creator_config.get('name', 'Unknown Creator')
-            creator_url = creator_config.get('url')
-
-            if not creator_url:
-                print(f"Skipping creator '{creator_name}' due to missing URL.")
-                continue
-
-            print(f"Checking creator: {creator_name} at {creator_url}")
-            
-            scraped_tiers = None
+
+def _build_engine(config: dict) -> FetchEngine:
+    extraction = config.get('tier_extraction', 'html')
+    if extraction not in ('html', 'embedded_json'):
+        print(f"Warning: Unknown tier_extraction '{extraction}'. Using 'html'.")
+    fetch = functools.partial(scrape_patreon_page, conditional=True,
+                              embedded_json=extraction == 'embedded_json',
+                              self_check=config.get('tier_self_check', True),
+                              timeout=config.get('fetch_timeout_seconds', 10))
+    return FetchEngine.from_config(fetch, config, EgressPool.from_config(config))
+
+
+def _build_scheduler(plan: ConfigPlan) -> AdaptiveScheduler:
+    predictor = restock_predictor if restock_predictor.enabled else None
+    return AdaptiveScheduler.from_config(plan.schedules, plan.config, predictor)
+
+
+def _forget_page(url: str, watch_sets: tuple, engine: FetchEngine):
+    """Drops a page's validators and tier regions so its next fetch is parsed in full."""
+    get_session().forget(url)
+    if engine.egress_pool is not None:
+        for egress in engine.egress_pool.egresses:
+            egress.session.forget(url)
+    for watch_names in watch_sets:
+        tier_region_cache.discard((url, watch_names))
+
+
+class _Runtime:
+    """What the check loop runs from: the plan and the objects built from it.
+
+    ``apply`` swaps in a new plan between cycles. Per-page scheduling state
+    carries over for pages that are still configured, and the router and
+    fetch engine are rebuilt only if their settings changed. A page whose
+    watched tiers changed loses its stored validators and cached tier
+    region, so its next fetch is parsed in full rather than answered 304.
+    """
+
+    def __init__(self, plan: ConfigPlan, router: AlertRouter, engine: FetchEngine = None):
+        self.plan = plan
+        restock_predictor.configure_from(plan.config)
+        self.scheduler = _build_scheduler(plan)
+        self.router = router
+        self.engine = engine or _build_engine(plan.config)
+        slot_tracker.configure_from(plan.config)
+        fetch_health.configure_from(plan.config)
+
+    @property
+    def user_agent(self) -> str:
+        return self.plan.config.get('user_agent', 'Patreon Tier Alerter Bot/1.0')
+
+    def apply(self, plan: ConfigPlan):
+        old = self.plan
+        restock_predictor.configure_from(plan.config)
+        scheduler = _build_scheduler(plan)
+        scheduler.adopt(self.scheduler)
+        if any(old.config.get(key) != plan.config.get(key) for key in ROUTER_SETTINGS):
+            self.router.dispatcher.close()
+            self.router = _build_router(plan)
+        if any(old.config.get(key) != plan.config.get(key) for key in ENGINE_SETTINGS):
+            previous, self.engine = self.engine, _build_engine(plan.config)
+            if previous.egress_pool is not None:
+                previous.egress_pool.close()
+        watched_before = {page.url: page.watch_names for page in old.pages}
+        for page in plan.pages:
+            before = watched_before.get(page.url)
+            if before is not None and before != page.watch_names:
+                _forget_page(page.url, (before, page.watch_names), self.engine)
+        if old.config.get('log_level') != plan.config.get('log_level'):
+            configure_logging(plan.config.get('log_level', 'INFO'))
+        if old.config.get('alert_bus') != plan.config.get('alert_bus'):
+            print("Warning: alert_bus changes take effect when the bot is restarted.")
+        if old.config.get('parse_pool') != plan.config.get('parse_pool'):
+            print("Warning: parse_pool changes take effect when the bot is restarted.")
+        slot_tracker.configure_from(plan.config)
+        fetch_health.configure_from(plan.config)
+        tier_diff.retain(plan.pages)
+        if page_archive is not None:
+            page_archive.describe(plan.pages)
+        self.plan = plan
+        self.scheduler = scheduler
+
+
+def run_worker(config: dict, worker_id: str = None, sharded: bool = False, config_path: str = None,
+               once: bool = False) -> int:
+    """Runs the check loop for every creator, or for this worker's shard of them.
+
+    Args:
+        config (dict): Loaded configuration.
+        worker_id (str, optional): Sharded worker ID; see ``sharding``.
+        sharded (bool): Check only the creators this worker owns.
+        config_path (str, optional): File the configuration came from. When
+            given it is watched and reloaded whenever it changes.
+        once (bool): Check every page once, save the alert state and return,
+            for running from cron or a job scheduler.
+
+    Returns:
+        int: Exit status; 1 if the worker could not start or, with ``once``,
+        if no page could be checked.
+    """
+    global tier_history, page_archive, alert_bus, parse_pool
+    configure_logging(config.get('log_level', 'INFO'))
+
+    try:
+        plan = compile_config(config)
+    except ConfigError as e:
+        print(f"Error: Invalid configuration: {e}. Exiting.")
+        return 1
+    _print_plan_summary(plan)
+    runtime = _Runtime(plan, _build_router(plan))
+    if not once:
+        print(f"Polling adapts per creator between {runtime.scheduler.min_interval:.0f} and "
+              f"{runtime.scheduler.max_interval:.0f} seconds.")
+
+    watcher = None
+    if config_path and not once and config.get('config_reload_seconds', 5) > 0:
+        watcher = ConfigWatcher(config_path, config.get('config_reload_seconds', 5))
+        try:
+            watcher.load()
+        except (OSError, ConfigError) as e:
+            print(f"Warning: Not watching {config_path} for changes: {e}")
+            watcher = None
+
+    try:
+        alert_state = open_state_store(config)
+    except Exception as e:
+        print(f"Error: Could not open alert state store: {e}. Exiting.")
+        return 1
+    print(f"Alert state: {type(alert_state).__name__} with {len(alert_state)} remembered tier(s).")
+    ALERT_STATE_SIZE.set(len(alert_state))
+
+    coordinator = None
+    if sharded:
+        try:
+            coordinator = ShardCoordinator.from_config(config, worker_id)
+        except (ValueError, OSError) as e:
+            print(f"Error: Could not join the worker group: {e}. Exiting.")
+            alert_state.close()
+            return 1
+        print(f"Sharded worker '{coordinator.worker_id}' sharing state at {config.get('state_path', 'alert_state.sqlite3')}.")
+
+    try:
+        tier_history = HistoryLog.from_config(config, coordinator.worker_id if coordinator else None)
+    except (OSError, ValueError) as e:
+        print(f"Warning: Tier history disabled; could not open {config.get('history_path')}: {e}")
+        tier_history = None
+    if tier_history is not None:
+        print(f"Recording tier status history to {tier_history.path}.")
+
+    if restock_predictor.enabled and not once:
+        print(f"Predicting restock windows; polling every {restock_predictor.burst_interval:g} seconds inside them.")
+        if tier_history is not None:
             try:
-                scraped_tiers = scrape_patreon_page(creator_url, user_agent)
-            except Exception as e:
-                print(f"An unexpected error occurred during scraping for {creator_name}: {e}")
-                # Continue to the next creator even if one fails catastrophically during scrape function
-                time.sleep(5) # Still sleep before next creator
-                continue
-
-            if scraped_tiers is None:
-                print(f"Scraping failed for {creator_name} (returned None). Skipping tier check for this creator.")
-            else:
-                print(f"Successfully scraped {len(scraped_tiers)} tier(s) for {creator_name}.")
-                newly_available_alerts = check_tiers(scraped_tiers, creator_config, alerted_tiers_cache)
-                send_alerts(newly_available_alerts, sms_config=sms_settings_from_config)
-            
-            # Polite delay between requests to different creators
-            print(f"Waiting 5 seconds before next creator...")
-            time.sleep(5) 
-
-        print(f"\n[{time.strftime('%Y-%m-%d %H:%M:%S')}] Check cycle complete.")
-        print(f"Next check in {check_interval_seconds // 60} minutes (at {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time() + check_interval_seconds))}).")
-        time.sleep(check_interval_seconds)
+                with HistoryReader(tier_history.path) as reader:
+                    learned = restock_predictor.learn_history(reader, plan.pages)
+                print(f"Learned {learned} past restock(s) from the tier history.")
+            except (OSError, ValueError) as e:
+                print(f"Warning: Could not read past restocks from {tier_history.path}: {e}")
+
+    try:
+        page_archive = PageArchive.from_config(config, coordinator.worker_id if coordinator else None)
+    except (OSError, ValueError) as e:
+        print(f"Warning: Page archive disabled; could not open {config.get('archive_path')}: {e}")
+        page_archive = None
+    if page_archive is not None:
+        page_archive.describe(plan.pages)
+        print(f"Archiving fetched pages to {page_archive.path}.")
+
+    metrics_port = config.get('metrics_port')
+    if metrics_port is not None and not once:
+        try:
+            server = start_metrics_server(metrics_port, config.get('metrics_host', '127.0.0.1'))
+            host, port = server.server_address[:2]
+            print(f"Metrics available at http://{host}:{port}/metrics")
+        except OSError as e:
+            print(f"Warning: Could not start metrics endpoint on port {metrics_port}: {e}")
+
+    try:
+        alert_bus = AlertBus.from_config(config)
+        if alert_bus is not None and once:
+            alert_bus.port = None  # nobody stays connected for a single check
+            if not alert_bus.webhooks:
+                alert_bus = None
+        if alert_bus is not None:
+            alert_bus.start()
+    except (OSError, ValueError) as e:
+        print(f"Warning: Alert bus disabled: {e}")
+        alert_bus = None
+    if alert_bus is not None:
+        if alert_bus.address is not None:
+            host, port = alert_bus.address
+            print(f"Alert stream available at http://{host}:{port}/events")
+        if alert_bus.webhooks:
+            print(f"Posting alerts to {len(alert_bus.webhooks)} webhook(s).")
+
+    parse_pool = ParsePool.from_config(config)
+    if parse_pool is not None:
+        print(f"Parsing pages of {parse_pool.min_bytes} tier bytes or more in {parse_pool.workers} "
+              f"worker process(es), at most {parse_pool.max_pending} at a time.")
+
+    status = 0
+    try:
+        if once:
+            status = asyncio.run(_run_once(runtime, alert_state, coordinator))
+        else:
+            asyncio.run(_run_forever(runtime, alert_state, coordinator, watcher))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        runtime.router.dispatcher.close()
+        if runtime.engine.egress_pool is not None:
+            runtime.engine.egress_pool.close()
+        if alert_bus is not None:
+            alert_bus.close()
+        if parse_pool is not None:
+            parse_pool.close()
+        alert_state.close()
+        if tier_history is not None:
+            tier_history.close()
+        if page_archive is not None:
+            page_archive.close()
+        if coordinator is not None:
+            coordinator.leave()
+    return status
+
+
+async def _run_once(runtime: _Runtime, alert_state: AlertStateStore, coordinator: ShardCoordinator = None) -> int:
+    """Checks every page (or every page this worker owns) once; returns the exit status."""
+    pages = runtime.plan.pages
+    if coordinator is not None:
+        coordinator.heartbeat()
+        pages = [page for page in pages if coordinator.owns(page.schedule)]
+    print(f"\n[{time.strftime('%Y-%m-%d %H:%M:%S')}] Checking {len(pages)} page(s) once...")
+    started = time.monotonic()
+    results = await run_check_cycle(pages, runtime.user_agent, runtime.router, runtime.engine, alert_state)
+    CYCLE_SECONDS.observe(time.monotonic() - started)
+    failed = sum(1 for result in results if result is None)
+    print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] Done in {time.monotonic() - started:.1f} seconds"
+          + (f"; {failed} page(s) could not be checked." if failed else "."))
+    return 1 if pages and failed == len(pages) else 0
+
+
+async def _check_page(page: PagePlan, user_agent: str, router: AlertRouter, engine: FetchEngine,
+                      alert_state: AlertStateStore, pending_alerts: list = None):
+    """Scrapes one page through the engine, checks its tiers and sends alerts.
+
+    If ``pending_alerts`` is given, new alerts are appended to it instead of
+    being sent right away.
+
+    Returns:
+        The scrape result: a tier list, NOT_MODIFIED, or None on failure.
+    """
+    log.info("Checking creator: %s at %s", page.label, page.url)
+
+    # Checked before admit(), which may let this check through as a breaker's only probe.
+    cooling = engine.egress_pool.seconds_until_available() if engine.egress_pool is not None else 0
+    if cooling:
+        FETCHES_SKIPPED.inc()
+        log.info("Skipping %s: every egress is cooling down; next attempt in %.0f seconds.", page.label, cooling)
+        return None
+
+    backoff = fetch_health.admit(page.url)
+    if backoff:
+        FETCHES_SKIPPED.inc()
+        log.info("Skipping %s: it has been failing; next attempt in %.0f seconds.", page.label, backoff)
+        return None
+
+    try:
+        scraped_tiers = await _fetch_page(page, user_agent, engine)
+    except Exception as e:
+        log.error("An unexpected error occurred during scraping for %s: %s", page.label, e)
+        return None
+
+    if scraped_tiers is None:
+        log.warning("Scraping failed for %s (returned None). Skipping tier check for this creator.", page.label)
+        return None
+    if scraped_tiers is NOT_MODIFIED:
+        log.info("Page for %s not modified since last check. Skipping tier check.", page.label)
+        return NOT_MODIFIED
+
+    log.info("Successfully scraped %d tier(s) for %s.", len(scraped_tiers), page.label)
+    # check_page runs on the event loop thread, so the state is never mutated concurrently.
+    newly_available_alerts = check_page(scraped_tiers, page, alert_state,
+                                        slot_tracker if slot_tracker.enabled else None, tier_history)
+    if newly_available_alerts:
+        # With sharded workers another process may have alerted the same tier (or slot event) already.
+        keys = [_claim_key(alert) for alert in newly_available_alerts]
+        claimed = alert_state.claim(keys)
+        newly_available_alerts = [alert for alert, key in zip(newly_available_alerts, keys) if key in claimed]
+        for alert in newly_available_alerts:
+            if 'event' in alert:
+                SLOT_EVENTS.labels(alert['event']).inc()
+    ALERTS.inc(sum(1 for alert in newly_available_alerts if 'event' not in alert))
+    if newly_available_alerts and alert_bus is not None:
+        # Pushed before any SMS is sent or merged, so subscribers hear of it first.
+        received = alert_bus.publish(newly_available_alerts)
+        if alert_bus.sms_fallback:
+            # Decided per alert once this push's webhook deliveries have succeeded or failed.
+            received = await asyncio.wrap_future(received)
+            pushed = [alert for alert, got in zip(newly_available_alerts, received) if got]
+            if pushed:
+                _print_alerts(pushed)
+                print(f"Pushed {len(pushed)} alert(s) to alert bus subscribers; not sending SMS for them.")
+            newly_available_alerts = [alert for alert, got in zip(newly_available_alerts, received) if not got]
+            if not newly_available_alerts:
+                return scraped_tiers
+    if pending_alerts is not None:
+        pending_alerts.extend(newly_available_alerts)
+    else:
+        await asyncio.to_thread(send_alerts, newly_available_alerts, router=router)
+    return scraped_tiers
+
+
+def _claim_key(alert: dict) -> tuple:
+    """The alert state key ``claim`` takes for an alert; slot events include the event and count."""
+    if 'event' in alert:
+        return alert['creator_name'], alert['tier_name'], alert['event'], alert['remaining']
+    return alert['creator_name'], alert['tier_name']
+
+
+async def _fetch_page(page: PagePlan, user_agent: str, engine: FetchEngine):
+    """Scrapes a page, hedging the request if the page is high priority.
+
+    A hedged page gets a second request once the first has taken longer
+    than the host's usual latency (see ``FetchHealth.hedge_delay``), and the
+    first usable response wins. A ``NOT_MODIFIED`` only wins once the other
+    request has finished without tiers: it may mean that request already
+    stored the new digest or validators. Fetches run in threads that cannot
+    be interrupted, so the slower request finishes in the background and its
+    result is dropped.
+    """
+    delay = fetch_health.hedge_delay(page.url) if page.hedged else None
+    if delay is None:
+        return await scrape_patreon_page_async(page.url, user_agent, engine, tiers_to_watch=page.watch_names)
+
+    first = asyncio.ensure_future(
+        scrape_patreon_page_async(page.url, user_agent, engine, tiers_to_watch=page.watch_names))
+    done, _ = await asyncio.wait((first,), timeout=delay)
+    if done:
+        return first.result()
+    hedge = asyncio.ensure_future(
+        scrape_patreon_page_async(page.url, user_agent, engine, tiers_to_watch=page.watch_names))
+    pending = {first, hedge}
+    error = None
+    unchanged = None  # the task that answered NOT_MODIFIED, kept until the other one finishes
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.exception() is not None:
+                error = task.exception()
+            elif task.result() is NOT_MODIFIED:
+                unchanged = task
+            elif task.result() is not None:
+                HEDGED_FETCHES.labels('hedge' if task is hedge else 'first').inc()
+                for other in pending:
+                    # Retrieve the loser's exception, if any, so it is not reported as unhandled.
+                    other.add_done_callback(lambda t: t.cancelled() or t.exception())
+                return task.result()
+    if unchanged is not None:
+        HEDGED_FETCHES.labels('hedge' if unchanged is hedge else 'first').inc()
+        return NOT_MODIFIED
+    if error is not None:
+        raise error
+    return None
+
+
+async def run_check_cycle(pages: list, user_agent: str, router: AlertRouter, engine: FetchEngine,
+                          alert_state: AlertStateStore):
+    """Checks the given pages once, fetching them concurrently.
+
+    Pacing between requests is handled by the engine's per-host token bucket,
+    so the cycle is bounded by the configured request rate rather than by a
+    fixed delay per creator. Alert state changes are written in one batch
+    once every page has been checked. When the router's dispatcher merges
+    alerts, they are sent together at the end so they can be merged.
+
+    Args:
+        pages (list): PagePlan entries from a compiled plan. Creator config
+            dicts are also accepted and compiled one per entry.
+
+    Returns:
+        list: The scrape result for each page, in order.
+    """
+    pages = [page if isinstance(page, PagePlan) else PagePlan.from_creators(page.get('url'), [page])
+             for page in pages]
+    pending_alerts = [] if router.dispatcher.merge else None
+    try:
+        results = await asyncio.gather(*(
+            _check_page(page, user_agent, router, engine, alert_state, pending_alerts)
+            for page in pages
+        ))
+        if pending_alerts:
+            await asyncio.to_thread(send_alerts, pending_alerts, router=router)
+        return results
+    finally:
+        alert_state.flush()
+        if tier_history is not None:
+            tier_history.flush()
+        if page_archive is not None:
+            page_archive.flush()
+
+
+async def _run_forever(runtime: _Runtime, alert_state: AlertStateStore, coordinator: ShardCoordinator = None,
+                       watcher: ConfigWatcher = None):
+    prewarms = set()  # running pre-warm tasks, referenced until done
+    while True:
+        if watcher is not None:
+            plan = watcher.poll()
+            if plan is not None:
+                # Cycles are awaited one at a time, so no fetch is in flight here.
+                print(f"\n[{time.strftime('%Y-%m-%d %H:%M:%S')}] Configuration changed; reloading.")
+                _print_plan_summary(plan)
+                runtime.apply(plan)
+
+        if coordinator is not None and coordinator.seconds_until_heartbeat() == 0:
+            if coordinator.heartbeat():
+                # Creators that moved here were last written by another worker.
+                alert_state.reload()
+                print(f"Worker group changed: {len(coordinator.workers)} live worker(s) {coordinator.workers}.")
+
+        scheduler = runtime.scheduler
+        for _, schedule in scheduler.pop_warmups():
+            if coordinator is None or coordinator.owns(schedule):
+                task = asyncio.ensure_future(runtime.engine.run(prewarm_page, schedule['url'], runtime.user_agent))
+                prewarms.add(task)
+                task.add_done_callback(prewarms.discard)
+        due = scheduler.pop_due()
+        if coordinator is not None:
+            owned = []
+            for index, schedule in due:
+                if coordinator.owns(schedule):
+                    owned.append((index, schedule))
+                else:
+                    # Look again after the next heartbeat in case it moves here.
+                    scheduler.defer(index, coordinator.heartbeat_seconds)
+            due = owned
+        if not due:
+            await asyncio.sleep(_seconds_until_next(scheduler, coordinator, watcher))
+            continue
+
+        print(f"\n[{time.strftime('%Y-%m-%d %H:%M:%S')}] Starting check cycle for {len(due)} due page(s)...")
+        cycle_started = time.monotonic()
+
+        pages = [runtime.plan.pages[index] for index, _ in due]
+        results = await run_check_cycle(pages, runtime.user_agent, runtime.router, runtime.engine, alert_state)
+        for (index, _), page, scraped_tiers in zip(due, pages, results):
+            # A page that is backing off is not polled again until its backoff is over.
+            scheduler.record(index, scraped_tiers,
+                             retry_in=_seconds_blocked(page.url, runtime.engine) if scraped_tiers is None else 0)
+        OPEN_BREAKERS.set(fetch_health.open_breakers())
+        region_hits, region_misses = tier_region_cache.reset_counters()
+        CYCLE_SECONDS.observe(time.monotonic() - cycle_started)
+        ALERT_STATE_SIZE.set(len(alert_state))
+        if tier_history is not None:
+            dropped = tier_history.maybe_compact()
+            if dropped:
+                log.info("Compacted tier history: dropped %d old transition(s).", dropped)
+
+        wait = _seconds_until_next(scheduler, coordinator)
+        print(f"\n[{time.strftime('%Y-%m-%d %H:%M:%S')}] Check cycle complete in {time.monotonic() - cycle_started:.1f} seconds.")
+        print(f"Tier region cache: {region_hits} unchanged page(s) skipped, {region_misses} parsed.")
+        print(f"Next check in {wait:.0f} seconds (at {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time() + wait))}).")
+        await asyncio.sleep(_seconds_until_next(scheduler, coordinator, watcher))
+
+
+def _seconds_blocked(url: str, engine: FetchEngine) -> float:
+    """Seconds until ``url`` may be fetched: its backoff, or until an egress recovers if every one is cooling down."""
+    blocked = fetch_health.seconds_blocked(url)
+    if engine.egress_pool is not None:
+        blocked = max(blocked, engine.egress_pool.seconds_until_available())
+    return blocked
+
+
+def _seconds_until_next(scheduler: AdaptiveScheduler, coordinator: ShardCoordinator = None,
+                        watcher: ConfigWatcher = None) -> float:
+    wait = scheduler.seconds_until_next()
+    if coordinator is not None:
+        wait = min(wait, coordinator.seconds_until_heartbeat())
+    if watcher is not None:
+        wait = min(wait, watcher.seconds_until_check())
+    return wait
 
 
 def load_config(config_path="config/config.json"):
@@ -418,4 +1075,4 @@ if __name__ == '__main__':
     # trigger a spurious "file not found" warning when the script was executed
     # from a different working directory. Configuration loading is already
     # handled inside main(), so we only need to invoke it.
-    main()
+    sys.exit(main())
@@ -0,0 +1,553 @@
+"""Record/replay archive of fetched membership pages.
+
+With ``archive_path`` set, every response the alerter gets for a page (the
+body as read, its status and a few headers) is appended to an archive::
+
+    <archive>         header  b'PTPA', version, entry header size, reserved  (4 x uint32)
+                      entry   entry header, metadata JSON, zlib-compressed body
+                              entry header: url id, status, flags, timestamp,
+                              metadata length, stored body length, body length
+    <archive>.urls    one ``[url, label, [creator names]]`` JSON array per line,
+                      by url id (only grows)
+    <archive>.index   url id, status, flags, timestamp, offset of each entry
+                      (fixed width), written after the entries it points to
+
+A body identical to the previous one recorded for the same page is stored
+as a reference to it, so a page that did not change costs a few dozen bytes.
+The alerter reads a page only until every watched tier was found; with
+``archive_full_pages`` it reads the rest too, so the archive holds whole
+pages (at the cost of downloading them).
+
+``ArchiveReader`` memory-maps an archive for random access by page and time
+(``at``) or iteration in time order (``entries``). ``replay`` runs the
+archived responses through ``scrape_patreon_page`` and ``check_page`` in
+place of the network, as fast as the parser goes, so an archive is both a
+regression corpus for parser changes and a throughput benchmark.
+
+Command line::
+
+    python -m patreon_tier_alerter.src.archive ARCHIVE list
+    python -m patreon_tier_alerter.src.archive ARCHIVE show CREATOR_OR_URL [--at TIME] [--body]
+    python -m patreon_tier_alerter.src.archive ARCHIVE replay [--config FILE] [--since TIME] [--until TIME]
+        [--results FILE] [--compare FILE]
+"""
+import argparse
+import bisect
+import hashlib
+import io
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+from typing import NamedTuple
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+MAGIC = b'PTPA'
+VERSION = 1
+HEADER = struct.Struct('<4sIII')
+ENTRY = struct.Struct('<IHHdIII')
+INDEX = struct.Struct('<IHHdQ')
+# Entry flags.
+COMPRESSED = 1
+SAME_BODY = 2  # the body is that of the entry at metadata["same_as"]
+COMPLETE = 4  # the whole body was read, not only up to the last watched tier
+# Response headers kept with each entry; enough to replay conditional requests, Retry-After and charsets.
+KEPT_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Retry-After')
+COMPRESS_LEVEL = 6
+# Decompressed bodies an ArchiveReader keeps; unchanged pages refer back to bodies read a few polls earlier.
+BODY_CACHE_SIZE = 256
+
+log = logging.getLogger(__name__)
+
+
+def urls_path(path: str) -> str:
+    return path + '.urls'
+
+
+def index_path(path: str) -> str:
+    return path + '.index'
+
+
+def _read_urls(path: str) -> list:
+    try:
+        with open(urls_path(path), 'r', encoding='utf-8') as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+    # Lines written before the creator names were kept carry only the label.
+    return [(url, label, creators[0] if creators else [name for name in label.split(' / ') if name])
+            for url, label, *creators in entries]
+
+
+def _check_header(data, path: str):
+    if len(data) < HEADER.size:
+        raise ValueError(f"{path} is not a page archive (too short)")
+    magic, version, entry_size, _ = HEADER.unpack_from(data)
+    if magic != MAGIC or entry_size != ENTRY.size:
+        raise ValueError(f"{path} is not a page archive")
+    if version != VERSION:
+        raise ValueError(f"{path} has unsupported page archive version {version}")
+
+
+class PageArchive:
+    """Appends fetched responses to an archive.
+
+    ``record`` is called from the fetch threads: it compresses the body
+    there and buffers the entry; ``flush`` writes what was buffered once a
+    cycle ends.
+
+    Args:
+        path (str): The archive; created (with parent directories) if missing.
+        full_pages (bool): Ask the fetch to read each page to the end.
+    """
+
+    def __init__(self, path: str, full_pages: bool = False, clock=time.time):
+        self.path = path
+        self.full_pages = bool(full_pages)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._labels = {}
+        self._data = bytearray()
+        self._index = bytearray()
+        self._pending_urls = []
+        self.urls = _read_urls(path)
+        self._ids = {entry[0]: url_id for url_id, entry in enumerate(self.urls)}
+        self._last_body = {}  # url id -> (body digest, offset of the entry holding it)
+        self._open()
+
+    def _open(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            with open(self.path, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, VERSION, ENTRY.size, 0))
+        with open(self.path, 'rb') as f:
+            _check_header(f.read(HEADER.size), self.path)
+        index = index_path(self.path)
+        if os.path.exists(index):
+            torn = os.path.getsize(index) % INDEX.size
+            if torn:
+                # An index record cut short by a crash mid-write; drop it.
+                with open(index, 'r+b') as f:
+                    f.truncate(os.path.getsize(index) - torn)
+        self._file = open(self.path, 'ab')
+        self._index_file = open(index, 'ab')
+        # Entries written after the index by a run that crashed are left unindexed and skipped.
+        self._end = self._file.seek(0, os.SEEK_END)
+
+    @classmethod
+    def from_config(cls, config: dict, worker_id: str = None):
+        """Opens the archive named by ``archive_path``, or returns None if it is not set.
+
+        Sharded workers append their ID to the path so each writes its own archive.
+        """
+        path = config.get('archive_path')
+        if not path:
+            return None
+        if worker_id:
+            path = f"{path}.{worker_id}"
+        return cls(path, full_pages=config.get('archive_full_pages', False))
+
+    def describe(self, pages):
+        """Names the creators behind each page URL, for looking pages up by creator later."""
+        with self._lock:
+            self._labels = {page.url: (page.label, list(dict.fromkeys(watch.name for watch in page.creators)))
+                            for page in pages}
+
+    def record(self, url: str, response, body: bytes = b'', complete: bool = True, timestamp: float = None):
+        """Buffers one response.
+
+        Args:
+            url (str): The page URL requested.
+            response (requests.Response): Supplies the status and headers.
+            body (bytes): The body as read (empty for 304s and errors).
+            complete (bool): False if reading stopped before the end of the body.
+            timestamp (float, optional): When it was fetched; defaults to now.
+        """
+        headers = {name: response.headers[name] for name in KEPT_HEADERS if name in response.headers}
+        timestamp = self._clock() if timestamp is None else timestamp
+        digest = hashlib.blake2b(body, digest_size=16).digest() if body else None
+        flags = COMPLETE if complete else 0
+        with self._lock:
+            url_id = self._ids.get(url)
+            if url_id is None:
+                url_id = self._ids[url] = len(self.urls)
+                self.urls.append((url, *self._labels.get(url, ('', []))))
+                self._pending_urls.append(self.urls[-1])
+            previous = self._last_body.get(url_id)
+            same = digest is not None and previous is not None and previous[0] == digest
+        if same:
+            metadata, stored, flags = dict(headers, same_as=previous[1]), b'', flags | SAME_BODY
+        else:
+            metadata, flags = headers, flags | COMPRESSED
+            stored = zlib.compress(body, COMPRESS_LEVEL)  # outside the lock: zlib releases the GIL
+        meta = json.dumps(metadata, separators=(',', ':')).encode()
+        with self._lock:
+            offset = self._end
+            self._data += ENTRY.pack(url_id, response.status_code, flags, timestamp, len(meta), len(stored), len(body))
+            self._data += meta
+            self._data += stored
+            self._end += ENTRY.size + len(meta) + len(stored)
+            self._index += INDEX.pack(url_id, response.status_code, flags, timestamp, offset)
+            if digest is not None and not same:
+                self._last_body[url_id] = (digest, offset)
+
+    def flush(self):
+        """Writes buffered URLs, entries and index records, in that order, so everything indexed resolves."""
+        with self._lock:
+            if self._pending_urls:
+                with open(urls_path(self.path), 'a', encoding='utf-8') as f:
+                    f.writelines(json.dumps(list(entry)) + '\n' for entry in self._pending_urls)
+                self._pending_urls.clear()
+            if self._data:
+                self._file.write(self._data)
+                self._file.flush()
+                self._data.clear()
+            if self._index:
+                self._index_file.write(self._index)
+                self._index_file.flush()
+                self._index.clear()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+        self._index_file.close()
+
+
+class ArchivedResponse(NamedTuple):
+    """One archived response."""
+    url: str
+    label: str
+    timestamp: float
+    status: int
+    headers: dict
+    body: bytes
+    complete: bool
+    body_id: int  # the same for responses with identical bodies stored once
+
+
+class ArchiveReader:
+    """Read-only, memory-mapped view of an archive.
+
+    Args:
+        path (str): The archive; its ``.urls`` and ``.index`` files must sit next to it.
+
+    Attributes:
+        urls (list): ``(url, label, creator names)`` by url id.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.urls = _read_urls(path)
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        _check_header(self._map, path)
+        try:
+            with open(index_path(path), 'rb') as f:
+                index = f.read()
+        except FileNotFoundError:
+            index = b''
+        entries = [entry for entry in INDEX.iter_unpack(index[:len(index) - len(index) % INDEX.size])
+                   if entry[4] < len(self._map)]
+        entries.sort(key=lambda entry: entry[3])  # fetch threads may record slightly out of order
+        self._entries = entries  # (url id, status, flags, timestamp, offset) in time order
+        self._by_url = {}
+        for position, entry in enumerate(entries):
+            self._by_url.setdefault(entry[0], []).append(position)
+        self._times = {url_id: [entries[p][3] for p in positions] for url_id, positions in self._by_url.items()}
+        self._cached = OrderedDict()  # offset -> body, for the most recently read bodies
+
+    def __len__(self):
+        return len(self._entries)
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def find(self, creator_or_url: str) -> list:
+        """Url ids whose URL or one of whose creator names equals ``creator_or_url`` (names case-insensitively)."""
+        lowered = creator_or_url.lower()
+        return [url_id for url_id, (url, _, creators) in enumerate(self.urls)
+                if url == creator_or_url or lowered in (name.lower() for name in creators)]
+
+    def _body(self, offset: int) -> bytes:
+        body = self._cached.get(offset)
+        if body is not None:
+            self._cached.move_to_end(offset)
+            return body
+        _, _, flags, _, meta_length, stored_length, length = ENTRY.unpack_from(self._map, offset)
+        start = offset + ENTRY.size + meta_length
+        stored = self._map[start:start + stored_length]
+        body = zlib.decompress(stored, bufsize=max(length, 1)) if flags & COMPRESSED else stored
+        self._cached[offset] = body
+        if len(self._cached) > BODY_CACHE_SIZE:
+            self._cached.popitem(last=False)
+        return body
+
+    def _response(self, entry) -> ArchivedResponse:
+        url_id, status, flags, timestamp, offset = entry
+        _, _, _, _, meta_length, _, _ = ENTRY.unpack_from(self._map, offset)
+        metadata = json.loads(self._map[offset + ENTRY.size:offset + ENTRY.size + meta_length])
+        body_id = metadata.pop('same_as', offset)
+        url, label, _ = self.urls[url_id]
+        return ArchivedResponse(url, label, timestamp, status, metadata, self._body(body_id), bool(flags & COMPLETE),
+                                body_id)
+
+    def entries(self, url_ids: list = None, since: float = None, until: float = None):
+        """Yields archived responses in time order, optionally for some pages and a time range."""
+        positions = range(len(self._entries)) if url_ids is None else sorted(
+            p for url_id in url_ids for p in self._by_url.get(url_id, ()))
+        for position in positions:
+            entry = self._entries[position]
+            if (since is not None and entry[3] < since) or (until is not None and entry[3] > until):
+                continue
+            yield self._response(entry)
+
+    def at(self, url_id: int, timestamp: float) -> ArchivedResponse:
+        """The response for a page current at ``timestamp`` (the last one fetched by then), or None."""
+        times = self._times.get(url_id)
+        if not times:
+            return None
+        i = bisect.bisect_right(times, timestamp)
+        return self._response(self._entries[self._by_url[url_id][i - 1]]) if i else None
+
+    def summary(self) -> list:
+        """Per page: url, label, responses, first and last fetch time, and bytes of bodies stored."""
+        rows = []
+        for url_id, positions in sorted(self._by_url.items()):
+            url, label, _ = self.urls[url_id]
+            stored = sum(ENTRY.unpack_from(self._map, self._entries[p][4])[5] for p in positions)
+            rows.append({'url': url, 'label': label, 'responses': len(positions),
+                         'first': self._entries[positions[0]][3], 'last': self._entries[positions[-1]][3],
+                         'stored_bytes': stored})
+        return rows
+
+
+class ArchiveSession:
+    """Stands in for ``HttpSession`` during a replay: ``get`` answers with the current archived response."""
+
+    def __init__(self):
+        self.current = None
+
+    def get(self, url: str, headers: dict = None, timeout: float = 10, conditional: bool = False, **kwargs):
+        archived = self.current
+        response = requests.Response()
+        response.url = url
+        response.status_code = archived.status
+        response.reason = 'Archived'
+        response.headers = CaseInsensitiveDict(archived.headers)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.raw = io.BytesIO(archived.body)
+        return response
+
+    def remember(self, url: str, response):
+        pass
+
+    def forget(self, url: str):
+        pass
+
+
+class ReplayReport(NamedTuple):
+    responses: int
+    parsed: int  # responses that yielded a tier list
+    not_modified: int  # 304s and unchanged tier regions
+    failed: int  # errors and unparseable pages
+    suspect: int  # parsed, but no tiers or one with an unknown status: what a markup change looks like
+    alerts: list  # (timestamp, alert dict)
+    seconds: float
+
+
+def replay(reader: ArchiveReader, config: dict = None, url_ids: list = None, since: float = None,
+           until: float = None, on_result=None) -> ReplayReport:
+    """Runs archived responses through ``scrape_patreon_page`` and ``check_page``.
+
+    The alerter's tier region cache, diff state and fetch health are swapped
+    for fresh ones for the duration, so a replay starts from a clean process
+    and leaves the running one alone. Alerts go to a list, never to a
+    provider. A response whose body was stored as the same as the page's
+    previous one is reported unchanged without parsing it again, which is
+    what the tier region cache would find.
+
+    Args:
+        reader (ArchiveReader): The archive.
+        config (dict, optional): Supplies the creators (and their watched
+            tiers) and ``tier_extraction``/``tier_self_check``. Pages it does
+            not mention are parsed in full and watch nothing.
+        url_ids, since, until: Restrict the replay as in ``ArchiveReader.entries``.
+        on_result (callable, optional): Called with each archived response and
+            what ``scrape_patreon_page`` returned for it.
+    """
+    from . import alerter
+    from .health import FetchHealth
+    from .plan import PagePlan, compile_config
+    from .records import TierDiff
+    from .state import MemoryStateStore
+    from .tier_parser import TierRegionCache
+
+    config = config or {'creators': []}
+    pages = {page.url: page for page in compile_config(config).pages} if config.get('creators') else {}
+    embedded_json = config.get('tier_extraction', 'html') == 'embedded_json'
+    self_check = config.get('tier_self_check', True)
+    state = MemoryStateStore()
+    session = ArchiveSession()
+    saved = alerter.tier_region_cache, alerter.tier_diff, alerter.fetch_health
+    alerter.tier_region_cache = TierRegionCache()
+    alerter.tier_diff = TierDiff(alerter.log)
+    alerter.fetch_health = FetchHealth(enabled=False)
+    counts = {'responses': 0, 'parsed': 0, 'not_modified': 0, 'failed': 0, 'suspect': 0}
+    alerts = []
+    parsed_bodies = {}  # url -> body id of the last response that scraped successfully
+    started = time.perf_counter()
+    try:
+        for archived in reader.entries(url_ids, since, until):
+            page = pages.get(archived.url)
+            if page is None:
+                page = pages[archived.url] = PagePlan.from_creators(
+                    archived.url, [{'name': archived.label or archived.url, 'tiers_to_watch': []}])
+            if archived.status == 200 and parsed_bodies.get(archived.url) == archived.body_id:
+                result = alerter.NOT_MODIFIED
+            else:
+                session.current = archived
+                result = alerter.scrape_patreon_page(archived.url, 'replay', conditional=True,
+                                                     tiers_to_watch=page.watch_names or None,
+                                                     embedded_json=embedded_json, self_check=self_check,
+                                                     session=session)
+                parsed_bodies[archived.url] = archived.body_id if result is not None else None
+            counts['responses'] += 1
+            if result is None:
+                counts['failed'] += 1
+            elif result is alerter.NOT_MODIFIED:
+                counts['not_modified'] += 1
+            else:
+                counts['parsed'] += 1
+                if not result or any(tier.get('status') == 'unknown' for tier in result):
+                    counts['suspect'] += 1
+                alerts.extend((archived.timestamp, alert) for alert in alerter.check_page(result, page, state))
+            if on_result is not None:
+                on_result(archived, result)
+    finally:
+        alerter.tier_region_cache, alerter.tier_diff, alerter.fetch_health = saved
+    return ReplayReport(alerts=alerts, seconds=time.perf_counter() - started, **counts)
+
+
+def parse_time(value: str) -> float:
+    """Accepts Unix seconds or an ISO 8601 date/time (local time unless it has an offset)."""
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def _format_time(timestamp: float) -> str:
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp))
+
+
+def _result_json(archived: ArchivedResponse, result) -> dict:
+    if result is None:
+        tiers = None
+    elif isinstance(result, list):
+        tiers = result
+    else:
+        tiers = 'not_modified'
+    return {'url': archived.url, 'timestamp': archived.timestamp, 'status': archived.status, 'tiers': tiers}
+
+
+def _compare(path: str, results: list) -> list:
+    """Results that differ from those saved in ``path`` with ``--results``."""
+    with open(path, 'r', encoding='utf-8') as f:
+        before = {(row['url'], row['timestamp']): row['tiers'] for row in map(json.loads, f) if row}
+    return [(row, before[(row['url'], row['timestamp'])]) for row in results
+            if (row['url'], row['timestamp']) in before and before[(row['url'], row['timestamp'])] != row['tiers']]
+
+
+def main(argv: list = None):
+    ap = argparse.ArgumentParser(description="Inspect or replay an archive of fetched membership pages.")
+    ap.add_argument('archive', help="archive file (archive_path)")
+    ap.add_argument('command', choices=('list', 'show', 'replay'))
+    ap.add_argument('page', nargs='?', help="show/replay: creator name or page URL")
+    ap.add_argument('--at', help="show: the response current at this time (Unix seconds or ISO 8601; default latest)")
+    ap.add_argument('--body', action='store_true', help="show: write the archived body to stdout")
+    ap.add_argument('--config', help="replay: configuration supplying creators and extraction settings")
+    ap.add_argument('--since', help="replay: only responses fetched at or after this time")
+    ap.add_argument('--until', help="replay: only responses fetched at or before this time")
+    ap.add_argument('--results', help="replay: write what each response parsed to, one JSON object per line")
+    ap.add_argument('--compare', help="replay: compare with a --results file; exit status 1 if any differ")
+    args = ap.parse_args(argv)
+    logging.basicConfig(level=logging.ERROR, format='%(levelname)s %(name)s: %(message)s')
+
+    with ArchiveReader(args.archive) as reader:
+        url_ids = None
+        if args.page:
+            url_ids = reader.find(args.page)
+            if not url_ids:
+                print(f"Error: No archived page for '{args.page}'.", file=sys.stderr)
+                return 1
+
+        if args.command == 'list':
+            for row in reader.summary():
+                print(f"{row['responses']:>8}  {_format_time(row['first'])} .. {_format_time(row['last'])}  "
+                      f"{row['stored_bytes'] / 1e6:>8.1f} MB  {row['label'] or '-'}  {row['url']}")
+            print(f"({len(reader)} response(s))", file=sys.stderr)
+            return 0
+
+        if args.command == 'show':
+            if not url_ids:
+                print("Error: show needs a creator name or page URL.", file=sys.stderr)
+                return 1
+            archived = reader.at(url_ids[0], parse_time(args.at) if args.at else float('inf'))
+            if archived is None:
+                print(f"Error: Nothing archived for '{args.page}' by then.", file=sys.stderr)
+                return 1
+            if args.body:
+                sys.stdout.buffer.write(archived.body)
+                return 0
+            print(f"{archived.url} at {_format_time(archived.timestamp)}: HTTP {archived.status}, "
+                  f"{len(archived.body)} bytes{'' if archived.complete else ' (read up to the watched tiers)'}")
+            for name, value in archived.headers.items():
+                print(f"  {name}: {value}")
+            return 0
+
+        config = None
+        if args.config:
+            with open(args.config, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+        results = []
+        report = replay(reader, config, url_ids, parse_time(args.since) if args.since else None,
+                        parse_time(args.until) if args.until else None,
+                        lambda archived, result: results.append(_result_json(archived, result)))
+
+    print(f"Replayed {report.responses} response(s) in {report.seconds:.2f} s "
+          f"({report.responses / report.seconds if report.seconds else 0:.0f}/s): {report.parsed} parsed, "
+          f"{report.not_modified} unchanged, {report.failed} failed, {report.suspect} with no tiers or an unreadable status.")
+    for timestamp, alert in report.alerts:
+        print(f"  {_format_time(timestamp)}  {alert['creator_name']}: {alert['tier_name']}"
+              + (f" ({alert['event']})" if 'event' in alert else ''))
+    if args.results:
+        with open(args.results, 'w', encoding='utf-8') as f:
+            f.writelines(json.dumps(row) + '\n' for row in results)
+    if args.compare:
+        differences = _compare(args.compare, results)
+        for row, before in differences:
+            print(f"Changed: {row['url']} at {_format_time(row['timestamp'])}: {before} -> {row['tiers']}")
+        print(f"{len(differences)} response(s) parse differently from {args.compare}.")
+        return 1 if differences else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,511 @@
+"""In-process alert bus: a Server-Sent Events stream and webhooks alongside SMS.
+
+Configuration::
+
+    "alert_bus": {"port": 9110, "host": "127.0.0.1", "queue_size": 256,
+                  "webhooks": ["http://127.0.0.1:8000/hook",
+                               {"url": "https://example.com/hook", "secret": "..."}],
+                  "sms_fallback": false}
+
+``publish`` hands alerts to the bus's own thread and returns at once; the
+check loop never waits for a subscriber unless it asks to. On that thread every alert is
+encoded once and queued for each subscriber; alerts published together (or
+while the bus was busy) reach a stream in a single write. A stream whose
+client stops reading keeps up to ``queue_size`` alerts beyond what its
+connection buffers, and a webhook up to ``queue_size`` undelivered alerts;
+past that the oldest are dropped (counted in
+``patreon_alert_bus_dropped_total``) rather than holding anyone else up.
+
+Subscribers:
+
+* ``GET /events`` on ``port`` streams alerts as ``text/event-stream``, one
+  ``alert`` event per alert with the alert dict plus ``id`` and
+  ``published_at`` as JSON. ``?creator=NAME`` and ``?tier=NAME`` (repeatable,
+  case-insensitive) filter the stream. A client reconnecting with
+  ``Last-Event-ID`` is first sent the recent alerts it missed. Without
+  ``port`` there is no stream, only webhooks.
+* Each webhook gets every alert as a JSON POST, one at a time and in order,
+  retried twice. With a ``secret`` the body is signed: ``X-Alert-Signature:
+  sha256=<HMAC-SHA256 of the body>``.
+
+With ``sms_fallback`` SMS is sent only for alerts no subscriber received,
+decided per alert: no stream whose filters match it was connected when it
+was published, and every webhook's delivery of it failed (or was dropped).
+"""
+import asyncio
+import hashlib
+import hmac
+import itertools
+import json
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+
+from .metrics import REGISTRY
+
+DEFAULT_QUEUE_SIZE = 256
+# Alerts kept for clients that reconnect with Last-Event-ID.
+RECENT_ALERTS = 256
+KEEPALIVE_SECONDS = 15
+REQUEST_TIMEOUT_SECONDS = 10
+# How long close() waits for webhooks to deliver what is queued.
+DRAIN_SECONDS = 5
+# Bytes a stream's connection may buffer before alerts wait in its queue instead.
+STREAM_BUFFER_BYTES = 64 * 1024
+STREAM_HEADERS = (b'HTTP/1.1 200 OK\r\n'
+                  b'Content-Type: text/event-stream; charset=utf-8\r\n'
+                  b'Cache-Control: no-cache\r\n'
+                  b'Connection: keep-alive\r\n'
+                  b'X-Accel-Buffering: no\r\n'
+                  b'\r\n'
+                  b'retry: 2000\n\n')
+NOT_FOUND = b'HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n'
+
+SUBSCRIBERS = REGISTRY.gauge('patreon_alert_bus_subscribers', 'Connected alert stream subscribers.')
+PUBLISHED = REGISTRY.counter('patreon_alert_bus_alerts_total', 'Alerts published to the alert bus.')
+DROPPED = REGISTRY.counter('patreon_alert_bus_dropped_total',
+                           'Alerts dropped because a subscriber fell too far behind, by subscriber kind.', ('kind',))
+WEBHOOK_DELIVERIES = REGISTRY.counter('patreon_webhook_deliveries_total', 'Webhook POSTs by result.', ('result',))
+DELIVERY_SECONDS = REGISTRY.histogram(
+    'patreon_alert_bus_delivery_seconds', 'Time from publishing an alert to handing it to a subscriber.', ('kind',),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0, 5.0))
+_STREAM_DELIVERY = DELIVERY_SECONDS.labels('stream')
+_WEBHOOK_DELIVERY = DELIVERY_SECONDS.labels('webhook')
+_STREAM_DROPPED = DROPPED.labels('stream')
+_WEBHOOK_DROPPED = DROPPED.labels('webhook')
+
+log = logging.getLogger(__name__)
+
+
+def _offer(queue: asyncio.Queue, item):
+    """Queues a webhook delivery, dropping the oldest queued one if full."""
+    if queue.full():
+        dropped = queue.get_nowait()
+        queue.task_done()
+        _WEBHOOK_DROPPED.inc()
+        if dropped[2] is not None:
+            dropped[2].failed()
+    queue.put_nowait(item)
+
+
+class _Receipt:
+    """Resolves ``future`` to which alerts of one ``publish`` call reached a subscriber."""
+
+    __slots__ = ('future', 'received', 'waiting')
+
+    def __init__(self, future: Future, count: int):
+        self.future = future
+        self.received = [False] * count
+        self.waiting = 0  # alerts whose webhook deliveries are still undecided
+
+    def settle(self):
+        if not self.waiting and not self.future.done():
+            self.future.set_result(self.received)
+
+
+class _Ticket:
+    """One alert no stream took, waiting for any of its webhook deliveries to succeed."""
+
+    __slots__ = ('receipt', 'index', 'left')
+
+    def __init__(self, receipt: _Receipt, index: int, webhooks: int):
+        self.receipt = receipt
+        self.index = index
+        self.left = webhooks
+        receipt.waiting += 1
+
+    def delivered(self):
+        if self.left:
+            self.left = 0
+            self.receipt.received[self.index] = True
+            self.receipt.waiting -= 1
+            self.receipt.settle()
+
+    def failed(self):
+        if self.left:
+            self.left -= 1
+            if not self.left:
+                self.receipt.waiting -= 1
+                self.receipt.settle()
+
+
+class _Stream:
+    """A connected ``/events`` client and the alerts not yet handed to its connection."""
+
+    __slots__ = ('creators', 'tiers', 'writer', 'transport', 'pending', 'catching_up', 'dropped')
+
+    def __init__(self, queue_size: int, creators: set, tiers: set, writer: asyncio.StreamWriter):
+        self.creators = creators
+        self.tiers = tiers
+        self.writer = writer
+        self.transport = writer.transport
+        self.transport.set_write_buffer_limits(high=STREAM_BUFFER_BYTES)
+        self.pending = deque(maxlen=queue_size)
+        self.catching_up = False  # waiting for the client to read what is buffered
+        self.dropped = 0
+
+    @property
+    def filtered(self) -> bool:
+        return bool(self.creators or self.tiers)
+
+    def wants(self, alert: dict) -> bool:
+        return ((not self.creators or alert.get('creator_name', '').lower() in self.creators)
+                and (not self.tiers or alert.get('tier_name', '').lower() in self.tiers))
+
+    def offer(self, frame: bytes):
+        if len(self.pending) == self.pending.maxlen:
+            self.dropped += 1
+            _STREAM_DROPPED.inc()
+        self.pending.append(frame)
+
+
+class Webhook:
+    """A URL that alerts are POSTed to.
+
+    Args:
+        url (str): Endpoint; any 2xx response counts as delivered.
+        secret (str, optional): Key for the ``X-Alert-Signature`` HMAC.
+        retries (int): Extra attempts after a failed POST.
+        backoff_seconds (float): Delay before the first retry; doubled each time.
+        timeout (float): Seconds to wait for the endpoint.
+    """
+
+    def __init__(self, url: str, secret: str = None, retries: int = 2, backoff_seconds: float = 0.5,
+                 timeout: float = 5.0, sleep=time.sleep):
+        self.url = url
+        self.secret = secret.encode() if secret else None
+        self.retries = retries
+        self.backoff_seconds = backoff_seconds
+        self.timeout = timeout
+        self.healthy = True  # False from a failed delivery until the next successful one
+        self.queue = None  # created on the bus's event loop
+        self._sleep = sleep
+        self._session = requests.Session()
+
+    def __repr__(self):
+        return f"Webhook({self.url!r})"
+
+    def post(self, body: bytes) -> bool:
+        """POSTs one alert with retries; blocking. Returns True if it was delivered."""
+        headers = {'Content-Type': 'application/json'}
+        if self.secret:
+            headers['X-Alert-Signature'] = 'sha256=' + hmac.new(self.secret, body, hashlib.sha256).hexdigest()
+        delay = self.backoff_seconds
+        for attempt in range(self.retries + 1):
+            try:
+                response = self._session.post(self.url, data=body, headers=headers, timeout=self.timeout)
+                if 200 <= response.status_code < 300:
+                    self.healthy = True
+                    return True
+                detail = f"HTTP {response.status_code}"
+            except requests.exceptions.RequestException as e:
+                detail = str(e)
+            if attempt < self.retries:
+                self._sleep(delay)
+                delay *= 2
+        log.warning("Webhook %s failed after %d attempt(s): %s", self.url, self.retries + 1, detail)
+        self.healthy = False
+        return False
+
+    def close(self):
+        self._session.close()
+
+
+class AlertBus:
+    """Fans alerts out to stream subscribers and webhooks from its own thread.
+
+    Args:
+        port (int, optional): Port for ``/events``; 0 picks a free one, None
+            serves no stream.
+        host (str): Interface to bind. Defaults to localhost only.
+        webhooks (list): ``Webhook`` instances.
+        queue_size (int): Alerts each subscriber may fall behind by, beyond
+            what a stream's connection buffers.
+        sms_fallback (bool): Tells the caller to wait for ``publish``'s
+            result and skip SMS for the alerts a subscriber received.
+    """
+
+    def __init__(self, port: int = None, host: str = '127.0.0.1', webhooks: list = (),
+                 queue_size: int = DEFAULT_QUEUE_SIZE, sms_fallback: bool = False,
+                 keepalive_seconds: float = KEEPALIVE_SECONDS):
+        if queue_size < 1:
+            raise ValueError("queue_size must be at least 1")
+        self.port = port
+        self.host = host
+        self.webhooks = list(webhooks)
+        self.queue_size = queue_size
+        self.sms_fallback = sms_fallback
+        self.keepalive_seconds = keepalive_seconds
+        self.address = None  # (host, port) the stream is served on, once started
+        self._streams = set()  # without filters
+        self._filtered = set()
+        self._dirty = set()  # streams with alerts queued since the last flush
+        self._flush_from = None  # when the oldest of those alerts was published, if a flush is scheduled
+        self._recent = deque(maxlen=RECENT_ALERTS)  # (id, alert, frame)
+        self._ids = itertools.count(1)
+        self._loop = None
+        self._stopping = None
+        self._thread = None
+        self._executor = None
+        self._ready = threading.Event()
+        self._error = None
+
+    @classmethod
+    def from_config(cls, config: dict):
+        """Builds the bus described by ``alert_bus``, or returns None if it is not set.
+
+        Raises:
+            ValueError: If the settings are invalid.
+        """
+        settings = config.get('alert_bus')
+        if not settings:
+            return None
+        webhooks = []
+        for hook in settings.get('webhooks') or []:
+            hook = {'url': hook} if isinstance(hook, str) else dict(hook)
+            if not hook.get('url'):
+                raise ValueError("every webhook needs a url")
+            webhooks.append(Webhook(hook['url'], hook.get('secret'), timeout=hook.get('timeout_seconds', 5.0)))
+        if settings.get('port') is None and not webhooks:
+            raise ValueError("set a port for the alert stream or at least one webhook")
+        return cls(port=settings.get('port'), host=settings.get('host', '127.0.0.1'), webhooks=webhooks,
+                   queue_size=int(settings.get('queue_size', DEFAULT_QUEUE_SIZE)),
+                   sms_fallback=bool(settings.get('sms_fallback', False)))
+
+    @property
+    def subscribers(self) -> int:
+        """Connected stream subscribers."""
+        return len(self._streams) + len(self._filtered)
+
+    def start(self):
+        """Starts the bus thread and waits until the stream is listening.
+
+        Raises:
+            OSError: If the port cannot be bound.
+        """
+        self._executor = ThreadPoolExecutor(max_workers=max(1, len(self.webhooks)), thread_name_prefix='alert-webhook')
+        self._thread = threading.Thread(target=asyncio.run, args=(self._serve(),), name='alert-bus', daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._error is not None:
+            self._thread.join()
+            self._executor.shutdown(wait=False)
+            raise self._error
+        return self
+
+    def publish(self, alerts: list) -> Future:
+        """Hands alerts to every subscriber without waiting for any of them.
+
+        Safe to call from any thread.
+
+        Returns:
+            Future: Resolves to one bool per alert, True if a subscriber
+            received it: a connected stream whose filters match it was sent
+            it, or a webhook delivered it. An alert only webhooks could take
+            is decided once they have delivered it or given up on it, so the
+            result may take as long as their retries.
+        """
+        future = Future()
+        alerts = list(alerts)
+        if not alerts or self._loop is None:
+            future.set_result([False] * len(alerts))
+            return future
+        self._loop.call_soon_threadsafe(self._fan_out, alerts, time.time(), time.perf_counter(), future)
+        return future
+
+    def close(self):
+        """Stops the stream and waits (briefly) for webhooks to deliver what is queued."""
+        if self._loop is None or self._thread is None:
+            return
+        self._loop.call_soon_threadsafe(self._stopping.set)
+        self._thread.join(DRAIN_SECONDS + 5)
+        self._executor.shutdown(wait=False)
+        for hook in self.webhooks:
+            hook.close()
+        self._loop = None
+
+    # Everything below runs on the bus thread.
+
+    async def _serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        server = None
+        if self.port is not None:
+            try:
+                server = await asyncio.start_server(self._handle, self.host, self.port, backlog=1024)
+            except OSError as e:
+                self._error = e
+                self._loop = None
+                self._ready.set()
+                return
+            self.address = server.sockets[0].getsockname()[:2]
+        for hook in self.webhooks:
+            hook.queue = asyncio.Queue(self.queue_size)
+        senders = [asyncio.create_task(self._send(hook)) for hook in self.webhooks]
+        self._ready.set()
+
+        keepalive = asyncio.create_task(self._keepalive())
+        await self._stopping.wait()
+        keepalive.cancel()
+        if server is not None:
+            server.close()
+        for stream in list(self._streams | self._filtered):
+            stream.writer.close()
+        if senders:
+            try:
+                await asyncio.wait_for(asyncio.gather(*(hook.queue.join() for hook in self.webhooks)),
+                                       DRAIN_SECONDS)
+            except asyncio.TimeoutError:
+                log.warning("Webhook deliveries still queued at shutdown were dropped.")
+            for sender in senders:
+                sender.cancel()
+            await asyncio.gather(*senders, return_exceptions=True)
+            for hook in self.webhooks:
+                while not hook.queue.empty():
+                    ticket = hook.queue.get_nowait()[2]
+                    if ticket is not None:
+                        ticket.failed()
+
+    def _fan_out(self, alerts: list, published_at: float, published: float, future: Future):
+        dirty = self._dirty
+        receipt = _Receipt(future, len(alerts))
+        for index, alert in enumerate(alerts):
+            event_id = next(self._ids)
+            data = json.dumps(dict(alert, id=event_id, published_at=published_at), separators=(',', ':'))
+            frame = f'id: {event_id}\nevent: alert\ndata: {data}\n\n'.encode()
+            self._recent.append((event_id, alert, frame))
+            PUBLISHED.inc()
+            for stream in self._streams:
+                stream.offer(frame)
+            dirty.update(self._streams)
+            streamed = bool(self._streams)
+            for stream in self._filtered:
+                if stream.wants(alert):
+                    stream.offer(frame)
+                    dirty.add(stream)
+                    streamed = True
+            receipt.received[index] = streamed
+            if self.webhooks:
+                body = data.encode()
+                ticket = None if streamed else _Ticket(receipt, index, len(self.webhooks))
+                for hook in self.webhooks:
+                    _offer(hook.queue, (body, published, ticket))
+        receipt.settle()
+        if dirty and self._flush_from is None:
+            # Runs after any other publishes already waiting on the loop, so they share the writes.
+            self._flush_from = published
+            self._loop.call_soon(self._flush)
+
+    def _flush(self):
+        for stream in self._dirty:
+            if not stream.catching_up:
+                self._write(stream)
+        self._dirty.clear()
+        _STREAM_DELIVERY.observe(time.perf_counter() - self._flush_from)
+        self._flush_from = None
+
+    def _write(self, stream: _Stream):
+        transport = stream.transport
+        if transport.is_closing():
+            stream.pending.clear()
+        elif transport.get_write_buffer_size() < STREAM_BUFFER_BYTES:
+            transport.write(b''.join(stream.pending))
+            stream.pending.clear()
+        else:
+            stream.catching_up = True
+            asyncio.ensure_future(self._catch_up(stream))
+
+    async def _catch_up(self, stream: _Stream):
+        """Writes a slow stream's queued alerts as its client reads; newer ones queue (and old ones drop) meanwhile."""
+        try:
+            while stream.pending:
+                await stream.writer.drain()
+                stream.transport.write(b''.join(stream.pending))
+                stream.pending.clear()
+        except ConnectionError:
+            pass
+        finally:
+            stream.catching_up = False
+
+    async def _keepalive(self):
+        while True:
+            await asyncio.sleep(self.keepalive_seconds)
+            for stream in list(self._streams | self._filtered):
+                if not stream.pending and not stream.transport.is_closing():
+                    stream.transport.write(b': keepalive\n\n')
+
+    async def _send(self, hook: Webhook):
+        loop = asyncio.get_running_loop()
+        while True:
+            body, published, ticket = await hook.queue.get()
+            delivered = False
+            try:
+                delivered = await loop.run_in_executor(self._executor, hook.post, body)
+                WEBHOOK_DELIVERIES.labels('ok' if delivered else 'failed').inc()
+                if delivered:
+                    _WEBHOOK_DELIVERY.observe(time.perf_counter() - published)
+            finally:
+                hook.queue.task_done()
+                if ticket is not None and delivered:
+                    ticket.delivered()
+                elif ticket is not None:
+                    ticket.failed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        stream = None
+        try:
+            request = await asyncio.wait_for(_read_request(reader), REQUEST_TIMEOUT_SECONDS)
+            if request is None:
+                writer.write(NOT_FOUND)
+                await writer.drain()
+                return
+            query, last_event_id = request
+            creators = {name.lower() for name in query.get('creator', ())}
+            tiers = {name.lower() for name in query.get('tier', ())}
+            stream = _Stream(self.queue_size, creators, tiers, writer)
+            writer.write(STREAM_HEADERS)
+            if last_event_id is not None:
+                for event_id, alert, frame in self._recent:
+                    if event_id > last_event_id and stream.wants(alert):
+                        writer.write(frame)
+            (self._filtered if stream.filtered else self._streams).add(stream)
+            SUBSCRIBERS.set(self.subscribers)
+            # Clients send nothing after the request, so this returns once they hang up.
+            while await reader.read(4096):
+                pass
+        except (ConnectionError, asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                asyncio.CancelledError):
+            pass  # hung up, or the bus is closing
+        finally:
+            if stream is not None:
+                (self._filtered if stream.filtered else self._streams).discard(stream)
+                self._dirty.discard(stream)
+                SUBSCRIBERS.set(self.subscribers)
+            writer.close()
+
+
+async def _read_request(reader: asyncio.StreamReader):
+    """Reads an HTTP request head; returns ``(query, last_event_id)`` for ``GET /events``, else None."""
+    request_line = (await reader.readuntil(b'\r\n')).decode('latin-1').split()
+    last_event_id = None
+    while True:
+        line = await reader.readuntil(b'\r\n')
+        if line == b'\r\n':
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'last-event-id':
+            try:
+                last_event_id = int(value.strip())
+            except ValueError:
+                pass
+    if len(request_line) < 2 or request_line[0] != 'GET':
+        return None
+    target = urlsplit(request_line[1])
+    if target.path != '/events':
+        return None
+    return parse_qs(target.query), last_event_id
@@ -0,0 +1,189 @@
+"""Concurrent alert dispatch with per-channel retries and optional merging.
+
+A ``Channel`` is a provider bound to one recipient: a blocking
+``send(recipient, message)`` function plus its retry policy. Channels are
+built once (provider clients included) and reused for every dispatch.
+``AlertDispatcher`` turns the alerts routed to each channel into messages, at
+most ``MAX_SMS_LENGTH`` characters each, and sends them from a thread pool
+that is shared across cycles. Alerts for the same channel can be merged into
+as few messages as fit.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Two SMS segments; longer messages are truncated.
+MAX_SMS_LENGTH = 320
+
+
+class PermanentSendError(Exception):
+    """A send failure that retrying will not fix (e.g. rejected by the provider)."""
+
+
+class Channel:
+    """A provider bound to a recipient.
+
+    Args:
+        provider (str): Provider name, used in log messages.
+        recipient (str): Destination passed to ``send``.
+        send (callable): ``send(recipient, message) -> str`` returning a short
+            description of the sent message (e.g. its ID). Raises on failure.
+        retries (int): Extra attempts after a failed send.
+        backoff_seconds (float): Delay before the first retry; doubled each time.
+    """
+
+    __slots__ = ('provider', 'recipient', 'send', 'retries', 'backoff_seconds')
+
+    def __init__(self, provider: str, recipient: str, send, retries: int = 2, backoff_seconds: float = 0.5):
+        self.provider = provider
+        self.recipient = recipient
+        self.send = send
+        self.retries = retries
+        self.backoff_seconds = backoff_seconds
+
+    def __repr__(self):
+        return f"Channel({self.provider!r}, {self.recipient!r})"
+
+
+class SendResult:
+    """Outcome of sending one message."""
+
+    __slots__ = ('channel', 'message', 'alerts', 'ok', 'detail', 'attempts', 'finished_at')
+
+    def __init__(self, channel, message, alerts, ok, detail, attempts, finished_at):
+        self.channel = channel
+        self.message = message
+        self.alerts = alerts
+        self.ok = ok
+        self.detail = detail
+        self.attempts = attempts
+        self.finished_at = finished_at
+
+
+def truncate_message(message: str, limit: int = MAX_SMS_LENGTH) -> str:
+    if len(message) > limit:
+        return message[:limit - 3] + "..."
+    return message
+
+
+def describe_alert(alert: dict) -> str:
+    """What happened to the tier, e.g. ``"is now available (3 left)"``."""
+    event = alert.get('event')
+    remaining = alert.get('remaining')
+    left = f" ({remaining} left)" if remaining is not None else ""
+    if event == 'restocked':
+        return f"restocked {alert.get('added')} slot(s){left}"
+    if event == 'almost_sold_out':
+        return f"is almost sold out{left}"
+    return f"is now available{left}"
+
+
+def format_alert_message(alert: dict) -> str:
+    return truncate_message(
+        f"Patreon Alert: Tier '{alert['tier_name']}' for creator '{alert['creator_name']}' "
+        f"{describe_alert(alert)}! Check at: {alert['url']}"
+    )
+
+
+def build_messages(alerts: list, merge: bool = False, limit: int = MAX_SMS_LENGTH) -> list:
+    """Builds ``(message, alerts)`` pairs for one channel.
+
+    Without ``merge`` every alert gets its own message. With it, alerts are
+    packed greedily into as few messages of at most ``limit`` characters as
+    possible; an alert that does not fit alongside others is sent alone.
+    """
+    if not merge or len(alerts) < 2:
+        return [(format_alert_message(alert), [alert]) for alert in alerts]
+
+    messages = []
+    group = []
+    body = ''
+
+    def flush():
+        if len(group) == 1:
+            messages.append((format_alert_message(group[0]), list(group)))
+        elif group:
+            messages.append((f"Patreon Alert: {len(group)} tiers available! {body}", list(group)))
+
+    for alert in alerts:
+        item = f"'{alert['tier_name']}' ({alert['creator_name']}) {alert['url']}"
+        candidate = f"{body}; {item}" if body else item
+        header = f"Patreon Alert: {len(group) + 1} tiers available! "
+        if group and len(header) + len(candidate) > limit:
+            flush()
+            group, body = [], item
+        else:
+            body = candidate
+        group.append(alert)
+    flush()
+    return messages
+
+
+class AlertDispatcher:
+    """Sends messages for many channels concurrently with bounded parallelism.
+
+    Args:
+        max_parallel (int): Maximum number of sends in flight.
+        merge (bool): Merge the alerts routed to one channel into fewer messages.
+        sleep (callable): Used for retry backoff, overridable for tests.
+    """
+
+    def __init__(self, max_parallel: int = 4, merge: bool = False, sleep=time.sleep):
+        if max_parallel < 1:
+            raise ValueError("max_parallel must be at least 1")
+        self.max_parallel = max_parallel
+        self.merge = merge
+        self._sleep = sleep
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_parallel,
+                                                    thread_name_prefix='alert-dispatch')
+            return self._executor
+
+    def _send_with_retry(self, channel: Channel, message: str, alerts: list) -> SendResult:
+        attempts = 0
+        delay = channel.backoff_seconds
+        while True:
+            attempts += 1
+            try:
+                detail = channel.send(channel.recipient, message)
+                return SendResult(channel, message, alerts, True, detail, attempts, time.monotonic())
+            except PermanentSendError as e:
+                return SendResult(channel, message, alerts, False, str(e), attempts, time.monotonic())
+            except Exception as e:
+                if attempts > channel.retries:
+                    return SendResult(channel, message, alerts, False, str(e), attempts, time.monotonic())
+            self._sleep(delay)
+            delay *= 2
+
+    def dispatch(self, routed) -> list:
+        """Sends the alerts routed to each channel and waits for all sends.
+
+        Args:
+            routed: Iterable of ``(channel, alerts)`` pairs.
+
+        Returns:
+            list: A SendResult per message, in submission order.
+        """
+        jobs = [
+            (channel, message, message_alerts)
+            for channel, alerts in routed
+            for message, message_alerts in build_messages(alerts, self.merge)
+        ]
+        if not jobs:
+            return []
+        if len(jobs) == 1:
+            return [self._send_with_retry(*jobs[0])]
+        pool = self._pool()
+        futures = [pool.submit(self._send_with_retry, *job) for job in jobs]
+        return [future.result() for future in futures]
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
@@ -0,0 +1,144 @@
+"""Asyncio fetch engine with bounded concurrency and token-bucket rate limiting.
+
+The engine is deliberately agnostic of what a "fetch" is: it wraps any blocking
+callable taking a URL as its first argument and runs it in a worker thread while
+enforcing an overall concurrency cap, a per-host concurrency cap and a per-host
+token bucket. The alerter plugs ``scrape_patreon_page`` into it.
+
+With an egress pool (see ``egress``) the per-host limits are replaced by those
+of the egress each URL is routed through, and the fetch is also passed that
+egress's ``session``.
+"""
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+
+class TokenBucket:
+    """Asynchronous token bucket used to pace requests to a host.
+
+    Args:
+        rate (float): Tokens added per second (sustained requests per second).
+        capacity (float, optional): Maximum number of tokens that can accumulate,
+            i.e. the allowed burst. Defaults to ``max(1, rate)``.
+        clock (callable, optional): Monotonic clock, overridable for tests.
+    """
+
+    def __init__(self, rate: float, capacity: float = None, clock=time.monotonic):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity is not None else max(1.0, self.rate)
+        if self.capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = None
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self) -> bool:
+        """Takes a token if one is available without waiting."""
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    async def acquire(self):
+        """Waits until a token is available and consumes it.
+
+        Waiters are served in FIFO order because the wait happens while holding
+        the bucket's lock.
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while not self.try_acquire():
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class _HostLimits:
+    __slots__ = ("semaphore", "bucket")
+
+    def __init__(self, concurrency: int, rate: float, burst: float):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.bucket = TokenBucket(rate, burst)
+
+
+class FetchEngine:
+    """Runs blocking fetches concurrently under global and per-host limits.
+
+    Must be created and used inside a single running event loop.
+
+    Args:
+        fetch (callable): Blocking function ``fetch(url, *args, **kwargs)`` to run.
+        max_concurrency (int): Maximum number of fetches in flight overall.
+        per_host_concurrency (int): Maximum number of fetches in flight per host.
+        requests_per_second (float): Sustained request rate allowed per host.
+        burst (float, optional): Token-bucket capacity per host.
+        egress_pool (EgressPool, optional): Route fetches through its egresses.
+    """
+
+    def __init__(self, fetch, max_concurrency: int = 8, per_host_concurrency: int = 4,
+                 requests_per_second: float = 1.0, burst: float = None, egress_pool=None):
+        if max_concurrency < 1 or per_host_concurrency < 1:
+            raise ValueError("concurrency limits must be at least 1")
+        self._fetch = fetch
+        self._global = asyncio.Semaphore(max_concurrency)
+        self._per_host_concurrency = per_host_concurrency
+        self._rate = requests_per_second
+        self._burst = burst
+        self._hosts = {}
+        self.egress_pool = egress_pool
+
+    @classmethod
+    def from_config(cls, fetch, config: dict, egress_pool=None):
+        """Builds an engine from the top-level alerter configuration."""
+        return cls(
+            fetch,
+            max_concurrency=config.get('max_concurrent_requests', 8),
+            per_host_concurrency=config.get('max_requests_per_host', 4),
+            requests_per_second=config.get('requests_per_second', 1.0),
+            burst=config.get('request_burst'),
+            egress_pool=egress_pool,
+        )
+
+    def _limits_for(self, url: str) -> _HostLimits:
+        host = urlsplit(url).netloc.lower()
+        limits = self._hosts.get(host)
+        if limits is None:
+            limits = _HostLimits(self._per_host_concurrency, self._rate, self._burst)
+            self._hosts[host] = limits
+        return limits
+
+    async def fetch(self, url: str, *args, **kwargs):
+        """Fetches ``url`` once the host's (or egress's) slot and rate budget allow it."""
+        return await self.run(self._fetch, url, *args, **kwargs)
+
+    async def run(self, function, url: str, *args, **kwargs):
+        """Calls the blocking ``function(url, *args, **kwargs)`` under ``url``'s limits, like ``fetch``.
+
+        With an egress pool whose egresses are all cooling down, waits for
+        the first to recover instead of sending the request through one.
+        """
+        if self.egress_pool is not None:
+            egress = self.egress_pool.choose(url)
+            while egress is None:
+                await asyncio.sleep(self.egress_pool.seconds_until_available())
+                egress = self.egress_pool.choose(url)
+            async with egress.semaphore:
+                await egress.bucket.acquire()
+                async with self._global:
+                    return await asyncio.to_thread(function, url, *args, session=egress.session, **kwargs)
+        limits = self._limits_for(url)
+        # Take the host slot first so a backlog for one host does not pin
+        # global slots that other hosts could be using.
+        async with limits.semaphore:
+            await limits.bucket.acquire()
+            async with self._global:
+                return await asyncio.to_thread(function, url, *args, **kwargs)
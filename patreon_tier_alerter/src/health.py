@@ -0,0 +1,278 @@
+"""Fetch health per page and per host: circuit breakers, Retry-After and hedging.
+
+``FetchHealth`` keeps a circuit breaker for every page URL and every host.
+After ``failure_threshold`` consecutive failed fetches of a page, or when
+``host_failure_ratio`` of a host's recent fetches failed, the breaker opens
+and the page (or host) is not requested again until a jittered,
+exponentially growing backoff has passed. Then a single probe request is let through: success closes the
+breaker, failure opens it again for longer.
+
+A ``429 Too Many Requests`` blocks the whole host, and a ``503`` with
+``Retry-After`` blocks the page, for at least as long as the server asked.
+
+Successful fetch times are kept per host, so high-priority pages can send a
+second ("hedged") request when the first is slower than the host's usual
+``hedge_percentile`` latency.
+
+Configuration::
+
+    "fetch_health": {"failure_threshold": 3, "host_failure_ratio": 0.8,
+                     "backoff_seconds": 60, "max_backoff_seconds": 3600,
+                     "jitter": 0.2, "hedge_percentile": 0.9}
+"""
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Successful fetch times remembered per host, and how many are needed before hedging.
+LATENCY_WINDOW = 200
+MIN_HEDGE_SAMPLES = 20
+# Recent fetch outcomes per host judged by host_failure_ratio, and how many are needed first.
+HOST_WINDOW = 20
+MIN_HOST_SAMPLES = 10
+# A probe whose outcome was never recorded stops holding other fetches back after this long.
+PROBE_TIMEOUT_SECONDS = 60
+
+
+def parse_retry_after(value, now: float = None) -> float:
+    """Returns the delay a ``Retry-After`` header asks for, in seconds.
+
+    Args:
+        value (str): Either a number of seconds or an HTTP date.
+        now (float, optional): Current wall-clock time, for HTTP dates.
+
+    Returns:
+        float: Seconds to wait (0 if the date has passed), or None if the
+        value is missing or malformed.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+    return max(0.0, when - (time.time() if now is None else now))
+
+
+class _Breaker:
+    __slots__ = ('state', 'failures', 'opens', 'open_until', 'probe_until', 'outcomes')
+
+    def __init__(self, window: int = None):
+        self.state = CLOSED
+        self.failures = 0
+        self.opens = 0
+        self.open_until = 0.0
+        self.probe_until = 0.0
+        self.outcomes = deque(maxlen=window) if window else None  # True for a failure
+
+
+class FetchHealth:
+    """Tracks fetch outcomes and decides whether a page may be requested now.
+
+    Thread-safe: outcomes are recorded from the engine's worker threads.
+
+    Args:
+        failure_threshold (int): Consecutive failures that open a page's breaker.
+        host_failure_ratio (float): Share of the host's last ``HOST_WINDOW``
+            fetches that must have failed to open the host's breaker. A few
+            broken pages therefore do not block the healthy ones.
+        backoff_seconds (float): How long a breaker first stays open.
+        max_backoff_seconds (float): Ceiling for the doubling backoff.
+        jitter (float): Each backoff is scaled by a random factor in
+            ``[1 - jitter, 1 + jitter]`` so pages do not all retry together.
+        hedge_percentile (float): Latency percentile after which a hedged
+            request is sent; None disables hedging.
+        enabled (bool): When False every fetch is allowed and nothing is hedged.
+        clock (callable): Monotonic clock, overridable for tests.
+        rng (callable): Returns a float in [0, 1), overridable for tests.
+    """
+
+    def __init__(self, failure_threshold: int = 3, host_failure_ratio: float = 0.8,
+                 backoff_seconds: float = 60, max_backoff_seconds: float = 3600, jitter: float = 0.2,
+                 hedge_percentile: float = 0.9, enabled: bool = True, clock=time.monotonic, rng=random.random):
+        self._clock = clock
+        self._rng = rng
+        self._lock = threading.Lock()
+        self._pages = {}
+        self._hosts = {}
+        self._latencies = {}
+        self.configure(failure_threshold, host_failure_ratio, backoff_seconds, max_backoff_seconds,
+                       jitter, hedge_percentile, enabled)
+
+    def configure(self, failure_threshold: int = 3, host_failure_ratio: float = 0.8,
+                  backoff_seconds: float = 60, max_backoff_seconds: float = 3600, jitter: float = 0.2,
+                  hedge_percentile: float = 0.9, enabled: bool = True):
+        if failure_threshold < 1:
+            raise ValueError("failure_threshold must be at least 1")
+        if not 0 < host_failure_ratio <= 1:
+            raise ValueError("host_failure_ratio must be in (0, 1]")
+        if not 0 < backoff_seconds <= max_backoff_seconds:
+            raise ValueError("backoff must satisfy 0 < backoff_seconds <= max_backoff_seconds")
+        if not 0 <= jitter < 1:
+            raise ValueError("jitter must be in [0, 1)")
+        if hedge_percentile is not None and not 0 < hedge_percentile < 1:
+            raise ValueError("hedge_percentile must be between 0 and 1")
+        self.failure_threshold = failure_threshold
+        self.host_failure_ratio = host_failure_ratio
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.jitter = jitter
+        self.hedge_percentile = hedge_percentile
+        self.enabled = bool(enabled)
+
+    def configure_from(self, config: dict):
+        """Applies the ``fetch_health`` block of a configuration."""
+        settings = config.get('fetch_health') or {}
+        self.configure(
+            failure_threshold=settings.get('failure_threshold', 3),
+            host_failure_ratio=settings.get('host_failure_ratio', 0.8),
+            backoff_seconds=settings.get('backoff_seconds', 60),
+            max_backoff_seconds=settings.get('max_backoff_seconds', 3600),
+            jitter=settings.get('jitter', 0.2),
+            hedge_percentile=settings.get('hedge_percentile', 0.9),
+            enabled=settings.get('enabled', True),
+        )
+
+    @staticmethod
+    def _host(url: str) -> str:
+        return urlsplit(url).netloc.lower()
+
+    def _breakers(self, url: str) -> tuple:
+        page = self._pages.get(url)
+        if page is None:
+            page = self._pages[url] = _Breaker()
+        host_key = self._host(url)
+        host = self._hosts.get(host_key)
+        if host is None:
+            host = self._hosts[host_key] = _Breaker(HOST_WINDOW)
+        return page, host
+
+    def _backoff(self, breaker: _Breaker) -> float:
+        delay = min(self.max_backoff_seconds, self.backoff_seconds * 2 ** breaker.opens)
+        return delay * (1 - self.jitter + 2 * self.jitter * self._rng())
+
+    def _open(self, breaker: _Breaker, now: float, at_least: float = 0.0):
+        breaker.open_until = now + max(self._backoff(breaker), at_least)
+        breaker.opens += 1
+        breaker.state = OPEN
+        breaker.probe_until = 0.0
+
+    @staticmethod
+    def _wait(breaker: _Breaker, now: float) -> float:
+        if breaker.state == OPEN:
+            return max(0.0, breaker.open_until - now)
+        if breaker.state == HALF_OPEN:
+            return max(0.0, breaker.probe_until - now)
+        return 0.0
+
+    def seconds_blocked(self, url: str) -> float:
+        """Seconds until ``url`` may be requested again (0 if it may be now)."""
+        if not self.enabled:
+            return 0.0
+        with self._lock:
+            page, host = self._breakers(url)
+            now = self._clock()
+            return max(self._wait(page, now), self._wait(host, now))
+
+    def admit(self, url: str) -> float:
+        """Asks to fetch ``url`` now.
+
+        Returns 0 if the fetch may go ahead, else the seconds to wait. A
+        breaker whose backoff has passed lets exactly one probe through and
+        holds other callers back until that probe's outcome is recorded.
+        """
+        if not self.enabled:
+            return 0.0
+        with self._lock:
+            now = self._clock()
+            page, host = self._breakers(url)
+            wait = max(self._wait(page, now), self._wait(host, now))
+            if wait:
+                return wait
+            for breaker in (page, host):
+                if breaker.state != CLOSED:
+                    breaker.state = HALF_OPEN
+                    breaker.probe_until = now + PROBE_TIMEOUT_SECONDS
+            return 0.0
+
+    def record_success(self, url: str, seconds: float = None):
+        """Records a fetch that got a usable response, closing any open breaker."""
+        with self._lock:
+            page, host = self._breakers(url)
+            host.outcomes.append(False)
+            for breaker in (page, host):
+                if breaker.state == OPEN:
+                    # Sent before the breaker opened; the backoff (or Retry-After) still stands.
+                    continue
+                breaker.state = CLOSED
+                breaker.failures = 0
+                breaker.opens = 0
+                breaker.probe_until = 0.0
+            if seconds is not None:
+                latencies = self._latencies.get(self._host(url))
+                if latencies is None:
+                    latencies = self._latencies[self._host(url)] = deque(maxlen=LATENCY_WINDOW)
+                latencies.append(seconds)
+
+    def record_failure(self, url: str, status: int = None, retry_after: float = None):
+        """Records a failed fetch.
+
+        Args:
+            status (int, optional): HTTP status, if a response was received.
+            retry_after (float, optional): Seconds from the ``Retry-After`` header.
+        """
+        with self._lock:
+            now = self._clock()
+            page, host = self._breakers(url)
+            if status == 429:
+                # Rate limits apply to the whole host, not only this page.
+                self._open(host, now, retry_after or 0.0)
+                return
+            page.failures += 1
+            host.outcomes.append(True)
+            # A failure of a request sent before the breaker opened does not extend the backoff.
+            if retry_after or (page.state != OPEN and (page.state == HALF_OPEN
+                                                       or page.failures >= self.failure_threshold)):
+                self._open(page, now, retry_after or 0.0)
+            if host.state != OPEN and (host.state == HALF_OPEN or (
+                    len(host.outcomes) >= MIN_HOST_SAMPLES
+                    and sum(host.outcomes) >= self.host_failure_ratio * len(host.outcomes))):
+                self._open(host, now)
+                host.outcomes.clear()
+
+    def hedge_delay(self, url: str) -> float:
+        """Seconds after which a hedged second request for ``url`` should go out.
+
+        Returns None when hedging is off or too few fetches from the host have
+        succeeded to know what a slow one looks like.
+        """
+        if not self.enabled or self.hedge_percentile is None:
+            return None
+        with self._lock:
+            latencies = self._latencies.get(self._host(url))
+            if latencies is None or len(latencies) < MIN_HEDGE_SAMPLES:
+                return None
+            ordered = sorted(latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.hedge_percentile))]
+
+    def state_of(self, url: str) -> str:
+        """The page breaker's state: ``closed``, ``open`` or ``half_open``."""
+        with self._lock:
+            return self._breakers(url)[0].state
+
+    def open_breakers(self) -> int:
+        """Pages and hosts whose breaker is currently not closed."""
+        with self._lock:
+            return sum(1 for breaker in (*self._pages.values(), *self._hosts.values()) if breaker.state != CLOSED)
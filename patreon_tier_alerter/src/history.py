@@ -0,0 +1,572 @@
+"""Append-only history of tier status transitions, and queries over it.
+
+Every time a watched tier's status differs from the last one recorded for it,
+``HistoryLog`` appends a fixed-width record to a binary log::
+
+    header   b'PTHL', version, record size, reserved                (4 x uint32)
+    record   timestamp, series id, transition, seconds in previous  (4 x uint32, little-endian)
+
+A series is one (creator, tier) pair. Series are interned: the log stores
+their index in a ``<log>.series`` file holding one ``[creator, tier]`` JSON
+array per line, which only ever grows. ``transition`` packs the new status
+code, the previous one and the local hour of the week (Monday 00:00 is 0) as
+``status | previous << 8 | hour_of_week << 16``; the first record of a
+series has no previous status (``NONE``) and holds the status it had when
+first seen. Recording costs a dict lookup per watched tier, and records are
+buffered and written by ``flush`` once a cycle ends.
+
+Because each record already says what it changed from, for how long and at
+what local time, reports need no per-series replay or time conversion:
+``HistoryReader`` memory-maps a log as columns, and queries over millions of
+records select with ``itertools.compress`` and count with ``Counter``. ``compact`` drops transitions older than a retention
+period, keeping each series' last status before the cutoff so current states
+survive.
+
+A ``HistoryLog`` holds a shared lock on ``<log>.lock`` while it is open. The
+``compact`` command takes it exclusively and refuses a log that a running
+alerter is writing, since records appended after the swap would go to the
+replaced file; such a log is compacted by its writer
+(``history_retention_days``) instead. Where ``fcntl`` is unavailable, stop
+the alerter before compacting from the command line.
+
+Command line::
+
+    python -m patreon_tier_alerter.src.history LOG [LOG ...] restocks [--creator NAME] [--tier NAME]
+    python -m patreon_tier_alerter.src.history LOG [LOG ...] open [--creator NAME] [--tier NAME]
+    python -m patreon_tier_alerter.src.history LOG [LOG ...] rates [--days 30]
+    python -m patreon_tier_alerter.src.history LOG [LOG ...] compact --keep-days 365
+"""
+import argparse
+import bisect
+import json
+import mmap
+import operator
+import os
+import statistics
+import struct
+import sys
+import threading
+import time
+from array import array
+from collections import Counter
+from itertools import compress, repeat
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks
+    fcntl = None
+
+MAGIC = b'PTHL'
+VERSION = 1
+HEADER = struct.Struct('<4sIII')
+RECORD = struct.Struct('<IIII')
+FIELDS = RECORD.size // 4
+STATUSES = ('missing', 'sold_out', 'available', 'unknown')
+STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+AVAILABLE = STATUS_CODES['available']
+NONE = 0xff  # previous status of a series' first record
+STATUS_MASK = 0xff
+HOURS_PER_WEEK = 168
+
+
+def _transitions(pairs) -> frozenset:
+    """Every ``transition`` value for the given (status, previous) pairs, at any hour of the week."""
+    return frozenset(status | previous << 8 | hour << 16 for status, previous in pairs for hour in range(HOURS_PER_WEEK))
+
+
+CODES = range(len(STATUSES))
+# Transitions that open a tier, that end an open period, and first records.
+OPENED = _transitions((AVAILABLE, previous) for previous in CODES if previous != AVAILABLE)
+CLOSED = _transitions((status, AVAILABLE) for status in CODES if status != AVAILABLE)
+FIRSTS = _transitions((status, NONE) for status in CODES)
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+# On little-endian hosts the columns are sliced straight out of the mapping.
+_ZERO_COPY = sys.byteorder == 'little'
+
+
+def series_path(path: str) -> str:
+    return path + '.series'
+
+
+def lock_path(path: str) -> str:
+    return path + '.lock'
+
+
+def _read_series(path: str) -> list:
+    try:
+        with open(series_path(path), 'r', encoding='utf-8') as f:
+            return [tuple(json.loads(line)) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+def _check_header(data, path: str):
+    if len(data) < HEADER.size:
+        raise ValueError(f"{path} is not a tier history log (too short)")
+    magic, version, record_size, _ = HEADER.unpack_from(data)
+    if magic != MAGIC or record_size != RECORD.size:
+        raise ValueError(f"{path} is not a tier history log")
+    if version != VERSION:
+        raise ValueError(f"{path} has unsupported history log version {version}")
+
+
+class HistoryReader:
+    """Read-only, memory-mapped view of a history log.
+
+    Args:
+        path (str): The log file; its ``.series`` file must sit next to it.
+
+    Attributes:
+        series (list): ``(creator, tier)`` by series ID.
+        timestamps, series_ids, transitions, held: Columns of the log,
+            indexable by record number (memoryviews over the mapping where
+            possible).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.series = _read_series(path)
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        _check_header(self._map, path)
+        self.count = (size - HEADER.size) // RECORD.size
+        end = HEADER.size + self.count * RECORD.size
+        if _ZERO_COPY:
+            self._view = memoryview(self._map)[HEADER.size:end].cast('I')
+        else:
+            self._view = array('I', self._map[HEADER.size:end])
+            self._view.byteswap()
+        self.timestamps = self._view[0::FIELDS]
+        self.series_ids = self._view[1::FIELDS]
+        self.transitions = self._view[2::FIELDS]
+        self.held = self._view[3::FIELDS]
+
+    def close(self):
+        for view in (self.timestamps, self.series_ids, self.transitions, self.held, self._view):
+            if isinstance(view, memoryview):
+                view.release()
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def label(self, series_id: int) -> str:
+        return ' / '.join(self.series[series_id])
+
+    def select(self, creator: str = None, tier: str = None):
+        """Series IDs matching a creator and/or tier name (case-insensitive), or None for all."""
+        if not creator and not tier:
+            return None
+        creator = creator.lower() if creator else None
+        tier = tier.lower() if tier else None
+        return {series_id for series_id, (creator_name, tier_name) in enumerate(self.series)
+                if (creator is None or creator_name.lower() == creator) and (tier is None or tier_name.lower() == tier)}
+
+    def select_rows(self, selector, wanted: set = None, *columns):
+        """Iterates the given columns for records whose transition is in ``selector``.
+
+        ``wanted`` further limits them to those series IDs.
+        """
+        rows = compress(zip(self.series_ids, *columns), map(selector.__contains__, self.transitions))
+        if wanted is None:
+            return rows
+        return (row for row in rows if row[0] in wanted)
+
+    def group(self, rows) -> dict:
+        """Collects rows starting with a series ID into ``{series_id: [rows]}``, skipping empty series."""
+        groups = [[] for _ in self.series]
+        appends = [series_rows.append for series_rows in groups]
+        for row in rows:
+            appends[row[0]](row)
+        return {series_id: series_rows for series_id, series_rows in enumerate(groups) if series_rows}
+
+    def records(self):
+        """Yields ``(timestamp, creator, tier, status)`` with names and status strings."""
+        for timestamp, series_id, transition in zip(self.timestamps, self.series_ids, self.transitions):
+            creator, tier = self.series[series_id]
+            yield timestamp, creator, tier, STATUSES[transition & STATUS_MASK]
+
+    def index_at(self, timestamp: float) -> int:
+        """Index of the first record at or after ``timestamp``; records are in time order."""
+        return bisect.bisect_left(self.timestamps, timestamp)
+
+
+class HistoryLog:
+    """Appends status transitions to a history log.
+
+    Safe to call from several threads. Only one process may write a given
+    log; sharded workers each write their own.
+
+    Args:
+        path (str): The log file; created with its ``.series`` file if missing.
+        retention_days (float, optional): ``maybe_compact`` drops transitions
+            older than this. Nothing is dropped when None.
+        compact_every_seconds (float): Minimum time between compactions.
+        clock (callable): Wall clock, overridable for tests.
+    """
+
+    def __init__(self, path: str, retention_days: float = None, compact_every_seconds: float = 86400,
+                 clock=time.time):
+        self.path = path
+        self.retention_days = retention_days
+        self.compact_every_seconds = compact_every_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._buffer = bytearray()
+        self._pending_series = []
+        self._last_compaction = None
+        self.series = _read_series(path)
+        self._ids = {key: index for index, key in enumerate(self.series)}
+        self._last = [None] * len(self.series)  # last status code per series ID
+        self._since = [0] * len(self.series)  # when each series last changed
+        self._open()
+
+    def _open(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        # Shared, so only a compaction from the command line is kept out (and waited for).
+        self._lock_file = open(lock_path(self.path), 'a')
+        if fcntl is not None:
+            fcntl.flock(self._lock_file, fcntl.LOCK_SH)
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            with open(self.path, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, VERSION, RECORD.size, 0))
+        size = os.path.getsize(self.path)
+        torn = (size - HEADER.size) % RECORD.size
+        if torn:
+            # A record cut short by a crash mid-write; drop it.
+            with open(self.path, 'r+b') as f:
+                f.truncate(size - torn)
+        with HistoryReader(self.path) as reader:
+            for series_id, (transition, timestamp) in dict(zip(reader.series_ids,
+                                                               zip(reader.transitions, reader.timestamps))).items():
+                self._last[series_id] = transition & STATUS_MASK
+                self._since[series_id] = timestamp
+        self._file = open(self.path, 'ab')
+
+    @classmethod
+    def from_config(cls, config: dict, worker_id: str = None):
+        """Opens the log named by ``history_path``, or returns None if it is not set.
+
+        Sharded workers append their ID to the path so each writes its own log.
+        """
+        path = config.get('history_path')
+        if not path:
+            return None
+        if worker_id:
+            path = f"{path}.{worker_id}"
+        return cls(path, retention_days=config.get('history_retention_days'))
+
+    def observe(self, creator: str, tier: str, status: str, timestamp: float = None) -> bool:
+        """Records a tier's status if it differs from the last one recorded.
+
+        Returns:
+            bool: True if a record was buffered.
+        """
+        code = STATUS_CODES.get(status, STATUS_CODES['unknown'])
+        key = (creator, tier)
+        with self._lock:
+            series_id = self._ids.get(key)
+            if series_id is None:
+                series_id = self._ids[key] = len(self.series)
+                self.series.append(key)
+                self._pending_series.append(key)
+                self._last.append(None)
+                self._since.append(0)
+            previous = self._last[series_id]
+            if previous == code:
+                return False
+            timestamp = int(self._clock() if timestamp is None else timestamp)
+            local = time.localtime(timestamp)
+            hour_of_week = (local.tm_wday * 24 + local.tm_hour) << 16
+            if previous is None:
+                transition, held = code | NONE << 8 | hour_of_week, 0
+            else:
+                transition, held = code | previous << 8 | hour_of_week, max(0, timestamp - self._since[series_id])
+            self._last[series_id] = code
+            self._since[series_id] = timestamp
+            self._buffer += RECORD.pack(timestamp, series_id, transition, held)
+            return True
+
+    def flush(self):
+        """Writes buffered series and records. Series go first so every record's ID resolves."""
+        with self._lock:
+            if self._pending_series:
+                with open(series_path(self.path), 'a', encoding='utf-8') as f:
+                    f.writelines(json.dumps(list(key)) + '\n' for key in self._pending_series)
+                self._pending_series.clear()
+            if self._buffer:
+                self._file.write(self._buffer)
+                self._file.flush()
+                self._buffer.clear()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+        self._lock_file.close()
+
+    def maybe_compact(self) -> int:
+        """Compacts if a retention period is set and the last compaction is old enough.
+
+        Returns:
+            int: Records dropped (0 when nothing ran).
+        """
+        if self.retention_days is None:
+            return 0
+        now = self._clock()
+        if self._last_compaction is not None and now - self._last_compaction < self.compact_every_seconds:
+            return 0
+        self._last_compaction = now
+        return self.compact(now - self.retention_days * 86400)
+
+    def compact(self, cutoff: float) -> int:
+        """Rewrites the log without transitions older than ``cutoff``.
+
+        Returns:
+            int: Records dropped.
+        """
+        self.flush()
+        with self._lock:
+            self._file.close()
+            try:
+                dropped = compact_file(self.path, cutoff)
+            finally:
+                self._file = open(self.path, 'ab')
+        return dropped
+
+
+def compact_file(path: str, cutoff: float) -> int:
+    """Rewrites a log keeping records at or after ``cutoff`` plus each series' last earlier record.
+
+    The kept earlier records become the series' first records. The new log
+    is written beside the old one and swapped in atomically.
+
+    Returns:
+        int: Records dropped.
+    """
+    with HistoryReader(path) as reader:
+        start = reader.index_at(cutoff)
+        # Walking backwards from the cutoff, the first record met per series is its state there.
+        baselines = {}
+        for index in range(start - 1, -1, -1):
+            baselines.setdefault(reader.series_ids[index], index)
+            if len(baselines) == len(reader.series):
+                break
+        dropped = start - len(baselines)
+        if dropped == 0:
+            return 0
+        temporary = path + '.compacting'
+        with open(temporary, 'wb') as f:
+            f.write(reader._map[:HEADER.size])
+            for index in sorted(baselines.values()):
+                f.write(RECORD.pack(reader.timestamps[index], reader.series_ids[index],
+                                    reader.transitions[index] & ~0xff00 | NONE << 8, 0))
+            f.write(reader._map[HEADER.size + start * RECORD.size:HEADER.size + reader.count * RECORD.size])
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(temporary, path)
+    return dropped
+
+
+def restock_report(reader: HistoryReader, creator: str = None, tier: str = None) -> dict:
+    """Summarizes when tiers reopened.
+
+    Returns:
+        dict: Per ``"creator / tier"``: ``count``, ``last`` (timestamp),
+        ``weekdays`` and ``hours`` (local-time restock counts), and
+        ``median_sold_out_hours`` (how long it was unavailable before reopening).
+    """
+    return _restock_summary(_restock_rows(reader, creator, tier))
+
+
+def _restock_rows(reader: HistoryReader, creator: str = None, tier: str = None) -> dict:
+    """Reopenings as ``(series id, timestamp, transition, held)`` rows in time order, per ``"creator / tier"``."""
+    restocks = reader.group(reader.select_rows(OPENED, reader.select(creator, tier),
+                                               reader.timestamps, reader.transitions, reader.held))
+    return {reader.label(series_id): rows for series_id, rows in restocks.items()}
+
+
+def _restock_summary(restocks: dict) -> dict:
+    report = {}
+    for label, rows in restocks.items():
+        weekdays = [0] * 7
+        hours = [0] * 24
+        for hour_of_week, count in Counter(map(operator.rshift, map(operator.itemgetter(2), rows), repeat(16))).items():
+            weekday, hour = divmod(hour_of_week, 24)
+            weekdays[weekday] += count
+            hours[hour] += count
+        sold_out = sorted(map(operator.itemgetter(3), rows))
+        report[label] = {
+            'count': len(rows),
+            'last': rows[-1][1],
+            'weekdays': dict(zip(WEEKDAYS, weekdays)),
+            'hours': hours,
+            'median_sold_out_hours': round(statistics.median(sold_out) / 3600, 2),
+        }
+    return report
+
+
+def open_durations(reader: HistoryReader, creator: str = None, tier: str = None) -> dict:
+    """How long tiers stayed available before selling out or disappearing.
+
+    Tiers still available at the end of the log are not counted.
+
+    Returns:
+        dict: Per ``"creator / tier"``: ``count``, ``median_minutes``,
+        ``min_minutes`` and ``max_minutes``.
+    """
+    return _open_summary(_open_rows(reader, creator, tier))
+
+
+def _open_rows(reader: HistoryReader, creator: str = None, tier: str = None) -> dict:
+    """Ends of open periods as ``(series id, seconds open)`` rows, per ``"creator / tier"``."""
+    closes = reader.group(reader.select_rows(CLOSED, reader.select(creator, tier), reader.held))
+    return {reader.label(series_id): rows for series_id, rows in closes.items()}
+
+
+def _open_summary(closes: dict) -> dict:
+    report = {}
+    for label, rows in closes.items():
+        seconds = sorted(map(operator.itemgetter(1), rows))
+        report[label] = {
+            'count': len(seconds),
+            'median_minutes': round(statistics.median(seconds) / 60, 1),
+            'min_minutes': round(seconds[0] / 60, 1),
+            'max_minutes': round(seconds[-1] / 60, 1),
+        }
+    return report
+
+
+def change_rates(reader: HistoryReader, days: float = None, now: float = None) -> dict:
+    """Status changes per day for each creator, over the last ``days`` or the whole log.
+
+    Returns:
+        dict: Per creator, busiest first: ``changes`` and ``per_day``.
+    """
+    if not reader.count:
+        return {}
+    end = now if now is not None else max(reader.timestamps)
+    since = end - days * 86400 if days else min(reader.timestamps)
+    start = reader.index_at(since) if days else 0
+    series_ids = reader.series_ids[start:]
+    changes = Counter(series_ids)
+    changes.subtract(compress(series_ids, map(FIRSTS.__contains__, reader.transitions[start:])))
+    per_creator = Counter()
+    for series_id, count in changes.items():
+        per_creator[reader.series[series_id][0]] += count
+    span_days = max((end - since) / 86400, 1 / 24)
+    return {
+        creator: {'changes': count, 'per_day': round(count / span_days, 2)}
+        for creator, count in per_creator.most_common() if count
+    }
+
+
+def _merge_rows(groups: list, order=None) -> dict:
+    """Joins per-series rows from several logs, as a series is split across them after rebalancing.
+
+    With ``order`` (a sort key) each series' joined rows are sorted by it.
+    """
+    merged = {}
+    for group in groups:
+        for label, rows in group.items():
+            merged.setdefault(label, []).extend(rows)
+    if order is not None and len(groups) > 1:
+        for rows in merged.values():
+            rows.sort(key=order)
+    return merged
+
+
+def _merge_rates(reports: list) -> dict:
+    merged = {}
+    for report in reports:
+        for creator, row in report.items():
+            if creator in merged:
+                row = {'changes': merged[creator]['changes'] + row['changes'],
+                       'per_day': round(merged[creator]['per_day'] + row['per_day'], 2)}
+            merged[creator] = row
+    return dict(sorted(merged.items(), key=lambda item: -item[1]['changes']))
+
+
+def _print_report(command: str, report: dict):
+    if not report:
+        print("No matching history.")
+        return
+    for key, row in report.items():
+        if command == 'restocks':
+            busiest_day = max(row['weekdays'], key=row['weekdays'].get)
+            busiest_hour = max(range(24), key=row['hours'].__getitem__)
+            last = time.strftime('%Y-%m-%d %H:%M', time.localtime(row['last']))
+            print(f"{key}: {row['count']} restock(s), last {last}, mostly {busiest_day} around "
+                  f"{busiest_hour:02d}:00, median {row['median_sold_out_hours']} h sold out before")
+        elif command == 'open':
+            print(f"{key}: open {row['count']} time(s), median {row['median_minutes']} min "
+                  f"(min {row['min_minutes']}, max {row['max_minutes']})")
+        else:
+            print(f"{key}: {row['changes']} change(s), {row['per_day']}/day")
+
+
+def main(argv: list = None):
+    ap = argparse.ArgumentParser(description="Query or compact tier status history logs.")
+    ap.add_argument('logs', nargs='+', help="history log file(s), e.g. one per sharded worker")
+    ap.add_argument('command', choices=('restocks', 'open', 'rates', 'compact'))
+    ap.add_argument('--creator', help="only this creator")
+    ap.add_argument('--tier', help="only this tier")
+    ap.add_argument('--days', type=float, help="rates: only the last N days")
+    ap.add_argument('--keep-days', type=float, default=365, help="compact: drop transitions older than this")
+    ap.add_argument('--json', action='store_true', help="print the report as JSON")
+    args = ap.parse_args(argv)
+
+    if args.command == 'compact':
+        cutoff = time.time() - args.keep_days * 86400
+        refused = False
+        for path in args.logs:
+            with open(lock_path(path), 'a') as lock:
+                if fcntl is not None:
+                    try:
+                        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        print(f"{path}: skipped, a running alerter is writing it; stop it first or set "
+                              f"history_retention_days so it compacts the log itself.", file=sys.stderr)
+                        refused = True
+                        continue
+                print(f"{path}: dropped {compact_file(path, cutoff)} record(s).")
+        if refused:
+            sys.exit(1)
+        return
+
+    started = time.perf_counter()
+    # Restocks and open periods are merged as rows before summarizing, so medians cover every log.
+    parts = []
+    records = 0
+    for path in args.logs:
+        with HistoryReader(path) as reader:
+            records += len(reader)
+            if args.command == 'restocks':
+                parts.append(_restock_rows(reader, args.creator, args.tier))
+            elif args.command == 'open':
+                parts.append(_open_rows(reader, args.creator, args.tier))
+            else:
+                parts.append(change_rates(reader, args.days))
+    if args.command == 'restocks':
+        report = _restock_summary(_merge_rows(parts, operator.itemgetter(1)))
+    elif args.command == 'open':
+        report = _open_summary(_merge_rows(parts))
+    else:
+        report = _merge_rates(parts)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    _print_report(args.command, report)
+    print(f"({records} record(s) scanned in {time.perf_counter() - started:.3f} s)", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
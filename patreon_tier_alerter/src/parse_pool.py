@@ -0,0 +1,148 @@
+"""Process pool that parses tier regions off the fetch threads.
+
+``StreamingTierParser.feed`` is mostly byte searches and stays in the fetch
+thread, but finishing the parse (decoding the anchors and running them
+through ``HTMLParser``, and loading and walking the embedded JSON) is pure
+Python and holds the GIL. With many large pages per cycle that caps parsing
+at one core however many fetches are in flight. ``ParsePool`` sends that
+part to worker processes instead.
+
+Only the tier region crosses to a worker: the anchor fragments and the
+``__NEXT_DATA__`` script, as the raw bytes ``feed`` collected. The worker
+decodes and parses them and sends back the region digest and the tiers as
+tuples (see ``tier_parser.parse_region``). Regions smaller than
+``min_bytes`` are cheaper to parse in place than to send, and are.
+
+``parse`` blocks the calling fetch thread until its region is parsed, and
+at most ``max_pending`` regions are queued for or inside the workers at a
+time; further callers wait for room first. A waiting fetch thread keeps its
+fetch engine slot, so when fetching outpaces parsing no new requests start
+until the pool catches up, and memory stays bounded by the engine's
+concurrency rather than growing with the backlog.
+
+Configured with ``"parse_pool": {"workers": 4, "max_pending": 8,
+"min_bytes": 32768}``, or ``true`` for one worker per core. Workers are
+started with ``spawn`` on the first region sent.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from .metrics import REGISTRY
+from .tier_parser import parse_region
+
+PENDING = REGISTRY.gauge('patreon_parse_pool_pending', 'Tier regions queued for or being parsed in the parse pool.')
+WAIT_SECONDS = REGISTRY.histogram(
+    'patreon_parse_pool_wait_seconds', 'Time fetch threads waited for room in the parse pool, when it was full.',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5))
+REGIONS = REGISTRY.counter('patreon_parse_pool_regions_total', 'Tier regions parsed in the parse pool.')
+REGION_BYTES = REGISTRY.counter('patreon_parse_pool_bytes_total', 'Tier region bytes sent to the parse pool.')
+
+log = logging.getLogger(__name__)
+
+
+class ParsePool:
+    """Parses ``StreamingTierParser`` regions in worker processes.
+
+    Args:
+        workers (int, optional): Worker processes. Defaults to one per core.
+        max_pending (int, optional): Regions queued for or being parsed by
+            the workers at once. Defaults to twice ``workers``.
+        min_bytes (int): Regions smaller than this are parsed in the calling
+            thread.
+    """
+
+    def __init__(self, workers: int = None, max_pending: int = None, min_bytes: int = 32768):
+        workers = (os.cpu_count() or 1) if workers is None else workers
+        max_pending = 2 * workers if max_pending is None else max_pending
+        if not isinstance(workers, int) or workers < 1:
+            raise ValueError("workers must be a positive integer")
+        if not isinstance(max_pending, int) or max_pending < 1:
+            raise ValueError("max_pending must be a positive integer")
+        if not isinstance(min_bytes, (int, float)) or min_bytes < 0:
+            raise ValueError("min_bytes must not be negative")
+        self.workers = workers
+        self.max_pending = max_pending
+        self.min_bytes = min_bytes
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pending = 0
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: dict):
+        """Builds the pool described by ``parse_pool``, or returns None if it is not set.
+
+        Raises:
+            ValueError: If the settings are invalid.
+        """
+        settings = config.get('parse_pool')
+        if settings is None or settings is False:
+            return None
+        if settings is True:
+            settings = {}
+        return cls(settings.get('workers'), settings.get('max_pending'), settings.get('min_bytes', 32768))
+
+    @property
+    def pending(self) -> int:
+        """Regions queued for or being parsed by the workers."""
+        return self._pending
+
+    def accepts(self, parser) -> bool:
+        """True if ``parser``'s region is big enough to be worth sending to a worker."""
+        return parser.region_size >= self.min_bytes
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def _discard(self, executor: ProcessPoolExecutor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def parse(self, region: tuple) -> tuple:
+        """Parses ``region`` in a worker, waiting first if the pool is full.
+
+        Returns:
+            tuple: What ``tier_parser.parse_region`` returns. If a worker
+            died the region is parsed in the calling thread instead, and the
+            workers are restarted for the next one.
+        """
+        if not self._slots.acquire(blocking=False):
+            started = time.perf_counter()
+            self._slots.acquire()
+            WAIT_SECONDS.observe(time.perf_counter() - started)
+        with self._lock:
+            self._pending += 1
+        PENDING.inc()
+        try:
+            executor = self._pool()
+            try:
+                result = executor.submit(parse_region, region).result()
+            except BrokenProcessPool:
+                log.warning("A parse pool worker died; restarting the pool.")
+                self._discard(executor)
+                return parse_region(region)
+            REGIONS.inc()
+            REGION_BYTES.inc(sum(len(fragment) for fragment in region[1]) + len(region[2] or b''))
+            return result
+        finally:
+            with self._lock:
+                self._pending -= 1
+            PENDING.inc(-1)
+            self._slots.release()
+
+    def close(self):
+        """Stops the workers. A later ``parse`` starts new ones."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
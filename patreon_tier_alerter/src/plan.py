@@ -0,0 +1,208 @@
+"""Configuration compiled once into an immutable plan, and reloaded on change.
+
+``compile_config`` validates a loaded ``config.json`` and turns its
+``creators`` into one ``PagePlan`` per distinct URL: creators listing the same
+page share a single fetch, and each page carries its watched tier names
+already lowercased. Check cycles work from the plan, so their cost depends on
+the pages fetched rather than on re-reading the configuration.
+
+``ConfigWatcher`` re-reads the file when its modification time changes and
+hands back a new plan; an invalid edit is reported and the current plan kept.
+"""
+import json
+import os
+import time
+from typing import NamedTuple
+
+from .egress import EgressPool
+from .health import FetchHealth
+from .parse_pool import ParsePool
+from .predictor import RestockPredictor
+from .scheduler import AdaptiveScheduler
+
+SUPPORTED_STATE_STORES = ('sqlite', 'memory')
+
+
+class ConfigError(ValueError):
+    """The configuration cannot be used; the message says why."""
+
+
+class CreatorWatch(NamedTuple):
+    """The tiers one creator entry watches on a page."""
+    name: str
+    url: str
+    watched: tuple  # (tier name as configured, lowercased name) pairs
+
+
+class PagePlan(NamedTuple):
+    """One page to fetch and every creator entry watching it."""
+    url: str
+    creators: tuple  # CreatorWatch entries, in configuration order
+    watch_names: tuple  # sorted lowercased names of every tier watched on the page
+    schedule: dict  # creator-like dict handed to the scheduler and shard ring
+    label: str
+    hedged: bool = False  # a creator entry has "priority": "high"; slow fetches get a second request
+
+    @classmethod
+    def from_creators(cls, url: str, creator_configs: list):
+        watches = []
+        restock_times = []
+        hedged = False
+        for creator_config in creator_configs:
+            hedged = hedged or creator_config.get('priority') == 'high'
+            watched = tuple((name, name.lower()) for name in dict.fromkeys(creator_config.get('tiers_to_watch', [])))
+            watches.append(CreatorWatch(creator_config.get('name', 'Unknown Creator'), url, watched))
+            restock_times.extend(creator_config.get('restock_times', []))
+        watch_names = tuple(sorted({lower for watch in watches for _, lower in watch.watched}))
+        label = ' / '.join(dict.fromkeys(watch.name for watch in watches))
+        schedule = {'name': label, 'url': url, 'restock_times': list(dict.fromkeys(restock_times))}
+        return cls(url, tuple(watches), watch_names, schedule, label, hedged)
+
+
+class ConfigPlan(NamedTuple):
+    """A validated configuration ready to run."""
+    config: dict
+    creators: tuple  # the valid creator entries as configured
+    pages: tuple  # PagePlan per distinct URL, in order of first appearance
+    warnings: tuple
+
+    @property
+    def schedules(self) -> list:
+        return [page.schedule for page in self.pages]
+
+
+def compile_config(config: dict) -> ConfigPlan:
+    """Validates a configuration and compiles it into a ``ConfigPlan``.
+
+    Creator entries without a URL or with malformed ``tiers_to_watch`` are
+    dropped with a warning. Problems that make the whole configuration
+    unusable raise ``ConfigError``.
+    """
+    if not isinstance(config, dict):
+        raise ConfigError("the configuration must be a JSON object")
+    creators = config.get('creators')
+    if not creators or not isinstance(creators, list):
+        raise ConfigError("no creators configured to monitor")
+
+    warnings = []
+    valid = []
+    by_url = {}
+    url_for_name = {}
+    for position, creator_config in enumerate(creators, 1):
+        if not isinstance(creator_config, dict):
+            warnings.append(f"creator #{position} is not an object; ignored")
+            continue
+        name = creator_config.get('name', 'Unknown Creator')
+        url = creator_config.get('url')
+        if not url or not isinstance(url, str):
+            warnings.append(f"creator '{name}' has no URL; ignored")
+            continue
+        tiers = creator_config.get('tiers_to_watch', [])
+        if not isinstance(tiers, list) or not all(isinstance(tier, str) for tier in tiers):
+            warnings.append(f"creator '{name}' has tiers_to_watch that is not a list of names; ignored")
+            continue
+        if not tiers:
+            warnings.append(f"creator '{name}' watches no tiers")
+        if url_for_name.setdefault(name, url) != url:
+            warnings.append(f"creator name '{name}' is used for more than one URL; their alert state is shared")
+        valid.append(creator_config)
+        by_url.setdefault(url.strip(), []).append(creator_config)
+
+    if not valid:
+        raise ConfigError("no usable creators configured")
+
+    state_store = config.get('state_store', 'sqlite')
+    if state_store not in SUPPORTED_STATE_STORES:
+        raise ConfigError(f"unsupported state_store '{state_store}'")
+
+    pages = tuple(PagePlan.from_creators(url, group) for url, group in by_url.items())
+    try:
+        # Catches bad intervals and restock_times up front rather than at the first poll.
+        AdaptiveScheduler.from_config([page.schedule for page in pages], config)
+    except ValueError as e:
+        raise ConfigError(f"invalid polling configuration: {e}") from None
+    try:
+        FetchHealth().configure_from(config)
+    except (TypeError, ValueError) as e:
+        raise ConfigError(f"invalid fetch_health configuration: {e}") from None
+    try:
+        RestockPredictor().configure_from(config)
+    except (TypeError, ValueError) as e:
+        raise ConfigError(f"invalid restock_prediction configuration: {e}") from None
+    try:
+        # Validated without building the pool: that would reset the live egresses' health gauges.
+        EgressPool.validate(config)
+    except (TypeError, ValueError, AttributeError) as e:
+        raise ConfigError(f"invalid egress configuration: {e}") from None
+    try:
+        ParsePool.from_config(config)
+    except (TypeError, ValueError, AttributeError) as e:
+        raise ConfigError(f"invalid parse_pool configuration: {e}") from None
+
+    return ConfigPlan(config, tuple(valid), pages, tuple(warnings))
+
+
+def read_config(path: str) -> dict:
+    """Reads a JSON configuration file, raising ``ConfigError`` if it is invalid JSON."""
+    with open(path, 'r') as f:
+        try:
+            return json.load(f)
+        except json.JSONDecodeError as e:
+            raise ConfigError(f"invalid JSON in {path}: {e}") from None
+
+
+class ConfigWatcher:
+    """Recompiles the configuration file when it changes on disk.
+
+    Args:
+        path (str): Configuration file.
+        check_seconds (float): Minimum time between ``stat`` calls.
+        clock (callable): Monotonic clock, overridable for tests.
+    """
+
+    def __init__(self, path: str, check_seconds: float = 5.0, clock=time.monotonic):
+        self.path = path
+        self.check_seconds = check_seconds
+        self._clock = clock
+        self._signature = None
+        self._last_check = None
+
+    def _stat(self):
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def load(self) -> ConfigPlan:
+        """Reads and compiles the file now. Raises OSError or ConfigError."""
+        signature = self._stat()
+        plan = compile_config(read_config(self.path))
+        self._signature = signature
+        self._last_check = self._clock()
+        return plan
+
+    def seconds_until_check(self) -> float:
+        if self._last_check is None:
+            return 0.0
+        return max(0.0, self._last_check + self.check_seconds - self._clock())
+
+    def poll(self):
+        """Returns a new plan if the file changed and compiles, else None.
+
+        A change that fails to load is reported once and not retried until
+        the file changes again.
+        """
+        if self.seconds_until_check() > 0:
+            return None
+        self._last_check = self._clock()
+        try:
+            signature = self._stat()
+        except OSError as e:
+            print(f"Warning: Could not check configuration file {self.path}: {e}")
+            return None
+        if signature == self._signature:
+            return None
+        self._signature = signature
+        try:
+            return compile_config(read_config(self.path))
+        except (OSError, ConfigError) as e:
+            print(f"Error: Reloading {self.path} failed: {e}. Keeping the current configuration.")
+            return None
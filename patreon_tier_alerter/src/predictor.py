@@ -0,0 +1,331 @@
+"""Restock-window prediction from the restocks seen on each page.
+
+Many creators reopen tiers at about the same local time every week or every
+day. ``RestockPredictor`` keeps a histogram per page of when its watched
+tiers reopened over the week, in ``bucket_minutes`` buckets of local time.
+A restock is only known to have happened between the poll before the one
+that saw it and that poll, so its weight is spread evenly over the buckets
+of that gap: restocks caught by slow polling blur across a bucket or two,
+and those caught while burst polling land in one. Older restocks count for
+less, halving every ``half_life_days``.
+
+A bucket's probability is the larger of its weekly rate (restocks in it per
+week watched) and the daily rate of the same time of day on any weekday, so
+both "Fridays at 18:00" and "every day at 09:00" are found. Once a page has
+seen ``min_restocks`` restocks, its buckets with a probability of at least
+``min_probability`` become predicted windows, likeliest first, for as long
+as ``burst_budget`` of the requests the page gets in a week at
+``check_interval_seconds`` can poll all of them at most
+``max_burst_interval_seconds`` apart. Adjacent buckets merge, and each
+window opens ``lead_seconds`` early. The page's burst interval is the
+budget spread over its windows, but no shorter than
+``burst_interval_seconds``.
+
+The scheduler burst-polls a page inside its windows until it sees the
+restock, pre-warms a connection ``prewarm_seconds`` before a window opens,
+and stretches the page's interval outside them by ``stretch`` so that its
+requests per week stay about the same.
+
+Configuration::
+
+    "restock_prediction": {
+        "burst_interval_seconds": 5, "max_burst_interval_seconds": 60, "lead_seconds": 120,
+        "prewarm_seconds": 10, "bucket_minutes": 10, "min_restocks": 2, "min_probability": 0.3,
+        "burst_budget": 0.5, "half_life_days": 28
+    }
+
+With ``history_path`` set, the predictor starts from the restocks already
+recorded in the tier history log.
+"""
+import math
+import threading
+
+from .history import FIRSTS, OPENED, HistoryReader
+from .metrics import REGISTRY
+from .scheduler import DAY, WEEK, second_of_week
+
+# Polls further apart than this say nothing about when a restock happened.
+MAX_SPREAD_SECONDS = DAY
+# Windows are recomputed at least this often as the decay moves on.
+REPLAN_SECONDS = 3600
+# Restocks kept per page; with the default half-life older ones weigh nothing.
+MAX_RESTOCKS = 512
+
+RESTOCKS = REGISTRY.counter('patreon_restocks_seen_total',
+                            'Restocks seen while polling, by whether a predicted window covered them.',
+                            ('window',))
+_PREDICTED = RESTOCKS.labels('predicted')
+_UNPREDICTED = RESTOCKS.labels('unpredicted')
+
+
+class _Page:
+    __slots__ = ('since', 'restocks', 'windows', 'burst_interval', 'stretch', 'planned_at')
+
+    def __init__(self, since: float):
+        self.since = since  # when the page was first polled
+        self.restocks = []  # (after, seen) pairs: the restock happened in between
+        self.windows = ()  # (start, end) seconds of the week; end may pass WEEK
+        self.burst_interval = None
+        self.stretch = 1.0
+        self.planned_at = None
+
+
+class RestockPredictor:
+    """Learns each page's restock times and predicts windows to burst-poll.
+
+    Args:
+        burst_interval_seconds (float): Shortest poll interval inside a predicted window.
+        max_burst_interval_seconds (float): Longest one; windows the budget cannot
+            poll this often are left out.
+        lead_seconds (float): How long before its first bucket a window opens.
+        prewarm_seconds (float): How long before a window opens to pre-warm a connection.
+        bucket_minutes (int): Histogram resolution; must divide a day.
+        min_restocks (int): Restocks a page must have seen before it gets windows.
+        min_probability (float): Least restock probability of a bucket in a window.
+        burst_budget (float): Largest share of a page's weekly requests spent burst polling.
+        half_life_days (float): Age at which a restock counts half.
+        base_interval (float): The page's usual poll interval, for the budget.
+        enabled (bool): When False no windows are predicted.
+    """
+
+    def __init__(self, burst_interval_seconds: float = 5, max_burst_interval_seconds: float = 60,
+                 lead_seconds: float = 120, prewarm_seconds: float = 10,
+                 bucket_minutes: int = 10, min_restocks: int = 2, min_probability: float = 0.3,
+                 burst_budget: float = 0.5, half_life_days: float = 28, base_interval: float = 3600,
+                 enabled: bool = False):
+        self._pages = {}
+        self._lock = threading.Lock()
+        self.configure(burst_interval_seconds, max_burst_interval_seconds, lead_seconds, prewarm_seconds,
+                       bucket_minutes, min_restocks, min_probability, burst_budget, half_life_days, base_interval,
+                       enabled)
+
+    def configure(self, burst_interval_seconds: float = 5, max_burst_interval_seconds: float = 60,
+                  lead_seconds: float = 120, prewarm_seconds: float = 10,
+                  bucket_minutes: int = 10, min_restocks: int = 2, min_probability: float = 0.3,
+                  burst_budget: float = 0.5, half_life_days: float = 28, base_interval: float = 3600,
+                  enabled: bool = False):
+        if not 0 < burst_interval_seconds <= max_burst_interval_seconds:
+            raise ValueError("burst intervals must satisfy 0 < burst_interval_seconds <= max_burst_interval_seconds")
+        if lead_seconds < 0 or prewarm_seconds < 0:
+            raise ValueError("lead_seconds and prewarm_seconds must not be negative")
+        if bucket_minutes < 1 or 1440 % bucket_minutes:
+            raise ValueError("bucket_minutes must divide a day")
+        if min_restocks < 1:
+            raise ValueError("min_restocks must be at least 1")
+        if not 0 < min_probability <= 1:
+            raise ValueError("min_probability must be in (0, 1]")
+        if not 0 < burst_budget < 1:
+            raise ValueError("burst_budget must be in (0, 1)")
+        if half_life_days <= 0 or base_interval <= 0:
+            raise ValueError("half_life_days and base_interval must be positive")
+        self.burst_interval = float(burst_interval_seconds)
+        self.max_burst_interval = float(max_burst_interval_seconds)
+        self.lead_seconds = lead_seconds
+        self.prewarm_seconds = prewarm_seconds
+        self.bucket_seconds = bucket_minutes * 60
+        self.min_restocks = min_restocks
+        self.min_probability = min_probability
+        self.burst_budget = burst_budget
+        self.half_life = half_life_days * DAY
+        self.base_interval = base_interval
+        self.enabled = bool(enabled)
+        with self._lock:
+            for page in self._pages.values():
+                page.planned_at = None
+
+    def configure_from(self, config: dict):
+        """Applies the ``restock_prediction`` block of a configuration; ``true`` or ``{}`` uses the defaults."""
+        settings = config.get('restock_prediction')
+        enabled = settings is not None and settings is not False
+        settings = settings if isinstance(settings, dict) else {}
+        self.configure(
+            burst_interval_seconds=settings.get('burst_interval_seconds', 5),
+            max_burst_interval_seconds=settings.get('max_burst_interval_seconds', 60),
+            lead_seconds=settings.get('lead_seconds', 120),
+            prewarm_seconds=settings.get('prewarm_seconds', 10),
+            bucket_minutes=settings.get('bucket_minutes', 10),
+            min_restocks=settings.get('min_restocks', 2),
+            min_probability=settings.get('min_probability', 0.3),
+            burst_budget=settings.get('burst_budget', 0.5),
+            half_life_days=settings.get('half_life_days', 28),
+            base_interval=config.get('check_interval_seconds', 3600),
+            enabled=enabled,
+        )
+
+    def track(self, key: str, now: float):
+        """Starts watching a page, if it is new, at its first poll."""
+        with self._lock:
+            page = self._pages.get(key)
+            if page is None:
+                self._pages[key] = _Page(now)
+            elif now < page.since:
+                page.since = now
+
+    def observe(self, key: str, seen: float, after: float = None):
+        """Records a restock seen at ``seen`` that happened after ``after`` (the previous poll)."""
+        if after is None or seen - after > MAX_SPREAD_SECONDS:
+            after = seen
+        window = self.window(key, seen)
+        with self._lock:
+            page = self._pages.get(key)
+            if page is None:
+                page = self._pages[key] = _Page(after)
+            page.restocks.append((after, seen))
+            del page.restocks[:-MAX_RESTOCKS]
+            page.planned_at = None
+        (_PREDICTED if window is not None and window[0] == 0 else _UNPREDICTED).inc()
+
+    def window(self, key: str, now: float) -> tuple:
+        """``(seconds until the page's next window opens, seconds until it closes)``.
+
+        Both count from ``now``; the first is 0 inside a window. None when the
+        page has no predicted windows.
+        """
+        page = self._plan(key, now)
+        if page is None or not page.windows:
+            return None
+        position = second_of_week(now) + now % 1
+        best = None
+        for start, end in page.windows:
+            elapsed = (position - start) % WEEK
+            length = end - start
+            if elapsed < length:
+                return 0.0, float(length - elapsed)
+            opens = WEEK - elapsed
+            if best is None or opens < best[0]:
+                best = (float(opens), float(opens + length))
+        return best
+
+    def burst_interval_for(self, key: str, now: float) -> float:
+        """The page's poll interval inside its windows."""
+        page = self._plan(key, now)
+        return page.burst_interval if page is not None and page.burst_interval else self.burst_interval
+
+    def stretch(self, key: str, now: float) -> float:
+        """Factor for the page's interval outside its windows, paying for the burst polls."""
+        page = self._plan(key, now)
+        return page.stretch if page is not None else 1.0
+
+    def windows(self, key: str, now: float) -> tuple:
+        """The page's predicted windows as ``(start, end)`` seconds of the (local) week."""
+        page = self._plan(key, now)
+        return page.windows if page is not None else ()
+
+    def _plan(self, key: str, now: float):
+        if not self.enabled:
+            return None
+        with self._lock:
+            page = self._pages.get(key)
+            if page is None:
+                return None
+            if page.planned_at is None or now - page.planned_at >= REPLAN_SECONDS:
+                page.windows, page.burst_interval, page.stretch = self._windows(page, now)
+                page.planned_at = now
+            return page
+
+    def _windows(self, page: _Page, now: float) -> tuple:
+        if len(page.restocks) < self.min_restocks:
+            return (), None, 1.0
+        buckets = WEEK // self.bucket_seconds
+        weekly = [0.0] * buckets
+        for after, seen in page.restocks:
+            self._spread(weekly, after, seen, 0.5 ** (max(0.0, now - seen) / self.half_life))
+        # Time watched, discounted the same way as the restocks in it.
+        watched = self.half_life / math.log(2) * (1 - 0.5 ** (max(0.0, now - page.since) / self.half_life))
+        weeks = max(watched / WEEK, 1.0)
+        days = max(watched / DAY, 1.0)
+        per_day = DAY // self.bucket_seconds
+        daily = [sum(weekly[bucket::per_day]) for bucket in range(per_day)]
+        probability = [max(weekly[bucket] / weeks, daily[bucket % per_day] / days) for bucket in range(buckets)]
+
+        # Take the likeliest buckets first, while the budget can still poll them all often enough.
+        budget_polls = self.burst_budget * WEEK / self.base_interval
+        chosen = set()
+        covered = 0.0
+        for p, bucket in sorted(((p, bucket) for bucket, p in enumerate(probability) if p >= self.min_probability),
+                                reverse=True):
+            before, after = (bucket - 1) % buckets in chosen, (bucket + 1) % buckets in chosen
+            length = self.bucket_seconds + self.lead_seconds * (1 - before - after)
+            if (covered + length) / budget_polls > self.max_burst_interval:
+                continue
+            chosen.add(bucket)
+            covered += length
+        if not chosen:
+            return (), None, 1.0
+
+        windows = []
+        for bucket in sorted(chosen):
+            if (bucket - 1) % buckets in chosen and len(chosen) < buckets:
+                continue  # not the first bucket of its run
+            end = bucket
+            while (end + 1) % buckets in chosen and end - bucket < buckets - 1:
+                end += 1
+            windows.append((bucket * self.bucket_seconds - self.lead_seconds, (end + 1) * self.bucket_seconds))
+        windows = tuple((start % WEEK, start % WEEK + end - start) for start, end in windows)
+        covered = min(WEEK, sum(end - start for start, end in windows))
+        burst_interval = max(self.burst_interval, covered / budget_polls)
+        stretch = (WEEK - covered) / max(WEEK - covered / burst_interval * self.base_interval, 1.0)
+        return windows, burst_interval, max(1.0, stretch)
+
+    def _spread(self, weekly: list, after: float, seen: float, weight: float):
+        """Adds ``weight`` to the buckets between ``after`` and ``seen``, in proportion to overlap."""
+        size = self.bucket_seconds
+        position = second_of_week(after)
+        remaining = seen - after
+        if remaining <= 0:
+            weekly[position // size] += weight
+            return
+        per_second = weight / remaining
+        while remaining > 0:
+            bucket = position // size
+            step = min(remaining, (bucket + 1) * size - position)
+            weekly[bucket % len(weekly)] += step * per_second
+            remaining -= step
+            position = (position + step) % WEEK
+
+    def learn_history(self, reader: HistoryReader, pages: list, spread_seconds: float = None) -> int:
+        """Seeds the predictor from a tier history log.
+
+        The log does not say when the page was polled before a restock was
+        seen, so each is taken to have happened up to ``spread_seconds``
+        (default ``base_interval``) before it was recorded.
+
+        Args:
+            reader (HistoryReader): The open log.
+            pages (list): ``PagePlan`` entries; restocks of their watched tiers are learned.
+
+        Returns:
+            int: Restocks learned.
+        """
+        spread = self.base_interval if spread_seconds is None else spread_seconds
+        watched = {}
+        for page in pages:
+            for watch in page.creators:
+                for _, lowered in watch.watched:
+                    watched[(watch.name, lowered)] = page.url
+        page_of = [watched.get((creator, tier.lower())) for creator, tier in reader.series]
+        since = {}
+        seen = set()
+        for timestamp, series_id, transition in zip(reader.timestamps, reader.series_ids, reader.transitions):
+            url = page_of[series_id]
+            if url is None:
+                continue
+            if transition in FIRSTS:
+                since.setdefault(url, timestamp)
+            elif transition in OPENED:
+                seen.add((url, timestamp))  # several tiers of a page reopening together are one restock
+        with self._lock:
+            for url, first in since.items():
+                page = self._pages.get(url)
+                if page is None:
+                    self._pages[url] = _Page(first)
+                elif first < page.since:
+                    page.since = first
+            for url, timestamp in sorted(seen):
+                page = self._pages.get(url)
+                if page is None:
+                    page = self._pages[url] = _Page(timestamp - spread)
+                page.restocks.append((timestamp - spread, timestamp))
+                del page.restocks[:-MAX_RESTOCKS]
+                page.planned_at = None
+        return len(seen)
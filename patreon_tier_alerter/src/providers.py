@@ -0,0 +1,195 @@
+"""SMS providers behind a common interface.
+
+Each provider validates its settings, builds its client once in ``connect``
+and then sends messages with ``send(recipient, message)``. Providers are
+looked up by the ``provider`` field of their settings in ``PROVIDERS``.
+
+Provider SDKs are imported by ``connect``, the first time a provider that
+needs one is used, so a run that only sends through Textbelt never pays for
+loading ``boto3`` or ``twilio``.
+"""
+from .dispatch import Channel, PermanentSendError
+from .session import get_session
+
+TEXTBELT_URL = 'https://textbelt.com/text'
+
+# Set on first use by _boto3() and _twilio_client(); tests may patch them.
+boto3 = None
+Client = None
+
+
+def _boto3():
+    global boto3
+    if boto3 is None:
+        import boto3 as sdk
+        boto3 = sdk
+    return boto3
+
+
+def _twilio_client():
+    global Client
+    if Client is None:
+        from twilio.rest import Client as sdk_client
+        Client = sdk_client
+    return Client
+
+
+RECIPIENT_PLACEHOLDERS = (
+    "YOUR_RECIPIENT_PHONE_NUMBER",
+    "YOUR_RECIPIENT_PHONE_NUMBER (e.g., +11234567890)",
+)
+
+
+def send_textbelt_sms(phone, message, key="textbelt", url=TEXTBELT_URL):
+    """Send an SMS using the Textbelt API (or a self-hosted Textbelt at ``url``)."""
+    payload = {
+        'phone': phone,
+        'message': message,
+        'key': key,
+    }
+    response = get_session().post(url, data=payload)
+    return response.json()
+
+
+class SmsProvider:
+    """Base class for SMS providers.
+
+    Subclasses declare ``required_fields`` and the ``placeholders`` shipped in
+    the sample configuration, and implement ``connect`` and ``send``.
+
+    Args:
+        settings (dict): The provider's configuration block.
+    """
+
+    name = None
+    label = None
+    required_fields = ()
+    placeholders = {}
+    incomplete_warning = "Warning: SMS configuration is incomplete. Missing one or more required fields."
+
+    def __init__(self, settings: dict):
+        self.settings = settings
+        self.retries = settings.get("send_retries", 2)
+        self.backoff_seconds = settings.get("retry_backoff_seconds", 0.5)
+        self.client = None
+
+    def validate(self) -> bool:
+        """Checks required fields and placeholders, printing why if unusable."""
+        complete = all(self.settings.get(field) for field in self.required_fields)
+        placeholders_present = any(
+            self.settings.get(field) == placeholder for field, placeholder in self.placeholders.items()
+        )
+
+        if not complete:
+            print(self.incomplete_warning)
+        if placeholders_present:
+            print("Warning: SMS configuration contains placeholder values. Please update your config.json.")
+        return complete and not placeholders_present
+
+    def connect(self):
+        """Builds the provider client. Called once before the first send."""
+
+    def send(self, recipient: str, message: str) -> str:
+        """Sends one message and returns a short description (e.g. its ID)."""
+        raise NotImplementedError
+
+    def channel(self, recipient: str) -> Channel:
+        return Channel(self.name, recipient, self.send, retries=self.retries, backoff_seconds=self.backoff_seconds)
+
+
+class AwsSnsProvider(SmsProvider):
+    name = "aws_sns"
+    label = "AWS SNS"
+    required_fields = ("aws_access_key_id", "aws_secret_access_key", "aws_region")
+    placeholders = {
+        "aws_access_key_id": "YOUR_AWS_ACCESS_KEY_ID",
+        "aws_secret_access_key": "YOUR_AWS_SECRET_ACCESS_KEY",
+        "aws_region": "YOUR_AWS_REGION",
+    }
+    incomplete_warning = (
+        "Warning: SMS configuration for AWS SNS is incomplete. Missing one or more of: Access Key ID, "
+        "Secret Access Key or Region. Cannot send SMS."
+    )
+
+    def connect(self):
+        self.client = _boto3().client(
+            "sns",
+            aws_access_key_id=self.settings["aws_access_key_id"],
+            aws_secret_access_key=self.settings["aws_secret_access_key"],
+            region_name=self.settings["aws_region"],
+        )
+
+    def send(self, recipient, message):
+        response = self.client.publish(
+            PhoneNumber=recipient,
+            Message=message,
+            MessageAttributes={
+                'AWS.SNS.SMS.SMSType': {
+                    'DataType': 'String',
+                    'StringValue': 'Transactional'
+                }
+            }
+        )
+        return f"Message ID: {response.get('MessageId')}"
+
+
+class TwilioProvider(SmsProvider):
+    name = "twilio"
+    label = "Twilio"
+    required_fields = ("twilio_account_sid", "twilio_auth_token", "twilio_from_number")
+    placeholders = {
+        "twilio_account_sid": "YOUR_TWILIO_ACCOUNT_SID",
+        "twilio_auth_token": "YOUR_TWILIO_AUTH_TOKEN",
+        "twilio_from_number": "YOUR_TWILIO_PHONE_NUMBER (e.g., +15551234567)",
+    }
+    incomplete_warning = "Warning: SMS configuration for Twilio is incomplete. Missing one or more required fields."
+
+    def connect(self):
+        self.client = _twilio_client()(self.settings["twilio_account_sid"], self.settings["twilio_auth_token"])
+
+    def send(self, recipient, message):
+        sent = self.client.messages.create(body=message, from_=self.settings["twilio_from_number"], to=recipient)
+        return f"SID: {sent.sid}"
+
+
+class TextbeltProvider(SmsProvider):
+    name = "textbelt"
+    label = "Textbelt"
+    required_fields = ("textbelt_api_key",)
+    placeholders = {"textbelt_api_key": "YOUR_TEXTBELT_API_KEY"}
+    incomplete_warning = "Warning: SMS configuration for Textbelt is incomplete. Missing API key."
+
+    def __init__(self, settings: dict):
+        super().__init__(dict({"textbelt_api_key": "textbelt"}, **settings))
+
+    def send(self, recipient, message):
+        resp = send_textbelt_sms(recipient, message, self.settings["textbelt_api_key"],
+                                 self.settings.get("textbelt_url", TEXTBELT_URL))
+        if not resp.get("success"):
+            raise PermanentSendError(resp.get('error', 'Unknown error'))
+        return f"Textbelt ID: {resp.get('textId')}"
+
+
+PROVIDERS = {cls.name: cls for cls in (AwsSnsProvider, TwilioProvider, TextbeltProvider)}
+
+
+def create_provider(settings: dict):
+    """Validates settings and returns a connected provider, or None.
+
+    Args:
+        settings (dict): Provider configuration including its ``provider`` name.
+    """
+    provider_name = settings.get("provider")
+    provider_cls = PROVIDERS.get(provider_name)
+    if provider_cls is None:
+        print(f"SMS provider '{provider_name}' is configured but not supported. No SMS will be sent.")
+        return None
+    provider = provider_cls(settings)
+    if not provider.validate():
+        return None
+    try:
+        provider.connect()
+    except Exception as e:
+        print(f"Error initializing {provider.label} client: {e}")
+        return None
+    return provider
@@ -0,0 +1,284 @@
+"""Compact tier records and the status-vector diff engine behind ``check_page``.
+
+Scraped tiers arrive from the parser as dicts. ``tier_records`` turns a
+page's list into ``Tier`` records: slotted objects whose names are interned
+and whose status is a small int code (``history.STATUSES``). Records are
+immutable and shared, so a tier listed with the same name, status,
+remaining count and limit as before reuses the earlier record; the tier region cache
+keeps pages this way.
+
+``TierDiff`` remembers, for every page it has checked, the tier names it
+last listed, where each watched tier sits among them, and each creator
+entry's status codes for its watched tiers as a ``bytes`` vector in
+``watched`` order. A check reads the statuses straight from the scraped
+list into the current vector and compares it with the previous one; only
+when they differ are the changes worked out, with set operations over the
+vector positions, into typed ``Transition`` events:
+
+* ``opened``: a watched tier became available;
+* ``closed``: an available watched tier is listed but no longer available;
+* ``disappeared``: a watched tier is no longer listed at all;
+* ``appeared``: the page lists a tier (watched or not) it did not list before.
+
+The first check of a creator entry only records the baseline.
+
+Alerts still follow the alert state store, so restarts and state shared
+between workers behave as before: a watched tier alerts when it is available
+and not yet alerted, and is reset when it is not available or not listed.
+When a creator's vector is unchanged and the store (an ``AlertStateStore``)
+has not been reloaded since the previous check, that check already brought
+the store in line with these statuses, and the store is not consulted at all.
+"""
+import logging
+import sys
+from operator import itemgetter
+
+from .history import STATUS_CODES, STATUSES
+
+MISSING = STATUS_CODES['missing']
+SOLD_OUT = STATUS_CODES['sold_out']
+AVAILABLE = STATUS_CODES['available']
+UNKNOWN = STATUS_CODES['unknown']
+
+OPENED = 'opened'
+CLOSED = 'closed'
+DISAPPEARED = 'disappeared'
+APPEARED = 'appeared'
+
+
+class _StatusCodes(dict):
+    def __missing__(self, status):
+        return UNKNOWN
+
+
+_status_code = _StatusCodes(STATUS_CODES).__getitem__
+_name_of = itemgetter('name')
+_status_of = itemgetter('status')
+_MISSING_BYTE = bytes([MISSING])
+
+# Shared Tier records by (name, status, remaining, limit, counted); emptied when it grows past the limit.
+_records = {}
+RECORD_CACHE_LIMIT = 65536
+
+log = logging.getLogger(__name__)
+
+
+class Tier:
+    """One tier as listed on a page. Treat as immutable: records are shared.
+
+    Args:
+        name (str): Tier name as shown on the page.
+        status (str): ``available``, ``sold_out`` or ``unknown``.
+        remaining (int, optional): Open slots, when the page reports them.
+        limit (int, optional): Total slots, when the page reports them.
+        counted (bool): The tier came from the embedded JSON, whose dicts
+            always carry ``remaining`` and ``limit`` (None when unknown).
+    """
+
+    __slots__ = ('name', 'key', 'status', 'remaining', 'limit', 'counted')
+
+    def __init__(self, name: str, status: str, remaining: int = None, limit: int = None, counted: bool = False):
+        self.name = sys.intern(name)
+        self.key = sys.intern(name.lower())
+        self.status = STATUS_CODES.get(status, UNKNOWN)
+        self.remaining = remaining
+        self.limit = limit
+        self.counted = counted
+
+    @property
+    def status_name(self) -> str:
+        return STATUSES[self.status]
+
+    def as_dict(self) -> dict:
+        """The dict form the parser returns."""
+        tier = {'name': self.name, 'status': self.status_name}
+        if self.counted:
+            tier['remaining'] = self.remaining
+            tier['limit'] = self.limit
+        elif self.remaining is not None:
+            tier['remaining'] = self.remaining
+        return tier
+
+    def __repr__(self):
+        return f"Tier({self.name!r}, {self.status_name!r}, remaining={self.remaining!r}, limit={self.limit!r})"
+
+
+def tier_records(scraped_tiers: list) -> tuple:
+    """Returns the shared ``Tier`` record for each scraped tier dict, in order."""
+    records = _records
+    result = []
+    for scraped in scraped_tiers:
+        fields = (scraped.get('name', ''), scraped.get('status'), scraped.get('remaining'), scraped.get('limit'),
+                  'limit' in scraped)
+        tier = records.get(fields)
+        if tier is None:
+            if len(records) >= RECORD_CACHE_LIMIT:
+                records.clear()
+            tier = records[fields] = Tier(*fields)
+        result.append(tier)
+    return tuple(result)
+
+
+class Transition:
+    """A change in a tier's status between two checks of a page."""
+
+    __slots__ = ('kind', 'creator_name', 'tier_name', 'url', 'previous', 'status')
+
+    def __init__(self, kind: str, creator_name: str, tier_name: str, url: str, previous: int, status: int):
+        self.kind = kind
+        self.creator_name = creator_name
+        self.tier_name = tier_name
+        self.url = url
+        self.previous = previous
+        self.status = status
+
+    def __repr__(self):
+        return (f"Transition({self.kind!r}, {self.creator_name!r}, {self.tier_name!r}, "
+                f"{STATUSES[self.previous]!r} -> {STATUSES[self.status]!r})")
+
+
+class _PageState:
+    """A page's last listed tier names, where each watched tier sits among
+    them, and the last status vector of each creator entry watching it."""
+
+    __slots__ = ('names', 'creators', 'positions', 'vectors', 'epochs')
+
+    def __init__(self, names: tuple, creators: tuple, previous: '_PageState' = None):
+        self.names = tuple(sys.intern(name) for name in names)
+        self.creators = creators
+        listed = self.listed()
+        # A position of -1 reads the MISSING code after the page's statuses.
+        self.positions = tuple(tuple(listed.get(lowered_name, -1) for _, lowered_name in watch.watched)
+                               for watch in creators)
+        if previous is not None and previous.creators == creators:
+            self.vectors, self.epochs = previous.vectors, previous.epochs
+        else:
+            # New page, or its creator entries changed with a config reload.
+            carried = dict(zip(previous.creators, zip(previous.vectors, previous.epochs))) if previous else {}
+            self.vectors = [carried.get(watch, (None, None))[0] for watch in creators]
+            self.epochs = [carried.get(watch, (None, None))[1] for watch in creators]
+
+    def listed(self) -> dict:
+        # As with a dict lookup by lowercased name, a later tier with the same name wins.
+        return {name.lower(): i for i, name in enumerate(self.names)}
+
+
+def _positions(vector: bytes, code: int) -> set:
+    return {i for i, status in enumerate(vector) if status == code}
+
+
+def _listed(vector: bytes) -> set:
+    return {i for i, status in enumerate(vector) if status != MISSING}
+
+
+class TierDiff:
+    """Compares each check of a page with the previous one and keeps the alert state in step.
+
+    Used from the event loop thread only, like the alert state itself.
+
+    Args:
+        logger (logging.Logger, optional): Receives the per-tier debug
+            messages; defaults to this module's logger.
+    """
+
+    def __init__(self, logger: logging.Logger = None):
+        self._log = logger or log
+        self._pages = {}  # url -> _PageState
+
+    def forget(self):
+        """Drops all previous checks; the next check of every page is a baseline."""
+        self._pages.clear()
+
+    def retain(self, pages):
+        """Drops previous checks of pages not in ``pages`` (after a config reload)."""
+        urls = {page.url for page in pages}
+        for url in [url for url in self._pages if url not in urls]:
+            del self._pages[url]
+
+    def statuses(self, page) -> list:
+        """Status vectors of the page's creator entries as of its last check, in ``page.creators`` order."""
+        state = self._pages.get(page.url)
+        return list(state.vectors) if state is not None else [None] * len(page.creators)
+
+    def check_page(self, page, scraped_tiers: list, alerted_tiers_cache, alerts: list) -> list:
+        """Checks every creator entry watching a page.
+
+        Args:
+            page (PagePlan): The page and the creator entries watching it.
+            scraped_tiers (list): Tier dicts from the parser.
+            alerted_tiers_cache (AlertStateStore or dict): Updated in place.
+            alerts (list): New alert dicts are appended here.
+
+        Returns:
+            list: ``Transition`` events since the previous check of the page.
+        """
+        transitions = []
+        try:
+            names = tuple(map(_name_of, scraped_tiers))
+            statuses = map(_status_of, scraped_tiers)
+        except KeyError:  # The parsers always set both; hand-built tiers may not.
+            names = tuple([tier.get('name', '') for tier in scraped_tiers])
+            statuses = [tier.get('status') for tier in scraped_tiers]
+        codes = bytes(map(_status_code, statuses)) + _MISSING_BYTE
+        creators = page.creators
+        state = self._pages.get(page.url)
+        if state is None or state.names != names or (state.creators is not creators and state.creators != creators):
+            previous = state
+            state = self._pages[page.url] = _PageState(names, creators, previous)
+            if previous is not None:
+                listed = state.listed()
+                for key in listed.keys() - previous.listed().keys():
+                    i = listed[key]
+                    transitions.append(Transition(APPEARED, page.label, state.names[i], page.url, MISSING, codes[i]))
+
+        epoch = getattr(alerted_tiers_cache, 'epoch', None)
+        vectors, epochs = state.vectors, state.epochs
+        for j, positions in enumerate(state.positions):
+            vector = bytes(map(codes.__getitem__, positions))
+            previous_vector = vectors[j]
+            if previous_vector == vector and epoch is not None and epochs[j] == epoch:
+                continue
+            vectors[j] = vector
+            epochs[j] = epoch
+            watch = creators[j]
+            if previous_vector is not None and previous_vector != vector:
+                self._transitions(watch, previous_vector, vector, transitions)
+            self._reconcile(watch, vector, positions, scraped_tiers, alerted_tiers_cache, alerts)
+        return transitions
+
+    def _reconcile(self, watch, vector: bytes, positions: tuple, scraped_tiers: list, alerted_tiers_cache,
+                   alerts: list):
+        creator_name = watch.name
+        for (tier_to_watch_name, _), status, i in zip(watch.watched, vector, positions):
+            cache_key = (creator_name, tier_to_watch_name)
+            if status == AVAILABLE:
+                if not alerted_tiers_cache.get(cache_key):
+                    alert = {
+                        'creator_name': creator_name,
+                        'tier_name': tier_to_watch_name,  # Use original casing for alert
+                        'url': watch.url,
+                    }
+                    remaining = scraped_tiers[i].get('remaining')
+                    if remaining is not None:
+                        alert['remaining'] = remaining
+                    alerts.append(alert)
+                    alerted_tiers_cache[cache_key] = True
+                    self._log.debug("Tier '%s' for %s is AVAILABLE. Added to alerts.", tier_to_watch_name, creator_name)
+                else:
+                    self._log.debug("Tier '%s' for %s is available but already alerted.", tier_to_watch_name,
+                                    creator_name)
+            elif alerted_tiers_cache.get(cache_key):
+                self._log.debug("Tier '%s' for %s is NO LONGER %s. Resetting alert state.", tier_to_watch_name,
+                                creator_name, 'listed' if status == MISSING else 'available')
+                alerted_tiers_cache[cache_key] = False
+
+    @staticmethod
+    def _transitions(watch, previous: bytes, current: bytes, transitions: list):
+        open_before, open_now = _positions(previous, AVAILABLE), _positions(current, AVAILABLE)
+        listed_before, listed_now = _listed(previous), _listed(current)
+        for kind, positions in ((OPENED, open_now - open_before),
+                                (CLOSED, (open_before - open_now) & listed_now),
+                                (DISAPPEARED, listed_before - listed_now)):
+            for i in sorted(positions):
+                transitions.append(Transition(kind, watch.name, watch.watched[i][0], watch.url,
+                                              previous[i], current[i]))
@@ -0,0 +1,297 @@
+"""Adaptive per-creator polling scheduler.
+
+Every creator has its own poll interval, kept between a configurable floor and
+ceiling. When a creator's tier statuses change the interval is halved; every
+poll that finds nothing new stretches it by ``backoff`` so creators that stay
+static drift towards the ceiling. Inside a window around one of the creator's
+configured ``restock_times`` the floor interval is used, and a creator is
+never scheduled past the start of its next window. Next-due times are
+kept in a heap, so finding due creators costs O(log n) per creator.
+
+With a ``RestockPredictor`` (see ``predictor``) a page is also polled every
+few seconds inside the windows predicted from its past restocks, until it
+sees the restock; it is due for a connection pre-warm just before a window
+opens (``pop_warmups``), and outside windows its interval is stretched to
+pay for the burst polls.
+"""
+import heapq
+import time
+
+from .metrics import REGISTRY
+
+WEEKDAYS = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+DAY = 86400
+WEEK = 7 * DAY
+
+BURST_POLLS = REGISTRY.counter('patreon_burst_polls_total', 'Polls scheduled inside predicted restock windows.')
+
+
+def second_of_week(timestamp: float) -> int:
+    """Local time of ``timestamp`` as seconds since Monday 00:00."""
+    local = time.localtime(timestamp)
+    return local.tm_wday * DAY + local.tm_hour * 3600 + local.tm_min * 60 + local.tm_sec
+
+
+def parse_restock_time(spec: str) -> tuple:
+    """Parses ``"HH:MM"`` (daily) or ``"Fri HH:MM"`` (weekly) into (weekday, minute_of_day).
+
+    ``weekday`` is None for daily times.
+    """
+    parts = spec.split()
+    weekday = None
+    if len(parts) == 2:
+        day = parts[0][:3].lower()
+        if day not in WEEKDAYS:
+            raise ValueError(f"Invalid weekday in restock time '{spec}'")
+        weekday = WEEKDAYS.index(day)
+        parts = parts[1:]
+    if len(parts) != 1:
+        raise ValueError(f"Invalid restock time '{spec}'")
+    hours, _, minutes = parts[0].partition(':')
+    hours, minutes = int(hours), int(minutes or 0)
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        raise ValueError(f"Invalid restock time '{spec}'")
+    return weekday, hours * 60 + minutes
+
+
+def seconds_until_restock_window(restock_times, now: float, window_seconds: float) -> float:
+    """Seconds until the next restock window opens; 0 while inside one.
+
+    A window spans ``window_seconds`` either side of a restock time. Returns
+    infinity when there are no restock times.
+    """
+    position_in_week = second_of_week(now)
+    position_in_day = position_in_week % DAY
+    best = float('inf')
+    for weekday, minute_of_day in restock_times:
+        if weekday is None:
+            position, period, target = position_in_day, DAY, minute_of_day * 60
+        else:
+            position, period, target = position_in_week, WEEK, weekday * DAY + minute_of_day * 60
+        distance = abs(position - target)
+        if min(distance, period - distance) <= window_seconds:
+            return 0.0
+        best = min(best, (target - window_seconds - position) % period)
+    return best
+
+
+class _CreatorState:
+    __slots__ = ('creator_config', 'interval', 'next_due', 'last_statuses',
+                 'last_change', 'changes', 'restock_times', 'last_polled', 'quiet_until')
+
+    def __init__(self, creator_config: dict, interval: float, next_due: float, restock_times: list):
+        self.creator_config = creator_config
+        self.interval = interval
+        self.next_due = next_due
+        self.last_statuses = None
+        self.last_change = None
+        self.changes = 0
+        self.restock_times = restock_times
+        self.last_polled = None
+        self.quiet_until = 0.0  # no burst polling before this: the window's restock was seen
+
+
+class AdaptiveScheduler:
+    """Decides when each creator is polled next.
+
+    Args:
+        creators (list): Creator configurations; may carry ``restock_times``.
+        base_interval (float): Starting interval for every creator.
+        min_interval (float): Floor for any creator's interval.
+        max_interval (float): Ceiling for any creator's interval.
+        backoff (float): Factor applied to the interval after a poll without changes.
+        restock_window_seconds (float): How close to a restock time counts as "near".
+        predictor (RestockPredictor, optional): Predicts windows to burst-poll,
+            keyed by each creator's ``url``.
+        clock (callable): Wall clock, overridable for tests.
+    """
+
+    def __init__(self, creators: list, base_interval: float, min_interval: float = None,
+                 max_interval: float = None, backoff: float = 1.1,
+                 restock_window_seconds: float = 900, predictor=None, clock=time.time):
+        self.min_interval = float(min_interval if min_interval is not None else base_interval)
+        self.max_interval = float(max_interval if max_interval is not None else base_interval)
+        if not 0 < self.min_interval <= self.max_interval:
+            raise ValueError("intervals must satisfy 0 < min_interval <= max_interval")
+        if backoff < 1:
+            raise ValueError("backoff must be at least 1")
+        self.backoff = backoff
+        self.restock_window_seconds = restock_window_seconds
+        self.predictor = predictor
+        self._clock = clock
+        self._warmups = []  # (when, index, next_due) heap of connection pre-warms
+        start = min(max(float(base_interval), self.min_interval), self.max_interval)
+        now = clock()
+        self._states = []
+        self._heap = []
+        for index, creator_config in enumerate(creators):
+            restock_times = [parse_restock_time(spec) for spec in creator_config.get('restock_times', [])]
+            self._states.append(_CreatorState(creator_config, start, now, restock_times))
+            self._heap.append((now, index))
+        heapq.heapify(self._heap)
+
+    @classmethod
+    def from_config(cls, creators: list, config: dict, predictor=None, clock=time.time):
+        """Builds a scheduler from the top-level alerter configuration.
+
+        Without ``min_check_interval_seconds`` and ``max_check_interval_seconds``
+        every creator keeps ``check_interval_seconds``; adapting is opt-in.
+        """
+        base = config.get('check_interval_seconds', 3600)
+        return cls(
+            creators,
+            base_interval=base,
+            min_interval=config.get('min_check_interval_seconds', base),
+            max_interval=config.get('max_check_interval_seconds', base),
+            backoff=config.get('poll_backoff_factor', 1.1),
+            restock_window_seconds=config.get('restock_window_seconds', 900),
+            predictor=predictor,
+            clock=clock,
+        )
+
+    def seconds_until_next(self) -> float:
+        """Seconds until the earliest creator is due, or due for a pre-warm (0 if one is overdue)."""
+        earliest = min(self._heap[0][0] if self._heap else float('inf'),
+                       self._warmups[0][0] if self._warmups else float('inf'))
+        return max(0.0, earliest - self._clock())
+
+    def pop_due(self) -> list:
+        """Removes and returns ``(index, creator_config)`` for every creator now due.
+
+        Each returned creator must be handed back through ``record``.
+        """
+        now = self._clock()
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, index = heapq.heappop(self._heap)
+            due.append((index, self._states[index].creator_config))
+        return due
+
+    def pop_warmups(self) -> list:
+        """Removes and returns ``(index, creator_config)`` for every creator due for a pre-warm.
+
+        A creator is due shortly before it is next polled at the opening of
+        a predicted window.
+        """
+        now = self._clock()
+        due = []
+        while self._warmups and self._warmups[0][0] <= now:
+            _, index, next_due = heapq.heappop(self._warmups)
+            state = self._states[index]
+            if state.next_due == next_due and next_due > now:  # still waiting for that poll
+                due.append((index, state.creator_config))
+        return due
+
+    def record(self, index: int, scraped_tiers, retry_in: float = 0):
+        """Reschedules a creator after a poll.
+
+        Args:
+            index (int): Index returned by ``pop_due``.
+            scraped_tiers: The tiers that were scraped; None for a failed poll
+                or NOT_MODIFIED (anything that is not a list) for an unchanged page.
+            retry_in (float): Poll no sooner than this many seconds from now,
+                e.g. while the page's circuit breaker is open.
+        """
+        state = self._states[index]
+        now = self._clock()
+        opened = False
+        if isinstance(scraped_tiers, list):
+            statuses = frozenset((tier.get('name'), tier.get('status')) for tier in scraped_tiers)
+            changed = state.last_statuses is not None and statuses != state.last_statuses
+            opened = changed and any(status == 'available' and (name, status) not in state.last_statuses
+                                     for name, status in statuses)
+            state.last_statuses = statuses
+        else:
+            changed = False
+
+        if changed:
+            state.changes += 1
+            state.last_change = now
+            state.interval = max(self.min_interval, state.interval / 2)
+        elif scraped_tiers is not None:
+            state.interval = min(self.max_interval, state.interval * self.backoff)
+
+        interval = state.interval
+        opens_in = None
+        if self.predictor is not None and scraped_tiers is not None:
+            interval, opens_in = self._predicted_interval(state, interval, now, opened)
+        if state.restock_times:
+            until_window = seconds_until_restock_window(state.restock_times, now, self.restock_window_seconds)
+            # Poll at the floor rate inside a window, and wake up when the next one opens.
+            if until_window == 0:
+                interval = min(interval, self.min_interval)
+            elif until_window < interval:
+                interval, opens_in = max(until_window, self.min_interval), None
+        state.last_polled = now
+        state.next_due = now + max(interval, retry_in)
+        heapq.heappush(self._heap, (state.next_due, index))
+        if opens_in is not None and interval == opens_in and interval >= retry_in:
+            heapq.heappush(self._warmups, (state.next_due - self.predictor.prewarm_seconds, index, state.next_due))
+
+    def _predicted_interval(self, state: _CreatorState, interval: float, now: float, opened: bool) -> tuple:
+        """Applies the predictor's windows to a page's next interval.
+
+        Returns:
+            tuple: The interval, and the seconds until a window opens when the
+            next poll is timed for that.
+        """
+        predictor = self.predictor
+        key = state.creator_config.get('url')
+        if state.last_polled is None:
+            predictor.track(key, now)
+        elif opened:
+            predictor.observe(key, now, state.last_polled)
+        window = predictor.window(key, now)
+        if window is None:
+            return interval, None
+        opens_in, closes_in = window
+        if opens_in == 0:
+            if opened:
+                # Caught it: back to the slow rate until the next window.
+                state.quiet_until = now + closes_in
+            if now >= state.quiet_until:
+                BURST_POLLS.inc()
+                return min(interval, predictor.burst_interval_for(key, now)), None
+            following = predictor.window(key, now + closes_in)
+            opens_in = closes_in + (following[0] if following is not None else 0)
+        interval *= predictor.stretch(key, now)
+        if opens_in < interval:
+            return opens_in, opens_in
+        return interval, None
+
+    def defer(self, index: int, seconds: float):
+        """Hands back a creator from ``pop_due`` unpolled, due again in ``seconds``.
+
+        Its interval is left alone; sharded workers use this for creators
+        another worker currently owns.
+        """
+        state = self._states[index]
+        state.next_due = self._clock() + seconds
+        heapq.heappush(self._heap, (state.next_due, index))
+
+    def adopt(self, previous: 'AdaptiveScheduler', key=lambda creator: creator.get('url')):
+        """Carries per-creator timing over from the scheduler this one replaces.
+
+        Creators matched by ``key`` keep their interval, due time and change
+        history; new creators stay due immediately. Used when the
+        configuration is reloaded.
+        """
+        old_states = {key(state.creator_config): state for state in previous._states}
+        for state in self._states:
+            old = old_states.get(key(state.creator_config))
+            if old is None:
+                continue
+            state.interval = min(max(old.interval, self.min_interval), self.max_interval)
+            state.next_due = old.next_due
+            state.last_statuses = old.last_statuses
+            state.last_change = old.last_change
+            state.changes = old.changes
+            state.last_polled = old.last_polled
+            state.quiet_until = old.quiet_until
+        self._heap = [(state.next_due, index) for index, state in enumerate(self._states)]
+        heapq.heapify(self._heap)
+        self._warmups = []
+
+    def interval_for(self, index: int) -> float:
+        """Current adaptive interval of a creator (ignoring restock windows)."""
+        return self._states[index].interval
@@ -0,0 +1,162 @@
+"""Sharded worker mode: several alerter processes splitting one creator list.
+
+Every worker registers itself in a ``workers`` table in the same SQLite
+database as the alert state (``state_path``) and refreshes its heartbeat
+there. Workers whose heartbeat is older than ``worker_ttl_seconds`` are
+treated as gone. Each worker builds the same consistent-hash ring from the
+live worker IDs and checks only the creators whose URL hashes to it, so
+adding or removing a worker moves only that worker's share of creators.
+
+While membership changes propagate two workers may briefly both own a
+creator; alerts are claimed atomically in the shared store before sending
+(``SQLiteStateStore.claim``), so each alert is still sent once.
+
+Configuration::
+
+    "sharding": {"worker_id": "host-a-1", "heartbeat_seconds": 30,
+                 "worker_ttl_seconds": 90, "virtual_nodes": 64}
+"""
+import bisect
+import hashlib
+import os
+import socket
+import sqlite3
+import time
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def default_worker_id(index: int = None) -> str:
+    """``hostname-pid``, or ``hostname-index`` for the index-th local worker."""
+    suffix = os.getpid() if index is None else index
+    return f"{socket.gethostname()}-{suffix}"
+
+
+class HashRing:
+    """Consistent-hash ring mapping keys to nodes.
+
+    Args:
+        nodes (iterable): Node IDs.
+        virtual_nodes (int): Points per node on the ring; more points spread
+            keys more evenly.
+    """
+
+    def __init__(self, nodes=(), virtual_nodes: int = 64):
+        self.virtual_nodes = virtual_nodes
+        self.nodes = frozenset(nodes)
+        points = sorted((_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(virtual_nodes))
+        self._hashes = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+
+    def owner(self, key: str) -> str:
+        """The node owning ``key``: the first ring point at or after its hash."""
+        if not self._hashes:
+            raise LookupError("hash ring has no nodes")
+        index = bisect.bisect_left(self._hashes, _hash(key))
+        return self._owners[index % len(self._owners)]
+
+
+class ShardCoordinator:
+    """Tracks live workers in the shared database and decides what this worker owns.
+
+    Args:
+        path (str): Shared SQLite database (the alert state database).
+        worker_id (str): This worker's ID, unique among the workers.
+        heartbeat_seconds (float): How often ``heartbeat`` should be called.
+        ttl_seconds (float): Heartbeat age after which a worker is considered gone.
+        virtual_nodes (int): Ring points per worker.
+        clock (callable): Wall clock, overridable for tests.
+    """
+
+    def __init__(self, path: str, worker_id: str, heartbeat_seconds: float = 30, ttl_seconds: float = 90,
+                 virtual_nodes: int = 64, clock=time.time):
+        if ttl_seconds <= heartbeat_seconds:
+            raise ValueError("worker_ttl_seconds must be longer than heartbeat_seconds")
+        self.worker_id = worker_id
+        self.heartbeat_seconds = heartbeat_seconds
+        self.ttl_seconds = ttl_seconds
+        self.virtual_nodes = virtual_nodes
+        self._clock = clock
+        self._last_heartbeat = None
+        self._owners = {}
+        self.ring = HashRing((worker_id,), virtual_nodes)
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS workers ("
+            " worker_id TEXT PRIMARY KEY,"
+            " heartbeat REAL NOT NULL"
+            ") WITHOUT ROWID"
+        )
+        self._conn.commit()
+
+    @classmethod
+    def from_config(cls, config: dict, worker_id: str = None, clock=time.time):
+        """Builds a coordinator from the ``sharding`` block and ``state_path``.
+
+        Args:
+            worker_id (str, optional): Overrides ``sharding.worker_id``.
+        """
+        settings = config.get('sharding') or {}
+        return cls(
+            config.get('state_path', 'alert_state.sqlite3'),
+            worker_id or settings.get('worker_id') or default_worker_id(),
+            heartbeat_seconds=settings.get('heartbeat_seconds', 30),
+            ttl_seconds=settings.get('worker_ttl_seconds', 90),
+            virtual_nodes=settings.get('virtual_nodes', 64),
+            clock=clock,
+        )
+
+    def heartbeat(self) -> bool:
+        """Refreshes this worker's heartbeat and re-reads the live workers.
+
+        Returns:
+            bool: True if the set of live workers changed since the last call.
+        """
+        now = self._clock()
+        with self._conn:
+            self._conn.execute(
+                "INSERT INTO workers (worker_id, heartbeat) VALUES (?, ?) "
+                "ON CONFLICT (worker_id) DO UPDATE SET heartbeat = excluded.heartbeat",
+                (self.worker_id, now),
+            )
+            # Rows this old belong to workers that are certainly gone.
+            self._conn.execute("DELETE FROM workers WHERE heartbeat < ?", (now - 10 * self.ttl_seconds,))
+        live = {row[0] for row in self._conn.execute(
+            "SELECT worker_id FROM workers WHERE heartbeat >= ?", (now - self.ttl_seconds,))}
+        live.add(self.worker_id)
+        self._last_heartbeat = now
+        if live == self.ring.nodes:
+            return False
+        self.ring = HashRing(live, self.virtual_nodes)
+        self._owners.clear()
+        return True
+
+    def seconds_until_heartbeat(self) -> float:
+        if self._last_heartbeat is None:
+            return 0.0
+        return max(0.0, self._last_heartbeat + self.heartbeat_seconds - self._clock())
+
+    def owns(self, creator_config: dict) -> bool:
+        """True if this worker should check the creator (hashed on its URL)."""
+        key = creator_config.get('url') or creator_config.get('name', '')
+        owner = self._owners.get(key)
+        if owner is None:
+            owner = self._owners[key] = self.ring.owner(key)
+        return owner == self.worker_id
+
+    @property
+    def workers(self) -> list:
+        return sorted(self.ring.nodes)
+
+    def leave(self):
+        """Removes this worker so the others take over its creators right away."""
+        with self._conn:
+            self._conn.execute("DELETE FROM workers WHERE worker_id = ?", (self.worker_id,))
+        self._conn.close()
@@ -0,0 +1,79 @@
+"""Alerts derived from remaining-slot counts.
+
+Tiers read from a page's embedded JSON carry ``remaining`` (open slots, None
+when unlimited). ``SlotTracker`` remembers the last count per watched tier and
+turns changes into extra alerts:
+
+* ``almost_sold_out`` when the count drops to ``almost_sold_out_below`` or
+  fewer (but not to 0, which is an ordinary sell-out);
+* ``restocked`` when the count of a tier that was still open goes up. A tier
+  reopening from 0 is already reported as newly available.
+
+Configuration::
+
+    "slot_alerts": {"almost_sold_out_below": 3, "restocks": true}
+"""
+import threading
+
+EVENT_ALMOST_SOLD_OUT = 'almost_sold_out'
+EVENT_RESTOCKED = 'restocked'
+
+
+class SlotTracker:
+    """Remembers remaining-slot counts per (creator, tier) between checks.
+
+    Args:
+        almost_sold_out_below (int, optional): Alert when a tier's remaining
+            count falls to this many or fewer. Disabled when None.
+        restocks (bool): Alert when slots are added to an open tier.
+    """
+
+    def __init__(self, almost_sold_out_below: int = None, restocks: bool = False):
+        self._last = {}
+        self._lock = threading.Lock()
+        self.configure(almost_sold_out_below, restocks)
+
+    def configure(self, almost_sold_out_below: int = None, restocks: bool = False):
+        self.almost_sold_out_below = almost_sold_out_below
+        self.restocks = bool(restocks)
+
+    def configure_from(self, config: dict):
+        """Applies the ``slot_alerts`` block of a configuration."""
+        settings = config.get('slot_alerts') or {}
+        self.configure(settings.get('almost_sold_out_below'), settings.get('restocks', False))
+
+    @property
+    def enabled(self) -> bool:
+        return self.almost_sold_out_below is not None or self.restocks
+
+    def observe(self, watch, scraped_tiers_map: dict) -> list:
+        """Records the counts on a page for one creator entry and returns slot alerts.
+
+        Args:
+            watch (CreatorWatch): The creator entry and its watched tiers.
+            scraped_tiers_map (dict): Scraped tiers keyed by lowercased name.
+        """
+        alerts = []
+        threshold = self.almost_sold_out_below
+        with self._lock:
+            for tier_name, lowered_name in watch.watched:
+                tier = scraped_tiers_map.get(lowered_name)
+                remaining = tier.get('remaining') if tier else None
+                key = (watch.name, tier_name)
+                previous = self._last.get(key)
+                self._last[key] = remaining
+                if remaining is None or previous is None:
+                    continue
+                if self.restocks and previous > 0 and remaining > previous:
+                    alerts.append(self._alert(watch, tier_name, EVENT_RESTOCKED, remaining, remaining - previous))
+                elif threshold is not None and 0 < remaining <= threshold < previous:
+                    alerts.append(self._alert(watch, tier_name, EVENT_ALMOST_SOLD_OUT, remaining))
+        return alerts
+
+    @staticmethod
+    def _alert(watch, tier_name: str, event: str, remaining: int, added: int = None) -> dict:
+        alert = {'creator_name': watch.name, 'tier_name': tier_name, 'url': watch.url,
+                 'event': event, 'remaining': remaining}
+        if added is not None:
+            alert['added'] = added
+        return alert
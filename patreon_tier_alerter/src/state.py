@@ -0,0 +1,209 @@
+"""Alert state stores remembering which tiers have already been alerted.
+
+State is keyed by ``(creator_name, tier_name)`` tuples and held in memory
+while a cycle runs; ``check_tiers`` reads and writes it like a dict. Changes
+are tracked and written out in one batch by ``flush`` at the end of a cycle.
+
+``MemoryStateStore`` keeps nothing across restarts. ``SQLiteStateStore``
+persists to a SQLite database in WAL mode and loads it with a single query at
+startup, so a restarted alerter does not re-send alerts for tiers that were
+already open. Several sharded workers may share one SQLite database; they
+``claim`` alerts in it so each alert is sent by exactly one of them.
+Remaining-slot alerts are claimed too, keyed by ``(creator_name, tier_name,
+event, remaining)``; such a claim is not state and lapses after
+``EVENT_CLAIM_SECONDS``, so the same event at the same count can alert
+again later.
+"""
+import itertools
+import os
+import sqlite3
+import time
+
+# Store epochs are unique across instances, so an epoch also identifies its store.
+_EPOCHS = itertools.count()
+# How long a claimed remaining-slot event keeps other processes from sending it again.
+EVENT_CLAIM_SECONDS = 3600
+
+
+class AlertStateStore:
+    """In-memory alert state with dirty tracking; subclasses add persistence.
+
+    Attributes:
+        epoch (int): Changes whenever the state is replaced from outside the
+            checks of this process (``reload``). Until it changes, a diff of
+            unchanged statuses may assume the state still matches them.
+    """
+
+    def __init__(self, initial: dict = None):
+        self._state = dict(initial or {})
+        self._dirty = set()
+        self.epoch = next(_EPOCHS)
+
+    def get(self, key, default=None):
+        return self._state.get(key, default)
+
+    def __getitem__(self, key):
+        return self._state[key]
+
+    def __setitem__(self, key, value):
+        if not isinstance(key, tuple):
+            raise TypeError("alert state keys must be (creator_name, tier_name) tuples")
+        value = bool(value)
+        if self._state.get(key) is not value:
+            self._state[key] = value
+            self._dirty.add(key)
+
+    def __contains__(self, key):
+        return key in self._state
+
+    def __len__(self):
+        return len(self._state)
+
+    def items(self):
+        return self._state.items()
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self._state!r})"
+
+    @property
+    def dirty(self) -> bool:
+        """True if there are changes not yet written by ``flush``."""
+        return bool(self._dirty)
+
+    def flush(self):
+        """Writes all changes made since the last flush."""
+        self._dirty.clear()
+
+    def claim(self, keys: list) -> set:
+        """Marks ``keys`` as alerted and returns those this process may alert for.
+
+        ``check_tiers`` has already set the keys; a store shared between
+        processes uses this to make sure only one of them sends the alert.
+        Keys of remaining-slot events, ``(creator_name, tier_name, event,
+        remaining)``, are claimed without becoming part of the state.
+        """
+        return set(keys)
+
+    def reload(self):
+        """Re-reads state other processes may have written. No-op in memory."""
+
+    def close(self):
+        self.flush()
+
+
+class MemoryStateStore(AlertStateStore):
+    """Alert state that lives only as long as the process."""
+
+
+class SQLiteStateStore(AlertStateStore):
+    """Alert state persisted to a SQLite database.
+
+    Args:
+        path (str): Database file; created (with parent directories) if missing.
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS alert_state ("
+            " creator TEXT NOT NULL,"
+            " tier TEXT NOT NULL,"
+            " alerted INTEGER NOT NULL,"
+            " updated_at REAL NOT NULL,"
+            " PRIMARY KEY (creator, tier)"
+            ") WITHOUT ROWID"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS event_claims ("
+            " creator TEXT NOT NULL,"
+            " tier TEXT NOT NULL,"
+            " event TEXT NOT NULL,"
+            " remaining INTEGER NOT NULL,"
+            " claimed_at REAL NOT NULL,"
+            " PRIMARY KEY (creator, tier, event, remaining)"
+            ") WITHOUT ROWID"
+        )
+        self._conn.commit()
+        super().__init__(self._load())
+
+    def _load(self) -> dict:
+        rows = self._conn.execute("SELECT creator, tier, alerted FROM alert_state")
+        return {(creator, tier): bool(alerted) for creator, tier, alerted in rows}
+
+    def reload(self):
+        self.flush()
+        self._state = self._load()
+        self.epoch = next(_EPOCHS)
+
+    def claim(self, keys: list) -> set:
+        """Atomically flips each key from not-alerted to alerted in the database.
+
+        Only keys that were not already marked alerted by any process are
+        returned. Claimed or not, the keys are alerted in the database
+        afterwards, so they are no longer pending for ``flush``. An event key
+        is returned unless another process claimed the same event at the same
+        count within ``EVENT_CLAIM_SECONDS``.
+        """
+        claimed = set()
+        now = time.time()
+        with self._conn:
+            for key in keys:
+                if len(key) == 4:
+                    cursor = self._conn.execute(
+                        "INSERT INTO event_claims (creator, tier, event, remaining, claimed_at) "
+                        "VALUES (?, ?, ?, ?, ?) "
+                        "ON CONFLICT (creator, tier, event, remaining) DO UPDATE SET claimed_at = excluded.claimed_at "
+                        "WHERE event_claims.claimed_at < ?",
+                        (*key, now, now - EVENT_CLAIM_SECONDS),
+                    )
+                else:
+                    cursor = self._conn.execute(
+                        "INSERT INTO alert_state (creator, tier, alerted, updated_at) VALUES (?, ?, 1, ?) "
+                        "ON CONFLICT (creator, tier) DO UPDATE SET alerted = 1, updated_at = excluded.updated_at "
+                        "WHERE alert_state.alerted = 0",
+                        (key[0], key[1], now),
+                    )
+                if cursor.rowcount == 1:
+                    claimed.add(key)
+        for key in keys:
+            if len(key) == 2:
+                self._state[key] = True
+                self._dirty.discard(key)
+        return claimed
+
+    def flush(self):
+        if not self._dirty:
+            return
+        now = time.time()
+        rows = [(key[0], key[1], int(self._state[key]), now) for key in self._dirty]
+        with self._conn:
+            self._conn.executemany(
+                "INSERT INTO alert_state (creator, tier, alerted, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (creator, tier) DO UPDATE SET alerted = excluded.alerted, updated_at = excluded.updated_at",
+                rows,
+            )
+        self._dirty.clear()
+
+    def close(self):
+        self.flush()
+        self._conn.close()
+
+
+def open_state_store(config: dict) -> AlertStateStore:
+    """Creates the state store selected by ``state_store`` in the configuration.
+
+    Supported values are ``"sqlite"`` (the default, stored at ``state_path``)
+    and ``"memory"``.
+    """
+    kind = config.get('state_store', 'sqlite')
+    if kind == 'memory':
+        return MemoryStateStore()
+    if kind == 'sqlite':
+        return SQLiteStateStore(config.get('state_path', 'alert_state.sqlite3'))
+    raise ValueError(f"Unsupported state_store '{kind}'")
@@ -0,0 +1,141 @@
+"""Subscriptions mapping (creator, tier) to the channels that should be alerted.
+
+Configuration::
+
+    "sms_providers": {
+        "shop_twilio": {"provider": "twilio", "twilio_account_sid": "...", ...},
+        "free_textbelt": {"provider": "textbelt", "textbelt_api_key": "textbelt"}
+    },
+    "subscriptions": [
+        {"recipient": "+15551234567", "provider": "shop_twilio",
+         "creator": "Drums and Drams", "tiers": ["MICROBATCHES"]},
+        {"recipient": "+15557654321", "provider": "free_textbelt"}
+    ]
+
+A subscription without ``creator`` covers every creator, one without ``tiers``
+every watched tier of its creator(s). The legacy ``sms_settings`` block is a
+provider named ``"default"`` with one subscription to everything for its
+``recipient_phone_number``.
+
+All subscriptions are expanded into a dict keyed by ``(creator_name,
+lowercased tier_name)`` when the router is built, so routing an alert is a
+single lookup no matter how many subscriptions exist.
+"""
+from .dispatch import AlertDispatcher
+from .providers import RECIPIENT_PLACEHOLDERS, create_provider
+
+DEFAULT_PROVIDER = "default"
+
+
+class AlertRouter:
+    """Finds the channels for each alert and owns the dispatcher sending to them.
+
+    Args:
+        subscriptions (list): ``(creator_name or None, tier_names or None, Channel)`` triples.
+        creators (list): Creator configurations whose watched tiers are pre-indexed.
+        dispatcher (AlertDispatcher, optional): Dispatcher used by ``send_alerts``.
+        providers (dict, optional): Connected providers by configured name.
+    """
+
+    def __init__(self, subscriptions: list, creators: list = (), dispatcher: AlertDispatcher = None,
+                 providers: dict = None):
+        self.dispatcher = dispatcher or AlertDispatcher()
+        self.providers = providers or {}
+        self._exact = {}
+        self._by_creator = {}
+        self._everything = []
+        channels = {}
+        for creator_name, tier_names, channel in subscriptions:
+            channels[id(channel)] = channel
+            if creator_name is None:
+                self._everything.append(channel)
+            elif tier_names is None:
+                self._by_creator.setdefault(creator_name, []).append(channel)
+            else:
+                for tier_name in tier_names:
+                    self._exact.setdefault((creator_name, tier_name.lower()), []).append(channel)
+        self.channels = list(channels.values())
+
+        self._routes = {}
+        for creator_config in creators:
+            for tier_name in creator_config.get('tiers_to_watch', []):
+                key = (creator_config.get('name'), tier_name.lower())
+                self._routes[key] = self._resolve(key)
+
+    def _resolve(self, key) -> tuple:
+        matched = self._exact.get(key, []) + self._by_creator.get(key[0], []) + self._everything
+        # De-duplicate while keeping order; the same channel may match several ways.
+        return tuple({id(channel): channel for channel in matched}.values())
+
+    def route(self, alert: dict) -> tuple:
+        """Returns the channels subscribed to an alert's creator and tier."""
+        key = (alert['creator_name'], alert['tier_name'].lower())
+        channels = self._routes.get(key)
+        if channels is None:
+            channels = self._resolve(key)
+            self._routes[key] = channels
+        return channels
+
+    def route_all(self, alerts: list) -> list:
+        """Groups alerts by channel: a list of ``(channel, alerts)`` pairs."""
+        grouped = {}
+        for alert in alerts:
+            for channel in self.route(alert):
+                grouped.setdefault(id(channel), (channel, []))[1].append(alert)
+        return list(grouped.values())
+
+    @classmethod
+    def from_config(cls, config: dict, creators: list = None):
+        """Builds providers, channels and the routing index from configuration.
+
+        Providers that are misconfigured are reported and their subscriptions
+        dropped. Provider clients are created here, once.
+        """
+        creators = config.get('creators', []) if creators is None else creators
+        provider_settings = dict(config.get('sms_providers') or {})
+        subscription_configs = list(config.get('subscriptions') or [])
+
+        sms_settings = config.get('sms_settings')
+        if sms_settings and (sms_settings.get('provider') or sms_settings.get('recipient_phone_number')):
+            provider_settings.setdefault(DEFAULT_PROVIDER, sms_settings)
+            subscription_configs.append({
+                'recipient': sms_settings.get('recipient_phone_number'),
+                'provider': DEFAULT_PROVIDER,
+            })
+
+        providers = {}
+        for provider_key in dict.fromkeys(sub.get('provider') for sub in subscription_configs):
+            settings = provider_settings.get(provider_key)
+            if settings is None:
+                print(f"Warning: Subscriptions reference unknown SMS provider '{provider_key}'. They will be ignored.")
+                continue
+            provider = create_provider(settings)
+            if provider is not None:
+                providers[provider_key] = provider
+
+        channels = {}
+        subscriptions = []
+        for sub in subscription_configs:
+            provider = providers.get(sub.get('provider'))
+            if provider is None:
+                continue
+            if not sub.get('recipient') or sub['recipient'] in RECIPIENT_PLACEHOLDERS:
+                print(f"Warning: Subscription via '{sub['provider']}' has a missing or placeholder "
+                      f"recipient phone number. It will be ignored.")
+                continue
+            channel_key = (sub['provider'], sub['recipient'])
+            if channel_key not in channels:
+                channels[channel_key] = provider.channel(sub['recipient'])
+            tiers = sub.get('tiers')
+            subscriptions.append((sub.get('creator'), list(tiers) if tiers else None, channels[channel_key]))
+
+        dispatch_settings = config.get('alert_dispatch') or sms_settings or {}
+        dispatcher = AlertDispatcher(
+            max_parallel=dispatch_settings.get('max_parallel_sends', 4),
+            merge=dispatch_settings.get('merge_alerts', False),
+        )
+        return cls(subscriptions, creators, dispatcher, providers)
+
+    @property
+    def provider_labels(self) -> list:
+        return sorted({provider.label for provider in self.providers.values()})
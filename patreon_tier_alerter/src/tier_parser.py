@@ -0,0 +1,505 @@
+"""Parsers that extract tier names and availability from Patreon membership pages.
+
+``TierParser`` is the original full-page ``HTMLParser``. ``StreamingTierParser``
+takes the raw response bytes in chunks, skips everything that is not a
+checkout-button anchor with a plain byte search, and can report when every
+watched tier has been seen so the caller may stop reading the response. The
+anchors it collects are hashed, so with a ``TierRegionCache`` an unchanged tier
+region can be recognised without parsing it at all.
+
+With ``embedded_json`` the streaming parser also captures the page's
+``__NEXT_DATA__`` script, the JSON bootstrap data the page is rendered from,
+and reads the tiers (including remaining slot counts) from its ``reward``
+objects. It does not depend on CSS class names or label wording. The anchors
+are still parsed as a fallback and, with ``self_check``, compared against the
+JSON so a change in either format is noticed.
+
+``region`` packs what ``feed`` collected (the anchor fragments and the JSON
+script, still undecoded) into a tuple of bytes and strings, and
+``parse_region`` finishes the parse from it. That is how ``parse_pool``
+parses pages in worker processes without sending them the whole page.
+"""
+import hashlib
+import html
+import json
+import re
+import threading
+import time
+from html.parser import HTMLParser
+
+from .records import tier_records
+
+CHECKOUT_BUTTON_MARKER = b'data-tag="patron-checkout-continue-button"'
+BUTTON_TEXT_CLASS = 'cm-oHFIQB'
+
+# Bytes retained between chunks while no marker has been seen. Large enough to
+# hold the start of an anchor tag and its attributes preceding ``data-tag``.
+_MAX_TAG_PREFIX = 4096
+_TAG_NAME_END = (b' ', b'\t', b'\n', b'\r')
+
+# Attributes that change between otherwise identical responses (per-request
+# tracking tokens in checkout links) and so are left out of the region digest.
+_VOLATILE_ATTRS = re.compile(rb'\shref="[^"]*"')
+_ARIA_LABEL = re.compile(rb'aria-label="([^"]*)"')
+
+EMBEDDED_JSON_MARKER = b'<script id="__NEXT_DATA__"'
+_SCRIPT_END = b'</script>'
+
+
+def _tier_status(disabled: bool, button_text: str) -> str:
+    if disabled or button_text == 'Sold Out':
+        return 'sold_out'
+    if button_text == 'Join':
+        return 'available'
+    return 'unknown'
+
+
+def tiers_from_embedded_json(payload) -> list:
+    """Reads tiers from a page's bootstrap JSON.
+
+    Every object with ``"type": "reward"`` and a ``title`` attribute is a
+    tier, wherever it sits in the document. Unpublished rewards are skipped.
+    A tier is sold out when its ``remaining`` count is 0.
+
+    Args:
+        payload (str or bytes): The JSON text of the ``__NEXT_DATA__`` script.
+
+    Returns:
+        list: Tier dicts with ``name``, ``status``, ``remaining`` (None when
+        unlimited) and ``limit``; None if the payload is not valid JSON or
+        holds no rewards.
+    """
+    try:
+        document = json.loads(payload)
+    except ValueError:
+        return None
+    tiers = []
+    seen = set()
+    stack = [document]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            attributes = node.get('attributes')
+            if node.get('type') == 'reward' and isinstance(attributes, dict) and attributes.get('title'):
+                reward_id = node.get('id')
+                if attributes.get('published', True) and (reward_id is None or reward_id not in seen):
+                    seen.add(reward_id)
+                    remaining = attributes.get('remaining')
+                    tiers.append({
+                        'name': ' '.join(str(attributes['title']).split()),
+                        'status': 'sold_out' if remaining == 0 else 'available',
+                        'remaining': remaining,
+                        'limit': attributes.get('user_limit'),
+                    })
+                continue
+            stack.extend(node.values())
+        elif isinstance(node, list):
+            stack.extend(reversed(node))
+    return tiers or None
+
+
+def compare_tiers(json_tiers: list, html_tiers: list, names=None) -> list:
+    """Lists tiers on which the JSON and HTML extractions disagree.
+
+    Args:
+        names (iterable, optional): Lowercased tier names to compare; all
+            tiers seen by either extraction by default.
+
+    Returns:
+        list: ``(name, json_status, html_status)`` triples; a missing tier
+        has status None.
+    """
+    from_json = {tier['name'].lower(): tier['status'] for tier in json_tiers}
+    from_html = {tier['name'].lower(): tier['status'] for tier in html_tiers}
+    names = set(names) if names is not None else set(from_json) | set(from_html)
+    return sorted(
+        (name, from_json.get(name), from_html.get(name))
+        for name in names
+        if from_json.get(name) != from_html.get(name) and (name in from_json or name in from_html)
+    )
+
+
+class _EmbeddedJsonCollector:
+    """Captures the ``__NEXT_DATA__`` script body from a stream of chunks."""
+
+    def __init__(self):
+        self.payload = None
+        self._tail = b''
+        self._parts = None
+
+    @property
+    def complete(self) -> bool:
+        return self.payload is not None
+
+    def feed(self, chunk: bytes) -> bool:
+        if self.payload is not None:
+            return True
+        if self._parts is None:
+            buffer = self._tail + chunk
+            marker = buffer.find(EMBEDDED_JSON_MARKER)
+            if marker == -1:
+                self._tail = buffer[-(len(EMBEDDED_JSON_MARKER) - 1):]
+                return False
+            body_start = buffer.find(b'>', marker)
+            if body_start == -1:
+                self._tail = buffer[marker:]
+                return False
+            self._tail = b''
+            self._parts = []
+            chunk = buffer[body_start + 1:]
+        # Only the script body is kept. The end tag is searched for in the
+        # last few collected bytes plus the new chunk, in case it is split.
+        window = self._tail + chunk
+        end = window.find(_SCRIPT_END)
+        if end == -1:
+            self._parts.append(chunk)
+            self._tail = window[-(len(_SCRIPT_END) - 1):]
+            return False
+        body = b''.join(self._parts)
+        self.payload = body[:len(body) - len(self._tail)] + window[:end]
+        self._parts = None
+        self._tail = b''
+        return True
+
+
+class TierParser(HTMLParser):
+    """Full-document parser collecting ``{'name': ..., 'status': ...}`` tier dicts."""
+
+    def __init__(self):
+        super().__init__()
+        self.tiers = []
+        self.current = None
+        self.in_btn_div = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'a' and attrs.get('data-tag') == 'patron-checkout-continue-button':
+            aria_label = attrs.get('aria-label', '')
+            if not aria_label:
+                return
+            tier_name = ' '.join(aria_label.split()[:-1])
+            disabled = attrs.get('aria-disabled') == 'true'
+            self.current = {'name': tier_name, 'disabled': disabled, 'button': ''}
+        elif self.current and tag == 'div' and attrs.get('class') == BUTTON_TEXT_CLASS:
+            self.in_btn_div = True
+
+    def handle_data(self, data):
+        if self.current and self.in_btn_div:
+            self.current['button'] += data.strip()
+
+    def handle_endtag(self, tag):
+        if tag == 'div' and self.in_btn_div:
+            self.in_btn_div = False
+        elif tag == 'a' and self.current:
+            text = self.current.get('button', '')
+            status = _tier_status(self.current['disabled'], text)
+            if self.current['name']:
+                self.tiers.append({'name': self.current['name'], 'status': status})
+            self.current = None
+
+
+class _AnchorParser(HTMLParser):
+    """Parses a single checkout-button anchor fragment.
+
+    Only ever sees fragments already known to contain the marker, so it skips
+    the ``dict(attrs)`` conversion and scans the attribute list directly.
+    """
+
+    def __init__(self, on_tier):
+        super().__init__()
+        self._on_tier = on_tier
+        self._name = None
+        self._disabled = False
+        self._button = ''
+        self._in_btn_div = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            is_checkout = False
+            aria_label = ''
+            self._disabled = False
+            for key, value in attrs:
+                if key == 'data-tag':
+                    is_checkout = value == 'patron-checkout-continue-button'
+                elif key == 'aria-label':
+                    aria_label = value or ''
+                elif key == 'aria-disabled':
+                    self._disabled = value == 'true'
+            self._name = ' '.join(aria_label.split()[:-1]) if is_checkout and aria_label else None
+            self._button = ''
+        elif self._name is not None and tag == 'div':
+            for key, value in attrs:
+                if key == 'class' and value == BUTTON_TEXT_CLASS:
+                    self._in_btn_div = True
+                    break
+
+    def handle_data(self, data):
+        if self._in_btn_div:
+            self._button += data.strip()
+
+    def handle_endtag(self, tag):
+        if tag == 'div' and self._in_btn_div:
+            self._in_btn_div = False
+        elif tag == 'a' and self._name is not None:
+            if self._name:
+                self._on_tier(self._name, _tier_status(self._disabled, self._button))
+            self._name = None
+
+
+class StreamingTierParser:
+    """Incremental, byte-oriented tier parser with optional early exit.
+
+    Checkout-button anchors are collected as raw byte fragments while feeding;
+    they are only decoded and parsed by ``close``. ``digest`` identifies the
+    collected tier region so callers can skip ``close`` when it is unchanged.
+
+    Args:
+        tiers_to_watch (iterable, optional): Tier names whose status the caller
+            needs. Once all of them have been seen (case-insensitively),
+            ``done`` becomes True. Without it the whole page is scanned.
+        encoding (str, optional): Encoding used to decode anchor fragments.
+        embedded_json (bool): Read tiers from the page's bootstrap JSON when
+            present. ``done`` then also waits for the JSON script, which
+            usually sits near the end of the page.
+        self_check (bool): With ``embedded_json``, still parse the anchors
+            and record in ``disagreements`` where they differ from the JSON.
+            Without it the anchors are only parsed if the JSON is missing.
+
+    Usage::
+
+        parser = StreamingTierParser(tiers_to_watch)
+        for chunk in response.iter_content(chunk_size=16384):
+            if parser.feed(chunk):
+                break
+        tiers = parser.close()
+    """
+
+    def __init__(self, tiers_to_watch=None, encoding: str = 'utf-8', embedded_json: bool = False,
+                 self_check: bool = True):
+        self.tiers = []
+        self.encoding = encoding or 'utf-8'
+        self.source = None
+        self.disagreements = []
+        self._watched = {name.lower() for name in tiers_to_watch} if tiers_to_watch else None
+        self._pending = set(self._watched) if tiers_to_watch else None
+        self._buffer = b''
+        self._fragments = []
+        self._hash = hashlib.blake2b(digest_size=16)
+        self._json = _EmbeddedJsonCollector() if embedded_json else None
+        self._self_check = self_check
+        self._json_tiers = None
+        self._anchors_digest = None
+
+    @property
+    def done(self) -> bool:
+        """True once every watched tier (and the JSON, if wanted) has been seen."""
+        anchors_done = self._pending is not None and not self._pending
+        if self._json is None:
+            return anchors_done
+        return self._json.complete and (anchors_done or not self._self_check)
+
+    @classmethod
+    def from_region(cls, region: tuple) -> 'StreamingTierParser':
+        """Rebuilds a fed parser from ``region``, ready for ``digest`` and ``close``."""
+        encoding, fragments, payload, watched, self_check, anchors_digest = region
+        parser = cls(watched, encoding=encoding, embedded_json=payload is not None, self_check=self_check)
+        parser._fragments = list(fragments)
+        parser._anchors_digest = anchors_digest
+        if payload is not None:
+            parser._json.payload = payload
+        return parser
+
+    @property
+    def has_embedded_json(self) -> bool:
+        """True if the page's bootstrap JSON was captured."""
+        return self._json is not None and self._json.complete
+
+    @property
+    def region_size(self) -> int:
+        """Bytes of anchors and JSON collected so far."""
+        size = sum(len(fragment) for fragment in self._fragments)
+        return size + len(self._json.payload) if self.has_embedded_json else size
+
+    def region(self) -> tuple:
+        """What ``feed`` collected, as a picklable tuple for ``parse_region``.
+
+        Holds the raw anchor fragments and JSON script (the rest of the page
+        is not kept), the options the parse depends on and the anchors'
+        digest, so the rebuilt parser's ``digest`` matches this one's.
+        """
+        return (
+            self.encoding,
+            tuple(self._fragments),
+            self._json.payload if self.has_embedded_json else None,
+            tuple(sorted(self._watched)) if self._watched else None,
+            self._self_check,
+            self._anchors_digest or self._hash.digest(),
+        )
+
+    def _add_fragment(self, fragment: bytes):
+        self._fragments.append(fragment)
+        self._hash.update(_VOLATILE_ATTRS.sub(b'', fragment))
+        self._hash.update(b'\0')
+        if self._pending:
+            # Cheap name extraction for early exit; the full parse happens in close().
+            match = _ARIA_LABEL.search(fragment)
+            if match:
+                label = html.unescape(match.group(1).decode(self.encoding, errors='replace'))
+                self._pending.discard(' '.join(label.split()[:-1]).lower())
+
+    def feed(self, chunk: bytes) -> bool:
+        """Consumes a chunk of the raw response body.
+
+        Returns:
+            bool: True when the caller can stop feeding (see ``done``).
+        """
+        if self.done:
+            return True
+        if self._json is not None:
+            self._json.feed(chunk)
+            if self.done:
+                return True
+        buffer = self._buffer + chunk if self._buffer else chunk
+        pos = 0
+        while True:
+            marker = buffer.find(CHECKOUT_BUTTON_MARKER, pos)
+            if marker == -1:
+                # Keep enough of the tail to catch a marker (or the start of
+                # its tag) split across chunk boundaries.
+                keep_from = max(pos, len(buffer) - _MAX_TAG_PREFIX)
+                self._buffer = buffer[keep_from:]
+                return False
+            lower = max(pos, marker - _MAX_TAG_PREFIX)
+            start = buffer.rfind(b'<a', lower, marker)
+            while start != -1 and buffer[start + 2:start + 3] not in _TAG_NAME_END:
+                start = buffer.rfind(b'<a', lower, start)
+            if start == -1:
+                pos = marker + len(CHECKOUT_BUTTON_MARKER)
+                continue
+            end = buffer.find(b'</a>', marker)
+            if end == -1:
+                # Anchor not complete yet; wait for more bytes.
+                self._buffer = buffer[start:]
+                return False
+            end += len(b'</a>')
+            self._add_fragment(buffer[start:end])
+            pos = end
+            if self.done:
+                self._buffer = b''
+                return True
+
+    def _embedded_tiers(self):
+        if self._json is None or not self._json.complete:
+            return None
+        if self._json_tiers is None:
+            self._json_tiers = tiers_from_embedded_json(self._json.payload) or []
+        return self._json_tiers
+
+    def digest(self) -> bytes:
+        """Digest of the tier region seen so far, ignoring volatile attributes.
+
+        With ``embedded_json`` it covers the tiers read from the JSON rather
+        than the raw script, which also holds per-request tokens.
+        """
+        anchors = self._anchors_digest or self._hash.digest()
+        embedded = self._embedded_tiers()
+        if not embedded:
+            return anchors
+        return hashlib.blake2b(anchors + b'\1' + json.dumps(embedded, sort_keys=True).encode(),
+                               digest_size=16).digest()
+
+    def _parse_anchors(self) -> list:
+        tiers = []
+        anchor_parser = _AnchorParser(lambda name, status: tiers.append({'name': name, 'status': status}))
+        for fragment in self._fragments:
+            anchor_parser.feed(fragment.decode(self.encoding, errors='replace'))
+        anchor_parser.close()
+        return tiers
+
+    def close(self) -> list:
+        """Returns the tiers, from the embedded JSON if available, else from the anchors.
+
+        ``source`` is set to ``"json"`` or ``"html"`` accordingly.
+        """
+        self._buffer = b''
+        embedded = self._embedded_tiers()
+        if embedded:
+            self.source = 'json'
+            self.tiers = [dict(tier) for tier in embedded]
+            if self._self_check and self._fragments:
+                self.disagreements = compare_tiers(embedded, self._parse_anchors(), self._watched)
+        else:
+            self.source = 'html'
+            self.tiers = self._parse_anchors()
+        self._fragments = []
+        return self.tiers
+
+
+def parse_region(region: tuple) -> tuple:
+    """Finishes parsing a region returned by ``StreamingTierParser.region``.
+
+    Module-level so ``parse_pool`` workers can run it. Tiers come back as
+    tuples, which are smaller to send back than dicts; ``region_tiers``
+    turns them back into the dicts ``close`` returns.
+
+    Returns:
+        tuple: ``(digest, source, tiers, disagreements, seconds)``, where
+        ``tiers`` holds ``(name, status)`` or, read from the JSON,
+        ``(name, status, remaining, limit)`` tuples and ``seconds`` is the
+        time the parse took.
+    """
+    started = time.perf_counter()
+    parser = StreamingTierParser.from_region(region)
+    digest = parser.digest()
+    tiers = tuple(tuple(tier.values()) for tier in parser.close())
+    return digest, parser.source, tiers, tuple(parser.disagreements), time.perf_counter() - started
+
+
+def region_tiers(tiers: tuple) -> list:
+    """Tier dicts from the tuples returned by ``parse_region``."""
+    return [
+        {'name': tier[0], 'status': tier[1]} if len(tier) == 2
+        else {'name': tier[0], 'status': tier[1], 'remaining': tier[2], 'limit': tier[3]}
+        for tier in tiers
+    ]
+
+
+class TierRegionCache:
+    """Remembers the last tier-region digest and parsed tiers per page.
+
+    Keys are chosen by the caller and should cover everything that influences
+    the parse, e.g. the URL and the watched tier names. Tiers are kept as
+    shared ``records.Tier`` records rather than dicts. Safe to share between
+    fetch threads. Hit and miss counters accumulate until ``reset_counters``.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, key, digest: bytes):
+        """Returns a copy of the cached tiers if ``digest`` matches, else None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == digest:
+                self.hits += 1
+                return [tier.as_dict() for tier in entry[1]]
+            self.misses += 1
+            return None
+
+    def store(self, key, digest: bytes, tiers: list):
+        with self._lock:
+            self._entries[key] = (digest, tier_records(tiers))
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def reset_counters(self) -> tuple:
+        """Returns ``(hits, misses)`` since the last reset and zeroes them."""
+        with self._lock:
+            counts = (self.hits, self.misses)
+            self.hits = self.misses = 0
+            return counts
@@ -0,0 +1,156 @@
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from patreon_tier_alerter.src import alerter, archive
+from patreon_tier_alerter.src.archive import ArchiveReader, PageArchive, replay
+from patreon_tier_alerter.src.plan import PagePlan
+from patreon_tier_alerter.src.session import HttpSession
+
+URL = "http://archive.example/c/creator/membership"
+CONFIG = {"creators": [{"name": "Creator", "url": URL, "tiers_to_watch": ["Gold"]}]}
+
+
+def page(gold_button, markup_class="cm-oHFIQB"):
+    return (
+        '<html><body><div class="card"><h3>Gold</h3>'
+        '<a href="/checkout" data-tag="patron-checkout-continue-button" aria-label="Gold Join">'
+        f'<div class="{markup_class}">{gold_button}</div></a></div>'
+        '<footer>' + 'links ' * 500 + '</footer></body></html>'
+    ).encode()
+
+
+def response(status=200, headers=None):
+    result = requests.Response()
+    result.status_code = status
+    result.headers.update(headers or {})
+    return result
+
+
+def record(path, bodies, clock_start=1000):
+    recorder = PageArchive(str(path))
+    for i, body in enumerate(bodies):
+        recorder.record(URL, response(), body, timestamp=clock_start + 60 * i)
+    recorder.close()
+
+
+def test_reader_finds_responses_by_page_and_time(tmp_path):
+    path = tmp_path / "pages.archive"
+    recorder = PageArchive(str(path))
+    recorder.describe([PagePlan.from_creators(URL, CONFIG["creators"])])
+    recorder.record(URL, response(headers={"ETag": '"v1"'}), page("Sold Out"), timestamp=1000)
+    recorder.record(URL, response(), page("Sold Out"), timestamp=1060)
+    recorder.record(URL, response(503, {"Retry-After": "30"}), timestamp=1090)
+    recorder.record(URL, response(), page("Join"), complete=False, timestamp=1120)
+    recorder.close()
+
+    with ArchiveReader(str(path)) as reader:
+        assert len(reader) == 4
+        [url_id] = reader.find("creator")
+        assert reader.at(url_id, 999) is None
+        first = reader.at(url_id, 1059)
+        assert first.body == page("Sold Out") and first.headers == {"ETag": '"v1"'} and first.complete
+        assert reader.at(url_id, 1089).body == page("Sold Out")  # stored once, read back through the reference
+        assert reader.at(url_id, 1100).status == 503
+        latest = reader.at(url_id, float("inf"))
+        assert latest.body == page("Join") and not latest.complete
+        assert [entry.timestamp for entry in reader.entries(since=1050, until=1100)] == [1060, 1090]
+        [summary] = reader.summary()
+        assert summary["responses"] == 4 and summary["label"] == "Creator"
+
+
+def test_shared_pages_are_found_by_each_creator(tmp_path):
+    path = tmp_path / "pages.archive"
+    recorder = PageArchive(str(path))
+    recorder.describe([PagePlan.from_creators(URL, [{"name": "Alpha", "url": URL}, {"name": "Beta, Inc", "url": URL}])])
+    recorder.record(URL, response(), page("Join"), timestamp=1000)
+    recorder.close()
+    # An archive written before creator names were kept: only the joined label.
+    with open(archive.urls_path(str(path)), "a", encoding="utf-8") as f:
+        f.write('["http://archive.example/old", "Gamma / Delta"]\n')
+
+    with ArchiveReader(str(path)) as reader:
+        assert reader.urls[0] == (URL, "Alpha / Beta, Inc", ["Alpha", "Beta, Inc"])
+        assert reader.find("alpha") == reader.find("Beta, Inc") == [0]
+        assert reader.find("Beta") == []
+        assert reader.find("delta") == [1]
+
+
+def test_unflushed_entries_are_not_indexed(tmp_path):
+    path = tmp_path / "pages.archive"
+    recorder = PageArchive(str(path))
+    recorder.record(URL, response(), page("Join"), timestamp=1000)
+    recorder.flush()
+    recorder.record(URL, response(), page("Sold Out"), timestamp=1060)
+    with ArchiveReader(str(path)) as reader:
+        assert [entry.timestamp for entry in reader.entries()] == [1000]
+    recorder.close()
+
+
+def test_scrape_records_what_it_fetched(tmp_path, monkeypatch):
+    body = page("Join")
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    recorder = PageArchive(str(tmp_path / "pages.archive"), full_pages=True)
+    monkeypatch.setattr(alerter, 'page_archive', recorder)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/membership"
+        tiers = alerter.scrape_patreon_page(url, "UA", tiers_to_watch=["Gold"], session=HttpSession())
+        assert tiers == [{'name': 'Gold', 'status': 'available'}]
+    finally:
+        server.shutdown()
+        server.server_close()
+    recorder.close()
+
+    with ArchiveReader(recorder.path) as reader:
+        [archived] = reader.entries()
+        assert archived.body == body and archived.complete
+        assert archived.headers['Content-Type'] == 'text/html; charset=utf-8'
+
+
+def test_replay_reproduces_alerts_and_flags_markup_changes(tmp_path):
+    path = tmp_path / "pages.archive"
+    record(path, [page("Sold Out"), page("Join"), page("Join"), page("Sold Out"), page("Join"),
+                  page("Join", markup_class="cm-renamed")])
+
+    with ArchiveReader(str(path)) as reader:
+        report = replay(reader, CONFIG)
+    assert report.responses == 6 and report.failed == 0
+    assert report.not_modified == 1  # the repeated page
+    assert [(timestamp, alert['tier_name']) for timestamp, alert in report.alerts] == [(1060, 'Gold'), (1240, 'Gold')]
+    assert report.suspect == 1
+    # The running alerter's caches were left alone.
+    assert alerter.tier_diff.statuses(type("Page", (), {"url": URL, "creators": ()})) == []
+
+
+def test_replay_compare_reports_parse_differences(tmp_path, capsys):
+    path = tmp_path / "pages.archive"
+    record(path, [page("Sold Out"), page("Join")])
+    config_path = tmp_path / "config.json"
+    config_path.write_text('{"creators": [{"name": "Creator", "url": "%s", "tiers_to_watch": ["Gold"]}]}' % URL)
+    results = tmp_path / "results.jsonl"
+
+    assert archive.main([str(path), 'replay', '--config', str(config_path), '--results', str(results)]) == 0
+    assert archive.main([str(path), 'replay', '--config', str(config_path), '--compare', str(results)]) == 0
+
+    edited = results.read_text().replace('"available"', '"sold_out"')
+    results.write_text(edited)
+    assert archive.main([str(path), 'replay', '--config', str(config_path), '--compare', str(results)]) == 1
+    assert "1 response(s) parse differently" in capsys.readouterr().out
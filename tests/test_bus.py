@@ -0,0 +1,233 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from patreon_tier_alerter.src import alerter
+from patreon_tier_alerter.src.bus import AlertBus, Webhook
+from patreon_tier_alerter.src.plan import PagePlan
+from patreon_tier_alerter.src.state import MemoryStateStore
+from patreon_tier_alerter.src.subscriptions import AlertRouter
+
+
+def alert(creator, tier):
+    return {'creator_name': creator, 'tier_name': tier, 'url': f'https://www.patreon.com/c/{creator}/membership'}
+
+
+class StreamClient:
+    """Reads alert events from ``/events`` over a raw socket."""
+
+    def __init__(self, bus, query='', last_event_id=None):
+        self.sock = socket.create_connection(bus.address, timeout=5)
+        extra = f'Last-Event-ID: {last_event_id}\r\n' if last_event_id is not None else ''
+        self.sock.sendall(f'GET /events{query} HTTP/1.1\r\nHost: localhost\r\n{extra}\r\n'.encode())
+        self.buffer = b''
+
+    def events(self, count):
+        events = []
+        while len(events) < count:
+            while b'\n\n' not in self.buffer:
+                chunk = self.sock.recv(65536)
+                assert chunk, "stream closed"
+                self.buffer += chunk
+            block, self.buffer = self.buffer.split(b'\n\n', 1)
+            for line in block.split(b'\n'):
+                if line.startswith(b'data: '):
+                    events.append(json.loads(line[6:]))
+        return events
+
+    def close(self):
+        self.sock.close()
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_stream_delivers_filtered_alerts_in_order():
+    bus = AlertBus(port=0).start()
+    try:
+        everything = StreamClient(bus)
+        drums = StreamClient(bus, '?creator=DRUMS&tier=gold')
+        wait_for(lambda: bus.subscribers == 2)
+
+        assert bus.publish([alert('Drums', 'Gold'), alert('Other', 'Gold')]).result(5) == [True, True]
+        assert bus.publish([alert('Drums', 'Silver')]).result(5) == [True]
+
+        received = everything.events(3)
+        assert [(event['creator_name'], event['tier_name']) for event in received] == [
+            ('Drums', 'Gold'), ('Other', 'Gold'), ('Drums', 'Silver')]
+        assert [event['id'] for event in received] == [1, 2, 3]
+        [gold] = drums.events(1)
+        assert gold['id'] == 1 and gold['published_at'] <= time.time()
+        everything.close()
+        drums.close()
+        wait_for(lambda: bus.subscribers == 0)
+    finally:
+        bus.close()
+
+
+def test_reconnecting_client_gets_missed_alerts():
+    bus = AlertBus(port=0).start()
+    try:
+        client = StreamClient(bus)
+        wait_for(lambda: bus.subscribers == 1)
+        bus.publish([alert('A', 'Gold')])
+        [first] = client.events(1)
+        client.close()
+        wait_for(lambda: bus.subscribers == 0)
+
+        bus.publish([alert('A', 'Silver'), alert('A', 'Bronze')])
+        client = StreamClient(bus, last_event_id=first['id'])
+        assert [event['tier_name'] for event in client.events(2)] == ['Silver', 'Bronze']
+        client.close()
+    finally:
+        bus.close()
+
+
+def test_stalled_subscriber_does_not_hold_up_publishing_or_others():
+    bus = AlertBus(port=0, queue_size=4).start()
+    try:
+        stalled = StreamClient(bus)  # never reads
+        reader = StreamClient(bus)
+        wait_for(lambda: bus.subscribers == 2)
+        padding = 'x' * 4096
+        started = time.perf_counter()
+        for i in range(2000):
+            bus.publish([dict(alert('A', f'Tier {i}'), note=padding)])
+            if i % 4 == 3:
+                reader.events(4)
+        assert time.perf_counter() - started < 10
+        stalled_stream = next(stream for stream in bus._streams if stream.dropped)
+        assert stalled_stream.dropped > 0
+        stalled.close()
+        reader.close()
+    finally:
+        bus.close()
+
+
+def test_webhooks_are_signed_retried_and_drained_on_close():
+    received = []
+    failures = [1]
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers['Content-Length']))
+            if failures[0]:
+                failures[0] -= 1
+                self.send_response(500)
+            else:
+                received.append((body, self.headers['X-Alert-Signature']))
+                self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}/hook'
+    bus = AlertBus(webhooks=[Webhook(url, secret='s3cret', backoff_seconds=0.01)]).start()
+    try:
+        assert bus.address is None
+        assert bus.publish([alert('A', 'Gold'), alert('A', 'Silver')]).result(5) == [True, True]
+    finally:
+        bus.close()
+        server.shutdown()
+        server.server_close()
+
+    assert [json.loads(body)['tier_name'] for body, _ in received] == ['Gold', 'Silver']
+    body, signature = received[0]
+    assert signature == 'sha256=' + hmac.new(b's3cret', body, hashlib.sha256).hexdigest()
+    assert bus.webhooks[0].healthy
+
+
+def test_sms_is_skipped_when_a_subscriber_got_the_alert(monkeypatch):
+    bus = AlertBus(port=0, sms_fallback=True).start()
+    sent = []
+    monkeypatch.setattr(alerter, 'alert_bus', bus)
+    monkeypatch.setattr(alerter, 'send_alerts', lambda alerts, router=None: sent.append(alerts))
+    monkeypatch.setattr(alerter, 'scrape_patreon_page',
+                        lambda url, user_agent, **kwargs: [{'name': 'Gold', 'status': 'available'}])
+    config = {'creators': [{'name': 'Creator', 'url': 'http://example.com/c', 'tiers_to_watch': ['Gold']}]}
+    page = PagePlan.from_creators('http://example.com/c', config['creators'])
+
+    def cycle(state):
+        return asyncio.run(alerter.run_check_cycle([page], 'UA', AlertRouter([]), alerter._build_engine(config),
+                                                   state))
+
+    try:
+        cycle(MemoryStateStore())
+        assert sent == [[alert('Creator', 'Gold') | {'url': 'http://example.com/c'}]]
+
+        client = StreamClient(bus)
+        wait_for(lambda: bus.subscribers == 1)
+        cycle(MemoryStateStore())
+        [event] = client.events(1)
+        assert event['tier_name'] == 'Gold' and len(sent) == 1
+        client.close()
+    finally:
+        bus.close()
+
+
+def test_sms_fallback_is_decided_per_alert_from_matching_streams_and_current_deliveries(monkeypatch):
+    up = [False]
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers['Content-Length']))
+            self.send_response(204 if up[0] else 503)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    hook = Webhook(f'http://127.0.0.1:{server.server_address[1]}/hook', retries=1, backoff_seconds=0.01)
+    bus = AlertBus(port=0, webhooks=[hook], sms_fallback=True).start()
+    sent = []
+    monkeypatch.setattr(alerter, 'alert_bus', bus)
+    monkeypatch.setattr(alerter, 'send_alerts', lambda alerts, router=None: sent.append(alerts))
+    monkeypatch.setattr(alerter, 'scrape_patreon_page',
+                        lambda url, user_agent, **kwargs: [{'name': 'Gold', 'status': 'available'},
+                                                           {'name': 'Silver', 'status': 'available'}])
+    config = {'creators': [{'name': 'Creator', 'url': 'http://example.com/c', 'tiers_to_watch': ['Gold', 'Silver']}]}
+    page = PagePlan.from_creators('http://example.com/c', config['creators'])
+
+    def cycle():
+        return asyncio.run(alerter.run_check_cycle([page], 'UA', AlertRouter([]), alerter._build_engine(config),
+                                                   MemoryStateStore()))
+
+    try:
+        # The webhook has never failed before, but is down for this delivery.
+        assert hook.healthy
+        cycle()
+        assert [[a['tier_name'] for a in alerts] for alerts in sent] == [['Gold', 'Silver']]
+
+        # A stream filtered to Silver only covers Silver; Gold still needs the webhook, which is down.
+        client = StreamClient(bus, '?tier=silver')
+        wait_for(lambda: bus.subscribers == 1)
+        cycle()
+        assert [event['tier_name'] for event in client.events(1)] == ['Silver']
+        assert [a['tier_name'] for a in sent[-1]] == ['Gold']
+
+        up[0] = True
+        cycle()
+        assert len(sent) == 2
+        client.close()
+    finally:
+        bus.close()
+        server.shutdown()
+        server.server_close()
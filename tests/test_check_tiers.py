@@ -22,7 +22,7 @@ def test_tier_available_first_time_alert_and_cache():
 
     assert len(alerts) == 1
     assert alerts[0]["tier_name"] == "Cool Tier"
-    assert cache.get("CreatorX_Cool Tier") is True
+    assert cache.get(("CreatorX", "Cool Tier")) is True
 
 
 def test_tier_sold_out_resets_cache():
@@ -32,13 +32,13 @@ def test_tier_sold_out_resets_cache():
         "tiers_to_watch": ["Cool Tier"],
     }
     # Cache already indicates tier was available before
-    cache = {"CreatorX_Cool Tier": True}
+    cache = {("CreatorX", "Cool Tier"): True}
     scraped_tiers = [{"name": "Cool Tier", "status": "sold_out"}]
 
     alerts = check_tiers(scraped_tiers, creator_config, cache)
 
     assert alerts == []
-    assert cache["CreatorX_Cool Tier"] is False
+    assert cache[("CreatorX", "Cool Tier")] is False
 
 
 def test_tier_not_found_no_alert():
@@ -0,0 +1,84 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from patreon_tier_alerter.src.dispatch import (
+    MAX_SMS_LENGTH,
+    AlertDispatcher,
+    Channel,
+    PermanentSendError,
+    build_messages,
+)
+
+
+def make_alerts(count):
+    return [
+        {'tier_name': f'Tier {i}', 'creator_name': 'Creator', 'url': f'https://www.patreon.com/c/creator{i}/membership'}
+        for i in range(count)
+    ]
+
+
+def test_build_messages_merges_within_length_limit():
+    alerts = make_alerts(12)
+
+    separate = build_messages(alerts, merge=False)
+    merged = build_messages(alerts, merge=True)
+
+    assert len(separate) == 12
+    assert 1 < len(merged) < 12
+    assert all(len(message) <= MAX_SMS_LENGTH for message, _ in merged)
+    assert [a for _, group in merged for a in group] == alerts
+
+
+def test_retries_transient_errors_but_not_permanent_ones():
+    calls = {'flaky': 0, 'rejected': 0}
+    sleeps = []
+
+    def flaky(recipient, message):
+        calls['flaky'] += 1
+        if calls['flaky'] < 3:
+            raise ConnectionError("reset")
+        return "ID 1"
+
+    def rejected(recipient, message):
+        calls['rejected'] += 1
+        raise PermanentSendError("Out of quota")
+
+    dispatcher = AlertDispatcher(max_parallel=1, sleep=sleeps.append)
+    results = dispatcher.dispatch([
+        (Channel('fake', '+1', flaky, retries=2, backoff_seconds=0.1), make_alerts(1)),
+        (Channel('fake', '+2', rejected, retries=5), make_alerts(1)),
+    ])
+
+    assert [r.ok for r in results] == [True, False]
+    assert results[0].attempts == 3 and results[1].attempts == 1
+    assert sleeps == [0.1, 0.2]
+    assert results[1].detail == "Out of quota"
+
+
+def test_sends_concurrently_up_to_max_parallel():
+    in_flight = []
+    peak = []
+    lock = threading.Lock()
+
+    def slow_send(recipient, message):
+        with lock:
+            in_flight.append(1)
+            peak.append(len(in_flight))
+        time.sleep(0.05)
+        with lock:
+            in_flight.pop()
+        return "ok"
+
+    dispatcher = AlertDispatcher(max_parallel=4)
+    started = time.monotonic()
+    results = dispatcher.dispatch([(Channel('fake', '+1', slow_send), make_alerts(8))])
+    elapsed = time.monotonic() - started
+    dispatcher.close()
+
+    assert all(r.ok for r in results)
+    assert max(peak) == 4
+    assert elapsed < 8 * 0.05
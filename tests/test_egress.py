@@ -0,0 +1,247 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import requests
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from patreon_tier_alerter.src import alerter
+from patreon_tier_alerter.src.egress import HEALTH, Egress, EgressPool
+from patreon_tier_alerter.src.engine import FetchEngine
+from patreon_tier_alerter.src.health import FetchHealth
+from patreon_tier_alerter.src.plan import PagePlan, compile_config
+from patreon_tier_alerter.src.session import HttpSession
+
+PAGE = (b'<html><body><div><h3>Gold</h3><a href="/checkout" data-tag="patron-checkout-continue-button" '
+        b'aria-label="Gold Join"><div class="cm-oHFIQB">Join</div></a></div></body></html>')
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def serve(handler_class):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler_class)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def page_server(seen, status=200):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            seen.append((self.client_address[0], self.path, self.headers['User-Agent']))
+            self.send_response(status)
+            self.send_header('Content-Length', str(len(PAGE)))
+            self.end_headers()
+            self.wfile.write(PAGE)
+
+        def log_message(self, *args):
+            pass
+
+    return serve(Handler)
+
+
+def stand_in_proxy(forwarded, status=None):
+    """A forward proxy that relays GETs (or answers ``status`` itself) and records the URLs."""
+    upstream = requests.Session()
+    upstream.trust_env = False
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            forwarded.append(self.path)
+            if status is not None:
+                self.send_response(status)
+                self.send_header('Retry-After', '120')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            response = upstream.get(self.path, headers={'User-Agent': self.headers['User-Agent']})
+            self.send_response(response.status_code)
+            self.send_header('Content-Length', str(len(response.content)))
+            self.end_headers()
+            self.wfile.write(response.content)
+
+        def log_message(self, *args):
+            pass
+
+    return serve(Handler)
+
+
+def proxy_url(server):
+    return f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def test_pages_are_pinned_in_proportion_to_rate_and_stay_put():
+    pool = EgressPool([Egress('a', requests_per_second=1), Egress('b', requests_per_second=1),
+                       Egress('c', requests_per_second=2)])
+    urls = [f'https://www.patreon.com/c/creator{i}/membership' for i in range(4000)]
+    pinned = {url: pool.choose(url).name for url in urls}
+    shares = {name: sum(1 for value in pinned.values() if value == name) / len(urls) for name in 'abc'}
+    assert abs(shares['a'] - 0.25) < 0.03 and abs(shares['b'] - 0.25) < 0.03 and abs(shares['c'] - 0.5) < 0.03
+    assert all(pool.choose(url).name == name for url, name in pinned.items())
+
+    # Without 'a', only a's pages move.
+    smaller = EgressPool([Egress('b', requests_per_second=1), Egress('c', requests_per_second=2)])
+    assert all(smaller.choose(url).name == name for url, name in pinned.items() if name != 'a')
+
+
+def test_throttled_or_failing_egress_cools_down_and_its_pages_fail_over():
+    clock = FakeClock()
+    first, second = (Egress(name, failure_threshold=2, backoff_seconds=10, clock=clock) for name in ('a', 'b'))
+    pool = EgressPool([first, second])
+    url = next(f'https://www.patreon.com/c/c{i}/membership' for i in range(100)
+               if pool.choose(f'https://www.patreon.com/c/c{i}/membership') is first)
+
+    first.record(429, retry_after=60)
+    assert pool.choose(url) is second and first.score < 1
+    clock.now = 60
+    assert pool.choose(url) is first
+
+    first.record(None)
+    assert pool.choose(url) is first  # one failure is below the threshold
+    first.record(503)
+    assert pool.choose(url) is second
+    clock.now = 60 + 20  # the second cooldown in a row lasts twice as long
+    assert pool.choose(url) is first
+    first.record(200)
+    assert first.failures == 0 and first.cooldowns == 0
+
+    second.record(429, retry_after=300)
+    first.record(429, retry_after=30)
+    assert pool.choose(url) is None  # all cooling down: nothing to fetch through
+    assert pool.seconds_until_available() == 30
+    clock.now += 30
+    assert pool.choose(url) is first and pool.seconds_until_available() == 0
+
+
+def test_pages_wait_while_every_egress_cools_down(monkeypatch):
+    monkeypatch.setattr(alerter, 'fetch_health', FetchHealth(enabled=False))
+    sent = []
+    egress = Egress('a', backoff_seconds=0.2)
+    pool = EgressPool([egress])
+    egress.record(429)
+
+    def fetch(url, user_agent, tiers_to_watch=None, session=None):
+        sent.append(time.monotonic())
+        return [{'name': 'Gold', 'status': 'sold_out'}]
+
+    page = PagePlan.from_creators('http://example.com/c', [{'name': 'C', 'tiers_to_watch': ['Gold']}])
+
+    async def run():
+        engine = FetchEngine(fetch, egress_pool=pool)
+        # The check is skipped and deferred until the egress recovers...
+        assert await alerter._check_page(page, 'UA', None, engine, None) is None
+        assert 0 < alerter._seconds_blocked(page.url, engine) <= 0.2
+        # ...and a fetch already under way waits for it rather than going out through it.
+        started = time.monotonic()
+        await engine.fetch(page.url, 'UA')
+        return started
+
+    started = asyncio.run(run())
+    pool.close()
+    assert len(sent) == 1 and sent[0] - started > 0.1
+
+
+def test_reloading_the_config_leaves_the_live_egresses_alone():
+    live = EgressPool.from_config({'egress': {'pool': [{'name': 'reload-a'}]}})
+    live.egresses[0].record(503)
+    health = HEALTH.labels('reload-a').value
+    assert health < 1
+
+    compile_config({'creators': [{'name': 'A', 'url': 'http://example.com/c', 'tiers_to_watch': ['Gold']}],
+                    'state_store': 'memory', 'egress': {'pool': [{'name': 'reload-a'}]}})
+    assert HEALTH.labels('reload-a').value == health
+    live.close()
+
+
+def test_fetches_go_through_their_pinned_proxy():
+    seen = []
+    pages = page_server(seen)
+    via = {'a': [], 'b': []}
+    proxies = {name: stand_in_proxy(forwarded) for name, forwarded in via.items()}
+    pool = EgressPool([Egress('a', proxy=proxy_url(proxies['a']), requests_per_second=1000),
+                       Egress('b', proxy=proxy_url(proxies['b']), requests_per_second=1000, user_agent='UA-b')])
+    urls = [f'http://127.0.0.1:{pages.server_address[1]}/c/creator{i}/membership' for i in range(20)]
+
+    async def run():
+        engine = FetchEngine(lambda url, user_agent, session: alerter.scrape_patreon_page(
+            url, user_agent, tiers_to_watch=['Gold'], session=session), egress_pool=pool)
+        return await asyncio.gather(*(engine.fetch(url, 'UA') for url in urls))
+
+    try:
+        results = asyncio.run(run())
+    finally:
+        for server in (pages, *proxies.values()):
+            server.shutdown()
+            server.server_close()
+        pool.close()
+
+    assert all(result == [{'name': 'Gold', 'status': 'available'}] for result in results)
+    for name, forwarded in via.items():
+        assert sorted(forwarded) == sorted(url for url in urls if pool.choose(url).name == name)
+    assert via['a'] and via['b']
+    agents = {path: agent for _, path, agent in seen}
+    assert all(agents[urlsplit(url).path] == ('UA-b' if pool.choose(url).name == 'b' else 'UA') for url in urls)
+
+
+def test_session_connects_from_its_source_address():
+    seen = []
+    pages = page_server(seen)
+    session = HttpSession(source_address='127.0.0.2')
+    try:
+        assert session.get(f'http://127.0.0.1:{pages.server_address[1]}/c/x/membership').status_code == 200
+    finally:
+        session.close()
+        pages.shutdown()
+        pages.server_close()
+    assert seen[0][0] == '127.0.0.2'
+
+
+def test_each_egress_keeps_to_its_own_rate():
+    sent = {'a': [], 'b': []}
+
+    def fetch(url, user_agent, session):
+        sent[session.egress.name].append(time.monotonic())
+        return []
+
+    pool = EgressPool([Egress('a', requests_per_second=20, burst=1), Egress('b', requests_per_second=20, burst=1)])
+
+    async def run():
+        engine = FetchEngine(fetch, max_concurrency=16, egress_pool=pool)
+        started = time.monotonic()
+        await asyncio.gather(*(engine.fetch(f'http://example.com/c/{i}', 'UA') for i in range(30)))
+        return time.monotonic() - started
+
+    elapsed = asyncio.run(run())
+    pool.close()
+    for times in sent.values():
+        gaps = [later - earlier for earlier, later in zip(times, times[1:])]
+        assert min(gaps) > 0.04  # 20/s with no burst
+    # Together the two egresses go faster than either could alone.
+    assert elapsed < (30 - 1) / 20
+
+
+def test_throttling_through_an_egress_does_not_block_the_host(monkeypatch):
+    health = FetchHealth()
+    monkeypatch.setattr(alerter, 'fetch_health', health)
+    throttling = stand_in_proxy([], status=429)
+    egress = Egress('a', proxy=proxy_url(throttling))
+    url = 'http://127.0.0.1:9/c/creator/membership'
+    try:
+        assert alerter.scrape_patreon_page(url, 'UA', session=egress.session) is None
+    finally:
+        throttling.shutdown()
+        throttling.server_close()
+        egress.close()
+    assert not egress.available() and egress.cooling_until - time.monotonic() > 100
+    assert health.admit(url) == 0
@@ -0,0 +1,69 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from patreon_tier_alerter.src.engine import FetchEngine, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_allows_burst_then_refills():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, capacity=3, clock=clock)
+
+    assert [bucket.try_acquire() for _ in range(4)] == [True, True, True, False]
+    clock.now = 0.5
+    assert bucket.try_acquire() is True
+    assert bucket.try_acquire() is False
+
+
+def test_engine_bounds_per_host_concurrency():
+    in_flight = {}
+    peak = {}
+    lock = threading.Lock()
+
+    def fetch(url, user_agent):
+        host = url.split('/')[2]
+        with lock:
+            in_flight[host] = in_flight.get(host, 0) + 1
+            peak[host] = max(peak.get(host, 0), in_flight[host])
+        time.sleep(0.02)
+        with lock:
+            in_flight[host] -= 1
+        return [{'name': url, 'status': 'available'}]
+
+    async def run():
+        engine = FetchEngine(fetch, max_concurrency=8, per_host_concurrency=2,
+                             requests_per_second=1000, burst=1000)
+        urls = [f"http://a.example/{i}" for i in range(6)] + [f"http://b.example/{i}" for i in range(6)]
+        return await asyncio.gather(*(engine.fetch(url, "UA") for url in urls))
+
+    results = asyncio.run(run())
+
+    assert len(results) == 12
+    assert peak == {'a.example': 2, 'b.example': 2}
+
+
+def test_engine_cycle_time_bound_by_rate_not_creator_count():
+    def fetch(url, user_agent):
+        return []
+
+    async def run():
+        engine = FetchEngine(fetch, max_concurrency=50, per_host_concurrency=50,
+                             requests_per_second=200, burst=20)
+        started = time.monotonic()
+        await asyncio.gather(*(engine.fetch(f"http://a.example/{i}", "UA") for i in range(40)))
+        return time.monotonic() - started
+
+    # 20 burst tokens + 20 more at 200/s is ~0.1s, far below 40 * 5s of the old loop.
+    assert asyncio.run(run()) < 2
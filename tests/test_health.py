@@ -0,0 +1,168 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from patreon_tier_alerter.src import alerter
+from patreon_tier_alerter.src.engine import FetchEngine
+from patreon_tier_alerter.src.health import CLOSED, HALF_OPEN, OPEN, FetchHealth, parse_retry_after
+from patreon_tier_alerter.src.plan import PagePlan
+from patreon_tier_alerter.src.session import HttpSession
+
+PAGE = "http://a.example/c/1/membership"
+OTHER_PAGE = "http://a.example/c/2/membership"
+OTHER_HOST = "http://b.example/c/1/membership"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_health(clock, **kwargs):
+    # rng of 0.5 puts the jitter factor at exactly 1.
+    return FetchHealth(backoff_seconds=60, max_backoff_seconds=600, clock=clock, rng=lambda: 0.5, **kwargs)
+
+
+def test_breaker_opens_probes_once_and_backs_off_exponentially():
+    clock = FakeClock()
+    health = make_health(clock, failure_threshold=2)
+
+    health.record_failure(PAGE)
+    assert health.admit(PAGE) == 0
+    health.record_failure(PAGE)
+    assert health.state_of(PAGE) == OPEN
+    assert health.admit(PAGE) == 60
+    assert health.admit(OTHER_PAGE) == 0  # other pages on the host are unaffected
+
+    clock.now = 60
+    assert health.admit(PAGE) == 0  # the probe
+    assert health.state_of(PAGE) == HALF_OPEN
+    assert health.admit(PAGE) > 0  # nothing else until the probe is recorded
+    health.record_failure(PAGE)
+    assert health.seconds_blocked(PAGE) == 120
+
+    clock.now = 180
+    assert health.admit(PAGE) == 0
+    health.record_success(PAGE, 0.1)
+    assert health.state_of(PAGE) == CLOSED and health.admit(PAGE) == 0
+
+
+def test_retry_after_on_429_blocks_the_host_for_at_least_that_long():
+    clock = FakeClock()
+    health = make_health(clock)
+
+    health.record_failure(PAGE, status=429, retry_after=300)
+    assert health.admit(OTHER_PAGE) == 300
+    assert health.admit(OTHER_HOST) == 0
+    # A response to a request sent earlier does not lift the block.
+    health.record_success(OTHER_PAGE, 0.1)
+    assert health.seconds_blocked(PAGE) == 300
+
+    health.record_failure(OTHER_HOST, status=503, retry_after=90)
+    assert health.seconds_blocked(OTHER_HOST) == 90
+    assert health.seconds_blocked("http://b.example/c/2/membership") == 0
+
+
+def test_host_breaker_opens_only_when_most_of_its_fetches_fail():
+    clock = FakeClock()
+    health = make_health(clock, failure_threshold=100)
+
+    for i in range(30):
+        health.record_success(f"http://a.example/ok/{i}", 0.1)
+        health.record_failure(f"http://a.example/broken/{i}")
+    assert health.admit(OTHER_PAGE) == 0
+
+    for i in range(20):
+        health.record_failure(f"http://a.example/down/{i}")
+    assert health.admit(OTHER_PAGE) == 60
+    assert health.admit(OTHER_HOST) == 0
+
+
+def test_parse_retry_after_accepts_seconds_and_http_dates():
+    assert parse_retry_after("120") == 120
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT", now=1445412450) == 30
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after(None) is None
+
+
+def test_scrape_records_429_retry_after(monkeypatch):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(429)
+            self.send_header('Retry-After', '45')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    health = FetchHealth(rng=lambda: 0.5)
+    session = HttpSession()
+    monkeypatch.setattr(alerter, 'fetch_health', health)
+    monkeypatch.setattr(alerter, 'get_session', lambda: session)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/membership"
+        assert alerter.scrape_patreon_page(url, "UA") is None
+        assert 44 < health.seconds_blocked(url) <= 60
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_slow_high_priority_page_is_hedged(monkeypatch):
+    health = FetchHealth()
+    for _ in range(50):
+        health.record_success(PAGE, 0.01)
+    monkeypatch.setattr(alerter, 'fetch_health', health)
+    calls = []
+
+    def fetch(url, user_agent, tiers_to_watch=None):
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            time.sleep(0.5)
+            return [{'name': 'Gold', 'status': 'sold_out'}]
+        return [{'name': 'Gold', 'status': 'available'}]
+
+    page = PagePlan.from_creators(PAGE, [{'name': 'C', 'tiers_to_watch': ['Gold'], 'priority': 'high'}])
+    assert page.hedged
+
+    async def run():
+        engine = FetchEngine(fetch, requests_per_second=1000, burst=1000)
+        started = time.monotonic()
+        result = await alerter._fetch_page(page, "UA", engine)
+        return result, time.monotonic() - started
+
+    result, elapsed = asyncio.run(run())
+    assert result == [{'name': 'Gold', 'status': 'available'}]
+    assert len(calls) == 2 and elapsed < 0.4
+
+
+def test_hedged_not_modified_does_not_beat_the_request_with_tiers(monkeypatch):
+    health = FetchHealth()
+    for _ in range(50):
+        health.record_success(PAGE, 0.01)
+    monkeypatch.setattr(alerter, 'fetch_health', health)
+    calls = []
+
+    def fetch(url, user_agent, tiers_to_watch=None):
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            # Slow, but it stores the new digest before the hedge reads the page.
+            time.sleep(0.3)
+            return [{'name': 'Gold', 'status': 'available'}]
+        return alerter.NOT_MODIFIED
+
+    page = PagePlan.from_creators(PAGE, [{'name': 'C', 'tiers_to_watch': ['Gold'], 'priority': 'high'}])
+    engine = FetchEngine(fetch, requests_per_second=1000, burst=1000)
+    assert asyncio.run(alerter._fetch_page(page, "UA", engine)) == [{'name': 'Gold', 'status': 'available'}]
+    assert len(calls) == 2
@@ -0,0 +1,142 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from patreon_tier_alerter.src.alerter import check_page
+from patreon_tier_alerter.src.history import (HEADER, RECORD, HistoryLog, HistoryReader, change_rates, main,
+                                              open_durations, restock_report)
+from patreon_tier_alerter.src.plan import PagePlan
+from patreon_tier_alerter.src.state import MemoryStateStore
+
+DAY = 86400
+
+
+def test_only_transitions_are_appended_with_interned_names(tmp_path):
+    path = str(tmp_path / "history.log")
+    log = HistoryLog(path)
+    assert log.observe("Creator", "Gold", "sold_out", 100)
+    assert not log.observe("Creator", "Gold", "sold_out", 200)
+    assert log.observe("Creator", "Gold", "available", 300)
+    assert log.observe("Creator", "Silver", "available", 300)
+    log.close()
+
+    assert os.path.getsize(path) == HEADER.size + 3 * RECORD.size
+    with HistoryReader(path) as reader:
+        assert reader.series == [("Creator", "Gold"), ("Creator", "Silver")]
+        assert list(reader.records()) == [
+            (100, "Creator", "Gold", "sold_out"),
+            (300, "Creator", "Gold", "available"),
+            (300, "Creator", "Silver", "available"),
+        ]
+
+    # Reopening remembers the last status, so an unchanged tier is not written again.
+    reopened = HistoryLog(path)
+    assert not reopened.observe("Creator", "Gold", "available", 400)
+    reopened.close()
+
+
+def test_torn_trailing_record_is_dropped_on_open(tmp_path):
+    path = str(tmp_path / "history.log")
+    log = HistoryLog(path)
+    log.observe("Creator", "Gold", "sold_out", 100)
+    log.close()
+    with open(path, "ab") as f:
+        f.write(b"\x01\x02\x03")
+
+    HistoryLog(path).close()
+    with HistoryReader(path) as reader:
+        assert len(reader) == 1
+
+
+def test_reports_restocks_open_durations_and_rates(tmp_path):
+    path = str(tmp_path / "history.log")
+    log = HistoryLog(path)
+    for status, at in (("sold_out", 0), ("available", DAY), ("sold_out", DAY + 600),
+                       ("available", 3 * DAY), ("sold_out", 3 * DAY + 1800)):
+        log.observe("Creator", "Gold", status, at)
+    log.observe("Other", "Gold", "available", 0)
+    log.close()
+
+    with HistoryReader(path) as reader:
+        restocks = restock_report(reader, creator="creator")
+        assert list(restocks) == ["Creator / Gold"]
+        assert restocks["Creator / Gold"]["count"] == 2
+        # Sold out for 24 hours before the first restock, 47h50m before the second.
+        assert restocks["Creator / Gold"]["median_sold_out_hours"] == round((24 + 47 + 50 / 60) / 2, 2)
+
+        durations = open_durations(reader)["Creator / Gold"]
+        assert (durations["count"], durations["min_minutes"], durations["max_minutes"]) == (2, 10, 30)
+
+        assert change_rates(reader) == {"Creator": {"changes": 4, "per_day": round(4 / (3 * DAY + 1800) * DAY, 2)}}
+
+
+def test_reports_merge_a_series_split_across_logs(tmp_path, capsys):
+    # The page moved to another worker between two restocks.
+    first, second = str(tmp_path / "history.log.w0"), str(tmp_path / "history.log.w1")
+    log = HistoryLog(first)
+    for status, at in (("sold_out", 0), ("available", DAY), ("sold_out", DAY + 600)):
+        log.observe("Creator", "Gold", status, at)
+    log.close()
+    log = HistoryLog(second)
+    for status, at in (("sold_out", 2 * DAY), ("available", 3 * DAY), ("sold_out", 3 * DAY + 1800)):
+        log.observe("Creator", "Gold", status, at)
+    log.close()
+
+    main([second, first, "restocks", "--json"])
+    restocks = json.loads(capsys.readouterr().out)["Creator / Gold"]
+    assert (restocks["count"], restocks["last"]) == (2, 3 * DAY)
+    main([first, second, "open", "--json"])
+    durations = json.loads(capsys.readouterr().out)["Creator / Gold"]
+    assert (durations["count"], durations["min_minutes"], durations["max_minutes"]) == (2, 10, 30)
+
+
+def test_compaction_keeps_the_status_at_the_cutoff(tmp_path):
+    path = str(tmp_path / "history.log")
+    log = HistoryLog(path, retention_days=1, clock=lambda: 10 * DAY)
+    for day, status in enumerate(("sold_out", "available", "sold_out", "available")):
+        log.observe("Creator", "Gold", status, day * DAY)
+    log.observe("Creator", "Gold", "sold_out", 9.5 * DAY)
+
+    assert log.maybe_compact() == 3
+    assert log.maybe_compact() == 0  # not again until compact_every_seconds has passed
+    assert not log.observe("Creator", "Gold", "sold_out", 10 * DAY)
+    log.close()
+
+    with HistoryReader(path) as reader:
+        assert [(at, status) for at, _, _, status in reader.records()] == [
+            (3 * DAY, "available"), (9.5 * DAY, "sold_out")]
+
+
+def test_compact_command_refuses_a_log_being_written(tmp_path, capsys):
+    path = str(tmp_path / "history.log")
+    log = HistoryLog(path)
+    log.observe("Creator", "Gold", "sold_out", 0)
+    log.observe("Creator", "Gold", "available", DAY)
+    log.flush()
+
+    with pytest.raises(SystemExit):
+        main([path, "compact", "--keep-days", "0"])
+    assert "running alerter" in capsys.readouterr().err
+    assert log.observe("Creator", "Gold", "sold_out", 2 * DAY)
+    log.close()
+    with HistoryReader(path) as reader:
+        assert len(reader) == 3
+
+    main([path, "compact", "--keep-days", "0"])
+    assert "dropped 2 record(s)" in capsys.readouterr().out
+
+
+def test_check_page_records_watched_tiers(tmp_path):
+    log = HistoryLog(str(tmp_path / "history.log"))
+    page = PagePlan.from_creators("http://example.com", [{"name": "Creator", "tiers_to_watch": ["Gold", "Silver"]}])
+
+    check_page([{"name": "Gold", "status": "available"}], page, MemoryStateStore(), history=log)
+    log.close()
+
+    with HistoryReader(log.path) as reader:
+        assert [(tier, status) for _, _, tier, status in reader.records()] == [
+            ("Gold", "available"), ("Silver", "missing")]
@@ -0,0 +1,78 @@
+import logging
+import os
+import sys
+import urllib.request
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from patreon_tier_alerter.src import alerter
+from patreon_tier_alerter.src.metrics import MetricsRegistry, start_metrics_server
+
+
+def test_render_counters_gauges_and_histograms():
+    registry = MetricsRegistry()
+    sent = registry.counter('sms_total', 'Sent.', ('provider',))
+    size = registry.gauge('state_entries', 'Entries.')
+    latency = registry.histogram('fetch_seconds', 'Fetch time.', buckets=(0.1, 1.0))
+
+    sent.labels('twilio').inc()
+    sent.labels('twilio').inc(2)
+    size.set(7)
+    for value in (0.05, 0.5, 3):
+        latency.observe(value)
+
+    text = registry.render()
+    assert '# TYPE sms_total counter' in text
+    assert 'sms_total{provider="twilio"} 3' in text
+    assert 'state_entries 7' in text
+    assert 'fetch_seconds_bucket{le="0.1"} 1' in text
+    assert 'fetch_seconds_bucket{le="1"} 2' in text
+    assert 'fetch_seconds_bucket{le="+Inf"} 3' in text
+    assert 'fetch_seconds_count 3' in text
+
+
+def test_render_escapes_label_values():
+    registry = MetricsRegistry()
+    alerts = registry.counter('alerts_total', 'Alerts.', ('creator', 'tier'))
+    alerts.labels('The "Band"', 'C:\\Gold\nTier').inc()
+
+    text = registry.render()
+    assert 'alerts_total{creator="The \\"Band\\"",tier="C:\\\\Gold\\nTier"} 1' in text
+    assert len(text.splitlines()) == 3
+
+
+def test_registering_twice_returns_the_same_metric_unless_it_conflicts():
+    registry = MetricsRegistry()
+    counter = registry.counter('c', 'C.')
+    assert registry.counter('c', 'C.') is counter
+    with pytest.raises(ValueError):
+        registry.histogram('c', 'C.')
+    with pytest.raises(ValueError):
+        registry.counter('d', 'D.', ('a',)).labels('x', 'y')
+
+
+def test_metrics_endpoint_serves_registry():
+    registry = MetricsRegistry()
+    registry.counter('pages_total', 'Pages.').inc(4)
+    server = start_metrics_server(0, registry=registry)
+    try:
+        port = server.server_address[1]
+        with urllib.request.urlopen(f'http://127.0.0.1:{port}/metrics') as response:
+            assert response.headers['Content-Type'].startswith('text/plain')
+            assert 'pages_total 4' in response.read().decode()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_check_tiers_debug_logging_does_not_dump_alert_state(capsys, caplog):
+    cache = {(f"Other {i}", "Tier"): True for i in range(50)}
+    creator = {"name": "C", "url": "u", "tiers_to_watch": ["Gold"]}
+
+    with caplog.at_level(logging.DEBUG, logger=alerter.__name__):
+        alerter.check_tiers([{"name": "Gold", "status": "available"}], creator, cache)
+
+    assert capsys.readouterr().out == ""
+    assert [record.getMessage() for record in caplog.records] == ["Tier 'Gold' for C is AVAILABLE. Added to alerts."]
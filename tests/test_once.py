@@ -0,0 +1,52 @@
+import json
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from patreon_tier_alerter.src import alerter
+from patreon_tier_alerter.src.state import SQLiteStateStore
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def write_config(tmp_path) -> str:
+    config = {
+        "creators": [{"name": "Creator", "url": "http://example.com/c", "tiers_to_watch": ["Gold"]}],
+        "state_path": str(tmp_path / "state.sqlite3"),
+        "requests_per_second": 1000,
+    }
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps(config))
+    return str(path)
+
+
+def test_once_checks_every_page_saves_state_and_returns(tmp_path, monkeypatch):
+    fetched = []
+
+    def fake_scrape(url, user_agent, **kwargs):
+        fetched.append(url)
+        return [{"name": "Gold", "status": "available"}]
+
+    monkeypatch.setattr(alerter, "scrape_patreon_page", fake_scrape)
+    config_path = write_config(tmp_path)
+
+    assert alerter.main(["--config", config_path, "--once"]) == 0
+    assert fetched == ["http://example.com/c"]
+    store = SQLiteStateStore(str(tmp_path / "state.sqlite3"))
+    assert store.get(("Creator", "Gold")) is True
+    store.close()
+
+
+def test_once_fails_when_no_page_could_be_checked(tmp_path, monkeypatch):
+    monkeypatch.setattr(alerter, "scrape_patreon_page", lambda url, user_agent, **kwargs: None)
+
+    assert alerter.main(["--config", write_config(tmp_path), "--once"]) == 1
+
+
+def test_importing_the_alerter_does_not_load_provider_sdks():
+    code = ("import sys, patreon_tier_alerter.src.alerter; "
+            "print(any(name.split('.')[0] in ('boto3', 'botocore', 'twilio') for name in sys.modules))")
+    output = subprocess.run([sys.executable, "-c", code], cwd=REPO_ROOT, capture_output=True, text=True, check=True)
+    assert output.stdout.strip() == "False"
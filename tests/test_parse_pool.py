@@ -0,0 +1,126 @@
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from patreon_tier_alerter.src import alerter, parse_pool
+from patreon_tier_alerter.src.parse_pool import ParsePool
+from patreon_tier_alerter.src.tier_parser import StreamingTierParser, TierRegionCache, parse_region, region_tiers
+
+
+def tier_card(name, button, disabled=False):
+    return (
+        f'<div class="card"><h3>{name}</h3>'
+        f'<a class="btn" href="/checkout?t=1" data-tag="patron-checkout-continue-button" '
+        f'aria-label="{name} Join" aria-disabled="{str(disabled).lower()}">'
+        f'<div class="cm-oHFIQB">{button}</div></a></div>'
+    )
+
+
+CARDS = (tier_card('Bronze &amp; Oak', 'Join') + tier_card('Silver', 'Sold Out')
+         + tier_card('Gold', 'Join', disabled=True)).encode()
+REWARDS = [{"title": "Bronze & Oak", "remaining": 4, "user_limit": 10},
+           {"title": "Silver", "remaining": 0, "user_limit": 10},
+           {"title": "Gold", "remaining": 1, "user_limit": 5}]
+
+
+def page(rewards=None, padding=0):
+    body = b'<html><body>' + CARDS
+    if rewards is not None:
+        payload = json.dumps({"props": {"pad": "z" * padding, "included": [
+            {"type": "reward", "id": str(i), "attributes": attributes} for i, attributes in enumerate(rewards)]}})
+        body += b'<script id="__NEXT_DATA__" type="application/json">' + payload.encode() + b'</script>'
+    return body + b'</body></html>'
+
+
+def fed(data, watch=None, **options):
+    parser = StreamingTierParser(watch, **options)
+    for i in range(0, len(data), 1000):
+        parser.feed(data[i:i + 1000])
+    return parser
+
+
+def test_a_region_parses_the_same_in_a_worker_as_in_place():
+    pool = ParsePool(workers=1, min_bytes=0)
+    parsed = []
+    try:
+        for data, options in ((page(), {}), (page(REWARDS), {'embedded_json': True}),
+                              (page(REWARDS), {'embedded_json': True, 'self_check': False})):
+            parser = fed(data, ['gold'], **options)
+            region = parser.region()
+            digest, source, tiers, disagreements, _ = pool.parse(region)
+            assert parse_region(region)[:4] == (digest, source, tiers, disagreements)
+            assert digest == parser.digest()
+            assert region_tiers(tiers) == parser.close()
+            assert (source, list(disagreements)) == (parser.source, parser.disagreements)
+            parsed.append((source, tiers[2], disagreements))
+    finally:
+        pool.close()
+    assert parsed == [
+        ('html', ('Gold', 'sold_out'), ()),
+        ('json', ('Gold', 'available', 1, 5), (('gold', 'available', 'sold_out'),)),
+        ('json', ('Gold', 'available', 1, 5), ()),
+    ]
+
+
+def test_scrape_parses_large_regions_in_the_pool(monkeypatch):
+    body = page(REWARDS, padding=50000)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    pool = ParsePool(workers=1)
+    monkeypatch.setattr(alerter, 'parse_pool', pool)
+    monkeypatch.setattr(alerter, 'tier_region_cache', TierRegionCache())
+    url = f'http://127.0.0.1:{server.server_address[1]}/c/creator/membership'
+    sent = parse_pool.REGIONS.value
+    try:
+        first = alerter.scrape_patreon_page(url, 'UA', tiers_to_watch=['Gold'], embedded_json=True)
+        second = alerter.scrape_patreon_page(url, 'UA', tiers_to_watch=['Gold'], embedded_json=True)
+    finally:
+        pool.close()
+        server.shutdown()
+        server.server_close()
+
+    assert first == [
+        {'name': 'Bronze & Oak', 'status': 'available', 'remaining': 4, 'limit': 10},
+        {'name': 'Silver', 'status': 'sold_out', 'remaining': 0, 'limit': 10},
+        {'name': 'Gold', 'status': 'available', 'remaining': 1, 'limit': 5},
+    ]
+    # The second response hashes the same and comes from the region cache, in the same shape.
+    assert second == first
+    assert parse_pool.REGIONS.value - sent == 2
+    assert alerter.tier_region_cache.reset_counters() == (1, 1)
+
+
+def test_callers_wait_while_the_pool_is_full():
+    region = fed(page(REWARDS, padding=2_000_000), embedded_json=True).region()
+    pool = ParsePool(workers=1, max_pending=2, min_bytes=0)
+    waits = parse_pool.WAIT_SECONDS.labels().count
+    results, peak = [], []
+    threads = [threading.Thread(target=lambda: results.append(pool.parse(region)[:4])) for _ in range(6)]
+    try:
+        for thread in threads:
+            thread.start()
+        while any(thread.is_alive() for thread in threads):
+            peak.append(pool.pending)
+        for thread in threads:
+            thread.join()
+    finally:
+        pool.close()
+
+    assert len(results) == 6 and len(set(results)) == 1
+    assert max(peak) <= 2 and pool.pending == 0
+    assert parse_pool.WAIT_SECONDS.labels().count > waits
@@ -0,0 +1,99 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from patreon_tier_alerter.src import alerter
+from patreon_tier_alerter.src.plan import ConfigError, ConfigWatcher, compile_config
+
+URL = "https://www.patreon.com/c/shared/membership"
+
+
+def config(creators, **extra):
+    return dict({"creators": creators, "check_interval_seconds": 600, "state_store": "memory"}, **extra)
+
+
+def test_creators_sharing_a_url_are_fetched_once_with_normalized_names():
+    plan = compile_config(config([
+        {"name": "A", "url": URL, "tiers_to_watch": ["Gold", "SILVER"]},
+        {"name": "B", "url": URL, "tiers_to_watch": ["gold"]},
+        {"name": "C", "url": "https://www.patreon.com/c/other/membership", "tiers_to_watch": ["Bronze"]},
+        {"name": "No URL", "tiers_to_watch": ["x"]},
+    ]))
+
+    assert [page.url for page in plan.pages] == [URL, "https://www.patreon.com/c/other/membership"]
+    shared = plan.pages[0]
+    assert shared.watch_names == ("gold", "silver")
+    assert [watch.name for watch in shared.creators] == ["A", "B"]
+    assert shared.creators[0].watched == (("Gold", "gold"), ("SILVER", "silver"))
+    assert len(plan.creators) == 3
+    assert any("No URL" in warning for warning in plan.warnings)
+
+
+def test_check_page_alerts_every_creator_watching_the_page():
+    plan = compile_config(config([
+        {"name": "A", "url": URL, "tiers_to_watch": ["Gold"]},
+        {"name": "B", "url": URL, "tiers_to_watch": ["gold", "Silver"]},
+    ]))
+    state = {}
+    alerts = alerter.check_page([{"name": "GOLD", "status": "available"}], plan.pages[0], state)
+
+    assert [(a["creator_name"], a["tier_name"]) for a in alerts] == [("A", "Gold"), ("B", "gold")]
+    assert state == {("A", "Gold"): True, ("B", "gold"): True}
+
+
+@pytest.mark.parametrize("bad", [
+    {"creators": []},
+    config([{"name": "A", "tiers_to_watch": ["x"]}]),
+    config([{"name": "A", "url": URL}], min_check_interval_seconds=0),
+    config([{"name": "A", "url": URL, "restock_times": ["someday"]}]),
+    config([{"name": "A", "url": URL}], state_store="redis"),
+    config([{"name": "A", "url": URL}], egress={"pool": [{"name": "x"}, {"name": "x"}]}),
+    config([{"name": "A", "url": URL}], egress={"pool": [{"max_concurrent": 0}]}),
+    config([{"name": "A", "url": URL}], restock_prediction={"bucket_minutes": 7}),
+    config([{"name": "A", "url": URL}], parse_pool={"workers": 0}),
+])
+def test_unusable_configurations_raise(bad):
+    with pytest.raises(ConfigError):
+        compile_config(bad)
+
+
+def test_watcher_reloads_on_change_and_keeps_plan_on_bad_edit(tmp_path, capsys):
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps(config([{"name": "A", "url": URL, "tiers_to_watch": ["Gold"]}])))
+    watcher = ConfigWatcher(str(path), check_seconds=0)
+    assert len(watcher.load().pages) == 1
+    assert watcher.poll() is None
+
+    path.write_text("{not json")
+    os.utime(path, ns=(1, 1))
+    assert watcher.poll() is None
+    assert "Keeping the current configuration" in capsys.readouterr().out
+
+    path.write_text(json.dumps(config([
+        {"name": "A", "url": URL, "tiers_to_watch": ["Gold"]},
+        {"name": "B", "url": URL + "2", "tiers_to_watch": ["Gold"]},
+    ])))
+    os.utime(path, ns=(2, 2))
+    assert len(watcher.poll().pages) == 2
+
+
+def test_runtime_apply_keeps_page_timing_and_unchanged_router():
+    first = compile_config(config([{"name": "A", "url": URL, "tiers_to_watch": ["Gold"]}]))
+    runtime = alerter._Runtime(first, alerter._build_router(first))
+    [(index, _)] = runtime.scheduler.pop_due()
+    runtime.scheduler.record(index, [])
+    interval = runtime.scheduler.interval_for(index)
+    router = runtime.router
+
+    runtime.apply(compile_config(config([
+        {"name": "B", "url": URL + "2", "tiers_to_watch": ["Gold"]},
+        {"name": "A", "url": URL, "tiers_to_watch": ["Gold", "Silver"]},
+    ])))
+
+    assert runtime.router is router
+    assert runtime.scheduler.interval_for(1) == interval
+    assert [schedule["url"] for _, schedule in runtime.scheduler.pop_due()] == [URL + "2"]
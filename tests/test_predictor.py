@@ -0,0 +1,102 @@
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from patreon_tier_alerter.src.history import HistoryLog, HistoryReader
+from patreon_tier_alerter.src.plan import PagePlan
+from patreon_tier_alerter.src.predictor import RestockPredictor
+from patreon_tier_alerter.src.scheduler import DAY, WEEK, AdaptiveScheduler
+
+URL = 'https://www.patreon.com/c/drums/membership'
+MONDAY = time.mktime((2024, 1, 1, 0, 0, 0, 0, 0, -1))  # local midnight
+FRIDAY_SIX = MONDAY + 4 * DAY + 18 * 3600
+
+
+class FakeClock:
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def weekly_predictor(weeks=3):
+    """A predictor that has seen the page restock between 18:00 and 18:10 on the last few Fridays."""
+    predictor = RestockPredictor(base_interval=600, enabled=True)
+    predictor.track(URL, MONDAY)
+    for week in range(weeks):
+        predictor.observe(URL, FRIDAY_SIX + week * WEEK + 600, FRIDAY_SIX + week * WEEK)
+    return predictor
+
+
+def test_weekly_restocks_become_a_window_paid_for_outside_it():
+    assert weekly_predictor(weeks=1).window(URL, MONDAY + WEEK) is None  # one restock is not a pattern
+
+    predictor = weekly_predictor()
+    now = MONDAY + 3 * WEEK
+    opens = 4 * DAY + 18 * 3600 - 120  # lead_seconds before the bucket
+    assert predictor.windows(URL, now) == ((opens, opens + 720),)
+    assert predictor.window(URL, now) == (opens, opens + 720)
+    assert predictor.window(URL, now + opens + 60) == (0, 660)
+    assert predictor.burst_interval_for(URL, now) == 5
+    # 144 burst polls a week instead of ~1; the rest of the week is polled that much less often.
+    assert predictor.stretch(URL, now) == pytest.approx((WEEK - 720) / (WEEK - 144 * 600))
+
+
+def test_daily_restocks_share_the_budget_with_a_longer_burst_interval():
+    predictor = RestockPredictor(base_interval=600, enabled=True)
+    predictor.track(URL, MONDAY)
+    for day in range(7):
+        nine = MONDAY + day * DAY + 9 * 3600
+        predictor.observe(URL, nine + 600, nine)
+
+    windows = predictor.windows(URL, MONDAY + WEEK)
+    assert [start % DAY for start, _ in windows] == [9 * 3600 - 120] * 7
+    # 7 x 12 minutes of windows over half of 1008 polls a week.
+    assert predictor.burst_interval_for(URL, MONDAY + WEEK) == pytest.approx(7 * 720 / 504)
+
+
+def test_scheduler_prewarms_burst_polls_the_window_and_backs_off_once_it_sees_the_restock():
+    clock = FakeClock(FRIDAY_SIX + 3 * WEEK - 20 * 60)
+    opens = FRIDAY_SIX + 3 * WEEK - 120
+    restock = FRIDAY_SIX + 3 * WEEK + 180
+    scheduler = AdaptiveScheduler([{'name': 'Drums', 'url': URL}], base_interval=600, min_interval=600,
+                                  max_interval=600, predictor=weekly_predictor(), clock=clock)
+    polls, warmed = [], []
+    while clock.now < FRIDAY_SIX + 3 * WEEK + 1800:
+        clock.now += scheduler.seconds_until_next()
+        warmed.extend(clock.now for _ in scheduler.pop_warmups())
+        for index, _ in scheduler.pop_due():
+            polls.append(clock.now)
+            scheduler.record(index, [{'name': 'Gold', 'status': 'available' if clock.now >= restock else 'sold_out'}])
+
+    assert warmed == [opens - 10]
+    assert opens in polls
+    seen = next(poll for poll in polls if poll >= restock)
+    assert seen - restock < 5
+    assert polls[polls.index(seen) - 1] - polls[polls.index(seen) - 2] == 5
+    # Back to the (stretched) slow rate for the rest of the window.
+    assert polls[polls.index(seen) + 1] - seen > 600
+
+
+def test_restocks_are_learned_from_the_tier_history(tmp_path):
+    history = HistoryLog(str(tmp_path / 'tiers.log'))
+    history.observe('Drums', 'Gold', 'sold_out', MONDAY)
+    history.observe('Drums', 'Silver', 'sold_out', MONDAY)
+    history.observe('Drums', 'Unwatched', 'sold_out', MONDAY)
+    for week in range(3):
+        at = FRIDAY_SIX + week * WEEK + 600
+        for tier in ('Gold', 'Silver', 'Unwatched'):
+            history.observe('Drums', tier, 'available', at)
+            history.observe('Drums', tier, 'sold_out', at + 900)
+    history.close()
+
+    page = PagePlan.from_creators(URL, [{'name': 'Drums', 'url': URL, 'tiers_to_watch': ['gold', 'SILVER']}])
+    predictor = RestockPredictor(base_interval=600, enabled=True)
+    with HistoryReader(history.path) as reader:
+        assert predictor.learn_history(reader, [page]) == 3  # Gold and Silver reopening together count once
+    assert predictor.windows(URL, MONDAY + 3 * WEEK) == weekly_predictor().windows(URL, MONDAY + 3 * WEEK)
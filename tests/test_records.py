@@ -0,0 +1,121 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from patreon_tier_alerter.src.plan import PagePlan
+from patreon_tier_alerter.src.records import APPEARED, CLOSED, DISAPPEARED, OPENED, TierDiff, tier_records
+from patreon_tier_alerter.src.state import MemoryStateStore, SQLiteStateStore
+
+URL = "http://example.com/c/membership"
+PAGE = PagePlan.from_creators(URL, [{"name": "C", "tiers_to_watch": ["Gold", "Silver", "Bronze"]}])
+
+
+def check(diff, scraped, store):
+    alerts = []
+    transitions = diff.check_page(PAGE, scraped, store, alerts)
+    return alerts, [(t.kind, t.tier_name) for t in transitions]
+
+
+class CountingStore(MemoryStateStore):
+    def __init__(self):
+        super().__init__()
+        self.reads = 0
+
+    def get(self, key, default=None):
+        self.reads += 1
+        return super().get(key, default)
+
+
+def test_tier_records_are_shared_and_interned():
+    first, = tier_records([{"name": " ".join(["Gold", "Tier"]), "status": "available", "remaining": 2}])
+    again, = tier_records([{"name": " ".join(["Gold", "Tier"]), "status": "available", "remaining": 2}])
+    other, = tier_records([{"name": "Gold Tier", "status": "weird"}])
+    assert first is again
+    assert first.name is other.name
+    assert first.as_dict() == {"name": "Gold Tier", "status": "available", "remaining": 2}
+    for counted in ({"name": "Gold Tier", "status": "available", "remaining": 2, "limit": 5},
+                    {"name": "Gold Tier", "status": "available", "remaining": None, "limit": None}):
+        record, = tier_records([counted])
+        assert record is not first and record.as_dict() == counted
+    assert other.status_name == "unknown"
+
+
+def test_transitions_between_checks():
+    diff = TierDiff()
+    store = MemoryStateStore()
+    alerts, transitions = check(diff, [{"name": "Gold", "status": "sold_out"},
+                                       {"name": "Silver", "status": "available"}], store)
+    assert transitions == []  # the first check is the baseline
+    assert [a["tier_name"] for a in alerts] == ["Silver"]
+
+    alerts, transitions = check(diff, [{"name": "Gold", "status": "available"},
+                                       {"name": "Silver", "status": "sold_out"},
+                                       {"name": "Bronze", "status": "sold_out"},
+                                       {"name": "Extra", "status": "available"}], store)
+    assert [a["tier_name"] for a in alerts] == ["Gold"]
+    assert sorted(transitions) == sorted([(APPEARED, "Bronze"), (APPEARED, "Extra"),
+                                          (OPENED, "Gold"), (CLOSED, "Silver")])
+    assert store.get(("C", "Silver")) is False
+
+    alerts, transitions = check(diff, [{"name": "Silver", "status": "sold_out"}], store)
+    assert alerts == []
+    assert sorted(transitions) == [(DISAPPEARED, "Bronze"), (DISAPPEARED, "Gold")]
+    assert store.get(("C", "Gold")) is False  # reset, so it alerts again when it comes back
+
+
+def test_unchanged_statuses_skip_the_alert_state():
+    diff = TierDiff()
+    store = CountingStore()
+    scraped = [{"name": "Gold", "status": "available"}]
+    assert len(check(diff, scraped, store)[0]) == 1
+    reads = store.reads
+
+    assert check(diff, scraped, store) == ([], [])
+    assert store.reads == reads
+
+
+def test_reload_makes_the_next_check_consult_the_alert_state(tmp_path):
+    path = str(tmp_path / "state.sqlite3")
+    diff = TierDiff()
+    store = SQLiteStateStore(path)
+    scraped = [{"name": "Gold", "status": "available"}]
+    assert len(check(diff, scraped, store)[0]) == 1
+    store.flush()
+
+    other = SQLiteStateStore(path)  # another worker resets the tier
+    other[("C", "Gold")] = False
+    other.flush()
+    assert check(diff, scraped, store)[0] == []  # not reloaded: the diff trusts its previous check
+
+    store.reload()
+    assert len(check(diff, scraped, store)[0]) == 1
+    store.close()
+    other.close()
+
+
+def test_plain_dict_state_is_always_consulted():
+    diff = TierDiff()
+    cache = {}
+    scraped = [{"name": "Gold", "status": "available"}]
+    assert len(check(diff, scraped, cache)[0]) == 1
+    cache.clear()
+    assert len(check(diff, scraped, cache)[0]) == 1
+
+
+def test_retain_drops_removed_pages():
+    diff = TierDiff()
+    check(diff, [{"name": "Gold", "status": "sold_out"}], MemoryStateStore())
+    diff.retain([])
+    _, transitions = check(diff, [{"name": "Gold", "status": "available"}], MemoryStateStore())
+    assert transitions == []
+
+
+def test_alerts_carry_remaining_and_follow_reordered_pages():
+    diff = TierDiff()
+    store = MemoryStateStore()
+    check(diff, [{"name": "Gold", "status": "sold_out"}, {"name": "Silver", "status": "sold_out"}], store)
+    alerts, transitions = check(diff, [{"name": "Silver", "status": "sold_out"},
+                                       {"name": "GOLD", "status": "available", "remaining": 3}], store)
+    assert alerts == [{"creator_name": "C", "tier_name": "Gold", "url": URL, "remaining": 3}]
+    assert transitions == [(OPENED, "Gold")]
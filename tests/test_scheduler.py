@@ -0,0 +1,111 @@
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from patreon_tier_alerter.src.scheduler import (
+    AdaptiveScheduler,
+    parse_restock_time,
+    seconds_until_restock_window,
+)
+from patreon_tier_alerter.src.session import NOT_MODIFIED
+
+
+class FakeClock:
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def tiers(status):
+    return [{'name': 'Gold', 'status': status}]
+
+
+def test_changing_creator_speeds_up_and_static_creator_backs_off():
+    clock = FakeClock()
+    creators = [{'name': 'Busy', 'url': 'a'}, {'name': 'Quiet', 'url': 'b'}]
+    scheduler = AdaptiveScheduler(creators, base_interval=600, min_interval=60,
+                                  max_interval=3600, backoff=2, clock=clock)
+
+    assert [index for index, _ in scheduler.pop_due()] == [0, 1]
+    scheduler.record(0, tiers('sold_out'))
+    scheduler.record(1, tiers('sold_out'))
+
+    for status in ('available', 'sold_out', 'available', 'sold_out', 'available'):
+        clock.now += 3600
+        for index, _ in scheduler.pop_due():
+            scheduler.record(index, tiers(status) if index == 0 else NOT_MODIFIED)
+
+    assert scheduler.interval_for(0) == 60
+    assert scheduler.interval_for(1) == 3600
+
+
+def test_failed_poll_keeps_interval_and_pop_due_respects_heap_order():
+    clock = FakeClock()
+    scheduler = AdaptiveScheduler([{'name': 'A'}, {'name': 'B'}], base_interval=100,
+                                  min_interval=10, max_interval=1000, backoff=2, clock=clock)
+    scheduler.pop_due()
+    scheduler.record(0, None)
+    scheduler.record(1, tiers('sold_out'))
+
+    assert scheduler.interval_for(0) == 100
+    assert scheduler.seconds_until_next() == 100
+    clock.now = 150
+    assert [index for index, _ in scheduler.pop_due()] == [0]
+    assert scheduler.seconds_until_next() == 50
+
+
+def test_failed_poll_waits_out_a_backoff_longer_than_its_interval():
+    clock = FakeClock()
+    scheduler = AdaptiveScheduler([{'name': 'A'}], base_interval=100, clock=clock)
+    scheduler.pop_due()
+    scheduler.record(0, None, retry_in=900)
+
+    assert scheduler.interval_for(0) == 100
+    assert scheduler.seconds_until_next() == 900
+
+
+def test_interval_stays_fixed_unless_bounds_are_configured():
+    clock = FakeClock()
+    fixed = AdaptiveScheduler.from_config([{'name': 'A'}], {'check_interval_seconds': 600}, clock=clock)
+    adaptive = AdaptiveScheduler.from_config([{'name': 'A'}], {'check_interval_seconds': 600,
+                                                               'max_check_interval_seconds': 2400}, clock=clock)
+    for scheduler in (fixed, adaptive):
+        for _ in range(20):
+            scheduler.pop_due()
+            scheduler.record(0, NOT_MODIFIED)
+
+    assert fixed.interval_for(0) == 600
+    assert adaptive.interval_for(0) == 2400
+
+
+def test_parse_restock_time():
+    assert parse_restock_time("18:30") == (None, 18 * 60 + 30)
+    assert parse_restock_time("Fri 09:05") == (4, 9 * 60 + 5)
+    with pytest.raises(ValueError):
+        parse_restock_time("Someday 10:00")
+
+
+def test_restock_window_uses_floor_and_caps_next_due():
+    base = time.mktime((2026, 10, 16, 17, 0, 0, 0, 0, -1))  # Friday 17:00 local time
+    restock = [parse_restock_time("Fri 18:00")]
+
+    assert seconds_until_restock_window(restock, base, 900) == pytest.approx(45 * 60)
+    assert seconds_until_restock_window(restock, base + 3600, 900) == 0
+
+    clock = FakeClock(base)
+    scheduler = AdaptiveScheduler([{'name': 'A', 'restock_times': ["Fri 18:00"]}], base_interval=7200,
+                                  min_interval=30, max_interval=7200, restock_window_seconds=900, clock=clock)
+    scheduler.pop_due()
+    scheduler.record(0, tiers('sold_out'))
+    assert scheduler.seconds_until_next() == pytest.approx(45 * 60)
+
+    clock.now = base + 3600
+    scheduler.pop_due()
+    scheduler.record(0, tiers('sold_out'))
+    assert scheduler.seconds_until_next() == 30
@@ -3,7 +3,7 @@ import sys
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-from patreon_tier_alerter.src import alerter
+from patreon_tier_alerter.src import alerter, providers
 
 class DummyMessages:
     def __init__(self, recorded):
@@ -27,7 +27,7 @@ def test_send_alerts_twilio(monkeypatch):
     recorded = {}
     def client_factory(sid, token):
         return DummyClient(sid, token, recorded)
-    monkeypatch.setattr(alerter, 'Client', client_factory)
+    monkeypatch.setattr(providers, 'Client', client_factory)
 
     alerts = [{
         'tier_name': 'T',
@@ -0,0 +1,154 @@
+import asyncio
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from patreon_tier_alerter.src import alerter
+from patreon_tier_alerter.src.plan import compile_config
+from patreon_tier_alerter.src.session import NOT_MODIFIED, HttpSession
+
+PAGE = (
+    b'<a data-tag="patron-checkout-continue-button" aria-label="Cool Tier Join">'
+    b'<div class="cm-oHFIQB">Join</div></a>'
+)
+
+
+@pytest.fixture
+def etag_server():
+    seen = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            seen.append((self.headers.get('If-None-Match'), self.client_address[1]))
+            if self.headers.get('If-None-Match') == '"v1"':
+                self.send_response(304)
+                self.send_header('ETag', '"v1"')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('ETag', '"v1"')
+            self.send_header('Content-Length', str(len(PAGE)))
+            self.end_headers()
+            self.wfile.write(PAGE)
+
+        def do_HEAD(self):
+            seen.append(('HEAD', self.client_address[1]))
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(PAGE)))
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/membership", seen
+    server.shutdown()
+    server.server_close()
+
+
+def test_conditional_scrape_returns_not_modified_and_reuses_connection(etag_server, monkeypatch):
+    url, seen = etag_server
+    session = HttpSession()
+    monkeypatch.setattr(alerter, 'get_session', lambda: session)
+
+    first = alerter.scrape_patreon_page(url, "UA", conditional=True)
+    second = alerter.scrape_patreon_page(url, "UA", conditional=True)
+
+    assert first == [{'name': 'Cool Tier', 'status': 'available'}]
+    assert second is NOT_MODIFIED
+    assert seen[0][0] is None and seen[1][0] == '"v1"'
+    # Both requests went over the same keep-alive connection.
+    assert seen[0][1] == seen[1][1]
+
+
+def test_unconditional_scrape_always_parses(etag_server, monkeypatch):
+    url, seen = etag_server
+    session = HttpSession()
+    monkeypatch.setattr(alerter, 'get_session', lambda: session)
+
+    alerter.scrape_patreon_page(url, "UA", conditional=True)
+    tiers = alerter.scrape_patreon_page(url, "UA")
+
+    assert tiers == [{'name': 'Cool Tier', 'status': 'available'}]
+    assert seen[1][0] is None
+
+
+def test_prewarmed_connection_is_reused_by_the_next_fetch(etag_server, monkeypatch):
+    url, seen = etag_server
+    session = HttpSession()
+    monkeypatch.setattr(alerter, 'get_session', lambda: session)
+
+    assert alerter.prewarm_page(url, "UA")
+    alerter.scrape_patreon_page(url, "UA")
+
+    assert seen[0][0] == 'HEAD' and seen[1][0] is None
+    assert seen[0][1] == seen[1][1]
+
+
+def test_reload_watching_a_new_tier_parses_the_unchanged_page_again(etag_server, monkeypatch):
+    url, seen = etag_server
+    session = HttpSession()
+    monkeypatch.setattr(alerter, 'get_session', lambda: session)
+
+    def plan(tiers):
+        return compile_config({"creators": [{"name": "A", "url": url, "tiers_to_watch": tiers}],
+                               "state_store": "memory", "requests_per_second": 100})
+
+    def fetch():
+        [page] = runtime.plan.pages
+        return asyncio.run(alerter._fetch_page(page, "UA", runtime.engine))
+
+    runtime = alerter._Runtime(plan(["Other"]), alerter._build_router(plan(["Other"])))
+    assert fetch() == [{'name': 'Cool Tier', 'status': 'available'}]
+    assert fetch() is NOT_MODIFIED
+
+    runtime.apply(plan(["Other", "Cool Tier"]))
+    assert fetch() == [{'name': 'Cool Tier', 'status': 'available'}]
+    assert seen[-1][0] is None
+
+
+@pytest.mark.parametrize("padding, reused", [(50_000, True), (400_000, False)])
+def test_early_exit_keeps_the_connection_when_little_is_left(padding, reused, monkeypatch):
+    body = PAGE + b'<div>' + b'x' * padding + b'</div>'
+    ports = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            ports.append(self.client_address[1])
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            try:
+                self.wfile.write(body)
+            except OSError:
+                pass  # the client stopped reading and closed the connection
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    session = HttpSession()
+    monkeypatch.setattr(alerter, 'get_session', lambda: session)
+    url = f"http://127.0.0.1:{server.server_address[1]}/membership"
+    try:
+        for _ in range(3):
+            assert alerter.scrape_patreon_page(url, "UA", tiers_to_watch=["Cool Tier"]) == [
+                {'name': 'Cool Tier', 'status': 'available'}]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert len(set(ports)) == (1 if reused else 3)
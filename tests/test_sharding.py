@@ -0,0 +1,117 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from patreon_tier_alerter.src.scheduler import AdaptiveScheduler
+from patreon_tier_alerter.src.sharding import HashRing, ShardCoordinator
+from patreon_tier_alerter.src import state
+from patreon_tier_alerter.src.state import SQLiteStateStore
+
+KEYS = [f"https://www.patreon.com/c/creator{i}/membership" for i in range(2000)]
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_adding_a_worker_only_moves_keys_to_it():
+    before = HashRing(["a", "b", "c"])
+    after = HashRing(["a", "b", "c", "d"])
+
+    moved = [key for key in KEYS if before.owner(key) != after.owner(key)]
+
+    assert all(after.owner(key) == "d" for key in moved)
+    assert 0.15 < len(moved) / len(KEYS) < 0.35
+    shares = [sum(1 for key in KEYS if after.owner(key) == node) for node in "abcd"]
+    assert min(shares) > len(KEYS) / 4 * 0.6
+
+
+def test_removing_a_worker_only_moves_its_keys():
+    before = HashRing(["a", "b", "c"])
+    after = HashRing(["a", "c"])
+    for key in KEYS:
+        if before.owner(key) != "b":
+            assert after.owner(key) == before.owner(key)
+
+
+def test_coordinators_agree_on_ownership_and_expire_dead_workers(tmp_path):
+    path = str(tmp_path / "state.sqlite3")
+    clock = FakeClock()
+    one = ShardCoordinator(path, "one", heartbeat_seconds=10, ttl_seconds=30, clock=clock)
+    two = ShardCoordinator(path, "two", heartbeat_seconds=10, ttl_seconds=30, clock=clock)
+    one.heartbeat()
+    two.heartbeat()
+    assert one.heartbeat() is True  # sees "two" now
+    assert one.workers == two.workers == ["one", "two"]
+
+    creators = [{"url": key} for key in KEYS[:200]]
+    owned_by_one = {c["url"] for c in creators if one.owns(c)}
+    owned_by_two = {c["url"] for c in creators if two.owns(c)}
+    assert owned_by_one and owned_by_two
+    assert owned_by_one.isdisjoint(owned_by_two)
+    assert len(owned_by_one | owned_by_two) == 200
+
+    clock.now += 31  # "two" stops heartbeating
+    assert one.heartbeat() is True
+    assert one.workers == ["one"]
+    assert all(one.owns(c) for c in creators)
+
+    with pytest.raises(ValueError):
+        ShardCoordinator(path, "three", heartbeat_seconds=30, ttl_seconds=30)
+
+
+def test_each_alert_is_claimed_by_exactly_one_process(tmp_path):
+    path = str(tmp_path / "state.sqlite3")
+    first, second = SQLiteStateStore(path), SQLiteStateStore(path)
+    key = ("Creator", "Gold")
+
+    first[key] = True
+    second[key] = True
+    assert first.claim([key]) == {key}
+    assert second.claim([key]) == set()
+    assert not first.dirty and not second.dirty
+
+    # Once the tier closes and reopens it can be claimed again.
+    second[key] = False
+    second.flush()
+    first.reload()
+    assert first.get(key) is False
+    first[key] = True
+    assert first.claim([key]) == {key}
+    first.close()
+    second.close()
+
+
+def test_slot_events_are_claimed_by_exactly_one_process(tmp_path, monkeypatch):
+    path = str(tmp_path / "state.sqlite3")
+    first, second = SQLiteStateStore(path), SQLiteStateStore(path)
+    event = ("Creator", "Gold", "almost_sold_out", 2)
+    now = [1000.0]
+    monkeypatch.setattr(state.time, "time", lambda: now[0])
+
+    assert first.claim([event]) == {event}
+    assert second.claim([event]) == set()
+    assert second.claim([event[:3] + (1,)]) == {event[:3] + (1,)}
+    assert event not in first and not first.dirty
+
+    # Much later the same event at the same count is a new one.
+    now[0] += state.EVENT_CLAIM_SECONDS + 1
+    assert second.claim([event]) == {event}
+    first.close()
+    second.close()
+
+
+def test_deferred_creator_keeps_its_interval():
+    clock = FakeClock()
+    scheduler = AdaptiveScheduler([{"name": "a"}], base_interval=60, min_interval=15, max_interval=240, clock=clock)
+    [(index, _)] = scheduler.pop_due()
+    scheduler.defer(index, 5)
+    assert scheduler.interval_for(index) == 60
+    assert scheduler.seconds_until_next() == 5
@@ -0,0 +1,50 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from patreon_tier_alerter.src import alerter
+from patreon_tier_alerter.src.dispatch import format_alert_message
+from patreon_tier_alerter.src.plan import PagePlan
+from patreon_tier_alerter.src.slots import SlotTracker
+
+PAGE = PagePlan.from_creators("u", [{"name": "C", "url": "u", "tiers_to_watch": ["Gold"]}])
+
+
+def gold(remaining):
+    return [{"name": "Gold", "status": "sold_out" if remaining == 0 else "available", "remaining": remaining}]
+
+
+def events(alerts):
+    return [(alert.get("event"), alert.get("remaining")) for alert in alerts]
+
+
+def test_restock_and_almost_sold_out_events():
+    tracker = SlotTracker(almost_sold_out_below=2, restocks=True)
+    state = {}
+    check = lambda remaining: events(alerter.check_page(gold(remaining), PAGE, state, tracker))
+
+    assert check(5) == [(None, 5)]  # newly available, no history yet
+    assert check(3) == []
+    assert check(2) == [("almost_sold_out", 2)]
+    assert check(1) == []
+    assert check(4) == [("restocked", 4)]
+    assert check(0) == []
+    assert check(6) == [(None, 6)]  # reopening from 0 is a normal availability alert
+
+
+def test_disabled_tracker_adds_nothing():
+    tracker = SlotTracker()
+    assert not tracker.enabled
+    state = {}
+    alerter.check_page(gold(5), PAGE, state, tracker)
+    assert alerter.check_page(gold(9), PAGE, state, tracker) == []
+
+
+def test_messages_describe_slot_events():
+    alert = {"creator_name": "C", "tier_name": "Gold", "url": "u"}
+    assert "is now available! Check" in format_alert_message(alert)
+    assert "is now available (2 left)!" in format_alert_message(dict(alert, remaining=2))
+    assert "restocked 3 slot(s) (5 left)!" in format_alert_message(
+        dict(alert, event="restocked", remaining=5, added=3))
+    assert "is almost sold out (1 left)!" in format_alert_message(dict(alert, event="almost_sold_out", remaining=1))
@@ -0,0 +1,55 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from patreon_tier_alerter.src.alerter import check_tiers
+from patreon_tier_alerter.src.state import MemoryStateStore, SQLiteStateStore, open_state_store
+
+CREATOR = {"name": "Creator_X", "url": "http://example.com", "tiers_to_watch": ["Cool Tier"]}
+
+
+def test_sqlite_store_survives_restart_without_realerting(tmp_path):
+    path = str(tmp_path / "state.sqlite3")
+    store = SQLiteStateStore(path)
+    assert len(check_tiers([{"name": "Cool Tier", "status": "available"}], CREATOR, store)) == 1
+    store.close()
+
+    restarted = SQLiteStateStore(path)
+    assert restarted.get(("Creator_X", "Cool Tier")) is True
+    assert check_tiers([{"name": "Cool Tier", "status": "available"}], CREATOR, restarted) == []
+    restarted.close()
+
+
+def test_sqlite_store_writes_only_on_flush(tmp_path):
+    path = str(tmp_path / "state.sqlite3")
+    store = SQLiteStateStore(path)
+    store[("A", "T")] = True
+    assert store.dirty
+    assert len(SQLiteStateStore(path)) == 0
+
+    store.flush()
+    assert not store.dirty
+    assert SQLiteStateStore(path).get(("A", "T")) is True
+
+
+def test_tuple_keys_do_not_collide_on_underscores():
+    store = MemoryStateStore()
+    store[("a_b", "c")] = True
+    store[("a", "b_c")] = False
+    assert store.get(("a_b", "c")) is True
+    assert store.get(("a", "b_c")) is False
+
+    with pytest.raises(TypeError):
+        store["a_b_c"] = True
+
+
+def test_open_state_store_selects_backend(tmp_path):
+    assert isinstance(open_state_store({"state_store": "memory"}), MemoryStateStore)
+    store = open_state_store({"state_path": str(tmp_path / "s.sqlite3")})
+    assert isinstance(store, SQLiteStateStore)
+    store.close()
+    with pytest.raises(ValueError):
+        open_state_store({"state_store": "redis"})
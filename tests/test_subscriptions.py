@@ -0,0 +1,85 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from patreon_tier_alerter.src import alerter, providers
+from patreon_tier_alerter.src.subscriptions import AlertRouter
+
+CREATORS = [
+    {"name": "Drums", "url": "u1", "tiers_to_watch": ["MICROBATCHES", "WHISKEY DRUMMERS"]},
+    {"name": "Bird", "url": "u2", "tiers_to_watch": ["Bourbon Buddha"]},
+]
+
+
+def alert(creator, tier):
+    return {"creator_name": creator, "tier_name": tier, "url": "u"}
+
+
+def make_config(subscriptions):
+    return {
+        "creators": CREATORS,
+        "sms_providers": {
+            "tb": {"provider": "textbelt", "textbelt_api_key": "k"},
+            "tb2": {"provider": "textbelt", "textbelt_api_key": "k2"},
+        },
+        "subscriptions": subscriptions,
+    }
+
+
+def recipients(channels):
+    return sorted(channel.recipient for channel in channels)
+
+
+def test_routes_by_tier_creator_and_wildcard_without_duplicates():
+    router = AlertRouter.from_config(make_config([
+        {"recipient": "+1", "provider": "tb", "creator": "Drums", "tiers": ["microbatches"]},
+        {"recipient": "+2", "provider": "tb", "creator": "Drums"},
+        {"recipient": "+3", "provider": "tb2"},
+        {"recipient": "+1", "provider": "tb"},
+    ]))
+
+    assert recipients(router.route(alert("Drums", "MICROBATCHES"))) == ["+1", "+2", "+3"]
+    assert recipients(router.route(alert("Drums", "WHISKEY DRUMMERS"))) == ["+1", "+2", "+3"]
+    assert recipients(router.route(alert("Bird", "Bourbon Buddha"))) == ["+1", "+3"]
+    assert len(router.channels) == 3
+
+
+def test_unknown_provider_and_placeholder_recipient_are_skipped(capsys):
+    router = AlertRouter.from_config(make_config([
+        {"recipient": "+1", "provider": "nope"},
+        {"recipient": "YOUR_RECIPIENT_PHONE_NUMBER", "provider": "tb"},
+        {"recipient": "+2", "provider": "tb", "creator": "Bird"},
+    ]))
+
+    out = capsys.readouterr().out
+    assert "unknown SMS provider 'nope'" in out
+    assert "placeholder" in out
+    assert recipients(router.route(alert("Bird", "Bourbon Buddha"))) == ["+2"]
+    assert router.route(alert("Drums", "MICROBATCHES")) == ()
+
+
+def test_legacy_sms_settings_subscribe_to_everything():
+    router = AlertRouter.from_config({
+        "creators": CREATORS,
+        "sms_settings": {"provider": "textbelt", "recipient_phone_number": "+9"},
+    })
+    assert recipients(router.route(alert("Bird", "Anything"))) == ["+9"]
+
+
+def test_send_alerts_fans_out_one_message_per_recipient(monkeypatch):
+    sent = []
+
+    def fake_textbelt(phone, message, key="textbelt", url=None):
+        sent.append((phone, key))
+        return {"success": True, "textId": "1"}
+
+    monkeypatch.setattr(providers, "send_textbelt_sms", fake_textbelt)
+    router = AlertRouter.from_config(make_config([
+        {"recipient": "+1", "provider": "tb", "creator": "Drums"},
+        {"recipient": "+2", "provider": "tb2"},
+    ]))
+
+    alerter.send_alerts([alert("Drums", "MICROBATCHES"), alert("Bird", "Bourbon Buddha")], router=router)
+
+    assert sorted(sent) == [("+1", "k"), ("+2", "k2"), ("+2", "k2")]
@@ -0,0 +1,142 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from patreon_tier_alerter.src.tier_parser import StreamingTierParser, TierParser, TierRegionCache
+
+
+def tier_card(name, button, disabled=False):
+    return (
+        f'<div class="card"><h3>{name}</h3>'
+        f'<a class="btn" href="/checkout" data-tag="patron-checkout-continue-button" '
+        f'aria-label="{name} Join" aria-disabled="{str(disabled).lower()}">'
+        f'<div class="cm-oHFIQB">{button}</div></a></div>'
+    )
+
+
+PAGE = (
+    '<html><head><script>var x = "' + 'a' * 5000 + '";</script></head><body>'
+    + tier_card('Bronze &amp; Oak', 'Join')
+    + '<p>' + 'filler ' * 2000 + '</p>'
+    + tier_card('Silver', 'Sold Out')
+    + tier_card('Gold', 'Join', disabled=True)
+    + tier_card('Platinum', 'Join')
+    + '<footer>' + 'links ' * 2000 + '</footer></body></html>'
+).encode()
+
+
+def stream(parser, data, chunk_size):
+    for i in range(0, len(data), chunk_size):
+        if parser.feed(data[i:i + chunk_size]):
+            break
+    return parser.close()
+
+
+def test_streaming_matches_full_parser_for_any_chunking():
+    reference = TierParser()
+    reference.feed(PAGE.decode())
+
+    for chunk_size in (1, 7, 64, 1000, len(PAGE)):
+        assert stream(StreamingTierParser(), PAGE, chunk_size) == reference.tiers
+
+    assert reference.tiers[0] == {'name': 'Bronze & Oak', 'status': 'available'}
+    assert [t['status'] for t in reference.tiers] == ['available', 'sold_out', 'sold_out', 'available']
+
+
+def test_streaming_stops_once_watched_tiers_resolved():
+    parser = StreamingTierParser(['silver', 'Bronze & Oak'])
+    fed = 0
+    for i in range(0, len(PAGE), 256):
+        fed += 1
+        if parser.feed(PAGE[i:i + 256]):
+            break
+
+    assert parser.done
+    assert fed * 256 < len(PAGE) - 10000
+    assert [t['name'] for t in parser.close()] == ['Bronze & Oak', 'Silver']
+
+
+def test_streaming_ignores_similar_tags():
+    page = b'<abbr data-tag="patron-checkout-continue-button" aria-label="X Join"></abbr>' + tier_card('Real', 'Join').encode()
+    assert stream(StreamingTierParser(), page, 16) == [{'name': 'Real', 'status': 'available'}]
+
+
+def test_region_digest_ignores_tracking_tokens_but_not_status():
+    def digest(page):
+        parser = StreamingTierParser()
+        parser.feed(page)
+        return parser.digest()
+
+    base = digest(PAGE)
+    retokened = PAGE.replace(b'href="/checkout"', b'href="/checkout?t=abc123"')
+    changed = PAGE.replace(b'>Sold Out<', b'>Join<')
+
+    assert digest(retokened) == base
+    assert digest(changed) != base
+
+
+def test_region_cache_hits_and_counters():
+    cache = TierRegionCache()
+    tiers = [{'name': 'Silver', 'status': 'sold_out'}]
+
+    assert cache.lookup('k', b'd1') is None
+    cache.store('k', b'd1', tiers)
+    assert cache.lookup('k', b'd1') == tiers
+    assert cache.lookup('k', b'd2') is None
+    assert cache.reset_counters() == (1, 2)
+    assert cache.reset_counters() == (0, 0)
+
+
+def json_page(rewards, cards=PAGE):
+    import json
+    payload = json.dumps({"props": {"pageProps": {"token": "abc", "campaign": {"included": [
+        {"type": "reward", "id": str(i), "attributes": attributes} for i, attributes in enumerate(rewards)
+    ] + [{"type": "user", "id": "9", "attributes": {"title": "Not a tier"}}]}}}})
+    return cards + b'<script id="__NEXT_DATA__" type="application/json">' + payload.encode() + b'</script></body></html>'
+
+
+REWARDS = [
+    {"title": "Bronze & Oak", "remaining": 4, "user_limit": 10, "published": True},
+    {"title": "Silver", "remaining": 0, "user_limit": 10},
+    {"title": "Gold", "remaining": 0, "user_limit": 5},
+    {"title": "Platinum", "remaining": None},
+    {"title": "Draft", "remaining": 3, "published": False},
+]
+
+
+def test_embedded_json_reads_tiers_and_remaining_for_any_chunking():
+    expected = [
+        {"name": "Bronze & Oak", "status": "available", "remaining": 4, "limit": 10},
+        {"name": "Silver", "status": "sold_out", "remaining": 0, "limit": 10},
+        {"name": "Gold", "status": "sold_out", "remaining": 0, "limit": 5},
+        {"name": "Platinum", "status": "available", "remaining": None, "limit": None},
+    ]
+    page = json_page(REWARDS)
+    for chunk_size in (1, 5, 9, 64, 1000, len(page)):
+        parser = StreamingTierParser(embedded_json=True)
+        assert stream(parser, page, chunk_size) == expected
+        assert parser.source == "json"
+        assert parser.disagreements == []
+
+
+def test_embedded_json_falls_back_to_html_and_flags_disagreements():
+    parser = StreamingTierParser(embedded_json=True)
+    assert [tier["name"] for tier in stream(parser, PAGE, 512)] == ["Bronze & Oak", "Silver", "Gold", "Platinum"]
+    assert parser.source == "html"
+
+    stale = [dict(REWARDS[0], remaining=0)] + REWARDS[1:]
+    parser = StreamingTierParser(["bronze & oak", "silver"], embedded_json=True)
+    stream(parser, json_page(stale), 512)
+    assert parser.disagreements == [("bronze & oak", "sold_out", "available")]
+
+
+def test_embedded_json_digest_tracks_remaining_counts_not_tokens():
+    def digest(page):
+        parser = StreamingTierParser(embedded_json=True)
+        stream(parser, page, 4096)
+        return parser.digest()
+
+    base = digest(json_page(REWARDS))
+    assert digest(json_page(REWARDS).replace(b'"abc"', b'"xyz"')) == base
+    assert digest(json_page([dict(REWARDS[0], remaining=3)] + REWARDS[1:])) != base
@@ -2,9 +2,11 @@ import pytest
 import json
 import urllib.request
 
+from cloudflare_worker import worker
 from cloudflare_worker.worker import (
     scrape_patreon_page_async,
     send_sms_alerts_async,
+    fetch_alerts,
     on_fetch,
 )
 
@@ -64,7 +66,19 @@ async def test_send_sms_alerts_async_posts(monkeypatch):
 
 
 @pytest.mark.asyncio
-async def test_on_fetch_returns_alerts(monkeypatch):
+async def test_fetch_alerts_returns_alerts(monkeypatch):
     env = {"CONFIG_JSON": json.dumps({"creators": []})}
-    result = await on_fetch(None, env, None)
+    result = await fetch_alerts(env)
     assert result == {"alerts": []}
+
+
+@pytest.mark.asyncio
+async def test_on_fetch_returns_a_json_response_in_the_runtime(monkeypatch):
+    class FakeResponse:
+        @staticmethod
+        def json(data):
+            return ("Response", data)
+
+    monkeypatch.setattr(worker, "Response", FakeResponse)
+    env = {"CONFIG_JSON": json.dumps({"creators": []})}
+    assert await on_fetch(None, env, None) == ("Response", {"alerts": []})
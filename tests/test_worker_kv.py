@@ -0,0 +1,219 @@
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from cloudflare_worker import worker
+from cloudflare_worker.kv import STATE_KEY, KVAlertState, LocalKV
+from cloudflare_worker.worker import checkout_fragments, fetch_alerts
+
+BUTTON = ('<a data-tag="patron-checkout-continue-button" aria-label="{name} Join"{disabled}>'
+          '<div class="cm-oHFIQB">{text}</div></a>')
+
+
+def page(**tiers) -> bytes:
+    buttons = ''.join(
+        BUTTON.format(name=name, disabled='' if open_ else ' aria-disabled="true"', text='Join' if open_ else 'Sold Out')
+        for name, open_ in tiers.items())
+    return f'<html><body><div>{"x" * 1000}</div>{buttons}</body></html>'.encode()
+
+
+class FakeResp:
+    def __init__(self, body):
+        self.body = body
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def read(self):
+        return self.body
+
+
+@pytest.fixture
+def web(monkeypatch):
+    pages = {}
+    requests = []
+
+    def fake_urlopen(req, timeout=10):
+        requests.append(req.full_url)
+        return FakeResp(pages.get(req.full_url, b''))
+
+    monkeypatch.setattr(urllib.request, "urlopen", fake_urlopen)
+    return pages, requests
+
+
+def make_env(tmp_path, creators, **config):
+    config["creators"] = creators
+    return {
+        "CONFIG_JSON": json.dumps(config),
+        "PATREON_ALERT_CACHE": LocalKV.for_binding("PATREON_ALERT_CACHE", str(tmp_path)),
+        "SMS_API_URL": "http://sms.local",
+        "SMS_API_TOKEN": "token",
+        "RECIPIENT_PHONE_NUMBER": "123",
+    }
+
+
+@pytest.mark.asyncio
+async def test_local_kv_roundtrip_and_expiry(tmp_path):
+    now = [1000.0]
+    kv = LocalKV(str(tmp_path / ".worker_state" / "kv" / "NS.sqlite3"), clock=lambda: now[0])
+    await kv.put("config", '{"a": 1}')
+    await kv.put("temp", "x", expirationTtl=60)
+    assert await kv.get("config", type="json") == {"a": 1}
+    assert [key["name"] for key in (await kv.list())["keys"]] == ["config", "temp"]
+    now[0] += 61
+    assert await kv.get("temp") is None
+    await kv.delete("config")
+    assert await kv.get("config") is None
+
+
+@pytest.mark.asyncio
+async def test_alert_once_with_one_read_and_one_write_per_run(tmp_path, web):
+    pages, requests = web
+    pages["http://p/a"] = page(Gold=True, Silver=False)
+    creators = [{"name": "A", "url": "http://p/a", "tiers_to_watch": ["Gold", "Silver"]},
+                {"name": "A2", "url": "http://p/a", "tiers_to_watch": ["Gold"]}]
+    env = make_env(tmp_path, creators)
+    kv = env["PATREON_ALERT_CACHE"]
+
+    result = await fetch_alerts(env)
+    assert [(a["creator_name"], a["tier_name"]) for a in result["alerts"]] == [("A", "Gold"), ("A2", "Gold")]
+    # The shared page is fetched once; two SMS posts follow.
+    assert requests.count("http://p/a") == 1 and requests.count("http://sms.local") == 2
+    assert (kv.reads, kv.writes) == (1, 1)
+
+    # Still open: nothing to send and nothing to write.
+    assert await fetch_alerts(env) == {"alerts": []}
+    assert (kv.reads, kv.writes) == (2, 1)
+
+    # Sold out, then open again: alerts again.
+    pages["http://p/a"] = page(Gold=False)
+    await fetch_alerts(env)
+    pages["http://p/a"] = page(Gold=True)
+    assert len((await fetch_alerts(env))["alerts"]) == 2
+    assert (kv.reads, kv.writes) == (4, 3)
+
+
+@pytest.mark.asyncio
+async def test_hidden_tier_alerts_again_when_relisted(tmp_path, web):
+    pages, requests = web
+    pages["http://p/a"] = page(Gold=True)
+    env = make_env(tmp_path, [{"name": "A", "url": "http://p/a", "tiers_to_watch": ["Gold"]}])
+
+    assert len((await fetch_alerts(env))["alerts"]) == 1
+    pages["http://p/a"] = page(Silver=True)  # Gold hidden while sold out
+    assert (await fetch_alerts(env))["alerts"] == []
+    assert ("A", "Gold") not in await KVAlertState(env["PATREON_ALERT_CACHE"]).load()
+    pages["http://p/a"] = page(Gold=True)
+    assert len((await fetch_alerts(env))["alerts"]) == 1
+    assert requests.count("http://sms.local") == 2
+
+
+@pytest.mark.asyncio
+async def test_failed_sms_is_retried_next_run(tmp_path, web, monkeypatch):
+    pages, _ = web
+    pages["http://p/a"] = page(Gold=True)
+    env = make_env(tmp_path, [{"name": "A", "url": "http://p/a", "tiers_to_watch": ["Gold"]}])
+    del env["SMS_API_TOKEN"]
+
+    assert len((await fetch_alerts(env))["alerts"]) == 1
+    assert len((await fetch_alerts(env))["alerts"]) == 1
+    assert env["PATREON_ALERT_CACHE"].writes == 0
+
+
+@pytest.mark.asyncio
+async def test_pages_over_the_subrequest_budget_rotate_between_runs(tmp_path, web):
+    pages, requests = web
+    creators = [{"name": f"C{i}", "url": f"http://p/{i}", "tiers_to_watch": ["Gold"]} for i in range(5)]
+    env = make_env(tmp_path, creators, worker_max_subrequests=4, worker_sms_reserve=1)
+
+    seen = []
+    for _ in range(3):
+        requests.clear()
+        await fetch_alerts(env)
+        seen.append(requests[:])
+    assert seen == [["http://p/0", "http://p/1", "http://p/2"],
+                    ["http://p/3", "http://p/4", "http://p/0"],
+                    ["http://p/1", "http://p/2", "http://p/3"]]
+    document = json.loads(await env["PATREON_ALERT_CACHE"].get(STATE_KEY))
+    assert document["cursor"] == 4
+
+
+@pytest.mark.asyncio
+async def test_config_is_read_from_the_config_namespace(tmp_path, web):
+    pages, _ = web
+    pages["http://p/a"] = page(Gold=True)
+    config_kv = LocalKV.for_binding("PATREON_CONFIG", str(tmp_path))
+    await config_kv.put("config", json.dumps({"creators": [{"name": "A", "url": "http://p/a",
+                                                             "tiers_to_watch": ["Gold"]}]}))
+    env = make_env(tmp_path, [])
+    del env["CONFIG_JSON"]
+    env["PATREON_CONFIG"] = config_kv
+
+    assert len((await fetch_alerts(env))["alerts"]) == 1
+    state = await KVAlertState(env["PATREON_ALERT_CACHE"]).load()
+    assert ("A", "Gold") in state
+
+
+@pytest.mark.asyncio
+async def test_local_fetches_overlap(tmp_path, monkeypatch):
+    def slow_urlopen(req, timeout=10):
+        time.sleep(0.2)
+        return FakeResp(page(Gold=False))
+
+    monkeypatch.setattr(urllib.request, "urlopen", slow_urlopen)
+    creators = [{"name": f"C{i}", "url": f"http://p/{i}", "tiers_to_watch": ["Gold"]} for i in range(4)]
+    started = time.monotonic()
+    await fetch_alerts(make_env(tmp_path, creators))
+    assert time.monotonic() - started < 0.6
+
+
+def test_checkout_fragments_keep_only_the_anchors():
+    body = page(Gold=True, Silver=False)
+    fragments = checkout_fragments(body)
+    assert fragments.count("<a ") == 2 and "xxx" not in fragments
+
+
+@pytest.mark.asyncio
+async def test_runtime_fetch_is_used_when_available(tmp_path, web, monkeypatch):
+    _, urllib_requests = web
+    sent = []
+
+    class FakeFetchResponse:
+        def __init__(self, status, body):
+            self.status, self.ok, self.body = status, 200 <= status < 300, body
+
+        async def bytes(self):
+            return self.body
+
+    async def fake_pyfetch(url, method='GET', headers=None, body=None):
+        sent.append((method, url, body))
+        if url == "http://sms.local":
+            return FakeFetchResponse(500, b'')
+        return FakeFetchResponse(200, page(Gold=True))
+
+    monkeypatch.setattr(worker, "pyfetch", fake_pyfetch)
+    env = make_env(tmp_path, [{"name": "A", "url": "http://p/a", "tiers_to_watch": ["Gold"]}])
+
+    assert len((await fetch_alerts(env))["alerts"]) == 1
+    assert [(method, url) for method, url, _ in sent] == [("GET", "http://p/a"), ("POST", "http://sms.local")]
+    assert json.loads(sent[1][2])["to"] == "123"
+    assert urllib_requests == []
+    # The SMS request failed, so the tier is not marked and alerts again next run.
+    assert ("A", "Gold") not in await KVAlertState(env["PATREON_ALERT_CACHE"]).load()
+
+
+def test_importing_the_worker_does_not_need_sqlite():
+    code = "import sys, cloudflare_worker.worker; print('sqlite3' in sys.modules)"
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    assert subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True,
+                          check=True).stdout.strip() == "False"